@@ -0,0 +1,155 @@
+"""Benchmark de rendimiento de la API HTTP contra una base de datos local
+
+Lanza `python -m taller.api` en un subproceso (o usa --url para una API ya
+en marcha) y mantiene N clientes concurrentes durante la duración indicada.
+Reporta peticiones por segundo y percentiles de latencia.
+
+Escenarios:
+    lectura  GET /servicios, /horarios y /citas/{id}
+    reserva  POST /citas en horarios libres a partir de --desde (escribe datos)
+    mixto    90% lectura, 10% reserva
+
+Uso:
+    python benchmarks/bench_api.py --concurrencia 50 --duracion 10 --escenario lectura
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+
+import aiohttp
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HORARIOS = [f"{h:02d}:{m:02d}" for h in range(8, 18) for m in (0, 30)]
+
+def horarios_reserva(desde: date):
+    """Genera horarios únicos de lunes a viernes a partir de la fecha dada"""
+    for dias in itertools.count():
+        dia = desde + timedelta(days=dias)
+        if dia.weekday() < 5:
+            for hora in HORARIOS:
+                yield dia, hora
+
+async def esperar_api(session: aiohttp.ClientSession, url: str, timeout: float = 15):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            async with session.get(f"{url}/salud") as resp:
+                if resp.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"La API no respondió en {url}")
+
+async def peticion_lectura(session, url, cita_id, telefono):
+    opcion = random.random()
+    if opcion < 0.4:
+        return await session.get(f"{url}/servicios")
+    if opcion < 0.8:
+        fecha = date.today() + timedelta(days=random.randint(1, 30))
+        return await session.get(f"{url}/horarios", params={'fecha': fecha.isoformat()})
+    return await session.get(f"{url}/citas/{cita_id}", params={'telefono': telefono})
+
+async def peticion_reserva(session, url, slots, servicio_id):
+    dia, hora = next(slots)
+    sufijo = f"{dia:%y%m%d}{hora.replace(':', '')}"
+    return await session.post(f"{url}/citas", json={
+        'nombre': f"Cliente Bench {sufijo}",
+        'telefono': f"9{sufijo}",
+        'marca': 'Toyota',
+        'modelo': 'Yaris',
+        'placa': f"B{sufijo}",
+        'servicio_id': servicio_id,
+        'fecha': dia.isoformat(),
+        'hora': hora
+    })
+
+async def cliente(session, url, args, fin, slots, servicio_id, cita_id, latencias, errores):
+    while time.monotonic() < fin:
+        reservar = args.escenario == 'reserva' or (args.escenario == 'mixto' and random.random() < 0.1)
+        inicio = time.perf_counter()
+        try:
+            if reservar:
+                resp = await peticion_reserva(session, url, slots, servicio_id)
+            else:
+                resp = await peticion_lectura(session, url, cita_id, args.telefono)
+            async with resp:
+                await resp.read()
+                if resp.status >= 400 and resp.status != 404:
+                    errores.append(resp.status)
+        except aiohttp.ClientError as e:
+            errores.append(type(e).__name__)
+        latencias.append(time.perf_counter() - inicio)
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(int(len(ordenados) * p), len(ordenados) - 1)]
+
+async def ejecutar(args, url):
+    conector = aiohttp.TCPConnector(limit=args.concurrencia)
+    async with aiohttp.ClientSession(connector=conector) as session:
+        await esperar_api(session, url)
+
+        async with session.get(f"{url}/servicios") as resp:
+            servicio_id = (await resp.json())[0]['id']
+
+        slots = horarios_reserva(date.fromisoformat(args.desde))
+        latencias, errores = [], []
+        inicio = time.monotonic()
+        fin = inicio + args.duracion
+        await asyncio.gather(*[
+            cliente(session, url, args, fin, slots, servicio_id, args.cita_id, latencias, errores)
+            for _ in range(args.concurrencia)
+        ])
+        transcurrido = time.monotonic() - inicio
+
+    print(f"Escenario: {args.escenario}  concurrencia: {args.concurrencia}  duración: {transcurrido:.1f}s")
+    print(f"Peticiones: {len(latencias)}  errores: {len(errores)}")
+    print(f"Rendimiento: {len(latencias) / transcurrido:.1f} req/s")
+    if latencias:
+        print("Latencia (ms): p50 {:.1f}  p95 {:.1f}  p99 {:.1f}".format(
+            percentil(latencias, 0.50) * 1000,
+            percentil(latencias, 0.95) * 1000,
+            percentil(latencias, 0.99) * 1000
+        ))
+    if errores:
+        print(f"Primeros errores: {errores[:5]}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la API de Taller AutoMax")
+    parser.add_argument('--url', help="URL de una API en marcha (por defecto se lanza una local)")
+    parser.add_argument('--port', type=int, default=8765, help="Puerto de la API local")
+    parser.add_argument('--workers', type=int, default=10, help="Hilos de la API local")
+    parser.add_argument('--concurrencia', type=int, default=50, help="Clientes simultáneos")
+    parser.add_argument('--duracion', type=float, default=10, help="Segundos de prueba")
+    parser.add_argument('--escenario', choices=['lectura', 'reserva', 'mixto'], default='lectura')
+    parser.add_argument('--cita-id', type=int, default=1, help="Cita consultada en el escenario de lectura")
+    parser.add_argument('--telefono', default='987654321', help="Teléfono del cliente de --cita-id (acredita al titular)")
+    parser.add_argument('--desde', default=(date.today() + timedelta(days=random.randint(400, 4000))).isoformat(),
+                        help="Primera fecha para reservas de prueba (por defecto, una fecha lejana al azar)")
+    args = parser.parse_args()
+
+    proceso = None
+    url = args.url
+    if not url:
+        url = f"http://127.0.0.1:{args.port}"
+        proceso = subprocess.Popen(
+            [sys.executable, '-m', 'taller.api', '--host', '127.0.0.1',
+             '--port', str(args.port), '--workers', str(args.workers)],
+            cwd=RAIZ
+        )
+    try:
+        asyncio.run(ejecutar(args, url))
+    finally:
+        if proceso:
+            proceso.terminate()
+            proceso.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Benchmark del arranque en frío de la aplicación Streamlit
+
+Cada página se abre en un proceso de Python nuevo (sin módulos en caché)
+con `-X importtime`: se mide la primera ejecución del script con AppTest,
+qué bibliotecas pesadas (pandas, plotly, folium) llegaron a importarse y
+qué importaciones de primer nivel dispararon esa ejecución ordenadas por
+tiempo acumulado. Las importaciones de Streamlit y de AppTest ocurren antes
+de la marca y no cuentan.
+
+Con --presupuesto-ms termina con código 1 si alguna página lo excede, para
+usarlo como verificación en CI:
+    python benchmarks/bench_arranque.py --repeticiones 3 --presupuesto-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULOS_PESADOS = ('pandas', 'plotly', 'folium', 'numpy')
+MARCA = '--- inicio de la ejecucion ---'
+
+# Se ejecuta en el proceso hijo: abre la página indicada y reporta en JSON
+HIJO = """
+import json, os, sys, time
+from streamlit.testing.v1 import AppTest
+app, pagina = sys.argv[1], sys.argv[2]
+os.chdir(os.path.dirname(app))
+prueba = AppTest.from_file(app, default_timeout=120)
+if pagina == 'admin':
+    prueba.session_state.authenticated = True
+    prueba.session_state.username = 'admin'
+prueba.session_state.current_page = pagina
+print({marca!r}, file=sys.stderr, flush=True)
+inicio = time.perf_counter()
+prueba.run()
+segundos = time.perf_counter() - inicio
+print(json.dumps({{
+    'segundos': segundos,
+    'errores': [str(e.value) for e in prueba.exception],
+    'pesados': sorted({{m.split('.')[0] for m in sys.modules}} & set({pesados!r}))
+}}))
+""".format(marca=MARCA, pesados=MODULOS_PESADOS)
+
+def importaciones_principales(stderr: str, cantidad: int):
+    """Importaciones de primer nivel tras la marca, por tiempo acumulado (ms)"""
+    _, _, despues = stderr.partition(MARCA)
+    principales = []
+    for linea in despues.splitlines():
+        if not linea.startswith('import time:') or '|' not in linea:
+            continue
+        _, acumulado, nombre = linea[len('import time:'):].split('|')
+        if nombre.startswith('  ') or not acumulado.strip().isdigit():
+            continue
+        principales.append((int(acumulado) / 1000, nombre.strip()))
+    return sorted(principales, reverse=True)[:cantidad]
+
+def medir_pagina(app: str, pagina: str):
+    """Arranque en frío de una página en un proceso nuevo"""
+    entorno = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [RAIZ, os.environ.get('PYTHONPATH')])))
+    inicio = time.perf_counter()
+    proceso = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', HIJO, app, pagina],
+        capture_output=True, text=True, env=entorno
+    )
+    total = time.perf_counter() - inicio
+    if proceso.returncode != 0:
+        raise RuntimeError(f"La página '{pagina}' falló:\n{proceso.stderr[-2000:]}")
+    resultado = json.loads(proceso.stdout.strip().splitlines()[-1])
+    resultado['total'] = total
+    resultado['importaciones'] = importaciones_principales(proceso.stderr, 5)
+    return resultado
+
+def main():
+    parser = argparse.ArgumentParser(description="Arranque en frío por página de la aplicación")
+    parser.add_argument('--app', default=os.path.join(RAIZ, 'taller_automotriz_app.py'), help="Script de la aplicación")
+    parser.add_argument('--paginas', nargs='+', default=['home', 'services', 'citas', 'inventory', 'admin'])
+    parser.add_argument('--repeticiones', type=int, default=3, help="Procesos nuevos por página")
+    parser.add_argument('--presupuesto-ms', type=float, default=None,
+                        help="Máximo de la primera ejecución (p50) por página; excederlo termina con código 1")
+    args = parser.parse_args()
+    app = os.path.abspath(args.app)
+
+    excedidas = []
+    for pagina in args.paginas:
+        mediciones = [medir_pagina(app, pagina) for _ in range(args.repeticiones)]
+        primera = statistics.median(m['segundos'] for m in mediciones) * 1000
+        total = statistics.median(m['total'] for m in mediciones) * 1000
+        ultima = mediciones[-1]
+        print(f"{pagina:<10} primera ejecución p50 {primera:7.1f} ms   proceso completo p50 {total:7.1f} ms   "
+              f"pesados: {', '.join(ultima['pesados']) or 'ninguno'}")
+        for milisegundos, modulo in ultima['importaciones']:
+            print(f"{'':<12}{milisegundos:7.1f} ms  {modulo}")
+        if ultima['errores']:
+            print(f"{'':<12}errores: {ultima['errores'][:2]}")
+        if args.presupuesto_ms is not None and primera > args.presupuesto_ms:
+            excedidas.append(pagina)
+
+    if excedidas:
+        print(f"Presupuesto de {args.presupuesto_ms:.0f} ms excedido en: {', '.join(excedidas)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
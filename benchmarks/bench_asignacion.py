@@ -0,0 +1,105 @@
+"""Benchmark del tiempo de cálculo de la asignación de técnicos
+
+Genera días sintéticos con N citas repartidas en los horarios de atención,
+las duraciones del catálogo y técnicos con especialidades al azar, y mide
+taller.asignacion.asignar sin base de datos:
+- rápido: mediana y máximo por tamaño de día, y costo del plan por cita.
+- exacto: en días chicos, cuántas veces probó el óptimo dentro del límite y
+  cuánto más caro fue el plan voraz.
+
+Con --presupuesto-ms termina con código 1 si la mediana del modo rápido
+excede el presupuesto en algún tamaño, para usarlo como verificación en CI:
+    python benchmarks/bench_asignacion.py --trabajos 10 50 100 400 --presupuesto-ms 100
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from taller import asignacion
+
+# Duraciones en minutos de los servicios del catálogo inicial
+DURACIONES = [30, 60, 90, 45, 20, 240, 60, 90, 75, 120]
+# Horarios de reserva: de 8:00 a 17:30 cada media hora
+LLEGADAS = [8 * 60 + 30 * paso for paso in range(20)]
+
+def dia_sintetico(trabajos: int, tecnicos: int, especialidades: int, semilla: int):
+    """Citas y técnicos de un día; todo servicio lo sabe hacer al menos un técnico"""
+    azar = random.Random(semilla)
+    servicios = list(range(1, len(DURACIONES) + 1))
+    plantel = [{
+        'id': numero, 'entrada': 8 * 60, 'salida': 18 * 60,
+        'servicios': frozenset(azar.sample(servicios, especialidades))
+    } for numero in range(1, tecnicos + 1)]
+    for servicio in servicios:
+        if not any(servicio in tecnico['servicios'] for tecnico in plantel):
+            tecnico = azar.choice(plantel)
+            tecnico['servicios'] = tecnico['servicios'] | {servicio}
+
+    citas = []
+    for numero in range(1, trabajos + 1):
+        servicio = azar.choice(servicios)
+        citas.append({
+            'cita_id': numero, 'llegada': azar.choice(LLEGADAS),
+            'duracion': DURACIONES[servicio - 1], 'servicio_id': servicio
+        })
+    return citas, plantel
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la asignación de técnicos")
+    parser.add_argument('--trabajos', type=int, nargs='+', default=[10, 25, 50, 100, 200, 400],
+                        help="Citas por día en el modo rápido")
+    parser.add_argument('--exacto', type=int, nargs='*', default=[4, 6, 8, 10, 12],
+                        help="Citas por día en el modo exacto")
+    parser.add_argument('--tecnicos', type=int, default=6, help="Técnicos de la sede")
+    parser.add_argument('--especialidades', type=int, default=4, help="Servicios que sabe hacer cada técnico")
+    parser.add_argument('--puestos', type=int, default=3, help="Puestos de la sede")
+    parser.add_argument('--repeticiones', type=int, default=10, help="Días distintos por tamaño")
+    parser.add_argument('--presupuesto-ms', type=float, default=0, help="Mediana máxima del modo rápido (0 sin límite)")
+    args = parser.parse_args()
+
+    # Con más citas que capacidad el día se desborda: se escala el plantel con el tamaño
+    print(f"Modo rápido ({args.repeticiones} días por tamaño)")
+    print(f"{'citas':>6} {'técnicos':>9} {'puestos':>8} {'mediana ms':>11} {'máximo ms':>10} {'costo/cita':>11}")
+    excedidos = []
+    for trabajos in args.trabajos:
+        escala = max(1, trabajos // 25)
+        tecnicos, puestos = args.tecnicos * escala, args.puestos * escala
+        tiempos, costos = [], []
+        for semilla in range(args.repeticiones):
+            citas, plantel = dia_sintetico(trabajos, tecnicos, args.especialidades, semilla)
+            plan = asignacion.asignar(citas, plantel, puestos)
+            tiempos.append(plan['milisegundos'])
+            costos.append(plan['costo'] / trabajos)
+        mediana = statistics.median(tiempos)
+        print(f"{trabajos:>6} {tecnicos:>9} {puestos:>8} {mediana:>11.2f} {max(tiempos):>10.2f} "
+              f"{statistics.mean(costos):>11.1f}")
+        if args.presupuesto_ms and mediana > args.presupuesto_ms:
+            excedidos.append(trabajos)
+
+    if args.exacto:
+        print(f"\nModo exacto (límite {asignacion.LIMITE_EXACTO:.0f} s, {args.tecnicos} técnicos, {args.puestos} puestos)")
+        print(f"{'citas':>6} {'mediana ms':>11} {'máximo ms':>10} {'óptimos':>8} {'voraz sobre óptimo':>19}")
+        for trabajos in args.exacto:
+            tiempos, optimos, brechas = [], 0, []
+            for semilla in range(args.repeticiones):
+                citas, plantel = dia_sintetico(trabajos, args.tecnicos, args.especialidades, semilla)
+                voraz = asignacion.asignar(citas, plantel, args.puestos)
+                exacto = asignacion.asignar(citas, plantel, args.puestos, exacto=True)
+                tiempos.append(exacto['milisegundos'])
+                optimos += exacto['optimo']
+                if exacto['costo']:
+                    brechas.append(voraz['costo'] / exacto['costo'] - 1)
+            brecha = f"{statistics.mean(brechas) * 100:.1f}%" if brechas else "-"
+            print(f"{trabajos:>6} {statistics.median(tiempos):>11.2f} {max(tiempos):>10.2f} "
+                  f"{optimos:>5}/{args.repeticiones:<2} {brecha:>19}")
+
+    if excedidos:
+        print(f"\nExcede {args.presupuesto_ms:.0f} ms con {', '.join(map(str, excedidos))} citas")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""Prueba de carga con clientes y personal simultáneos
+
+Simula usuarios virtuales que repiten flujos completos con pausas entre
+ellos, en la proporción indicada por --mezcla:
+    reserva   catálogo -> horarios de un día -> reservar uno de los primeros
+              horarios libres (los más solicitados, de ahí la contención)
+    consulta  buscar citas por teléfono
+    admin     calendario del día -> confirmar una cita -> Dashboard
+
+Por defecto usa la capa de servicios (taller.citas y taller.reportes sobre
+taller.db.DatabaseManager), es decir, el mismo código que la interfaz; con
+--via api los flujos van por la API HTTP (las mismas rutas que usan los
+canales externos; el Dashboard no está en la API y se omite).
+
+Para cada nivel de --concurrencia reporta rendimiento, p50/p95/p99 por
+operación y la tasa de conflictos al reservar, y al final verifica que no
+haya dos citas activas en el mismo horario. Cada nivel reserva en su propia
+ventana de fechas lejanas; --limpiar borra las citas creadas.
+
+Uso:
+    python benchmarks/bench_carga.py --concurrencia 5 10 20 40 --duracion 15 --pausa-ms 200
+    python benchmarks/bench_carga.py --via api --url http://127.0.0.1:8000 --mezcla reserva=1
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from urllib.parse import urlencode, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from taller import citas, reportes
+from taller.config import DB_CONFIG
+from taller.db import DatabaseManager
+from taller.errores import Conflicto, TallerError
+
+PREFIJO_PLACA = 'CG-'
+
+class ViaServicios:
+    """Flujos por la capa de servicios, como la interfaz Streamlit"""
+
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+
+    def servicios(self):
+        return [servicio['id'] for servicio in citas.listar_servicios(self.db)]
+
+    def horarios(self, fecha: date):
+        return citas.horarios_disponibles(self.db, fecha)
+
+    def reservar(self, datos: dict) -> str:
+        try:
+            citas.agendar_cita(
+                self.db, nombre=datos['nombre'], telefono=datos['telefono'], marca='Toyota', modelo='Yaris',
+                placa=datos['placa'], servicio_id=datos['servicio_id'], fecha_cita=datos['fecha'],
+                hora_cita=datetime.strptime(datos['hora'], '%H:%M').time()
+            )
+            return 'creada'
+        except Conflicto:
+            return 'conflicto'
+
+    def buscar(self, telefono: str):
+        return citas.buscar_citas_por_telefono(self.db, telefono)
+
+    def calendario(self, fecha: date):
+        filas = self.db.consultar(
+            "SELECT id, estado FROM vista_citas_completas WHERE fecha_cita = %s ORDER BY hora_cita",
+            (fecha,), solo_lectura=True
+        )
+        return [fila['id'] for fila in filas if fila['estado'] == 'pendiente']
+
+    def confirmar(self, cita_id: int):
+        citas.actualizar_estado(self.db, cita_id, 'confirmada')
+
+    def tablero(self):
+        reportes.consultar_secuencial(self.db, reportes.consultas_dashboard(date.today()))
+        return True
+
+class ViaApi:
+    """Flujos por la API HTTP, con una conexión persistente por usuario virtual"""
+
+    def __init__(self, url: str):
+        self.url = urlparse(url)
+        self._local = threading.local()
+        # La API no tiene calendario: el personal trabaja sobre las citas que creó la prueba
+        self._creadas = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def _pedir(self, metodo: str, ruta: str, cuerpo: dict = None):
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None:
+            conexion = self._local.conexion = http.client.HTTPConnection(self.url.hostname, self.url.port, timeout=60)
+        datos = json.dumps(cuerpo, default=str) if cuerpo is not None else None
+        try:
+            conexion.request(metodo, ruta, body=datos, headers={'Content-Type': 'application/json'})
+            respuesta = conexion.getresponse()
+            contenido = respuesta.read()
+        except (http.client.HTTPException, OSError):
+            self._local.conexion = None
+            conexion.close()
+            raise
+        if respuesta.status == 409:
+            raise Conflicto(contenido.decode('utf-8', 'replace'))
+        if respuesta.status >= 400:
+            raise TallerError(f"HTTP {respuesta.status}: {contenido[:200]!r}")
+        return json.loads(contenido)
+
+    def servicios(self):
+        return [servicio['id'] for servicio in self._pedir('GET', '/servicios')]
+
+    def horarios(self, fecha: date):
+        return self._pedir('GET', f"/horarios?{urlencode({'fecha': fecha.isoformat()})}")['horarios']
+
+    def reservar(self, datos: dict) -> str:
+        try:
+            cita = self._pedir('POST', '/citas', dict(datos, marca='Toyota', modelo='Yaris', fecha=datos['fecha'].isoformat()))
+        except Conflicto:
+            return 'conflicto'
+        with self._lock:
+            self._creadas[datos['fecha']].append((cita['cita_id'], datos['telefono']))
+        return 'creada'
+
+    def buscar(self, telefono: str):
+        return self._pedir('GET', f"/citas?{urlencode({'telefono': telefono})}")
+
+    def calendario(self, fecha: date):
+        # Sin token, cada cita se consulta y confirma acreditando el teléfono de su cliente
+        with self._lock:
+            creadas = list(self._creadas[fecha][-20:])
+        return [
+            (cita_id, telefono) for cita_id, telefono in creadas
+            if self._pedir('GET', f"/citas/{cita_id}?{urlencode({'telefono': telefono})}")['estado'] == 'pendiente'
+        ]
+
+    def confirmar(self, cita):
+        cita_id, telefono = cita
+        self._pedir('PATCH', f"/citas/{cita_id}", {'estado': 'confirmada', 'telefono': telefono})
+
+    def tablero(self):
+        return None
+
+class Resultados:
+    """Latencias por operación y conteo de reservas, compartidos entre hilos"""
+
+    def __init__(self):
+        self.latencias = defaultdict(list)
+        self.reservas = defaultdict(int)
+        self.errores = []
+        self.flujos = 0
+        self._lock = threading.Lock()
+
+    def medir(self, operacion: str, funcion, *args):
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args)
+        finally:
+            duracion = time.perf_counter() - inicio
+            with self._lock:
+                self.latencias[operacion].append(duracion)
+
+    def reserva(self, resultado: str):
+        with self._lock:
+            self.reservas[resultado] += 1
+
+    def error(self, operacion: str, error: Exception):
+        with self._lock:
+            self.errores.append(f"{operacion}: {type(error).__name__}: {str(error)[:120]}")
+
+    def flujo(self):
+        with self._lock:
+            self.flujos += 1
+
+def dias_habiles(desde: date, cantidad: int):
+    """Primeros `cantidad` días de lunes a viernes desde la fecha"""
+    return list(itertools.islice((dia for dia in (desde + timedelta(days=n) for n in itertools.count()) if dia.weekday() < 5), cantidad))
+
+def usuario_virtual(numero: int, via, args, dias, resultados: Resultados, fin: float, mezcla, telefonos):
+    """Repite flujos elegidos según la mezcla hasta el fin de la prueba"""
+    aleatorio = random.Random(numero)
+    flujos, pesos = zip(*mezcla.items())
+    servicios = via.servicios()
+    iteracion = 0
+    while time.monotonic() < fin:
+        flujo = aleatorio.choices(flujos, pesos)[0]
+        try:
+            if flujo == 'reserva':
+                resultados.medir('catalogo', via.servicios)
+                dia = aleatorio.choice(dias)
+                libres = resultados.medir('horarios', via.horarios, dia)
+                if not libres:
+                    resultados.reserva('sin_horario')
+                else:
+                    iteracion += 1
+                    telefono = f"8{numero:04d}{iteracion:05d}"
+                    resultado = resultados.medir('reservar', via.reservar, {
+                        'nombre': f"Cliente Carga {numero}-{iteracion}",
+                        'telefono': telefono,
+                        'placa': f"{PREFIJO_PLACA}{numero:04d}-{iteracion:05d}",
+                        'servicio_id': aleatorio.choice(servicios),
+                        'fecha': dia,
+                        'hora': aleatorio.choice(libres[:args.populares])
+                    })
+                    resultados.reserva(resultado)
+                    if resultado == 'creada':
+                        telefonos.append(telefono)
+            elif flujo == 'consulta':
+                telefono = aleatorio.choice(telefonos) if telefonos else f"8{numero:05d}"
+                resultados.medir('buscar', via.buscar, telefono)
+            else:
+                pendientes = resultados.medir('calendario', via.calendario, aleatorio.choice(dias))
+                if pendientes:
+                    resultados.medir('confirmar', via.confirmar, aleatorio.choice(pendientes))
+                if isinstance(via, ViaServicios):
+                    resultados.medir('tablero', via.tablero)
+            resultados.flujo()
+        except TallerError as e:
+            resultados.error(flujo, e)
+            if flujo == 'reserva':
+                resultados.reserva('error')
+        except (http.client.HTTPException, OSError) as e:
+            resultados.error(flujo, e)
+        if args.pausa_ms:
+            time.sleep(min(aleatorio.expovariate(1000 / args.pausa_ms), args.pausa_ms * 10 / 1000))
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(int(len(ordenados) * p), len(ordenados) - 1)]
+
+def dobles_reservas(db: DatabaseManager, desde: date, hasta: date) -> int:
+    """Horarios con más de una cita activa en el rango: debe ser cero"""
+    return len(db.consultar("""
+        SELECT fecha_cita, hora_cita FROM citas
+        WHERE fecha_cita BETWEEN %s AND %s AND estado <> 'cancelada'
+        GROUP BY fecha_cita, hora_cita HAVING COUNT(*) > 1
+    """, (desde, hasta)))
+
+def limpiar(db: DatabaseManager, desde: date) -> int:
+    """Borra las citas de la prueba (vehículos con placa de carga desde la fecha)"""
+    filas = db.consultar(f"""
+        DELETE FROM citas
+        WHERE fecha_cita >= %s
+        AND vehiculo_id IN (SELECT id FROM vehiculos WHERE placa LIKE '{PREFIJO_PLACA}%%')
+        RETURNING id
+    """, (desde,))
+    return len(filas)
+
+def imprimir(concurrencia: int, transcurrido: float, resultados: Resultados, dobles: int):
+    reservas = resultados.reservas
+    intentos = reservas['creada'] + reservas['conflicto'] + reservas['error']
+    print(f"\n== Concurrencia {concurrencia}: {resultados.flujos} flujos en {transcurrido:.1f}s "
+          f"({resultados.flujos / transcurrido:.1f} flujos/s)")
+    print(f"{'operación':<12}{'n':>7}{'ops/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for operacion, latencias in sorted(resultados.latencias.items()):
+        print(f"{operacion:<12}{len(latencias):>7}{len(latencias) / transcurrido:>9.1f}"
+              f"{percentil(latencias, 0.50) * 1000:>9.1f}{percentil(latencias, 0.95) * 1000:>9.1f}"
+              f"{percentil(latencias, 0.99) * 1000:>9.1f}")
+    if intentos:
+        print(f"Reservas: {reservas['creada']} creadas, {reservas['conflicto']} conflictos "
+              f"({reservas['conflicto'] * 100 / intentos:.1f}%), {reservas['error']} errores, "
+              f"{reservas['sin_horario']} sin horario libre")
+    print(f"Dobles reservas: {dobles}   errores: {len(resultados.errores)}")
+    for error in resultados.errores[:3]:
+        print(f"  {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de Taller AutoMax")
+    parser.add_argument('--via', choices=['servicios', 'api'], default='servicios')
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help="URL de la API (con --via api)")
+    parser.add_argument('--concurrencia', type=int, nargs='+', default=[5, 10, 20], help="Niveles de usuarios simultáneos")
+    parser.add_argument('--duracion', type=float, default=10, help="Segundos por nivel")
+    parser.add_argument('--pausa-ms', type=float, default=200, help="Pausa media entre flujos (exponencial)")
+    parser.add_argument('--mezcla', default='reserva=0.3,consulta=0.5,admin=0.2',
+                        help="Peso de cada flujo: reserva, consulta, admin")
+    parser.add_argument('--dias', type=int, default=5, help="Días hábiles con horarios en disputa por nivel")
+    parser.add_argument('--populares', type=int, default=3, help="Se reserva entre los primeros N horarios libres")
+    parser.add_argument('--pool', type=int, default=20, help="Conexiones del pool (con --via servicios)")
+    parser.add_argument('--desde', default=(date.today() + timedelta(days=random.randint(400, 4000))).isoformat(),
+                        help="Primera fecha de reservas (por defecto, una fecha lejana al azar)")
+    parser.add_argument('--limpiar', action='store_true', help="Borrar al final las citas creadas")
+    args = parser.parse_args()
+
+    mezcla = {}
+    for parte in args.mezcla.split(','):
+        flujo, _, peso = parte.partition('=')
+        if flujo.strip() not in ('reserva', 'consulta', 'admin'):
+            parser.error(f"Flujo desconocido en --mezcla: {flujo}")
+        mezcla[flujo.strip()] = float(peso or 1)
+
+    db = DatabaseManager(DB_CONFIG, maximo=args.pool)
+    via = ViaServicios(db) if args.via == 'servicios' else ViaApi(args.url)
+    desde = date.fromisoformat(args.desde)
+    semanas = args.dias // 5 + 1
+    print(f"Vía: {args.via}   mezcla: {mezcla}   pausa media: {args.pausa_ms:.0f} ms   desde: {desde}")
+
+    try:
+        for nivel, concurrencia in enumerate(args.concurrencia):
+            dias = dias_habiles(desde + timedelta(weeks=nivel * semanas), args.dias)
+            resultados = Resultados()
+            telefonos = []
+            fin = time.monotonic() + args.duracion
+            inicio = time.monotonic()
+            hilos = [
+                threading.Thread(target=usuario_virtual, args=(numero, via, args, dias, resultados, fin, mezcla, telefonos))
+                for numero in range(concurrencia)
+            ]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+            imprimir(concurrencia, time.monotonic() - inicio, resultados, dobles_reservas(db, dias[0], dias[-1]))
+    finally:
+        if args.limpiar:
+            print(f"\nCitas de prueba borradas: {limpiar(db, desde)}")
+        db.cerrar()
+
+if __name__ == "__main__":
+    main()
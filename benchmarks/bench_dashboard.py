@@ -0,0 +1,86 @@
+"""Benchmark de latencia de páginas con varias consultas: secuencial vs. paralelo
+
+Compara el Dashboard y Reportes ejecutando sus consultas una tras otra con
+taller.db (psycopg2) frente a lanzarlas en paralelo con taller.db_async
+(asyncpg). Con --retardo-ms cada consulta espera además ese tiempo en el
+servidor, para simular una base de datos remota o con carga.
+
+Uso:
+    python benchmarks/bench_dashboard.py --iteraciones 50 --retardo-ms 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from taller import reportes
+from taller.config import DB_CONFIG
+from taller.db import DatabaseManager
+from taller.db_async import AsyncDatabaseManager
+
+def con_retardo(consultas, retardo_ms: float):
+    """Antepone pg_sleep a cada consulta sin cambiar su resultado"""
+    if not retardo_ms:
+        return consultas
+    return {
+        nombre: (f"SELECT q.* FROM pg_sleep({retardo_ms / 1000.0}), ({query}) q", params)
+        for nombre, (query, params) in consultas.items()
+    }
+
+def resumen(nombre: str, tiempos):
+    print(f"{nombre:<22} media {statistics.mean(tiempos) * 1000:7.1f} ms   "
+          f"p50 {statistics.median(tiempos) * 1000:7.1f} ms   "
+          f"máx {max(tiempos) * 1000:7.1f} ms")
+
+async def medir_paralelo(adb: AsyncDatabaseManager, consultas, iteraciones: int):
+    await adb.consultar_varios(consultas)
+    tiempos = []
+    for _ in range(iteraciones):
+        inicio = time.perf_counter()
+        await adb.consultar_varios(consultas)
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+def medir_secuencial(db: DatabaseManager, consultas, iteraciones: int):
+    reportes.consultar_secuencial(db, consultas)
+    tiempos = []
+    for _ in range(iteraciones):
+        inicio = time.perf_counter()
+        reportes.consultar_secuencial(db, consultas)
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+async def principal(args):
+    hoy = date.today()
+    paginas = {
+        'Dashboard': con_retardo(reportes.consultas_dashboard(hoy), args.retardo_ms),
+        'Reportes': con_retardo(reportes.consultas_reportes(hoy), args.retardo_ms)
+    }
+
+    db = DatabaseManager(DB_CONFIG)
+    adb = AsyncDatabaseManager(DB_CONFIG)
+    try:
+        for pagina, consultas in paginas.items():
+            print(f"{pagina} ({len(consultas)} consultas, retardo {args.retardo_ms} ms por consulta)")
+            secuencial = medir_secuencial(db, consultas, args.iteraciones)
+            paralelo = await medir_paralelo(adb, consultas, args.iteraciones)
+            resumen("  secuencial (psycopg2)", secuencial)
+            resumen("  paralelo (asyncpg)", paralelo)
+            print(f"  reducción de latencia: {1 - statistics.median(paralelo) / statistics.median(secuencial):.0%}")
+    finally:
+        db.cerrar()
+        await adb.cerrar()
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia de páginas con varias consultas")
+    parser.add_argument('--iteraciones', type=int, default=50, help="Repeticiones por página")
+    parser.add_argument('--retardo-ms', type=float, default=0, help="Espera simulada por consulta en el servidor")
+    asyncio.run(principal(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
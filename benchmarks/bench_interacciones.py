@@ -0,0 +1,198 @@
+"""Benchmark del tiempo de servidor por interacción en la interfaz Streamlit
+
+Levanta la aplicación con `streamlit run` y la maneja por su websocket como
+lo haría el navegador: inicia sesión, abre el panel administrativo y pulsa
+repetidamente los botones de estado de una cita (Confirmar / Marcar
+Pendiente). Mide, para cada clic, el tiempo desde que se envía la
+interacción hasta que el servidor termina de ejecutar el script (o el
+fragmento) y cuántos elementos tuvo que volver a enviar.
+
+Para comparar antes y después, ejecútelo contra dos versiones de la app:
+    python benchmarks/bench_interacciones.py --clics 30
+    python benchmarks/bench_interacciones.py --app /ruta/version_anterior/taller_automotriz_app.py
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import aiohttp
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from taller import citas
+from taller.config import DB_CONFIG
+from taller.db import DatabaseManager
+
+FIN_DE_EJECUCION = (
+    ForwardMsg.ScriptFinishedStatus.FINISHED_SUCCESSFULLY,
+    ForwardMsg.ScriptFinishedStatus.FINISHED_FRAGMENT_RUN_SUCCESSFULLY,
+)
+
+def preparar_citas(cantidad: int):
+    """Asegura al menos `cantidad` citas en la ventana por defecto del panel (±7 días)"""
+    db = DatabaseManager(DB_CONFIG, maximo=2)
+    try:
+        hoy = date.today()
+        existentes = db.consultar(
+            "SELECT COUNT(*) AS total FROM citas WHERE fecha_cita BETWEEN %s AND %s",
+            (hoy - timedelta(days=7), hoy + timedelta(days=7))
+        )[0]['total']
+        servicio_id = citas.listar_servicios(db)[0]['id']
+        creadas = 0
+        dia = hoy + timedelta(days=1)
+        while existentes + creadas < cantidad and dia <= hoy + timedelta(days=7):
+            for hora in citas.horarios_disponibles(db, dia):
+                if existentes + creadas >= cantidad:
+                    break
+                n = existentes + creadas
+                citas.agendar_cita(
+                    db, nombre=f"Cliente Benchmark {n}", telefono=f"99900{n:04d}",
+                    marca="Toyota", modelo="Yaris", placa=f"BEN-{n:04d}", servicio_id=servicio_id,
+                    fecha_cita=dia, hora_cita=datetime.strptime(hora, '%H:%M').time()
+                )
+                creadas += 1
+            dia += timedelta(days=1)
+        return existentes + creadas
+    finally:
+        db.cerrar()
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+class ClienteStreamlit:
+    """Cliente mínimo del protocolo websocket de Streamlit"""
+
+    def __init__(self, ws):
+        self.ws = ws
+        # etiqueta o id -> (id del widget, id del fragmento)
+        self.widgets = {}
+
+    async def ejecutar(self, estados=(), fragmento: str = ""):
+        """Envía una ejecución y espera su fin; devuelve (segundos, elementos recibidos)"""
+        mensaje = BackMsg()
+        mensaje.rerun_script.widget_states.widgets.extend(estados)
+        mensaje.rerun_script.fragment_id = fragmento
+        inicio = time.perf_counter()
+        await self.ws.send_bytes(mensaje.SerializeToString())
+
+        elementos = 0
+        while True:
+            datos = await self.ws.receive_bytes(timeout=120)
+            recibido = ForwardMsg()
+            recibido.ParseFromString(datos)
+            tipo = recibido.WhichOneof('type')
+            if tipo == 'delta':
+                elementos += 1
+                self._registrar(recibido.delta)
+            elif tipo == 'script_finished' and recibido.script_finished in FIN_DE_EJECUCION:
+                return time.perf_counter() - inicio, elementos
+
+    def _registrar(self, delta):
+        if delta.WhichOneof('type') != 'new_element':
+            return
+        elemento = delta.new_element
+        tipo = elemento.WhichOneof('type')
+        widget = getattr(elemento, tipo, None) if tipo else None
+        if widget is not None and hasattr(widget, 'id') and widget.id:
+            self.widgets[widget.id] = (widget.id, delta.fragment_id)
+            if hasattr(widget, 'label'):
+                self.widgets.setdefault(widget.label, (widget.id, delta.fragment_id))
+
+    def buscar(self, texto: str):
+        """Primer widget cuyo id termina en el texto (las claves forman parte del id)"""
+        for clave, valor in self.widgets.items():
+            if clave.endswith(texto):
+                return valor
+        return None
+
+    async def pulsar(self, widget, extras=()):
+        """Pulsa un botón dado por etiqueta o por (id, fragmento)"""
+        widget_id, fragmento = self.widgets[widget] if isinstance(widget, str) else widget
+        estado = WidgetState(id=widget_id, trigger_value=True)
+        return await self.ejecutar([estado, *extras], fragmento)
+
+def texto(widget_id: str, valor: str) -> WidgetState:
+    return WidgetState(id=widget_id, string_value=valor)
+
+async def medir(args):
+    async with aiohttp.ClientSession() as sesion:
+        url = f"ws://127.0.0.1:{args.puerto}/_stcore/stream"
+        for _ in range(60):
+            try:
+                ws = await sesion.ws_connect(url, protocols=('streamlit',), max_msg_size=0)
+                break
+            except aiohttp.ClientError:
+                await asyncio.sleep(0.5)
+        else:
+            raise RuntimeError("La aplicación no respondió")
+
+        cliente = ClienteStreamlit(ws)
+        await cliente.ejecutar()
+        await cliente.pulsar("🔐 Acceso Administrativo")
+        usuario, _ = cliente.widgets["Usuario:"]
+        clave, _ = cliente.widgets["Contraseña:"]
+        await cliente.pulsar("Iniciar Sesión", [texto(usuario, args.usuario), texto(clave, args.password)])
+        carga, elementos_pagina = await cliente.ejecutar()
+        await cliente.pulsar("👨‍💼 Panel Administrativo")
+        carga, elementos_pagina = await cliente.ejecutar()
+
+        # Una cita no confirmada: se alterna Confirmar / Marcar Pendiente para repetir el clic
+        confirmar = next((widget_id for widget_id in cliente.widgets if '-conf_' in widget_id), None)
+        if not confirmar:
+            raise RuntimeError("No hay citas en el panel; use --citas para crearlas")
+        cita_id = confirmar.rsplit('_', 1)[1]
+
+        tiempos, elementos = [], []
+        for i in range(args.clics):
+            boton = cliente.buscar(f"conf_{cita_id}" if i % 2 == 0 else f"pend_{cita_id}")
+            segundos, enviados = await cliente.pulsar(boton)
+            tiempos.append(segundos)
+            elementos.append(enviados)
+        await ws.close()
+        return carga, elementos_pagina, tiempos, elementos
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de servidor por interacción en Streamlit")
+    parser.add_argument('--app', default=os.path.join(RAIZ, 'taller_automotriz_app.py'), help="Script de la aplicación")
+    parser.add_argument('--clics', type=int, default=30, help="Clics de cambio de estado a medir")
+    parser.add_argument('--citas', type=int, default=40, help="Citas mínimas en el panel (se crean si faltan)")
+    parser.add_argument('--usuario', default='admin')
+    parser.add_argument('--password', default='admin123')
+    args = parser.parse_args()
+
+    print(f"Citas en el panel: {preparar_citas(args.citas)}")
+    args.puerto = puerto_libre()
+    servidor = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', args.app, '--server.headless', 'true',
+         '--server.port', str(args.puerto), '--server.enableXsrfProtection', 'false',
+         '--browser.gatherUsageStats', 'false'],
+        cwd=os.path.dirname(os.path.abspath(args.app)),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        carga, elementos_pagina, tiempos, elementos = asyncio.run(medir(args))
+    finally:
+        servidor.terminate()
+        servidor.wait()
+
+    print(f"Carga completa del panel: {carga * 1000:.1f} ms, {elementos_pagina} elementos")
+    print(f"Cambio de estado ({len(tiempos)} clics): "
+          f"p50 {statistics.median(tiempos) * 1000:.1f} ms   "
+          f"media {statistics.mean(tiempos) * 1000:.1f} ms   "
+          f"máx {max(tiempos) * 1000:.1f} ms   "
+          f"elementos reenviados p50 {statistics.median(elementos):.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Benchmark del envío de recordatorios en lote
+
+Genera N citas sintéticas, arma sus mensajes con taller.recordatorios y los
+envía por el transporte elegido a distintos niveles de concurrencia:
+- smtp: un servidor SMTP local en otro proceso.
+- archivo: JSON por línea en un archivo temporal.
+- nulo: no envía nada y solo mide el costo propio.
+
+Con --latencia-ms cada envío espera además ese tiempo, como lo haría un
+proveedor real, para ver cuánto aporta el paralelismo:
+    python benchmarks/bench_recordatorios.py --citas 5000 --concurrencia 1 10 50 --latencia-ms 50
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, time as dtime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from taller import recordatorios
+
+class TransporteNulo(recordatorios.Transporte):
+    """Descarta los mensajes tras la latencia simulada"""
+
+    def __init__(self, latencia: float):
+        self.latencia = latencia
+
+    def enviar(self, mensaje):
+        if self.latencia:
+            time.sleep(self.latencia)
+
+class ConLatencia(recordatorios.Transporte):
+    """Agrega la latencia de un proveedor remoto a otro transporte"""
+
+    def __init__(self, transporte: recordatorios.Transporte, latencia: float):
+        self.transporte = transporte
+        self.latencia = latencia
+
+    def enviar(self, mensaje):
+        time.sleep(self.latencia)
+        self.transporte.enviar(mensaje)
+
+    def cerrar(self):
+        self.transporte.cerrar()
+
+def citas_sinteticas(cantidad: int):
+    """Filas con la forma que devuelve recordatorios.reclamar (mitad email, mitad SMS)"""
+    fecha = date.today() + timedelta(days=1)
+    return [{
+        'cita_id': numero, 'fecha_cita': fecha, 'hora_cita': dtime(8 + numero % 10, 30 * (numero % 2)),
+        'nombre': f"Cliente {numero}", 'telefono': f"9{numero:08d}", 'email': f"cliente{numero}@correo.com",
+        'marca': 'Toyota', 'modelo': 'Corolla', 'placa': f"ABC-{numero % 1000:03d}", 'servicio': 'Cambio de Aceite',
+        'canal': 'email' if numero % 2 else 'sms',
+        'destino': f"cliente{numero}@correo.com" if numero % 2 else f"9{numero:08d}"
+    } for numero in range(1, cantidad + 1)]
+
+def crear_transportes(tipo: str, puerto: int, directorio: str, latencia: float):
+    if tipo == 'nulo':
+        return {'email': TransporteNulo(latencia), 'sms': TransporteNulo(latencia)}
+    sms = recordatorios.TransporteArchivo(os.path.join(directorio, 'sms.jsonl'))
+    if tipo == 'smtp':
+        email = recordatorios.TransporteSMTP('127.0.0.1', puerto, 'Taller AutoMax <citas@tallerautomax.com>')
+    else:
+        email = recordatorios.TransporteArchivo(os.path.join(directorio, 'email.jsonl'))
+    if latencia:
+        return {'email': ConLatencia(email, latencia), 'sms': ConLatencia(sms, latencia)}
+    return {'email': email, 'sms': sms}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del envío de recordatorios en lote")
+    parser.add_argument('--citas', type=int, default=3000, help="Recordatorios por ejecución")
+    parser.add_argument('--concurrencia', type=int, nargs='+', default=[1, 5, 20], help="Envíos en paralelo")
+    parser.add_argument('--transporte', choices=['smtp', 'archivo', 'nulo'], default='smtp')
+    parser.add_argument('--latencia-ms', type=float, default=0, help="Latencia simulada por envío")
+    parser.add_argument('--por-segundo', type=float, default=0, help="Límite de envíos por segundo (0 sin límite)")
+    parser.add_argument('--puerto', type=int, default=1026, help="Puerto del servidor SMTP local")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix='bench_recordatorios_')
+    servidor = None
+    if args.transporte == 'smtp':
+        # En otro proceso: el servidor no compite por el GIL con los hilos que envían
+        servidor = subprocess.Popen(
+            [sys.executable, '-m', 'taller.recordatorios', '--smtp-local', str(args.puerto)],
+            cwd=directorio, stdout=subprocess.DEVNULL,
+            env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        )
+        time.sleep(1)
+
+    try:
+        filas = citas_sinteticas(args.citas)
+        inicio = time.perf_counter()
+        mensajes = recordatorios.renderizar(filas)
+        print(f"Renderizado de {len(mensajes)} mensajes: {(time.perf_counter() - inicio) * 1000:.1f} ms")
+
+        for concurrencia in args.concurrencia:
+            transportes = crear_transportes(args.transporte, args.puerto, directorio, args.latencia_ms / 1000)
+            inicio = time.perf_counter()
+            resultados = recordatorios.enviar_lote(mensajes, transportes, concurrencia, args.por_segundo)
+            segundos = time.perf_counter() - inicio
+            for transporte in transportes.values():
+                transporte.cerrar()
+            fallidos = sum(1 for _, estado, _ in resultados if estado == 'fallido')
+            print(f"concurrencia {concurrencia:>3}: {segundos:7.2f} s   {len(mensajes) / segundos:8.0f} mensajes/s   "
+                  f"fallidos {fallidos}")
+    finally:
+        if servidor:
+            servidor.terminate()
+
+if __name__ == "__main__":
+    main()
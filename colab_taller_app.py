@@ -2,7 +2,7 @@
 # Ejecutar cada celda en orden
 
 # ===== CELDA 1: INSTALACIÓN DE DEPENDENCIAS =====
-!pip install streamlit pyngrok sqlite3 pandas plotly folium streamlit-folium -q
+!pip install streamlit pyngrok sqlite3 pandas plotly folium -q
 
 # ===== CELDA 2: CONFIGURACIÓN DE ARCHIVOS =====
 import os
@@ -20,12 +20,12 @@ os.chdir('/content/taller_app')
 app_code = '''
 import streamlit as st
 import sqlite3
-import pandas as pd
 from datetime import datetime, date, timedelta
 import hashlib
-import folium
-from streamlit_folium import st_folium
-import plotly.express as px
+import threading
+import time
+import uuid
+import streamlit.components.v1 as components
 from typing import Dict, List, Optional, Tuple
 import os
 
@@ -37,9 +37,18 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Tiempo límite por clase de consulta en segundos (0 sin límite), reportes simultáneos
+# y segundos que un reporte espera turno antes de rechazarse
+TIEMPOS_LIMITE = {'general': 0, 'busqueda': 2, 'reporte': 15}
+MAX_REPORTES = 2
+ESPERA_REPORTES = 5
+MIN_DIGITOS_TELEFONO = 6
+
 class DatabaseManager:
     def __init__(self, db_path="taller.db"):
         self.db_path = db_path
+        # Compartido por todas las sesiones: la instancia vive en st.cache_resource
+        self._reportes = threading.BoundedSemaphore(MAX_REPORTES)
         self.init_database()
     
     def get_connection(self):
@@ -50,14 +59,30 @@ class DatabaseManager:
             st.error(f"Error conectando a la base de datos: {e}")
             return None
     
-    def execute_query(self, query: str, params: tuple = None):
-        """Ejecuta una consulta SQL"""
+    def execute_query(self, query: str, params: tuple = None, clase: str = 'general'):
+        """Ejecuta una consulta SQL; los reportes esperan turno entre los MAX_REPORTES simultáneos"""
+        if clase != 'reporte':
+            return self._ejecutar(query, params, TIEMPOS_LIMITE[clase])
+        if not self._reportes.acquire(timeout=ESPERA_REPORTES):
+            st.warning("Hay muchos reportes en curso; intente de nuevo en unos segundos")
+            return None
+        try:
+            return self._ejecutar(query, params, TIEMPOS_LIMITE[clase])
+        finally:
+            self._reportes.release()
+    
+    def _ejecutar(self, query: str, params: tuple, limite: float):
+        """Ejecuta la consulta interrumpiéndola si pasa de `limite` segundos"""
         conn = self.get_connection()
         if not conn:
             return None
         
         try:
             conn.row_factory = sqlite3.Row
+            if limite:
+                vence = time.monotonic() + limite
+                # SQLite llama al manejador cada 10 000 instrucciones; devolver True interrumpe la sentencia
+                conn.set_progress_handler(lambda: time.monotonic() > vence, 10000)
             cursor = conn.cursor()
             
             if params:
@@ -72,6 +97,13 @@ class DatabaseManager:
                 conn.commit()
             
             return result
+        except sqlite3.OperationalError as e:
+            if str(e) == 'interrupted':
+                st.error(f"La consulta superó su tiempo límite ({limite} s) y se canceló")
+            else:
+                st.error(f"Error ejecutando consulta: {e}")
+            conn.rollback()
+            return None
         except Exception as e:
             st.error(f"Error ejecutando consulta: {e}")
             conn.rollback()
@@ -79,6 +111,95 @@ class DatabaseManager:
         finally:
             conn.close()
     
+    def registrar_movimiento(self, item_id: int, delta: int, tipo: str, motivo: str = None, usuario: str = None):
+        """Aplica un delta atómico al stock y lo registra en el libro de movimientos"""
+        conn = self.get_connection()
+        if not conn:
+            return None
+        
+        try:
+            cursor = conn.cursor()
+            # BEGIN IMMEDIATE toma el bloqueo de escritura antes de leer el saldo
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(
+                "UPDATE inventario SET cantidad_actual = cantidad_actual + ? WHERE id = ? AND cantidad_actual + ? >= 0",
+                (delta, item_id, delta)
+            )
+            
+            if cursor.rowcount == 0:
+                conn.rollback()
+                st.error("Stock insuficiente o item inexistente.")
+                return None
+            
+            saldo = cursor.execute("SELECT cantidad_actual FROM inventario WHERE id = ?", (item_id,)).fetchone()[0]
+            cursor.execute(
+                "INSERT INTO inventario_movimientos (item_id, delta, saldo_resultante, tipo, motivo, usuario) VALUES (?, ?, ?, ?, ?, ?)",
+                (item_id, delta, saldo, tipo, motivo, usuario)
+            )
+            conn.commit()
+            return saldo
+        except Exception as e:
+            st.error(f"Error registrando movimiento: {e}")
+            conn.rollback()
+            return None
+        finally:
+            conn.close()
+    
+    def agendar_cita(self, clave: str, cliente: tuple, vehiculo: tuple, cita: tuple) -> Optional[Tuple[int, bool]]:
+        """Registra cliente, vehículo y cita en una transacción; devuelve (cita_id, repetida)
+        
+        Si la clave de idempotencia ya se usó, devuelve la cita original sin escribir nada más.
+        """
+        conn = self.get_connection()
+        if not conn:
+            return None
+        
+        try:
+            cursor = conn.cursor()
+            # BEGIN IMMEDIATE serializa las reservas: clave y horario se verifican sin carreras
+            cursor.execute("BEGIN IMMEDIATE")
+            original = cursor.execute("SELECT cita_id FROM reservas_idempotencia WHERE clave = ?", (clave,)).fetchone()
+            if original:
+                conn.rollback()
+                return original[0], True
+            
+            servicio_id, fecha_cita, hora_cita, observaciones = cita
+            if cursor.execute(
+                "SELECT 1 FROM citas WHERE fecha_cita = ? AND hora_cita = ? AND estado != 'cancelada'",
+                (fecha_cita, hora_cita)
+            ).fetchone():
+                conn.rollback()
+                st.error("El horario seleccionado ya está ocupado.")
+                return None
+            
+            cursor.execute("INSERT INTO clientes (nombre, telefono, email, direccion) VALUES (?, ?, ?, ?)", cliente)
+            cliente_id = cursor.lastrowid
+            cursor.execute(
+                "INSERT INTO vehiculos (cliente_id, marca, modelo, año, placa, color) VALUES (?, ?, ?, ?, ?, ?)",
+                (cliente_id,) + vehiculo
+            )
+            vehiculo_id = cursor.lastrowid
+            cursor.execute(
+                "INSERT INTO citas (cliente_id, vehiculo_id, servicio_id, fecha_cita, hora_cita, observaciones) VALUES (?, ?, ?, ?, ?, ?)",
+                (cliente_id, vehiculo_id) + cita
+            )
+            cita_id = cursor.lastrowid
+            cursor.execute("INSERT INTO reservas_idempotencia (clave, cita_id) VALUES (?, ?)", (clave, cita_id))
+            # Las claves vencen al día; el índice de created_at hace barata la purga
+            cursor.execute("DELETE FROM reservas_idempotencia WHERE created_at < datetime('now', '-1 day')")
+            cursor.execute("DELETE FROM citas_cambios WHERE created_at < datetime('now', '-1 day')")
+            conn.commit()
+            return cita_id, False
+        except Exception as e:
+            conn.rollback()
+            if "UNIQUE constraint failed" in str(e):
+                st.error("La placa del vehículo ya está registrada.")
+            else:
+                st.error(f"Error al agendar la cita: {e}")
+            return None
+        finally:
+            conn.close()
+    
     def init_database(self):
         """Inicializa la base de datos con tablas y datos"""
         conn = self.get_connection()
@@ -156,6 +277,85 @@ class DatabaseManager:
                 categoria TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
+            
+            -- Movimientos de inventario (libro de solo inserción)
+            CREATE TABLE IF NOT EXISTS inventario_movimientos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                item_id INTEGER NOT NULL REFERENCES inventario(id),
+                delta INTEGER NOT NULL,
+                saldo_resultante INTEGER NOT NULL,
+                tipo TEXT NOT NULL CHECK (tipo IN ('inicial', 'entrada', 'consumo', 'ajuste')),
+                motivo TEXT,
+                usuario TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            
+            CREATE INDEX IF NOT EXISTS idx_movimientos_item_fecha ON inventario_movimientos(item_id, created_at, id);
+            
+            -- Claves de idempotencia de reservas: un reintento devuelve la cita original
+            CREATE TABLE IF NOT EXISTS reservas_idempotencia (
+                clave TEXT PRIMARY KEY,
+                cita_id INTEGER REFERENCES citas(id),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            
+            CREATE INDEX IF NOT EXISTS idx_reservas_idempotencia_fecha ON reservas_idempotencia(created_at);
+            
+            -- Registro de cambios de citas: el calendario lo lee con un cursor (último id visto)
+            CREATE TABLE IF NOT EXISTS citas_cambios (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                cita_id INTEGER NOT NULL,
+                fecha_cita DATE,
+                fecha_anterior DATE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            
+            CREATE INDEX IF NOT EXISTS idx_citas_cambios_fecha ON citas_cambios(created_at);
+            
+            CREATE TRIGGER IF NOT EXISTS tr_citas_cambios_alta
+            AFTER INSERT ON citas
+            BEGIN
+                INSERT INTO citas_cambios (cita_id, fecha_cita) VALUES (NEW.id, NEW.fecha_cita);
+            END;
+            
+            CREATE TRIGGER IF NOT EXISTS tr_citas_cambios_edicion
+            AFTER UPDATE ON citas
+            BEGIN
+                INSERT INTO citas_cambios (cita_id, fecha_cita, fecha_anterior) VALUES (NEW.id, NEW.fecha_cita, OLD.fecha_cita);
+            END;
+            
+            CREATE TRIGGER IF NOT EXISTS tr_citas_cambios_baja
+            AFTER DELETE ON citas
+            BEGIN
+                INSERT INTO citas_cambios (cita_id, fecha_anterior) VALUES (OLD.id, OLD.fecha_cita);
+            END;
+            
+            -- Saldo inicial de cada item nuevo
+            CREATE TRIGGER IF NOT EXISTS tr_movimiento_inicial
+            AFTER INSERT ON inventario
+            BEGIN
+                INSERT INTO inventario_movimientos (item_id, delta, saldo_resultante, tipo, motivo)
+                VALUES (NEW.id, COALESCE(NEW.cantidad_actual, 0), COALESCE(NEW.cantidad_actual, 0), 'inicial', 'Saldo inicial');
+            END;
+            
+            -- El libro es de solo inserción: las correcciones se registran como ajustes
+            CREATE TRIGGER IF NOT EXISTS tr_movimientos_sin_actualizar
+            BEFORE UPDATE ON inventario_movimientos
+            BEGIN
+                SELECT RAISE(ABORT, 'inventario_movimientos es de solo inserción; registre un ajuste');
+            END;
+            
+            CREATE TRIGGER IF NOT EXISTS tr_movimientos_sin_borrar
+            BEFORE DELETE ON inventario_movimientos
+            BEGIN
+                SELECT RAISE(ABORT, 'inventario_movimientos es de solo inserción; registre un ajuste');
+            END;
+            
+            -- Saldo inicial de los items creados antes del libro
+            INSERT INTO inventario_movimientos (item_id, delta, saldo_resultante, tipo, motivo)
+            SELECT i.id, COALESCE(i.cantidad_actual, 0), COALESCE(i.cantidad_actual, 0), 'inicial', 'Saldo inicial'
+            FROM inventario i
+            WHERE NOT EXISTS (SELECT 1 FROM inventario_movimientos m WHERE m.item_id = i.id);
             """)
             
             # Insertar datos iniciales si no existen
@@ -210,6 +410,30 @@ def get_database():
 
 db = get_database()
 
+# Datos de referencia compartidos por todas las sesiones; cada escritura de la app
+# en esas tablas limpia su caché (SQLite no tiene NOTIFY y solo escribe este proceso)
+@st.cache_data(ttl=300, max_entries=16, show_spinner=False)
+def servicios_activos():
+    return db.execute_query(
+        "SELECT id, nombre, descripcion, precio, duracion_minutos FROM servicios WHERE activo = 1 ORDER BY nombre"
+    )
+
+@st.cache_data(ttl=300, max_entries=16, show_spinner=False)
+def categorias_inventario():
+    filas = db.execute_query(
+        "SELECT DISTINCT categoria FROM inventario WHERE categoria IS NOT NULL ORDER BY categoria"
+    )
+    return [fila['categoria'] for fila in filas] if filas is not None else None
+
+def leer_catalogo(funcion):
+    """Lee de la caché sin guardar un fallo de la base de datos hasta el TTL"""
+    resultado = funcion()
+    if resultado is None:
+        funcion.clear()
+    return resultado
+
+NUEVA_CATEGORIA = "➕ Nueva categoría"
+
 def hash_password(password: str) -> str:
     """Genera hash SHA-256 de la contraseña"""
     return hashlib.sha256(password.encode()).hexdigest()
@@ -223,6 +447,39 @@ def authenticate_user(username: str, password: str) -> bool:
     )
     return len(result) > 0 if result else False
 
+# Coordenadas de San Isidro, Lima
+TALLER_UBICACION = (-12.0931, -77.0465)
+TALLER_DIRECCION = "Av. Principal 123, San Isidro"
+
+def url_mapa_estatico(lat: float, lon: float, margen: float = 0.006) -> str:
+    """Mapa embebido de OpenStreetMap: lo carga el navegador sin trabajo en el servidor"""
+    bbox = f"{lon - margen},{lat - margen / 2},{lon + margen},{lat + margen / 2}"
+    return f"https://www.openstreetmap.org/export/embed.html?bbox={bbox}&layer=mapnik&marker={lat},{lon}"
+
+@st.cache_resource
+def mapa_interactivo_html() -> str:
+    """HTML del mapa de Folium, construido una sola vez por proceso"""
+    import folium
+    lat, lon = TALLER_UBICACION
+    m = folium.Map(location=[lat, lon], zoom_start=15)
+    folium.Marker(
+        [lat, lon],
+        popup=f"Taller AutoMax<br>{TALLER_DIRECCION}",
+        tooltip="Taller AutoMax",
+        icon=folium.Icon(color='red', icon='wrench', prefix='fa')
+    ).add_to(m)
+    return m.get_root().render()
+
+@st.fragment
+def mapa_ubicacion():
+    """Vista estática ligera; el mapa interactivo se carga solo si el usuario lo pide"""
+    lat, lon = TALLER_UBICACION
+    if st.toggle("🗺️ Mapa interactivo"):
+        components.html(mapa_interactivo_html(), height=300)
+    else:
+        components.iframe(url_mapa_estatico(lat, lon), height=300)
+    st.markdown(f"[Cómo llegar](https://www.google.com/maps?q={lat},{lon}) · {TALLER_DIRECCION}")
+
 def show_home_page():
     """Página de inicio"""
     st.title("🔧 Taller AutoMax")
@@ -271,19 +528,7 @@ def show_home_page():
     
     # Mapa de ubicación
     st.markdown("### 📍 Nuestra Ubicación")
-    
-    # Coordenadas de San Isidro, Lima
-    lat, lon = -12.0931, -77.0465
-    
-    m = folium.Map(location=[lat, lon], zoom_start=15)
-    folium.Marker(
-        [lat, lon],
-        popup="Taller AutoMax<br>Av. Principal 123, San Isidro",
-        tooltip="Taller AutoMax",
-        icon=folium.Icon(color='red', icon='wrench', prefix='fa')
-    ).add_to(m)
-    
-    st_folium(m, width=700, height=300)
+    mapa_ubicacion()
     
     # Botón para agendar cita
     st.markdown("---")
@@ -297,9 +542,9 @@ def show_services_page():
     """Página de servicios"""
     st.title("🛠️ Nuestros Servicios")
     
-    servicios = db.execute_query(
-        "SELECT nombre, descripcion, precio, duracion_minutos FROM servicios WHERE activo = 1 ORDER BY precio"
-    )
+    servicios = leer_catalogo(servicios_activos)
+    if servicios:
+        servicios = sorted(servicios, key=lambda s: s['precio'])
     
     if servicios:
         for servicio in servicios:
@@ -320,6 +565,66 @@ def show_services_page():
     else:
         st.warning("No se pudieron cargar los servicios.")
 
+@st.fragment
+def mis_citas():
+    """Búsqueda de citas por teléfono; se recarga sin reconstruir el resto de la página"""
+    st.subheader("Consultar Citas por Teléfono")
+    
+    telefono_buscar = st.text_input("Ingresa tu número de teléfono:", help=f"Al menos {MIN_DIGITOS_TELEFONO} dígitos").strip()
+    
+    # Con pocos dígitos casi todos los clientes coinciden y la búsqueda recorre todas las citas
+    if telefono_buscar and sum(caracter.isdigit() for caracter in telefono_buscar) < MIN_DIGITOS_TELEFONO:
+        st.info(f"Ingrese al menos {MIN_DIGITOS_TELEFONO} dígitos del teléfono")
+    elif telefono_buscar:
+        citas = db.execute_query("""
+            SELECT 
+                c.id, c.fecha_cita, c.hora_cita, c.estado, c.observaciones,
+                cl.nombre as cliente_nombre, cl.telefono as cliente_telefono,
+                v.marca || ' ' || v.modelo || ' (' || v.placa || ')' as vehiculo_info,
+                s.nombre as servicio_nombre, s.precio as servicio_precio, s.duracion_minutos
+            FROM citas c
+            JOIN clientes cl ON c.cliente_id = cl.id
+            JOIN vehiculos v ON c.vehiculo_id = v.id
+            JOIN servicios s ON c.servicio_id = s.id
+            WHERE instr(cl.telefono, ?) > 0
+            ORDER BY c.fecha_cita DESC, c.hora_cita
+            LIMIT 50
+        """, (telefono_buscar,), clase='busqueda')
+        
+        if citas:
+            for cita in citas:
+                with st.expander(f"Cita #{cita['id']} - {cita['fecha_cita']} {cita['hora_cita']}"):
+                    col1, col2 = st.columns(2)
+                    
+                    with col1:
+                        st.write(f"**Cliente:** {cita['cliente_nombre']}")
+                        st.write(f"**Vehículo:** {cita['vehiculo_info']}")
+                        st.write(f"**Servicio:** {cita['servicio_nombre']}")
+                    
+                    with col2:
+                        st.write(f"**Estado:** {cita['estado'].title()}")
+                        st.write(f"**Precio:** S/ {cita['servicio_precio']:.2f}")
+                        st.write(f"**Duración:** {cita['duracion_minutos']} min")
+                    
+                    if cita['observaciones']:
+                        st.write(f"**Observaciones:** {cita['observaciones']}")
+                    
+                    if cita['estado'] == 'pendiente':
+                        col_btn1, col_btn2 = st.columns(2)
+                        with col_btn1:
+                            if st.button(f"Confirmar #{cita['id']}", type="primary"):
+                                db.execute_query("UPDATE citas SET estado = 'confirmada' WHERE id = ?", (cita['id'],))
+                                st.toast("Cita confirmada")
+                                st.rerun(scope="fragment")
+                        
+                        with col_btn2:
+                            if st.button(f"Cancelar #{cita['id']}", type="secondary"):
+                                db.execute_query("UPDATE citas SET estado = 'cancelada' WHERE id = ?", (cita['id'],))
+                                st.toast("Cita cancelada")
+                                st.rerun(scope="fragment")
+        else:
+            st.info("No se encontraron citas con ese número de teléfono.")
+
 def show_appointments_page():
     """Página de citas"""
     st.title("📅 Gestión de Citas")
@@ -349,7 +654,7 @@ def show_appointments_page():
             
             st.markdown("**Detalles de la Cita**")
             
-            servicios = db.execute_query("SELECT id, nombre, precio FROM servicios WHERE activo = 1 ORDER BY nombre")
+            servicios = leer_catalogo(servicios_activos)
             if servicios:
                 servicio_options = {f"{s['nombre']} - S/ {s['precio']:.2f}": s['id'] for s in servicios}
                 servicio_seleccionado = st.selectbox("Servicio*", options=list(servicio_options.keys()))
@@ -373,95 +678,27 @@ def show_appointments_page():
                 if not all([nombre_cliente, telefono, marca, modelo, placa]) or not servicio_id:
                     st.error("Por favor completa todos los campos obligatorios (*)")
                 else:
-                    try:
-                        # Verificar disponibilidad
-                        cita_existente = db.execute_query(
-                            "SELECT id FROM citas WHERE fecha_cita = ? AND hora_cita = ? AND estado != 'cancelada'",
-                            (str(fecha_cita), hora_cita)
-                        )
-                        
-                        if cita_existente:
-                            st.error("El horario seleccionado ya está ocupado.")
+                    cliente = (nombre_cliente, telefono, email, direccion)
+                    vehiculo = (marca, modelo, año, placa, color)
+                    cita = (servicio_id, str(fecha_cita), hora_cita, observaciones)
+                    # Doble clic o reenvío: misma instancia del formulario y mismos datos, misma clave
+                    instancia = st.session_state.setdefault('_form_reserva', uuid.uuid4().hex)
+                    clave = hashlib.sha256(f"{instancia}|{cliente + vehiculo + cita!r}".encode()).hexdigest()
+                    
+                    reserva = db.agendar_cita(clave, cliente, vehiculo, cita)
+                    if reserva:
+                        cita_id, repetida = reserva
+                        if repetida:
+                            st.info(f"Esta cita ya estaba registrada. Número de cita: {cita_id}")
                         else:
-                            # Crear cliente
-                            cliente_id = db.execute_query(
-                                "INSERT INTO clientes (nombre, telefono, email, direccion) VALUES (?, ?, ?, ?)",
-                                (nombre_cliente, telefono, email, direccion)
-                            )
-                            
-                            # Crear vehículo
-                            vehiculo_id = db.execute_query(
-                                "INSERT INTO vehiculos (cliente_id, marca, modelo, año, placa, color) VALUES (?, ?, ?, ?, ?, ?)",
-                                (cliente_id, marca, modelo, año, placa, color)
-                            )
-                            
-                            # Crear cita
-                            cita_id = db.execute_query(
-                                "INSERT INTO citas (cliente_id, vehiculo_id, servicio_id, fecha_cita, hora_cita, observaciones) VALUES (?, ?, ?, ?, ?, ?)",
-                                (cliente_id, vehiculo_id, servicio_id, str(fecha_cita), hora_cita, observaciones)
-                            )
-                            
                             st.success(f"¡Cita agendada exitosamente! Número de cita: {cita_id}")
-                            
-                    except Exception as e:
-                        if "UNIQUE constraint failed" in str(e):
-                            st.error("La placa del vehículo ya está registrada.")
-                        else:
-                            st.error(f"Error al agendar la cita: {e}")
+                        st.session_state._reserva_registrada = True
+            elif st.session_state.pop('_reserva_registrada', False):
+                # La siguiente ejecución sin envío abre una instancia nueva del formulario
+                st.session_state._form_reserva = uuid.uuid4().hex
     
     with tab2:
-        st.subheader("Consultar Citas por Teléfono")
-        
-        telefono_buscar = st.text_input("Ingresa tu número de teléfono:")
-        
-        if telefono_buscar:
-            citas = db.execute_query("""
-                SELECT 
-                    c.id, c.fecha_cita, c.hora_cita, c.estado, c.observaciones,
-                    cl.nombre as cliente_nombre, cl.telefono as cliente_telefono,
-                    v.marca || ' ' || v.modelo || ' (' || v.placa || ')' as vehiculo_info,
-                    s.nombre as servicio_nombre, s.precio as servicio_precio, s.duracion_minutos
-                FROM citas c
-                JOIN clientes cl ON c.cliente_id = cl.id
-                JOIN vehiculos v ON c.vehiculo_id = v.id
-                JOIN servicios s ON c.servicio_id = s.id
-                WHERE cl.telefono LIKE ?
-                ORDER BY c.fecha_cita DESC, c.hora_cita
-            """, (f"%{telefono_buscar}%",))
-            
-            if citas:
-                for cita in citas:
-                    with st.expander(f"Cita #{cita['id']} - {cita['fecha_cita']} {cita['hora_cita']}"):
-                        col1, col2 = st.columns(2)
-                        
-                        with col1:
-                            st.write(f"**Cliente:** {cita['cliente_nombre']}")
-                            st.write(f"**Vehículo:** {cita['vehiculo_info']}")
-                            st.write(f"**Servicio:** {cita['servicio_nombre']}")
-                        
-                        with col2:
-                            st.write(f"**Estado:** {cita['estado'].title()}")
-                            st.write(f"**Precio:** S/ {cita['servicio_precio']:.2f}")
-                            st.write(f"**Duración:** {cita['duracion_minutos']} min")
-                        
-                        if cita['observaciones']:
-                            st.write(f"**Observaciones:** {cita['observaciones']}")
-                        
-                        if cita['estado'] == 'pendiente':
-                            col_btn1, col_btn2 = st.columns(2)
-                            with col_btn1:
-                                if st.button(f"Confirmar #{cita['id']}", type="primary"):
-                                    db.execute_query("UPDATE citas SET estado = 'confirmada' WHERE id = ?", (cita['id'],))
-                                    st.success("Cita confirmada")
-                                    st.rerun()
-                            
-                            with col_btn2:
-                                if st.button(f"Cancelar #{cita['id']}", type="secondary"):
-                                    db.execute_query("UPDATE citas SET estado = 'cancelada' WHERE id = ?", (cita['id'],))
-                                    st.success("Cita cancelada")
-                                    st.rerun()
-            else:
-                st.info("No se encontraron citas con ese número de teléfono.")
+        mis_citas()
     
     with tab3:
         st.subheader("Consultar Cita por ID")
@@ -520,6 +757,7 @@ def show_appointments_page():
 
 def show_inventory_page():
     """Página de inventario"""
+    import pandas as pd
     st.title("📦 Inventario")
     
     tab1, tab2, tab3 = st.tabs(["Ver Inventario", "Agregar Item", "Stock Bajo"])
@@ -584,7 +822,8 @@ def show_inventory_page():
             with col1:
                 nombre = st.text_input("Nombre del Item*")
                 descripcion = st.text_area("Descripción")
-                categoria = st.text_input("Categoría*")
+                categoria = st.selectbox("Categoría*", (leer_catalogo(categorias_inventario) or []) + [NUEVA_CATEGORIA])
+                nueva_categoria = st.text_input("Nueva categoría", help=f"Solo si eligió «{NUEVA_CATEGORIA}»")
             
             with col2:
                 cantidad_actual = st.number_input("Cantidad Actual", min_value=0, value=0)
@@ -594,6 +833,8 @@ def show_inventory_page():
             submitted = st.form_submit_button("Agregar Item", type="primary")
             
             if submitted:
+                if categoria == NUEVA_CATEGORIA:
+                    categoria = nueva_categoria.strip()
                 if not all([nombre, categoria]):
                     st.error("Por favor completa todos los campos obligatorios (*)")
                 else:
@@ -603,6 +844,7 @@ def show_inventory_page():
                     """, (nombre, descripcion, cantidad_actual, cantidad_minima, precio_unitario, categoria))
                     
                     if result:
+                        categorias_inventario.clear()
                         st.success(f"Item agregado exitosamente con ID: {result}")
                     else:
                         st.error("Error al agregar el item.")
@@ -633,290 +875,360 @@ def show_inventory_page():
                         st.metric("Stock Actual", item['cantidad_actual'])
                         st.metric("Stock Mínimo", item['cantidad_minima'])
                         
-                        nueva_cantidad = st.number_input(
-                            f"Nueva cantidad para {item['nombre']}", 
-                            min_value=0, 
-                            value=item['cantidad_actual'],
+                        cantidad_recibida = st.number_input(
+                            f"Cantidad recibida de {item['nombre']}", 
+                            min_value=1, 
+                            value=max(item['deficit'], 1),
                             key=f"stock_{item['id']}"
                         )
                         
-                        if st.button(f"Actualizar Stock", key=f"btn_{item['id']}"):
-                            if db.execute_query("UPDATE inventario SET cantidad_actual = ? WHERE id = ?", (nueva_cantidad, item['id'])):
+                        if st.button(f"Registrar Entrada", key=f"btn_{item['id']}"):
+                            if db.registrar_movimiento(item['id'], cantidad_recibida, 'entrada', 'Reposición de stock bajo', st.session_state.get('username')) is not None:
                                 st.success("Stock actualizado")
                                 st.rerun()
         else:
             st.success("✅ Todos los items tienen stock suficiente")
 
-def show_admin_panel():
-    """Panel administrativo"""
-    st.title("👨‍💼 Panel Administrativo")
+@st.fragment
+def panel_dashboard():
+    """Métricas principales y distribución de citas"""
+    import pandas as pd
+    import plotly.express as px
+    st.subheader("Dashboard")
     
-    tab1, tab2, tab3, tab4 = st.tabs(["Dashboard", "Calendario", "Citas", "Reportes"])
+    today = str(date.today())
     
-    with tab1:
-        st.subheader("Dashboard")
-        
-        today = str(date.today())
-        
-        # Métricas principales
-        citas_hoy = db.execute_query("SELECT COUNT(*) as total FROM citas WHERE fecha_cita = ? AND estado != 'cancelada'", (today,))
-        citas_pendientes = db.execute_query("SELECT COUNT(*) as total FROM citas WHERE estado = 'pendiente' AND fecha_cita >= ?", (today,))
+    # Métricas principales
+    citas_hoy = db.execute_query("SELECT COUNT(*) as total FROM citas WHERE fecha_cita = ? AND estado != 'cancelada'", (today,))
+    citas_pendientes = db.execute_query("SELECT COUNT(*) as total FROM citas WHERE estado = 'pendiente' AND fecha_cita >= ?", (today,))
+    
+    ingresos_mes = db.execute_query("""
+        SELECT COALESCE(SUM(s.precio), 0) as total
+        FROM citas c
+        JOIN servicios s ON c.servicio_id = s.id
+        WHERE strftime('%Y-%m', c.fecha_cita) = strftime('%Y-%m', ?)
+        AND c.estado = 'completada'
+    """, (today,), clase='reporte')
+    
+    stock_bajo = db.execute_query("SELECT COUNT(*) as total FROM inventario WHERE cantidad_actual <= cantidad_minima")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("Citas Hoy", citas_hoy[0]['total'] if citas_hoy else 0)
+    with col2:
+        st.metric("Citas Pendientes", citas_pendientes[0]['total'] if citas_pendientes else 0)
+    with col3:
+        st.metric("Ingresos del Mes", f"S/ {ingresos_mes[0]['total']:.2f}" if ingresos_mes else "S/ 0.00")
+    with col4:
+        st.metric("Stock Bajo", stock_bajo[0]['total'] if stock_bajo else 0, delta_color="inverse")
+    
+    # Gráfico de citas por estado
+    st.subheader("Citas por Estado (Últimos 30 días)")
+    
+    fecha_limite = str(date.today() - timedelta(days=30))
+    citas_estado = db.execute_query("""
+        SELECT estado, COUNT(*) as cantidad
+        FROM citas 
+        WHERE fecha_cita >= ?
+        GROUP BY estado
+        ORDER BY cantidad DESC
+    """, (fecha_limite,), clase='reporte')
+    
+    if citas_estado:
+        df_estado = pd.DataFrame(citas_estado)
+        fig = px.pie(df_estado, values='cantidad', names='estado', title="Distribución de Citas por Estado")
+        st.plotly_chart(fig, use_container_width=True)
+
+CONSULTA_CALENDARIO = """
+    SELECT 
+        c.id, c.fecha_cita, c.hora_cita, c.estado, c.observaciones,
+        cl.nombre as cliente_nombre, cl.telefono as cliente_telefono,
+        v.marca || ' ' || v.modelo || ' (' || v.placa || ')' as vehiculo_info,
+        s.nombre as servicio_nombre
+    FROM citas c
+    JOIN clientes cl ON c.cliente_id = cl.id
+    JOIN vehiculos v ON c.vehiculo_id = v.id
+    JOIN servicios s ON c.servicio_id = s.id
+"""
+
+def cargar_dia_calendario(fecha: date) -> Dict:
+    """Lee el día completo y el cursor del registro de cambios desde el que seguirlo"""
+    # El cursor se toma antes que las citas: un cambio intermedio se vuelve a aplicar, no se pierde
+    ultimo = db.execute_query("SELECT COALESCE(MAX(id), 0) as id FROM citas_cambios")
+    filas = db.execute_query(CONSULTA_CALENDARIO + " WHERE c.fecha_cita = ?", (str(fecha),))
+    return {
+        'fecha': fecha,
+        'cursor': ultimo[0]['id'] if ultimo else 0,
+        'citas': {fila['id']: fila for fila in filas or []}
+    }
+
+def citas_del_dia(fecha: date) -> List[Dict]:
+    """Citas del día desde la vista en memoria de la sesión
+
+    Tras la primera carga solo se leen las filas de citas_cambios posteriores
+    al cursor y se releen por id las citas que tocan el día. Los ids del
+    registro son consecutivos (AUTOINCREMENT no reutiliza ni salta ids de
+    transacciones confirmadas), así que un salto tras el cursor significa que
+    la purga borró cambios no vistos y el día se vuelve a cargar.
+    """
+    vista = st.session_state.get('_calendario')
+    if not vista or vista['fecha'] != fecha:
+        vista = st.session_state['_calendario'] = cargar_dia_calendario(fecha)
+    else:
+        cambios = db.execute_query(
+            "SELECT id, cita_id, fecha_cita, fecha_anterior FROM citas_cambios WHERE id > ? ORDER BY id",
+            (vista['cursor'],)
+        ) or []
+        if cambios and cambios[0]['id'] != vista['cursor'] + 1:
+            vista = st.session_state['_calendario'] = cargar_dia_calendario(fecha)
+        elif cambios:
+            vista['cursor'] = cambios[-1]['id']
+            ids = {c['cita_id'] for c in cambios if str(fecha) in (c['fecha_cita'], c['fecha_anterior'])}
+            if ids:
+                marcas = ', '.join('?' * len(ids))
+                filas = db.execute_query(CONSULTA_CALENDARIO + f" WHERE c.id IN ({marcas})", tuple(ids)) or []
+                releidas = {fila['id']: fila for fila in filas}
+                for cita_id in ids:
+                    fila = releidas.get(cita_id)
+                    if fila and fila['fecha_cita'] == str(fecha):
+                        vista['citas'][cita_id] = fila
+                    else:
+                        vista['citas'].pop(cita_id, None)
+    
+    return sorted(vista['citas'].values(), key=lambda cita: cita['hora_cita'])
+
+@st.fragment(run_every=5)
+def panel_calendario():
+    """Citas de la fecha elegida; cada 5 segundos aplica los cambios registrados"""
+    st.subheader("Calendario de Citas")
+    
+    fecha_seleccionada = st.date_input("Seleccionar fecha:", value=date.today(), key='calendario_fecha')
+    
+    citas_dia = citas_del_dia(fecha_seleccionada)
+    
+    if citas_dia:
+        st.write(f"**{len(citas_dia)} citas programadas para {fecha_seleccionada}**")
         
-        ingresos_mes = db.execute_query("""
-            SELECT COALESCE(SUM(s.precio), 0) as total
-            FROM citas c
-            JOIN servicios s ON c.servicio_id = s.id
-            WHERE strftime('%Y-%m', c.fecha_cita) = strftime('%Y-%m', ?)
-            AND c.estado = 'completada'
-        """, (today,))
+        for cita in citas_dia:
+            with st.container():
+                col1, col2, col3, col4 = st.columns([1, 2, 2, 1])
+                
+                with col1:
+                    st.write(f"**{cita['hora_cita']}**")
+                
+                with col2:
+                    st.write(f"**{cita['cliente_nombre']}**")
+                    st.caption(f"Tel: {cita['cliente_telefono']}")
+                
+                with col3:
+                    st.write(f"{cita['servicio_nombre']}")
+                    st.caption(f"{cita['vehiculo_info']}")
+                
+                with col4:
+                    color = {
+                        'pendiente': '🟡',
+                        'confirmada': '🟢', 
+                        'completada': '✅',
+                        'cancelada': '❌'
+                    }.get(cita['estado'], '⚪')
+                    st.write(f"{color} {cita['estado'].title()}")
+                
+                st.markdown("---")
+    else:
+        st.info(f"No hay citas programadas para {fecha_seleccionada}")
+
+@st.fragment
+def panel_citas():
+    """Gestión de citas con filtros y cambios de estado"""
+    st.subheader("Gestión de Citas")
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        estado_filtro = st.selectbox("Estado:", ['Todos', 'pendiente', 'confirmada', 'completada', 'cancelada'])
+    
+    with col2:
+        fecha_desde = st.date_input("Desde:", value=date.today() - timedelta(days=7))
+    
+    with col3:
+        fecha_hasta = st.date_input("Hasta:", value=date.today() + timedelta(days=7))
+    
+    # Consulta con filtros
+    query = """
+        SELECT 
+            c.id, c.fecha_cita, c.hora_cita, c.estado, c.observaciones,
+            cl.nombre as cliente_nombre, cl.telefono as cliente_telefono,
+            v.marca || ' ' || v.modelo || ' (' || v.placa || ')' as vehiculo_info,
+            s.nombre as servicio_nombre, s.precio as servicio_precio
+        FROM citas c
+        JOIN clientes cl ON c.cliente_id = cl.id
+        JOIN vehiculos v ON c.vehiculo_id = v.id
+        JOIN servicios s ON c.servicio_id = s.id
+        WHERE c.fecha_cita BETWEEN ? AND ?
+    """
+    params = [str(fecha_desde), str(fecha_hasta)]
+    
+    if estado_filtro != 'Todos':
+        query += " AND c.estado = ?"
+        params.append(estado_filtro)
+    
+    query += " ORDER BY c.fecha_cita DESC, c.hora_cita"
+    
+    citas_filtradas = db.execute_query(query, tuple(params))
+    
+    if citas_filtradas:
+        for cita in citas_filtradas:
+            with st.expander(f"#{cita['id']} - {cita['cliente_nombre']} - {cita['fecha_cita']} {cita['hora_cita']}"):
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    st.write(f"**Cliente:** {cita['cliente_nombre']}")
+                    st.write(f"**Teléfono:** {cita['cliente_telefono']}")
+                    st.write(f"**Vehículo:** {cita['vehiculo_info']}")
+                
+                with col2:
+                    st.write(f"**Servicio:** {cita['servicio_nombre']}")
+                    st.write(f"**Precio:** S/ {cita['servicio_precio']:.2f}")
+                    st.write(f"**Estado:** {cita['estado'].title()}")
+                
+                if cita['observaciones']:
+                    st.write(f"**Observaciones:** {cita['observaciones']}")
+                
+                # Botones de cambio de estado
+                col_btn1, col_btn2, col_btn3, col_btn4 = st.columns(4)
+                
+                if cita['estado'] != 'pendiente':
+                    with col_btn1:
+                        if st.button("Marcar Pendiente", key=f"pend_{cita['id']}"):
+                            if db.execute_query("UPDATE citas SET estado = 'pendiente' WHERE id = ?", (cita['id'],)):
+                                st.toast("Estado actualizado")
+                                st.rerun(scope="fragment")
+                
+                if cita['estado'] != 'confirmada':
+                    with col_btn2:
+                        if st.button("Confirmar", key=f"conf_{cita['id']}"):
+                            if db.execute_query("UPDATE citas SET estado = 'confirmada' WHERE id = ?", (cita['id'],)):
+                                st.toast("Estado actualizado")
+                                st.rerun(scope="fragment")
+                
+                if cita['estado'] != 'completada':
+                    with col_btn3:
+                        if st.button("Completar", key=f"comp_{cita['id']}"):
+                            if db.execute_query("UPDATE citas SET estado = 'completada' WHERE id = ?", (cita['id'],)):
+                                st.toast("Estado actualizado")
+                                st.rerun(scope="fragment")
+                
+                if cita['estado'] != 'cancelada':
+                    with col_btn4:
+                        if st.button("Cancelar", key=f"canc_{cita['id']}"):
+                            if db.execute_query("UPDATE citas SET estado = 'cancelada' WHERE id = ?", (cita['id'],)):
+                                st.toast("Estado actualizado")
+                                st.rerun(scope="fragment")
+    else:
+        st.info("No se encontraron citas con los filtros seleccionados.")
+
+@st.fragment
+def panel_reportes():
+    """Ingresos mensuales y servicios más solicitados"""
+    import pandas as pd
+    import plotly.express as px
+    st.subheader("Reportes")
+    
+    # Reporte de ingresos
+    st.markdown("### 💰 Ingresos por Mes")
+    
+    fecha_limite = str(date.today() - timedelta(days=365))
+    ingresos_mensuales = db.execute_query("""
+        SELECT 
+            strftime('%Y-%m', c.fecha_cita) as mes,
+            SUM(s.precio) as total_ingresos,
+            COUNT(*) as total_citas
+        FROM citas c
+        JOIN servicios s ON c.servicio_id = s.id
+        WHERE c.estado = 'completada'
+        AND c.fecha_cita >= ?
+        GROUP BY strftime('%Y-%m', c.fecha_cita)
+        ORDER BY mes DESC
+    """, (fecha_limite,), clase='reporte')
+    
+    if ingresos_mensuales:
+        df_ingresos = pd.DataFrame(ingresos_mensuales)
         
-        stock_bajo = db.execute_query("SELECT COUNT(*) as total FROM inventario WHERE cantidad_actual <= cantidad_minima")
+        fig_ingresos = px.bar(
+            df_ingresos, 
+            x='mes', 
+            y='total_ingresos', 
+            title="Ingresos Mensuales",
+            labels={'total_ingresos': 'Ingresos (S/)', 'mes': 'Mes'}
+        )
+        st.plotly_chart(fig_ingresos, use_container_width=True)
+    
+    # Reporte de servicios más solicitados
+    st.markdown("### 🔧 Servicios Más Solicitados")
+    
+    fecha_limite_90 = str(date.today() - timedelta(days=90))
+    servicios_populares = db.execute_query("""
+        SELECT 
+            s.nombre,
+            COUNT(*) as cantidad_citas,
+            SUM(s.precio) as ingresos_totales
+        FROM citas c
+        JOIN servicios s ON c.servicio_id = s.id
+        WHERE c.fecha_cita >= ?
+        AND c.estado != 'cancelada'
+        GROUP BY s.id, s.nombre
+        ORDER BY cantidad_citas DESC
+        LIMIT 10
+    """, (fecha_limite_90,), clase='reporte')
+    
+    if servicios_populares:
+        df_servicios = pd.DataFrame(servicios_populares)
         
-        col1, col2, col3, col4 = st.columns(4)
+        col1, col2 = st.columns(2)
         
         with col1:
-            st.metric("Citas Hoy", citas_hoy[0]['total'] if citas_hoy else 0)
-        with col2:
-            st.metric("Citas Pendientes", citas_pendientes[0]['total'] if citas_pendientes else 0)
-        with col3:
-            st.metric("Ingresos del Mes", f"S/ {ingresos_mes[0]['total']:.2f}" if ingresos_mes else "S/ 0.00")
-        with col4:
-            st.metric("Stock Bajo", stock_bajo[0]['total'] if stock_bajo else 0, delta_color="inverse")
-        
-        # Gráfico de citas por estado
-        st.subheader("Citas por Estado (Últimos 30 días)")
-        
-        fecha_limite = str(date.today() - timedelta(days=30))
-        citas_estado = db.execute_query("""
-            SELECT estado, COUNT(*) as cantidad
-            FROM citas 
-            WHERE fecha_cita >= ?
-            GROUP BY estado
-            ORDER BY cantidad DESC
-        """, (fecha_limite,))
+            fig_servicios = px.bar(
+                df_servicios, 
+                x='cantidad_citas', 
+                y='nombre', 
+                orientation='h',
+                title="Cantidad de Citas por Servicio"
+            )
+            st.plotly_chart(fig_servicios, use_container_width=True)
         
-        if citas_estado:
-            df_estado = pd.DataFrame(citas_estado)
-            fig = px.pie(df_estado, values='cantidad', names='estado', title="Distribución de Citas por Estado")
-            st.plotly_chart(fig, use_container_width=True)
+        with col2:
+            st.dataframe(
+                df_servicios[['nombre', 'cantidad_citas', 'ingresos_totales']],
+                column_config={
+                    'nombre': 'Servicio',
+                    'cantidad_citas': 'Citas',
+                    'ingresos_totales': st.column_config.NumberColumn(
+                        'Ingresos (S/)',
+                        format="S/ %.2f"
+                    )
+                },
+                hide_index=True,
+                use_container_width=True
+            )
+
+def show_admin_panel():
+    """Panel administrativo; cada pestaña es un fragmento que se recarga por separado"""
+    st.title("👨‍💼 Panel Administrativo")
+    
+    tab1, tab2, tab3, tab4 = st.tabs(["Dashboard", "Calendario", "Citas", "Reportes"])
+    
+    with tab1:
+        panel_dashboard()
     
     with tab2:
-        st.subheader("Calendario de Citas")
-        
-        fecha_seleccionada = st.date_input("Seleccionar fecha:", value=date.today())
-        
-        citas_dia = db.execute_query("""
-            SELECT 
-                c.id, c.hora_cita, c.estado, c.observaciones,
-                cl.nombre as cliente_nombre, cl.telefono as cliente_telefono,
-                v.marca || ' ' || v.modelo || ' (' || v.placa || ')' as vehiculo_info,
-                s.nombre as servicio_nombre
-            FROM citas c
-            JOIN clientes cl ON c.cliente_id = cl.id
-            JOIN vehiculos v ON c.vehiculo_id = v.id
-            JOIN servicios s ON c.servicio_id = s.id
-            WHERE c.fecha_cita = ?
-            ORDER BY c.hora_cita
-        """, (str(fecha_seleccionada),))
-        
-        if citas_dia:
-            st.write(f"**{len(citas_dia)} citas programadas para {fecha_seleccionada}**")
-            
-            for cita in citas_dia:
-                with st.container():
-                    col1, col2, col3, col4 = st.columns([1, 2, 2, 1])
-                    
-                    with col1:
-                        st.write(f"**{cita['hora_cita']}**")
-                    
-                    with col2:
-                        st.write(f"**{cita['cliente_nombre']}**")
-                        st.caption(f"Tel: {cita['cliente_telefono']}")
-                    
-                    with col3:
-                        st.write(f"{cita['servicio_nombre']}")
-                        st.caption(f"{cita['vehiculo_info']}")
-                    
-                    with col4:
-                        color = {
-                            'pendiente': '🟡',
-                            'confirmada': '🟢', 
-                            'completada': '✅',
-                            'cancelada': '❌'
-                        }.get(cita['estado'], '⚪')
-                        st.write(f"{color} {cita['estado'].title()}")
-                    
-                    st.markdown("---")
-        else:
-            st.info(f"No hay citas programadas para {fecha_seleccionada}")
+        panel_calendario()
     
     with tab3:
-        st.subheader("Gestión de Citas")
-        
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            estado_filtro = st.selectbox("Estado:", ['Todos', 'pendiente', 'confirmada', 'completada', 'cancelada'])
-        
-        with col2:
-            fecha_desde = st.date_input("Desde:", value=date.today() - timedelta(days=7))
-        
-        with col3:
-            fecha_hasta = st.date_input("Hasta:", value=date.today() + timedelta(days=7))
-        
-        # Consulta con filtros
-        query = """
-            SELECT 
-                c.id, c.fecha_cita, c.hora_cita, c.estado, c.observaciones,
-                cl.nombre as cliente_nombre, cl.telefono as cliente_telefono,
-                v.marca || ' ' || v.modelo || ' (' || v.placa || ')' as vehiculo_info,
-                s.nombre as servicio_nombre, s.precio as servicio_precio
-            FROM citas c
-            JOIN clientes cl ON c.cliente_id = cl.id
-            JOIN vehiculos v ON c.vehiculo_id = v.id
-            JOIN servicios s ON c.servicio_id = s.id
-            WHERE c.fecha_cita BETWEEN ? AND ?
-        """
-        params = [str(fecha_desde), str(fecha_hasta)]
-        
-        if estado_filtro != 'Todos':
-            query += " AND c.estado = ?"
-            params.append(estado_filtro)
-        
-        query += " ORDER BY c.fecha_cita DESC, c.hora_cita"
-        
-        citas_filtradas = db.execute_query(query, tuple(params))
-        
-        if citas_filtradas:
-            for cita in citas_filtradas:
-                with st.expander(f"#{cita['id']} - {cita['cliente_nombre']} - {cita['fecha_cita']} {cita['hora_cita']}"):
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        st.write(f"**Cliente:** {cita['cliente_nombre']}")
-                        st.write(f"**Teléfono:** {cita['cliente_telefono']}")
-                        st.write(f"**Vehículo:** {cita['vehiculo_info']}")
-                    
-                    with col2:
-                        st.write(f"**Servicio:** {cita['servicio_nombre']}")
-                        st.write(f"**Precio:** S/ {cita['servicio_precio']:.2f}")
-                        st.write(f"**Estado:** {cita['estado'].title()}")
-                    
-                    if cita['observaciones']:
-                        st.write(f"**Observaciones:** {cita['observaciones']}")
-                    
-                    # Botones de cambio de estado
-                    col_btn1, col_btn2, col_btn3, col_btn4 = st.columns(4)
-                    
-                    if cita['estado'] != 'pendiente':
-                        with col_btn1:
-                            if st.button("Marcar Pendiente", key=f"pend_{cita['id']}"):
-                                if db.execute_query("UPDATE citas SET estado = 'pendiente' WHERE id = ?", (cita['id'],)):
-                                    st.success("Estado actualizado")
-                                    st.rerun()
-                    
-                    if cita['estado'] != 'confirmada':
-                        with col_btn2:
-                            if st.button("Confirmar", key=f"conf_{cita['id']}"):
-                                if db.execute_query("UPDATE citas SET estado = 'confirmada' WHERE id = ?", (cita['id'],)):
-                                    st.success("Estado actualizado")
-                                    st.rerun()
-                    
-                    if cita['estado'] != 'completada':
-                        with col_btn3:
-                            if st.button("Completar", key=f"comp_{cita['id']}"):
-                                if db.execute_query("UPDATE citas SET estado = 'completada' WHERE id = ?", (cita['id'],)):
-                                    st.success("Estado actualizado")
-                                    st.rerun()
-                    
-                    if cita['estado'] != 'cancelada':
-                        with col_btn4:
-                            if st.button("Cancelar", key=f"canc_{cita['id']}"):
-                                if db.execute_query("UPDATE citas SET estado = 'cancelada' WHERE id = ?", (cita['id'],)):
-                                    st.success("Estado actualizado")
-                                    st.rerun()
-        else:
-            st.info("No se encontraron citas con los filtros seleccionados.")
+        panel_citas()
     
     with tab4:
-        st.subheader("Reportes")
-        
-        # Reporte de ingresos
-        st.markdown("### 💰 Ingresos por Mes")
-        
-        fecha_limite = str(date.today() - timedelta(days=365))
-        ingresos_mensuales = db.execute_query("""
-            SELECT 
-                strftime('%Y-%m', c.fecha_cita) as mes,
-                SUM(s.precio) as total_ingresos,
-                COUNT(*) as total_citas
-            FROM citas c
-            JOIN servicios s ON c.servicio_id = s.id
-            WHERE c.estado = 'completada'
-            AND c.fecha_cita >= ?
-            GROUP BY strftime('%Y-%m', c.fecha_cita)
-            ORDER BY mes DESC
-        """, (fecha_limite,))
-        
-        if ingresos_mensuales:
-            df_ingresos = pd.DataFrame(ingresos_mensuales)
-            
-            fig_ingresos = px.bar(
-                df_ingresos, 
-                x='mes', 
-                y='total_ingresos', 
-                title="Ingresos Mensuales",
-                labels={'total_ingresos': 'Ingresos (S/)', 'mes': 'Mes'}
-            )
-            st.plotly_chart(fig_ingresos, use_container_width=True)
-        
-        # Reporte de servicios más solicitados
-        st.markdown("### 🔧 Servicios Más Solicitados")
-        
-        fecha_limite_90 = str(date.today() - timedelta(days=90))
-        servicios_populares = db.execute_query("""
-            SELECT 
-                s.nombre,
-                COUNT(*) as cantidad_citas,
-                SUM(s.precio) as ingresos_totales
-            FROM citas c
-            JOIN servicios s ON c.servicio_id = s.id
-            WHERE c.fecha_cita >= ?
-            AND c.estado != 'cancelada'
-            GROUP BY s.id, s.nombre
-            ORDER BY cantidad_citas DESC
-            LIMIT 10
-        """, (fecha_limite_90,))
-        
-        if servicios_populares:
-            df_servicios = pd.DataFrame(servicios_populares)
-            
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                fig_servicios = px.bar(
-                    df_servicios, 
-                    x='cantidad_citas', 
-                    y='nombre', 
-                    orientation='h',
-                    title="Cantidad de Citas por Servicio"
-                )
-                st.plotly_chart(fig_servicios, use_container_width=True)
-            
-            with col2:
-                st.dataframe(
-                    df_servicios[['nombre', 'cantidad_citas', 'ingresos_totales']],
-                    column_config={
-                        'nombre': 'Servicio',
-                        'cantidad_citas': 'Citas',
-                        'ingresos_totales': st.column_config.NumberColumn(
-                            'Ingresos (S/)',
-                            format="S/ %.2f"
-                        )
-                    },
-                    hide_index=True,
-                    use_container_width=True
-                )
+        panel_reportes()
 
 def show_login_page():
     """Página de login"""
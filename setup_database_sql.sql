@@ -78,12 +78,268 @@ CREATE TABLE IF NOT EXISTS inventario (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Sedes del taller; sus coordenadas se guardan para buscar la más cercana sin geocodificar
+CREATE TABLE IF NOT EXISTS sedes (
+    id SERIAL PRIMARY KEY,
+    nombre VARCHAR(100) UNIQUE NOT NULL,
+    direccion TEXT NOT NULL,
+    telefono VARCHAR(20),
+    latitud DOUBLE PRECISION NOT NULL,
+    longitud DOUBLE PRECISION NOT NULL,
+    puestos INTEGER NOT NULL DEFAULT 1 CHECK (puestos > 0),
+    activa BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Sede principal: las citas e items anteriores a las sedes quedan en ella
+INSERT INTO sedes (id, nombre, direccion, telefono, latitud, longitud)
+VALUES (1, 'San Isidro', 'Av. Principal 123, San Isidro', '(01) 234-5678', -12.0931, -77.0465)
+ON CONFLICT (id) DO NOTHING;
+SELECT setval(pg_get_serial_sequence('sedes', 'id'), (SELECT MAX(id) FROM sedes));
+
+-- Sede de cada cita y de cada item (el stock es por sede)
+ALTER TABLE citas ADD COLUMN IF NOT EXISTS sede_id INTEGER NOT NULL DEFAULT 1 REFERENCES sedes(id);
+ALTER TABLE inventario ADD COLUMN IF NOT EXISTS sede_id INTEGER NOT NULL DEFAULT 1 REFERENCES sedes(id);
+
+-- Movimientos de inventario (libro de solo inserción)
+CREATE TABLE IF NOT EXISTS inventario_movimientos (
+    id BIGSERIAL PRIMARY KEY,
+    item_id INTEGER NOT NULL REFERENCES inventario(id),
+    delta INTEGER NOT NULL,
+    saldo_resultante INTEGER NOT NULL,
+    tipo VARCHAR(20) NOT NULL,
+    motivo TEXT,
+    usuario VARCHAR(50),
+    cita_id INTEGER REFERENCES citas(id),
+    -- Hora real del INSERT (no la de inicio de la transacción): los movimientos de un item
+    -- se registran con su fila bloqueada, así que quedan en el mismo orden que sus saldos
+    created_at TIMESTAMP DEFAULT clock_timestamp(),
+    CONSTRAINT chk_tipo_movimiento CHECK (tipo IN ('inicial', 'entrada', 'consumo', 'ajuste')),
+    CONSTRAINT chk_delta_movimiento CHECK (delta <> 0 OR tipo = 'inicial')
+);
+
+ALTER TABLE inventario_movimientos ALTER COLUMN created_at SET DEFAULT clock_timestamp();
+
+-- Instantáneas periódicas del stock
+CREATE TABLE IF NOT EXISTS inventario_snapshots (
+    item_id INTEGER NOT NULL REFERENCES inventario(id),
+    tomado_en TIMESTAMP NOT NULL,
+    cantidad INTEGER NOT NULL,
+    ultimo_movimiento_id BIGINT NOT NULL,
+    PRIMARY KEY (item_id, tomado_en)
+);
+
+-- Repuestos que consume cada servicio (lista de materiales)
+CREATE TABLE IF NOT EXISTS servicio_repuestos (
+    servicio_id INTEGER NOT NULL REFERENCES servicios(id),
+    item_id INTEGER NOT NULL REFERENCES inventario(id),
+    cantidad INTEGER NOT NULL CHECK (cantidad > 0),
+    PRIMARY KEY (servicio_id, item_id)
+);
+
+-- Pronóstico de reposición (calculado por taller.pronostico)
+CREATE TABLE IF NOT EXISTS inventario_pronostico (
+    item_id INTEGER PRIMARY KEY REFERENCES inventario(id),
+    consumo_diario NUMERIC(10,3) NOT NULL DEFAULT 0,
+    desviacion_diaria NUMERIC(10,3) NOT NULL DEFAULT 0,
+    demanda_agendada INTEGER NOT NULL DEFAULT 0,
+    punto_reorden INTEGER NOT NULL DEFAULT 0,
+    cantidad_sugerida INTEGER NOT NULL DEFAULT 0,
+    calculado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Resumen de inventario por sede y categoría (mantenido por tr_resumen_inventario)
+-- Un resumen anterior a las sedes se descarta: sp_recalcular_resumen_inventario lo reconstruye
+DO $$
+BEGIN
+    IF to_regclass('inventario_resumen') IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'inventario_resumen' AND column_name = 'sede_id'
+    ) THEN
+        DROP TABLE inventario_resumen;
+    END IF;
+END $$;
+
+CREATE TABLE IF NOT EXISTS inventario_resumen (
+    sede_id INTEGER NOT NULL REFERENCES sedes(id),
+    categoria VARCHAR(50) NOT NULL,
+    total_items INTEGER NOT NULL DEFAULT 0,
+    stock_bajo INTEGER NOT NULL DEFAULT 0,
+    valor_total DECIMAL(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (sede_id, categoria)
+);
+
+-- Claves de idempotencia de reservas: un reintento devuelve la cita original
+CREATE TABLE IF NOT EXISTS reservas_idempotencia (
+    clave VARCHAR(64) PRIMARY KEY,
+    cita_id INTEGER REFERENCES citas(id) ON DELETE CASCADE,
+    cliente_id INTEGER,
+    vehiculo_id INTEGER,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Cola de tareas en segundo plano (taller.tareas)
+CREATE TABLE IF NOT EXISTS tareas (
+    id BIGSERIAL PRIMARY KEY,
+    tipo VARCHAR(50) NOT NULL,
+    parametros JSONB NOT NULL DEFAULT '{}',
+    estado VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+    intentos INTEGER NOT NULL DEFAULT 0,
+    max_intentos INTEGER NOT NULL DEFAULT 5,
+    ejecutar_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    programa VARCHAR(50),
+    trabajador VARCHAR(100),
+    iniciada_en TIMESTAMP,
+    terminada_en TIMESTAMP,
+    resultado JSONB,
+    ultimo_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT chk_estado_tarea CHECK (estado IN ('pendiente', 'en_curso', 'completada', 'fallida'))
+);
+
+-- Tareas recurrentes: el planificador encola una tarea en cada coincidencia de la expresión cron
+CREATE TABLE IF NOT EXISTS tareas_programadas (
+    nombre VARCHAR(50) PRIMARY KEY,
+    tipo VARCHAR(50) NOT NULL,
+    cron VARCHAR(100) NOT NULL,
+    parametros JSONB NOT NULL DEFAULT '{}',
+    max_intentos INTEGER NOT NULL DEFAULT 5,
+    activa BOOLEAN NOT NULL DEFAULT TRUE,
+    proxima_ejecucion TIMESTAMP NOT NULL,
+    ultima_ejecucion TIMESTAMP
+);
+
+-- Recordatorios de citas (taller.recordatorios): uno por cita y fecha, con su estado de entrega
+CREATE TABLE IF NOT EXISTS recordatorios (
+    cita_id INTEGER NOT NULL REFERENCES citas(id) ON DELETE CASCADE,
+    fecha_cita DATE NOT NULL,
+    canal VARCHAR(10) NOT NULL,
+    destino VARCHAR(100) NOT NULL,
+    estado VARCHAR(20) NOT NULL DEFAULT 'enviando',
+    intentos INTEGER NOT NULL DEFAULT 1,
+    error TEXT,
+    enviado_en TIMESTAMP,
+    actualizado_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (cita_id, fecha_cita),
+    CONSTRAINT chk_canal_recordatorio CHECK (canal IN ('email', 'sms')),
+    CONSTRAINT chk_estado_recordatorio CHECK (estado IN ('enviando', 'enviado', 'fallido'))
+);
+
+-- Transiciones permitidas entre los estados de chk_estado (completada y cancelada son finales)
+CREATE TABLE IF NOT EXISTS citas_transiciones (
+    desde VARCHAR(20) NOT NULL,
+    hacia VARCHAR(20) NOT NULL,
+    PRIMARY KEY (desde, hacia)
+);
+
+-- Historial de estados de las citas (solo inserción, lo escriben los triggers de citas)
+CREATE TABLE IF NOT EXISTS citas_historial (
+    id BIGSERIAL PRIMARY KEY,
+    cita_id INTEGER NOT NULL REFERENCES citas(id) ON DELETE CASCADE,
+    estado_anterior VARCHAR(20),
+    estado VARCHAR(20) NOT NULL,
+    usuario VARCHAR(50),
+    cambiado_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Resumen por vehículo de sus citas completadas (mantenido por tr_resumen_vehiculos)
+CREATE TABLE IF NOT EXISTS vehiculos_resumen (
+    vehiculo_id INTEGER PRIMARY KEY REFERENCES vehiculos(id) ON DELETE CASCADE,
+    visitas INTEGER NOT NULL DEFAULT 0,
+    gasto_total DECIMAL(12,2) NOT NULL DEFAULT 0,
+    primera_visita DATE,
+    ultima_visita DATE,
+    actualizado_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Último servicio de cada tipo por vehículo (mantenido por tr_resumen_vehiculos)
+CREATE TABLE IF NOT EXISTS vehiculos_servicios (
+    vehiculo_id INTEGER NOT NULL REFERENCES vehiculos(id) ON DELETE CASCADE,
+    servicio_id INTEGER NOT NULL REFERENCES servicios(id),
+    veces INTEGER NOT NULL DEFAULT 0,
+    ultima_fecha DATE NOT NULL,
+    ultima_cita_id INTEGER,
+    PRIMARY KEY (vehiculo_id, servicio_id)
+);
+
+-- Cada cuántos días conviene repetir un servicio (servicios sin fila no son periódicos)
+CREATE TABLE IF NOT EXISTS servicios_intervalos (
+    servicio_id INTEGER PRIMARY KEY REFERENCES servicios(id) ON DELETE CASCADE,
+    intervalo_dias INTEGER NOT NULL CHECK (intervalo_dias > 0)
+);
+
+-- Mantenimientos por vencer por vehículo y servicio (calculado cada noche por taller.mantenimiento)
+CREATE TABLE IF NOT EXISTS mantenimiento_pendiente (
+    vehiculo_id INTEGER NOT NULL REFERENCES vehiculos(id) ON DELETE CASCADE,
+    servicio_id INTEGER NOT NULL REFERENCES servicios(id) ON DELETE CASCADE,
+    ultima_fecha DATE NOT NULL,
+    veces INTEGER NOT NULL,
+    intervalo_dias INTEGER NOT NULL,
+    proxima_fecha DATE NOT NULL,
+    calculado_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (vehiculo_id, servicio_id)
+);
+
+-- Técnicos de cada sede con su turno; tecnicos_servicios dice qué servicios sabe hacer cada uno
+CREATE TABLE IF NOT EXISTS tecnicos (
+    id SERIAL PRIMARY KEY,
+    nombre VARCHAR(100) NOT NULL,
+    sede_id INTEGER NOT NULL DEFAULT 1 REFERENCES sedes(id),
+    hora_entrada TIME NOT NULL DEFAULT '08:00',
+    hora_salida TIME NOT NULL DEFAULT '18:00',
+    activo BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CHECK (hora_salida > hora_entrada)
+);
+
+CREATE TABLE IF NOT EXISTS tecnicos_servicios (
+    tecnico_id INTEGER NOT NULL REFERENCES tecnicos(id) ON DELETE CASCADE,
+    servicio_id INTEGER NOT NULL REFERENCES servicios(id) ON DELETE CASCADE,
+    PRIMARY KEY (tecnico_id, servicio_id)
+);
+
+-- Técnico, puesto y horario asignados a cada cita (plan guardado por taller.asignacion)
+CREATE TABLE IF NOT EXISTS citas_asignaciones (
+    cita_id INTEGER PRIMARY KEY REFERENCES citas(id) ON DELETE CASCADE,
+    tecnico_id INTEGER NOT NULL REFERENCES tecnicos(id) ON DELETE CASCADE,
+    puesto INTEGER NOT NULL CHECK (puesto > 0),
+    inicio TIMESTAMP NOT NULL,
+    fin TIMESTAMP NOT NULL,
+    asignado_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CHECK (fin > inicio)
+);
+
 -- Índices para mejorar rendimiento
 CREATE INDEX IF NOT EXISTS idx_citas_fecha ON citas(fecha_cita);
 CREATE INDEX IF NOT EXISTS idx_citas_estado ON citas(estado);
 CREATE INDEX IF NOT EXISTS idx_clientes_telefono ON clientes(telefono);
 CREATE INDEX IF NOT EXISTS idx_vehiculos_placa ON vehiculos(placa);
 CREATE INDEX IF NOT EXISTS idx_inventario_categoria ON inventario(categoria);
+CREATE INDEX IF NOT EXISTS idx_inventario_orden ON inventario(categoria, nombre, id);
+CREATE INDEX IF NOT EXISTS idx_inventario_bajo_orden ON inventario(categoria, nombre, id) WHERE cantidad_actual <= cantidad_minima;
+CREATE INDEX IF NOT EXISTS idx_movimientos_item_fecha ON inventario_movimientos(item_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_movimientos_item_id ON inventario_movimientos(item_id, id);
+CREATE INDEX IF NOT EXISTS idx_snapshots_fecha ON inventario_snapshots(tomado_en);
+CREATE INDEX IF NOT EXISTS idx_servicio_repuestos_item ON servicio_repuestos(item_id);
+CREATE INDEX IF NOT EXISTS idx_citas_agendadas_fecha ON citas(fecha_cita, servicio_id) WHERE estado IN ('pendiente', 'confirmada');
+CREATE INDEX IF NOT EXISTS idx_reservas_idempotencia_fecha ON reservas_idempotencia(created_at);
+CREATE INDEX IF NOT EXISTS idx_tareas_pendientes ON tareas(ejecutar_en, id) WHERE estado = 'pendiente';
+CREATE INDEX IF NOT EXISTS idx_tareas_en_curso ON tareas(iniciada_en) WHERE estado = 'en_curso';
+CREATE INDEX IF NOT EXISTS idx_tareas_terminadas ON tareas(terminada_en) WHERE estado IN ('completada', 'fallida');
+CREATE INDEX IF NOT EXISTS idx_recordatorios_fecha_estado ON recordatorios(fecha_cita, estado);
+CREATE INDEX IF NOT EXISTS idx_historial_cita ON citas_historial(cita_id, cambiado_en, id);
+CREATE INDEX IF NOT EXISTS idx_historial_fecha_estado ON citas_historial(cambiado_en, estado) INCLUDE (estado_anterior);
+CREATE INDEX IF NOT EXISTS idx_citas_vehiculo_fecha ON citas(vehiculo_id, fecha_cita);
+CREATE INDEX IF NOT EXISTS idx_vehiculos_placa_mayusculas ON vehiculos(UPPER(placa));
+CREATE INDEX IF NOT EXISTS idx_mantenimiento_proxima ON mantenimiento_pendiente(proxima_fecha, vehiculo_id, servicio_id);
+
+-- Índices encabezados por la sede: las consultas de una sede no recorren filas de otras
+CREATE INDEX IF NOT EXISTS idx_citas_sede_fecha ON citas(sede_id, fecha_cita, hora_cita);
+CREATE INDEX IF NOT EXISTS idx_inventario_sede_orden ON inventario(sede_id, categoria, nombre, id);
+CREATE INDEX IF NOT EXISTS idx_inventario_sede_bajo_orden ON inventario(sede_id, categoria, nombre, id) WHERE cantidad_actual <= cantidad_minima;
+CREATE INDEX IF NOT EXISTS idx_inventario_sede_nombre ON inventario(sede_id, nombre);
+CREATE INDEX IF NOT EXISTS idx_tecnicos_sede ON tecnicos(sede_id) WHERE activo;
+CREATE INDEX IF NOT EXISTS idx_asignaciones_tecnico ON citas_asignaciones(tecnico_id);
 
 -- Procedimientos almacenados
 
@@ -133,27 +389,74 @@ EXCEPTION
 END;
 $$ LANGUAGE plpgsql;
 
--- Procedimiento para crear cita
+-- Procedimiento para abrir una sede: copia los items (sin stock) y la lista de
+-- materiales de los servicios desde otra sede
+CREATE OR REPLACE FUNCTION sp_crear_sede(
+    p_nombre VARCHAR(100),
+    p_direccion TEXT,
+    p_telefono VARCHAR(20),
+    p_latitud DOUBLE PRECISION,
+    p_longitud DOUBLE PRECISION,
+    p_puestos INTEGER DEFAULT 1,
+    p_copiar_de INTEGER DEFAULT 1
+)
+RETURNS INTEGER AS $$
+DECLARE
+    v_sede_id INTEGER;
+    v_item RECORD;
+    v_item_id INTEGER;
+BEGIN
+    INSERT INTO sedes (nombre, direccion, telefono, latitud, longitud, puestos)
+    VALUES (p_nombre, p_direccion, p_telefono, p_latitud, p_longitud, p_puestos)
+    RETURNING id INTO v_sede_id;
+    
+    FOR v_item IN SELECT * FROM inventario WHERE sede_id = p_copiar_de ORDER BY id LOOP
+        INSERT INTO inventario (sede_id, nombre, descripcion, cantidad_actual, cantidad_minima, precio_unitario, categoria)
+        VALUES (v_sede_id, v_item.nombre, v_item.descripcion, 0, v_item.cantidad_minima, v_item.precio_unitario, v_item.categoria)
+        RETURNING id INTO v_item_id;
+        
+        INSERT INTO servicio_repuestos (servicio_id, item_id, cantidad)
+        SELECT servicio_id, v_item_id, cantidad
+        FROM servicio_repuestos
+        WHERE item_id = v_item.id;
+    END LOOP;
+    
+    RETURN v_sede_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Procedimiento para crear cita (la versión anterior a las sedes se reemplaza)
+DROP FUNCTION IF EXISTS sp_crear_cita(INTEGER, INTEGER, INTEGER, DATE, TIME, TEXT);
 CREATE OR REPLACE FUNCTION sp_crear_cita(
     p_cliente_id INTEGER,
     p_vehiculo_id INTEGER,
     p_servicio_id INTEGER,
     p_fecha_cita DATE,
     p_hora_cita TIME,
-    p_observaciones TEXT
+    p_observaciones TEXT,
+    p_sede_id INTEGER DEFAULT 1
 )
 RETURNS INTEGER AS $$
 DECLARE
     cita_id INTEGER;
+    v_puestos INTEGER;
     horario_ocupado BOOLEAN;
 BEGIN
-    -- Verificar disponibilidad de horario
-    SELECT EXISTS (
-        SELECT 1 FROM citas 
-        WHERE fecha_cita = p_fecha_cita 
-        AND hora_cita = p_hora_cita 
-        AND estado != 'cancelada'
-    ) INTO horario_ocupado;
+    SELECT puestos INTO v_puestos FROM sedes WHERE id = p_sede_id AND activa;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'La sede % no existe o no está activa', p_sede_id;
+    END IF;
+    
+    -- Serializar reservas del mismo horario y sede hasta el fin de la transacción
+    PERFORM pg_advisory_xact_lock(hashtext('cita ' || p_sede_id || ' ' || p_fecha_cita || ' ' || p_hora_cita));
+    
+    -- Verificar disponibilidad de horario: cada sede atiende `puestos` citas a la vez
+    SELECT COUNT(*) >= v_puestos INTO horario_ocupado
+    FROM citas 
+    WHERE sede_id = p_sede_id
+    AND fecha_cita = p_fecha_cita 
+    AND hora_cita = p_hora_cita 
+    AND estado != 'cancelada';
     
     IF horario_ocupado THEN
         RAISE EXCEPTION 'El horario ya está ocupado';
@@ -164,8 +467,8 @@ BEGIN
         RAISE EXCEPTION 'No se pueden agendar citas en fechas pasadas';
     END IF;
     
-    INSERT INTO citas (cliente_id, vehiculo_id, servicio_id, fecha_cita, hora_cita, observaciones)
-    VALUES (p_cliente_id, p_vehiculo_id, p_servicio_id, p_fecha_cita, p_hora_cita, p_observaciones)
+    INSERT INTO citas (cliente_id, vehiculo_id, servicio_id, fecha_cita, hora_cita, observaciones, sede_id)
+    VALUES (p_cliente_id, p_vehiculo_id, p_servicio_id, p_fecha_cita, p_hora_cita, p_observaciones, p_sede_id)
     RETURNING id INTO cita_id;
     
     RETURN cita_id;
@@ -175,6 +478,68 @@ EXCEPTION
 END;
 $$ LANGUAGE plpgsql;
 
+-- Procedimiento para completar citas y descontar sus repuestos
+-- Una sola sentencia: cambia el estado, descuenta el stock por item y registra
+-- un movimiento por cita e item. Completar nunca se bloquea por stock: si el
+-- conteo del sistema está desfasado, el item queda en negativo y en stock bajo
+CREATE OR REPLACE FUNCTION sp_completar_citas(
+    p_cita_ids INTEGER[],
+    p_usuario VARCHAR(50)
+)
+RETURNS INTEGER AS $$
+DECLARE
+    v_total INTEGER;
+BEGIN
+    -- Usuario del historial de estados (tr_historial_citas_estado)
+    IF p_usuario IS NOT NULL THEN
+        PERFORM set_config('taller.usuario', p_usuario, true);
+    END IF;
+    
+    WITH completadas AS (
+        UPDATE citas 
+        SET estado = 'completada'
+        WHERE id = ANY(p_cita_ids)
+        AND estado IN ('pendiente', 'confirmada')
+        RETURNING id, servicio_id, sede_id
+    ),
+    consumo AS (
+        -- Cada sede tiene sus propios items: solo cuentan los de la sede de la cita
+        SELECT c.id AS cita_id, sr.item_id, sr.cantidad
+        FROM completadas c
+        JOIN servicio_repuestos sr ON sr.servicio_id = c.servicio_id
+        JOIN inventario i ON i.id = sr.item_id AND i.sede_id = c.sede_id
+    ),
+    totales AS (
+        SELECT item_id, SUM(cantidad)::INTEGER AS total
+        FROM consumo
+        GROUP BY item_id
+    ),
+    descontados AS (
+        UPDATE inventario i
+        SET cantidad_actual = i.cantidad_actual - t.total
+        FROM totales t
+        WHERE i.id = t.item_id
+        RETURNING i.id, i.cantidad_actual AS saldo_final, t.total
+    ),
+    movimientos AS (
+        INSERT INTO inventario_movimientos (item_id, delta, saldo_resultante, tipo, motivo, usuario, cita_id)
+        SELECT 
+            co.item_id,
+            -co.cantidad,
+            d.saldo_final + d.total - SUM(co.cantidad) OVER (PARTITION BY co.item_id ORDER BY co.cita_id),
+            'consumo',
+            'Cita completada',
+            p_usuario,
+            co.cita_id
+        FROM consumo co
+        JOIN descontados d ON d.id = co.item_id
+    )
+    SELECT COUNT(*) INTO v_total FROM completadas;
+    
+    RETURN v_total;
+END;
+$$ LANGUAGE plpgsql;
+
 -- Procedimiento para actualizar estado de cita
 CREATE OR REPLACE FUNCTION sp_actualizar_cita(
     p_cita_id INTEGER,
@@ -187,6 +552,14 @@ BEGIN
         RAISE EXCEPTION 'Estado inválido: %', p_estado;
     END IF;
     
+    -- Completar descuenta los repuestos del servicio
+    IF p_estado = 'completada' THEN
+        IF sp_completar_citas(ARRAY[p_cita_id], NULL) = 0 THEN
+            RAISE EXCEPTION 'La cita % no existe o no está pendiente ni confirmada', p_cita_id;
+        END IF;
+        RETURN TRUE;
+    END IF;
+    
     UPDATE citas SET estado = p_estado WHERE id = p_cita_id;
     
     IF NOT FOUND THEN
@@ -200,25 +573,73 @@ EXCEPTION
 END;
 $$ LANGUAGE plpgsql;
 
--- Procedimiento para actualizar inventario
+-- Procedimiento para registrar un movimiento de inventario
+-- El stock se modifica con un delta atómico y el saldo resultante queda en el libro
+CREATE OR REPLACE FUNCTION sp_registrar_movimiento(
+    p_item_id INTEGER,
+    p_delta INTEGER,
+    p_tipo VARCHAR(20),
+    p_motivo TEXT,
+    p_usuario VARCHAR(50)
+)
+RETURNS INTEGER AS $$
+DECLARE
+    v_saldo INTEGER;
+BEGIN
+    IF p_delta = 0 THEN
+        RAISE EXCEPTION 'El movimiento debe tener una cantidad distinta de cero';
+    END IF;
+    
+    UPDATE inventario 
+    SET cantidad_actual = cantidad_actual + p_delta 
+    WHERE id = p_item_id
+    AND cantidad_actual + p_delta >= 0
+    RETURNING cantidad_actual INTO v_saldo;
+    
+    IF NOT FOUND THEN
+        IF EXISTS (SELECT 1 FROM inventario WHERE id = p_item_id) THEN
+            RAISE EXCEPTION 'Stock insuficiente para el item con ID: %', p_item_id;
+        END IF;
+        RAISE EXCEPTION 'No se encontró el item con ID: %', p_item_id;
+    END IF;
+    
+    INSERT INTO inventario_movimientos (item_id, delta, saldo_resultante, tipo, motivo, usuario)
+    VALUES (p_item_id, p_delta, v_saldo, p_tipo, p_motivo, p_usuario);
+    
+    RETURN v_saldo;
+EXCEPTION
+    WHEN OTHERS THEN
+        RAISE EXCEPTION 'Error al registrar movimiento: %', SQLERRM;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Procedimiento para actualizar inventario (conteo físico)
+-- Registra la diferencia con el stock actual como un ajuste en el libro
 CREATE OR REPLACE FUNCTION sp_actualizar_inventario(
     p_item_id INTEGER,
     p_cantidad INTEGER
 )
 RETURNS BOOLEAN AS $$
+DECLARE
+    v_actual INTEGER;
 BEGIN
     IF p_cantidad < 0 THEN
         RAISE EXCEPTION 'La cantidad no puede ser negativa';
     END IF;
     
-    UPDATE inventario 
-    SET cantidad_actual = p_cantidad 
-    WHERE id = p_item_id;
+    SELECT cantidad_actual INTO v_actual
+    FROM inventario 
+    WHERE id = p_item_id
+    FOR UPDATE;
     
     IF NOT FOUND THEN
         RAISE EXCEPTION 'No se encontró el item con ID: %', p_item_id;
     END IF;
     
+    IF p_cantidad <> v_actual THEN
+        PERFORM sp_registrar_movimiento(p_item_id, p_cantidad - v_actual, 'ajuste', 'Conteo físico', NULL);
+    END IF;
+    
     RETURN TRUE;
 EXCEPTION
     WHEN OTHERS THEN
@@ -226,9 +647,400 @@ EXCEPTION
 END;
 $$ LANGUAGE plpgsql;
 
--- Función para obtener horarios disponibles
+-- Trigger para abrir el libro de movimientos de cada item nuevo
+CREATE OR REPLACE FUNCTION fn_movimiento_inicial()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO inventario_movimientos (item_id, delta, saldo_resultante, tipo, motivo)
+    VALUES (NEW.id, COALESCE(NEW.cantidad_actual, 0), COALESCE(NEW.cantidad_actual, 0), 'inicial', 'Saldo inicial');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tr_movimiento_inicial ON inventario;
+CREATE TRIGGER tr_movimiento_inicial
+    AFTER INSERT ON inventario
+    FOR EACH ROW
+    EXECUTE FUNCTION fn_movimiento_inicial();
+
+-- Trigger para impedir modificar o borrar movimientos registrados
+CREATE OR REPLACE FUNCTION fn_movimientos_solo_insercion()
+RETURNS TRIGGER AS $$
+BEGIN
+    RAISE EXCEPTION 'Los movimientos de inventario no se pueden modificar ni eliminar';
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tr_movimientos_solo_insercion ON inventario_movimientos;
+CREATE TRIGGER tr_movimientos_solo_insercion
+    BEFORE UPDATE OR DELETE ON inventario_movimientos
+    FOR EACH ROW
+    EXECUTE FUNCTION fn_movimientos_solo_insercion();
+
+-- Triggers del historial de estados de citas
+-- Son por sentencia con tablas de transición: completar un lote de citas valida
+-- las transiciones y registra su historial con una consulta para todo el lote.
+-- El usuario se toma de la variable de transacción taller.usuario
+CREATE OR REPLACE FUNCTION fn_historial_citas()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_invalida RECORD;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO citas_historial (cita_id, estado_anterior, estado, usuario)
+        SELECT n.id, NULL, n.estado, NULLIF(current_setting('taller.usuario', true), '')
+        FROM nuevas n;
+        RETURN NULL;
+    END IF;
+    
+    SELECT n.id, a.estado AS desde, n.estado AS hacia INTO v_invalida
+    FROM anteriores a
+    JOIN nuevas n ON n.id = a.id
+    WHERE n.estado IS DISTINCT FROM a.estado
+    AND NOT EXISTS (
+        SELECT 1 FROM citas_transiciones t WHERE t.desde = a.estado AND t.hacia = n.estado
+    )
+    LIMIT 1;
+    
+    IF FOUND THEN
+        RAISE EXCEPTION 'La cita % no puede pasar de % a %', v_invalida.id, v_invalida.desde, v_invalida.hacia;
+    END IF;
+    
+    INSERT INTO citas_historial (cita_id, estado_anterior, estado, usuario)
+    SELECT n.id, a.estado, n.estado, NULLIF(current_setting('taller.usuario', true), '')
+    FROM anteriores a
+    JOIN nuevas n ON n.id = a.id
+    WHERE n.estado IS DISTINCT FROM a.estado;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tr_historial_citas_alta ON citas;
+CREATE TRIGGER tr_historial_citas_alta
+    AFTER INSERT ON citas
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION fn_historial_citas();
+
+DROP TRIGGER IF EXISTS tr_historial_citas_estado ON citas;
+CREATE TRIGGER tr_historial_citas_estado
+    AFTER UPDATE ON citas
+    REFERENCING OLD TABLE AS anteriores NEW TABLE AS nuevas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION fn_historial_citas();
+
+-- Trigger para impedir modificar o borrar el historial de estados
+-- Solo se borra en cascada junto con su cita
+CREATE OR REPLACE FUNCTION fn_historial_solo_insercion()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' AND NOT EXISTS (SELECT 1 FROM citas WHERE id = OLD.cita_id) THEN
+        RETURN OLD;
+    END IF;
+    RAISE EXCEPTION 'El historial de estados de las citas no se puede modificar ni eliminar';
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tr_historial_solo_insercion ON citas_historial;
+CREATE TRIGGER tr_historial_solo_insercion
+    BEFORE UPDATE OR DELETE ON citas_historial
+    FOR EACH ROW
+    EXECUTE FUNCTION fn_historial_solo_insercion();
+
+-- Trigger para mantener el resumen por sede y categoría con deltas por fila
+CREATE OR REPLACE FUNCTION fn_resumen_inventario()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE inventario_resumen
+        SET total_items = total_items - 1,
+            stock_bajo = stock_bajo - COALESCE((OLD.cantidad_actual <= OLD.cantidad_minima)::INTEGER, 0),
+            valor_total = valor_total - COALESCE(OLD.cantidad_actual * OLD.precio_unitario, 0)
+        WHERE sede_id = OLD.sede_id
+        AND categoria = COALESCE(OLD.categoria, 'Sin categoría');
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO inventario_resumen AS r (sede_id, categoria, total_items, stock_bajo, valor_total)
+        VALUES (
+            NEW.sede_id,
+            COALESCE(NEW.categoria, 'Sin categoría'),
+            1,
+            COALESCE((NEW.cantidad_actual <= NEW.cantidad_minima)::INTEGER, 0),
+            COALESCE(NEW.cantidad_actual * NEW.precio_unitario, 0)
+        )
+        ON CONFLICT (sede_id, categoria) DO UPDATE SET
+            total_items = r.total_items + 1,
+            stock_bajo = r.stock_bajo + EXCLUDED.stock_bajo,
+            valor_total = r.valor_total + EXCLUDED.valor_total;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tr_resumen_inventario ON inventario;
+CREATE TRIGGER tr_resumen_inventario
+    AFTER INSERT OR DELETE OR UPDATE OF cantidad_actual, cantidad_minima, precio_unitario, categoria, sede_id ON inventario
+    FOR EACH ROW
+    EXECUTE FUNCTION fn_resumen_inventario();
+
+-- Procedimiento para reconstruir el resumen por sede y categoría desde inventario
+CREATE OR REPLACE FUNCTION sp_recalcular_resumen_inventario()
+RETURNS INTEGER AS $$
+DECLARE
+    v_categorias INTEGER;
+BEGIN
+    LOCK TABLE inventario_resumen IN EXCLUSIVE MODE;
+    DELETE FROM inventario_resumen;
+
+    INSERT INTO inventario_resumen (sede_id, categoria, total_items, stock_bajo, valor_total)
+    SELECT
+        sede_id,
+        COALESCE(categoria, 'Sin categoría'),
+        COUNT(*),
+        COUNT(*) FILTER (WHERE cantidad_actual <= cantidad_minima),
+        COALESCE(SUM(cantidad_actual * precio_unitario), 0)
+    FROM inventario
+    GROUP BY sede_id, COALESCE(categoria, 'Sin categoría');
+
+    GET DIAGNOSTICS v_categorias = ROW_COUNT;
+    RETURN v_categorias;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Procedimiento para reconstruir el resumen de los vehículos (todos si no se indican)
+CREATE OR REPLACE FUNCTION sp_recalcular_resumen_vehiculos(p_vehiculo_ids INTEGER[] DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+    v_vehiculos INTEGER;
+BEGIN
+    IF p_vehiculo_ids IS NULL THEN
+        LOCK TABLE vehiculos_resumen, vehiculos_servicios IN EXCLUSIVE MODE;
+    END IF;
+    
+    DELETE FROM vehiculos_servicios WHERE p_vehiculo_ids IS NULL OR vehiculo_id = ANY(p_vehiculo_ids);
+    DELETE FROM vehiculos_resumen WHERE p_vehiculo_ids IS NULL OR vehiculo_id = ANY(p_vehiculo_ids);
+    
+    INSERT INTO vehiculos_servicios (vehiculo_id, servicio_id, veces, ultima_fecha, ultima_cita_id)
+    SELECT DISTINCT ON (c.vehiculo_id, c.servicio_id)
+        c.vehiculo_id,
+        c.servicio_id,
+        COUNT(*) OVER (PARTITION BY c.vehiculo_id, c.servicio_id),
+        c.fecha_cita,
+        c.id
+    FROM citas c
+    WHERE c.estado = 'completada'
+    AND c.vehiculo_id IS NOT NULL
+    AND (p_vehiculo_ids IS NULL OR c.vehiculo_id = ANY(p_vehiculo_ids))
+    ORDER BY c.vehiculo_id, c.servicio_id, c.fecha_cita DESC, c.id DESC;
+    
+    INSERT INTO vehiculos_resumen (vehiculo_id, visitas, gasto_total, primera_visita, ultima_visita)
+    SELECT c.vehiculo_id, COUNT(*), COALESCE(SUM(s.precio), 0), MIN(c.fecha_cita), MAX(c.fecha_cita)
+    FROM citas c
+    JOIN servicios s ON s.id = c.servicio_id
+    WHERE c.estado = 'completada'
+    AND c.vehiculo_id IS NOT NULL
+    AND (p_vehiculo_ids IS NULL OR c.vehiculo_id = ANY(p_vehiculo_ids))
+    GROUP BY c.vehiculo_id;
+    
+    GET DIAGNOSTICS v_vehiculos = ROW_COUNT;
+    RETURN v_vehiculos;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger para mantener el resumen por vehículo al completar citas
+-- Completar suma sus deltas (completada es un estado final); borrar una cita
+-- completada recalcula solo los vehículos afectados
+CREATE OR REPLACE FUNCTION fn_resumen_vehiculos()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM sp_recalcular_resumen_vehiculos(ARRAY(
+            SELECT DISTINCT vehiculo_id FROM anteriores
+            WHERE estado = 'completada' AND vehiculo_id IS NOT NULL
+        ))
+        WHERE EXISTS (SELECT 1 FROM anteriores WHERE estado = 'completada');
+        RETURN NULL;
+    END IF;
+    
+    WITH completadas AS (
+        SELECT n.id, n.vehiculo_id, n.servicio_id, n.fecha_cita, s.precio
+        FROM anteriores a
+        JOIN nuevas n ON n.id = a.id
+        JOIN servicios s ON s.id = n.servicio_id
+        WHERE n.estado = 'completada'
+        AND a.estado IS DISTINCT FROM 'completada'
+        AND n.vehiculo_id IS NOT NULL
+    ),
+    por_servicio AS (
+        INSERT INTO vehiculos_servicios (vehiculo_id, servicio_id, veces, ultima_fecha, ultima_cita_id)
+        SELECT DISTINCT ON (vehiculo_id, servicio_id)
+            vehiculo_id,
+            servicio_id,
+            COUNT(*) OVER (PARTITION BY vehiculo_id, servicio_id),
+            fecha_cita,
+            id
+        FROM completadas
+        ORDER BY vehiculo_id, servicio_id, fecha_cita DESC, id DESC
+        ON CONFLICT (vehiculo_id, servicio_id) DO UPDATE SET
+            veces = vehiculos_servicios.veces + EXCLUDED.veces,
+            ultima_fecha = GREATEST(vehiculos_servicios.ultima_fecha, EXCLUDED.ultima_fecha),
+            ultima_cita_id = CASE
+                WHEN (EXCLUDED.ultima_fecha, EXCLUDED.ultima_cita_id)
+                    > (vehiculos_servicios.ultima_fecha, vehiculos_servicios.ultima_cita_id)
+                THEN EXCLUDED.ultima_cita_id
+                ELSE vehiculos_servicios.ultima_cita_id
+            END
+    )
+    INSERT INTO vehiculos_resumen (vehiculo_id, visitas, gasto_total, primera_visita, ultima_visita)
+    SELECT vehiculo_id, COUNT(*), COALESCE(SUM(precio), 0), MIN(fecha_cita), MAX(fecha_cita)
+    FROM completadas
+    GROUP BY vehiculo_id
+    ON CONFLICT (vehiculo_id) DO UPDATE SET
+        visitas = vehiculos_resumen.visitas + EXCLUDED.visitas,
+        gasto_total = vehiculos_resumen.gasto_total + EXCLUDED.gasto_total,
+        primera_visita = LEAST(vehiculos_resumen.primera_visita, EXCLUDED.primera_visita),
+        ultima_visita = GREATEST(vehiculos_resumen.ultima_visita, EXCLUDED.ultima_visita),
+        actualizado_en = CURRENT_TIMESTAMP;
+    
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tr_resumen_vehiculos ON citas;
+CREATE TRIGGER tr_resumen_vehiculos
+    AFTER UPDATE ON citas
+    REFERENCING OLD TABLE AS anteriores NEW TABLE AS nuevas
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION fn_resumen_vehiculos();
+
+DROP TRIGGER IF EXISTS tr_resumen_vehiculos_baja ON citas;
+CREATE TRIGGER tr_resumen_vehiculos_baja
+    AFTER DELETE ON citas
+    REFERENCING OLD TABLE AS anteriores
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION fn_resumen_vehiculos();
+
+-- Procedimiento para tomar una instantánea del stock de todos los items
+-- Ejecutar periódicamente (p. ej. diariamente) para acotar las consultas históricas
+CREATE OR REPLACE FUNCTION sp_snapshot_inventario()
+RETURNS INTEGER AS $$
+DECLARE
+    v_total INTEGER;
+BEGIN
+    -- Un acceso por índice al último movimiento de cada item, sin recorrer todo el libro
+    INSERT INTO inventario_snapshots (item_id, tomado_en, cantidad, ultimo_movimiento_id)
+    SELECT i.id, CURRENT_TIMESTAMP, i.cantidad_actual, COALESCE(m.id, 0)
+    FROM inventario i
+    LEFT JOIN LATERAL (
+        SELECT id
+        FROM inventario_movimientos
+        WHERE item_id = i.id
+        ORDER BY id DESC
+        LIMIT 1
+    ) m ON TRUE
+    ON CONFLICT (item_id, tomado_en) DO NOTHING;
+    
+    GET DIAGNOSTICS v_total = ROW_COUNT;
+    RETURN v_total;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Función para obtener el stock de un item en una fecha
+-- Un único acceso por idx_movimientos_item_fecha al último movimiento anterior a la fecha;
+-- created_at (clock_timestamp bajo el bloqueo del item) sigue el orden de los saldos
+CREATE OR REPLACE FUNCTION fn_stock_a_fecha(
+    p_item_id INTEGER,
+    p_fecha TIMESTAMP
+)
+RETURNS INTEGER AS $$
+    SELECT COALESCE(
+        (SELECT m.saldo_resultante
+         FROM inventario_movimientos m
+         WHERE m.item_id = p_item_id AND m.created_at <= p_fecha
+         ORDER BY m.created_at DESC, m.id DESC
+         LIMIT 1),
+        0
+    );
+$$ LANGUAGE sql STABLE;
+
+-- Función para obtener el stock de todos los items en una fecha
+-- Parte de la última instantánea anterior y suma solo los movimientos posteriores
+CREATE OR REPLACE FUNCTION fn_inventario_a_fecha(
+    p_fecha TIMESTAMP
+)
+RETURNS TABLE(
+    item_id INTEGER,
+    cantidad INTEGER
+) AS $$
+BEGIN
+    RETURN QUERY
+    WITH ultima_snapshot AS (
+        SELECT MAX(tomado_en) AS tomado_en
+        FROM inventario_snapshots
+        WHERE tomado_en <= p_fecha
+    ),
+    base AS (
+        SELECT s.item_id, s.cantidad, s.ultimo_movimiento_id
+        FROM inventario_snapshots s
+        JOIN ultima_snapshot u ON s.tomado_en = u.tomado_en
+    )
+    SELECT 
+        i.id,
+        (COALESCE(b.cantidad, 0) + COALESCE(SUM(m.delta), 0))::INTEGER
+    FROM inventario i
+    LEFT JOIN base b ON b.item_id = i.id
+    LEFT JOIN inventario_movimientos m 
+        ON m.item_id = i.id
+        AND m.id > COALESCE(b.ultimo_movimiento_id, 0)
+        AND m.created_at <= p_fecha
+    GROUP BY i.id, b.cantidad
+    ORDER BY i.id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Función para proyectar la demanda de repuestos de las citas agendadas
+-- Una sola consulta agregada sobre el calendario reservado (de una sede o de todas)
+DROP FUNCTION IF EXISTS fn_proyeccion_repuestos(DATE, DATE);
+CREATE OR REPLACE FUNCTION fn_proyeccion_repuestos(
+    p_desde DATE,
+    p_hasta DATE,
+    p_sede_id INTEGER DEFAULT NULL
+)
+RETURNS TABLE(
+    item_id INTEGER,
+    nombre VARCHAR(100),
+    categoria VARCHAR(50),
+    requerido INTEGER,
+    cantidad_actual INTEGER,
+    faltante INTEGER,
+    primera_fecha DATE
+) AS $$
+    SELECT 
+        i.id,
+        i.nombre,
+        i.categoria,
+        SUM(sr.cantidad)::INTEGER,
+        i.cantidad_actual,
+        GREATEST(SUM(sr.cantidad) - i.cantidad_actual, 0)::INTEGER,
+        MIN(c.fecha_cita)
+    FROM citas c
+    JOIN servicio_repuestos sr ON sr.servicio_id = c.servicio_id
+    JOIN inventario i ON i.id = sr.item_id AND i.sede_id = c.sede_id
+    WHERE c.fecha_cita BETWEEN p_desde AND p_hasta
+    AND c.estado IN ('pendiente', 'confirmada')
+    AND (p_sede_id IS NULL OR c.sede_id = p_sede_id)
+    GROUP BY i.id
+    ORDER BY 6 DESC, 4 DESC;
+$$ LANGUAGE sql STABLE;
+
+-- Función para obtener horarios disponibles de una sede
+-- Un horario sigue libre mientras tenga menos citas que puestos la sede
+DROP FUNCTION IF EXISTS fn_horarios_disponibles(DATE);
 CREATE OR REPLACE FUNCTION fn_horarios_disponibles(
-    p_fecha DATE
+    p_fecha DATE,
+    p_sede_id INTEGER DEFAULT 1
 )
 RETURNS TABLE(hora TIME) AS $$
 BEGIN
@@ -237,15 +1049,18 @@ BEGIN
         SELECT (TIME '08:00:00' + (interval '30 minutes' * generate_series(0, 19))) AS hora_disponible
     ),
     horarios_ocupados AS (
-        SELECT hora_cita 
+        SELECT hora_cita, COUNT(*) AS reservas
         FROM citas 
-        WHERE fecha_cita = p_fecha 
+        WHERE sede_id = p_sede_id
+        AND fecha_cita = p_fecha 
         AND estado != 'cancelada'
+        GROUP BY hora_cita
     )
     SELECT hb.hora_disponible
     FROM horarios_base hb
+    JOIN sedes s ON s.id = p_sede_id AND s.activa
     LEFT JOIN horarios_ocupados ho ON hb.hora_disponible = ho.hora_cita
-    WHERE ho.hora_cita IS NULL
+    WHERE COALESCE(ho.reservas, 0) < s.puestos
     AND hb.hora_disponible <= TIME '17:00:00'
     ORDER BY hb.hora_disponible;
 END;
@@ -272,11 +1087,14 @@ SELECT
     s.nombre as servicio_nombre,
     s.descripcion as servicio_descripcion,
     s.precio as servicio_precio,
-    s.duracion_minutos
+    s.duracion_minutos,
+    c.sede_id,
+    se.nombre as sede_nombre
 FROM citas c
 JOIN clientes cl ON c.cliente_id = cl.id
 JOIN vehiculos v ON c.vehiculo_id = v.id
-JOIN servicios s ON c.servicio_id = s.id;
+JOIN servicios s ON c.servicio_id = s.id
+JOIN sedes se ON c.sede_id = se.id;
 
 -- Vista para items con stock bajo
 CREATE OR REPLACE VIEW vista_stock_bajo AS
@@ -288,7 +1106,8 @@ SELECT
     cantidad_actual,
     cantidad_minima,
     (cantidad_minima - cantidad_actual) as deficit,
-    precio_unitario
+    precio_unitario,
+    sede_id
 FROM inventario 
 WHERE cantidad_actual <= cantidad_minima
 ORDER BY (cantidad_minima - cantidad_actual) DESC;
@@ -336,6 +1155,101 @@ INSERT INTO inventario (nombre, descripcion, cantidad_actual, cantidad_minima, p
 ('Grasa Multiuso', 'Grasa lubricante multiuso 500g', 8, 2, 15.00, 'Lubricantes')
 ON CONFLICT DO NOTHING;
 
+-- Saldo inicial del libro de movimientos para los items existentes
+INSERT INTO inventario_movimientos (item_id, delta, saldo_resultante, tipo, motivo)
+SELECT i.id, i.cantidad_actual, i.cantidad_actual, 'inicial', 'Saldo inicial'
+FROM inventario i
+WHERE NOT EXISTS (SELECT 1 FROM inventario_movimientos m WHERE m.item_id = i.id);
+
+-- Transiciones de estado de las citas
+INSERT INTO citas_transiciones (desde, hacia) VALUES
+('pendiente', 'confirmada'),
+('pendiente', 'completada'),
+('pendiente', 'cancelada'),
+('confirmada', 'pendiente'),
+('confirmada', 'completada'),
+('confirmada', 'cancelada')
+ON CONFLICT DO NOTHING;
+
+-- Historial inicial de las citas anteriores a los triggers (solo su estado actual)
+INSERT INTO citas_historial (cita_id, estado_anterior, estado, cambiado_en)
+SELECT c.id, NULL, c.estado, COALESCE(c.created_at, CURRENT_TIMESTAMP)
+FROM citas c
+WHERE NOT EXISTS (SELECT 1 FROM citas_historial h WHERE h.cita_id = c.id);
+
+-- Intervalos de mantenimiento de los servicios periódicos
+INSERT INTO servicios_intervalos (servicio_id, intervalo_dias)
+SELECT MIN(s.id), i.dias
+FROM (VALUES
+    ('Cambio de Aceite', 180),
+    ('Revisión General', 365),
+    ('Cambio de Frenos', 540),
+    ('Alineación y Balanceo', 180),
+    ('Cambio de Batería', 730),
+    ('Cambio de Llantas', 1095),
+    ('Limpieza de Inyectores', 365),
+    ('Revisión de Aire Acondicionado', 365),
+    ('Cambio de Amortiguadores', 1095)
+) AS i(servicio, dias)
+JOIN servicios s ON s.nombre = i.servicio
+GROUP BY i.servicio, i.dias
+ON CONFLICT DO NOTHING;
+
+-- Repuestos por servicio
+INSERT INTO servicio_repuestos (servicio_id, item_id, cantidad)
+SELECT 
+    (SELECT MIN(id) FROM servicios WHERE nombre = r.servicio),
+    (SELECT MIN(id) FROM inventario WHERE nombre = r.item),
+    r.cantidad
+FROM (VALUES
+    ('Cambio de Aceite', 'Aceite 5W-30', 1),
+    ('Cambio de Aceite', 'Filtro de Aceite Universal', 1),
+    ('Revisión General', 'Filtro de Aire', 1),
+    ('Cambio de Frenos', 'Pastillas de Freno Delanteras', 1),
+    ('Cambio de Frenos', 'Líquido de Frenos', 1),
+    ('Cambio de Batería', 'Batería 12V 60Ah', 1),
+    ('Reparación de Motor', 'Aceite 10W-40', 1),
+    ('Reparación de Motor', 'Bujías', 1),
+    ('Reparación de Motor', 'Refrigerante', 1),
+    ('Cambio de Llantas', 'Llantas 185/65R15', 4),
+    ('Cambio de Amortiguadores', 'Amortiguadores Delanteros', 1),
+    ('Cambio de Amortiguadores', 'Grasa Multiuso', 1)
+) AS r(servicio, item, cantidad)
+ON CONFLICT DO NOTHING;
+
+-- Técnicos de ejemplo de la sede principal
+INSERT INTO tecnicos (nombre, sede_id)
+SELECT t.nombre, 1
+FROM (VALUES ('Carlos Ramírez'), ('Luis Torres'), ('Ana Quispe'), ('Jorge Mendoza')) AS t(nombre)
+WHERE NOT EXISTS (SELECT 1 FROM tecnicos);
+
+-- Servicios que sabe hacer cada técnico de ejemplo (solo si aún no tiene ninguno)
+INSERT INTO tecnicos_servicios (tecnico_id, servicio_id)
+SELECT t.id, s.id
+FROM (VALUES
+    ('Carlos Ramírez', 'Cambio de Aceite'),
+    ('Carlos Ramírez', 'Revisión General'),
+    ('Carlos Ramírez', 'Cambio de Batería'),
+    ('Carlos Ramírez', 'Cambio de Llantas'),
+    ('Carlos Ramírez', 'Alineación y Balanceo'),
+    ('Luis Torres', 'Reparación de Motor'),
+    ('Luis Torres', 'Limpieza de Inyectores'),
+    ('Luis Torres', 'Revisión General'),
+    ('Luis Torres', 'Cambio de Aceite'),
+    ('Ana Quispe', 'Cambio de Frenos'),
+    ('Ana Quispe', 'Cambio de Amortiguadores'),
+    ('Ana Quispe', 'Alineación y Balanceo'),
+    ('Ana Quispe', 'Cambio de Llantas'),
+    ('Jorge Mendoza', 'Revisión de Aire Acondicionado'),
+    ('Jorge Mendoza', 'Cambio de Batería'),
+    ('Jorge Mendoza', 'Revisión General'),
+    ('Jorge Mendoza', 'Cambio de Aceite')
+) AS e(tecnico, servicio)
+JOIN tecnicos t ON t.nombre = e.tecnico
+JOIN servicios s ON s.nombre = e.servicio
+WHERE NOT EXISTS (SELECT 1 FROM tecnicos_servicios x WHERE x.tecnico_id = t.id)
+ON CONFLICT DO NOTHING;
+
 -- Insertar algunos clientes y vehículos de ejemplo (opcional)
 INSERT INTO clientes (nombre, telefono, email, direccion) VALUES
 ('Juan Pérez', '987654321', 'juan.perez@email.com', 'Av. Arequipa 123, Lima'),
@@ -354,7 +1268,7 @@ ON CONFLICT DO NOTHING;
 
 -- Trigger para validar horarios de trabajo
 CREATE OR REPLACE FUNCTION fn_validar_horario_cita()
-RETURNS TRIGGER AS $
+RETURNS TRIGGER AS $$
 BEGIN
     -- Validar que la cita esté en horario de trabajo (8:00 AM - 5:30 PM)
     IF NEW.hora_cita < TIME '08:00:00' OR NEW.hora_cita > TIME '17:30:00' THEN
@@ -373,7 +1287,7 @@ BEGIN
     
     RETURN NEW;
 END;
-$ LANGUAGE plpgsql;
+$$ LANGUAGE plpgsql;
 
 CREATE TRIGGER tr_validar_horario_cita
     BEFORE INSERT OR UPDATE ON citas
@@ -391,7 +1305,7 @@ RETURNS TABLE(
     citas_completadas BIGINT,
     ingresos_totales NUMERIC,
     servicios_mas_solicitados TEXT
-) AS $
+) AS $$
 BEGIN
     RETURN QUERY
     WITH citas_por_dia AS (
@@ -425,7 +1339,7 @@ BEGIN
     LEFT JOIN servicios_populares sp ON cpd.fecha_cita = sp.fecha_cita
     ORDER BY cpd.fecha_cita;
 END;
-$ LANGUAGE plpgsql;
+$$ LANGUAGE plpgsql;
 
 -- Función para notificar stock bajo
 CREATE OR REPLACE FUNCTION fn_notificar_stock_bajo()
@@ -435,7 +1349,7 @@ RETURNS TABLE(
     cantidad_actual INTEGER,
     cantidad_minima INTEGER,
     deficit INTEGER
-) AS $
+) AS $$
 BEGIN
     RETURN QUERY
     SELECT 
@@ -448,7 +1362,108 @@ BEGIN
     WHERE i.cantidad_actual <= i.cantidad_minima
     ORDER BY (i.cantidad_minima - i.cantidad_actual) DESC;
 END;
-$ LANGUAGE plpgsql;
+$$ LANGUAGE plpgsql;
+
+-- Trigger para publicar cambios de stock bajo (LISTEN stock_bajo)
+CREATE OR REPLACE FUNCTION fn_trigger_stock_bajo()
+RETURNS TRIGGER AS $$
+DECLARE
+    item inventario%ROWTYPE;
+    estaba_bajo BOOLEAN := FALSE;
+    esta_bajo BOOLEAN := FALSE;
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD IS NOT DISTINCT FROM NEW THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        estaba_bajo := OLD.cantidad_actual <= OLD.cantidad_minima;
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        item := OLD;
+    ELSE
+        item := NEW;
+        esta_bajo := NEW.cantidad_actual <= NEW.cantidad_minima;
+    END IF;
+
+    -- Se notifican los cruces del mínimo y los cambios de items que siguen en stock bajo
+    IF estaba_bajo OR esta_bajo THEN
+        PERFORM pg_notify('stock_bajo', json_build_object(
+            'id', item.id,
+            'nombre', item.nombre,
+            'descripcion', LEFT(item.descripcion, 200),
+            'categoria', item.categoria,
+            'cantidad_actual', item.cantidad_actual,
+            'cantidad_minima', item.cantidad_minima,
+            'sede_id', item.sede_id,
+            'bajo', esta_bajo,
+            'cruce', estaba_bajo <> esta_bajo
+        )::text);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tr_stock_bajo ON inventario;
+CREATE TRIGGER tr_stock_bajo
+    AFTER INSERT OR UPDATE OR DELETE ON inventario
+    FOR EACH ROW
+    EXECUTE FUNCTION fn_trigger_stock_bajo();
+
+-- Trigger para invalidar la caché del catálogo en la aplicación (LISTEN catalogo)
+CREATE OR REPLACE FUNCTION fn_trigger_catalogo()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- TG_ARGV[0]: etiqueta de la caché afectada ('servicios', 'categorias', 'sedes')
+    PERFORM pg_notify('catalogo', TG_ARGV[0]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tr_catalogo_servicios ON servicios;
+CREATE TRIGGER tr_catalogo_servicios
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON servicios
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION fn_trigger_catalogo('servicios');
+
+DROP TRIGGER IF EXISTS tr_catalogo_categorias ON inventario;
+CREATE TRIGGER tr_catalogo_categorias
+    AFTER INSERT OR DELETE OR UPDATE OF categoria OR TRUNCATE ON inventario
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION fn_trigger_catalogo('categorias');
+
+DROP TRIGGER IF EXISTS tr_catalogo_sedes ON sedes;
+CREATE TRIGGER tr_catalogo_sedes
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON sedes
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION fn_trigger_catalogo('sedes');
+
+-- Trigger para publicar los cambios de citas (LISTEN citas): alimenta el calendario en vivo
+CREATE OR REPLACE FUNCTION fn_trigger_citas_cambios()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('citas', json_build_object('id', OLD.id, 'fecha', OLD.fecha_cita)::text);
+    ELSIF TG_OP = 'INSERT' THEN
+        PERFORM pg_notify('citas', json_build_object('id', NEW.id, 'fecha', NEW.fecha_cita)::text);
+    ELSIF OLD IS DISTINCT FROM NEW THEN
+        PERFORM pg_notify('citas', json_build_object(
+            'id', NEW.id,
+            'fecha', NEW.fecha_cita,
+            'fecha_anterior', NULLIF(OLD.fecha_cita, NEW.fecha_cita)
+        )::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tr_citas_cambios ON citas;
+CREATE TRIGGER tr_citas_cambios
+    AFTER INSERT OR UPDATE OR DELETE ON citas
+    FOR EACH ROW
+    EXECUTE FUNCTION fn_trigger_citas_cambios();
 
 -- Crear índices adicionales para optimización
 CREATE INDEX IF NOT EXISTS idx_citas_cliente_fecha ON citas(cliente_id, fecha_cita);
@@ -456,6 +1471,12 @@ CREATE INDEX IF NOT EXISTS idx_citas_servicio_estado ON citas(servicio_id, estad
 CREATE INDEX IF NOT EXISTS idx_vehiculos_cliente ON vehiculos(cliente_id);
 CREATE INDEX IF NOT EXISTS idx_inventario_stock_bajo ON inventario(cantidad_actual, cantidad_minima);
 
+-- Reconstruir el resumen por categoría (idempotente al re-ejecutar el script)
+SELECT sp_recalcular_resumen_inventario();
+
+-- Reconstruir el resumen por vehículo
+SELECT sp_recalcular_resumen_vehiculos();
+
 -- Comentarios en las tablas
 COMMENT ON TABLE usuarios IS 'Tabla de usuarios del sistema (administradores)';
 COMMENT ON TABLE clientes IS 'Tabla de clientes del taller';
@@ -463,13 +1484,15 @@ COMMENT ON TABLE vehiculos IS 'Tabla de vehículos asociados a clientes';
 COMMENT ON TABLE servicios IS 'Tabla de servicios ofrecidos por el taller';
 COMMENT ON TABLE citas IS 'Tabla de citas agendadas';
 COMMENT ON TABLE inventario IS 'Tabla de inventario de repuestos y materiales';
+COMMENT ON TABLE sedes IS 'Sedes del taller con su ubicación y puestos de atención';
+COMMENT ON TABLE tecnicos IS 'Técnicos de cada sede con su turno';
 
 -- Mensaje de confirmación
-DO $
+DO $$
 BEGIN
     RAISE NOTICE 'Base de datos del Taller Automotriz configurada exitosamente!';
     RAISE NOTICE 'Usuario administrador: admin';
     RAISE NOTICE 'Contraseña: admin123';
     RAISE NOTICE 'Servicios iniciales: % registrados', (SELECT COUNT(*) FROM servicios);
     RAISE NOTICE 'Items de inventario: % registrados', (SELECT COUNT(*) FROM inventario);
-END $;
\ No newline at end of file
+END $$;
\ No newline at end of file
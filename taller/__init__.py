@@ -0,0 +1 @@
+"""Módulos compartidos de Taller AutoMax"""
@@ -0,0 +1,48 @@
+"""Control de admisión de consultas pesadas
+
+Los reportes recorren meses de citas e historial. Si muchos se piden a la vez
+ocupan las conexiones y la CPU de la base de datos que necesitan las reservas.
+Cada proceso deja correr a lo sumo DB_MAX_REPORTES a la vez; los demás esperan
+turno hasta DB_ESPERA_REPORTES segundos, sin tomar conexión, y luego se
+rechazan con Saturado. Las clases sin límite pasan directo.
+"""
+import threading
+from contextlib import contextmanager
+
+from taller import metricas
+from taller.config import DB_ESPERA_REPORTES, DB_MAX_REPORTES
+from taller.errores import Saturado
+
+class LimiteConcurrencia:
+    """Semáforo con espera acotada para una clase de consultas"""
+
+    def __init__(self, clase: str, maximo: int, espera: float):
+        self.clase = clase
+        self.maximo = maximo
+        self.espera = espera
+        self._semaforo = threading.BoundedSemaphore(maximo)
+
+    @contextmanager
+    def turno(self):
+        """Ocupa un lugar mientras dura el bloque; Saturado si no se libera ninguno a tiempo"""
+        if not self._semaforo.acquire(timeout=self.espera):
+            metricas.db_admision_rechazos.inc(clase=self.clase)
+            raise Saturado("Hay muchos reportes en curso; intente de nuevo en unos segundos")
+        metricas.db_admision_en_curso.inc(clase=self.clase)
+        try:
+            yield
+        finally:
+            self._semaforo.release()
+            metricas.db_admision_en_curso.dec(clase=self.clase)
+
+LIMITES = {'reporte': LimiteConcurrencia('reporte', DB_MAX_REPORTES, DB_ESPERA_REPORTES)}
+
+@contextmanager
+def admitir(clase: str):
+    """Turno de la clase si tiene límite de concurrencia"""
+    limite = LIMITES.get(clase)
+    if limite is None:
+        yield
+        return
+    with limite.turno():
+        yield
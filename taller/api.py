@@ -0,0 +1,311 @@
+"""API HTTP/JSON de Taller AutoMax
+
+Expone la capa de servicios (taller.citas, taller.inventario) para canales
+externos como bots de WhatsApp o sitios de socios. El bucle asíncrono solo
+atiende HTTP; las llamadas a la base de datos corren en un pool de hilos
+propio del tamaño del pool de conexiones.
+
+Uso:
+    python -m taller.api --host 0.0.0.0 --port 8000 --workers 10
+"""
+import argparse
+import asyncio
+import contextvars
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time
+from decimal import Decimal
+from time import perf_counter
+from typing import Optional
+
+from aiohttp import web
+
+from taller import citas, inventario, metricas, sedes, vehiculos
+from taller.catalogo import EscuchaCatalogo
+from taller.config import API_TOKEN, DB_CONFIG, DB_MAX_RETRASO_REPLICA, DB_REPLICAS
+from taller.db import DatabaseManager
+from taller.errores import Conflicto, DatosInvalidos, ErrorBaseDatos, NoEncontrado, Saturado, TallerError, TiempoAgotado
+
+ESTADOS_HTTP = {
+    DatosInvalidos: 400,
+    NoEncontrado: 404,
+    Conflicto: 409,
+    ErrorBaseDatos: 503,
+    Saturado: 503,
+    TiempoAgotado: 504
+}
+
+# Estados que un cliente puede asignar a su propia cita sin token, acreditando su teléfono
+ESTADOS_CLIENTE = ('confirmada', 'cancelada')
+
+def _serializar(valor):
+    """Convierte fechas, horas y decimales a tipos JSON"""
+    if isinstance(valor, (date, datetime, time)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+_dumps = functools.partial(json.dumps, default=_serializar, ensure_ascii=False)
+
+def _respuesta(datos, status: int = 200) -> web.Response:
+    return web.json_response(datos, status=status, dumps=_dumps)
+
+async def _en_pool(request: web.Request, funcion, *args, **kwargs):
+    """Ejecuta una función de servicio en el pool de hilos de la API
+
+    Cada petición corre en un contexto propio, de modo que la lectura tras
+    escritura de taller.replicas no se mezcla entre peticiones del mismo hilo.
+    """
+    loop = asyncio.get_running_loop()
+    llamada = functools.partial(contextvars.copy_context().run, funcion, request.app['db'], *args, **kwargs)
+    return await loop.run_in_executor(request.app['executor'], llamada)
+
+async def _json(request: web.Request) -> dict:
+    try:
+        datos = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise DatosInvalidos("El cuerpo debe ser JSON válido")
+    if not isinstance(datos, dict):
+        raise DatosInvalidos("El cuerpo debe ser un objeto JSON")
+    return datos
+
+def _entero(valor, campo: str) -> int:
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise DatosInvalidos(f"'{campo}' debe ser un número entero")
+
+def _numero(valor, campo: str) -> float:
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        raise DatosInvalidos(f"'{campo}' debe ser un número")
+
+def _fecha(valor, campo: str) -> date:
+    try:
+        return date.fromisoformat(valor)
+    except (TypeError, ValueError):
+        raise DatosInvalidos(f"'{campo}' debe tener formato AAAA-MM-DD")
+
+def _hora(valor, campo: str) -> time:
+    try:
+        return time.fromisoformat(valor)
+    except (TypeError, ValueError):
+        raise DatosInvalidos(f"'{campo}' debe tener formato HH:MM")
+
+def _requiere_token(request: web.Request):
+    """Las operaciones administrativas exigen el token configurado"""
+    token = request.app['token']
+    if not token:
+        raise web.HTTPForbidden(text=_dumps({'error': "Operación deshabilitada: defina TALLER_API_TOKEN"}),
+                                content_type='application/json')
+    if request.headers.get('Authorization') != f"Bearer {token}":
+        raise web.HTTPUnauthorized(text=_dumps({'error': "Token inválido"}),
+                                   content_type='application/json')
+
+def _con_token(request: web.Request) -> bool:
+    token = request.app['token']
+    return bool(token) and request.headers.get('Authorization') == f"Bearer {token}"
+
+def _titular(request: web.Request, telefono: Optional[str]) -> Optional[str]:
+    """Teléfono con el que el cliente acredita ser titular de la cita (None con el token)
+
+    Sin token ni teléfono la operación se trata como administrativa.
+    """
+    if _con_token(request):
+        return None
+    telefono = (telefono or '').strip()
+    if not telefono:
+        _requiere_token(request)
+    return telefono
+
+@web.middleware
+async def medir_peticiones(request: web.Request, handler):
+    """Cuenta peticiones y latencia por ruta (plantilla, no URL concreta) y estado HTTP"""
+    recurso = request.match_info.route.resource
+    ruta = recurso.canonical if recurso is not None else 'desconocida'
+    inicio = perf_counter()
+    estado = 500
+    try:
+        respuesta = await handler(request)
+        estado = respuesta.status
+        return respuesta
+    except web.HTTPException as e:
+        estado = e.status
+        raise
+    finally:
+        metricas.api_peticiones.inc(ruta=ruta, estado=estado)
+        metricas.api_duracion.observar(perf_counter() - inicio, ruta=ruta)
+
+@web.middleware
+async def manejar_errores(request: web.Request, handler):
+    """Traduce los errores de la capa de servicios a respuestas JSON"""
+    try:
+        return await handler(request)
+    except TallerError as e:
+        return _respuesta({'error': str(e)}, ESTADOS_HTTP.get(type(e), 500))
+
+async def salud(request: web.Request) -> web.Response:
+    await _en_pool(request, lambda db: db.consultar("SELECT 1"))
+    return _respuesta({'estado': 'ok'})
+
+async def exponer_metricas(request: web.Request) -> web.Response:
+    """Métricas del proceso en formato de texto de Prometheus"""
+    return web.Response(body=metricas.registro.exponer().encode('utf-8'),
+                        headers={'Content-Type': metricas.TIPO_CONTENIDO})
+
+async def listar_servicios(request: web.Request) -> web.Response:
+    return _respuesta(await _en_pool(request, citas.listar_servicios))
+
+async def listar_sedes(request: web.Request) -> web.Response:
+    return _respuesta(await _en_pool(request, sedes.listar_sedes))
+
+async def sede_cercana(request: web.Request) -> web.Response:
+    """Sede más cercana a ?lat=&lon= o al centro de ?distrito="""
+    distrito = request.query.get('distrito')
+    if distrito:
+        return _respuesta(await _en_pool(request, sedes.sede_por_distrito, distrito))
+    latitud = _numero(request.query.get('lat'), 'lat')
+    longitud = _numero(request.query.get('lon'), 'lon')
+    return _respuesta(await _en_pool(request, sedes.sede_mas_cercana, latitud, longitud))
+
+async def horarios(request: web.Request) -> web.Response:
+    fecha = _fecha(request.query.get('fecha'), 'fecha')
+    sede_id = _entero(request.query.get('sede', sedes.SEDE_PRINCIPAL), 'sede')
+    return _respuesta({
+        'fecha': fecha,
+        'sede_id': sede_id,
+        'horarios': await _en_pool(request, citas.horarios_disponibles, fecha, sede_id)
+    })
+
+async def crear_cita(request: web.Request) -> web.Response:
+    datos = await _json(request)
+    reserva = dict(
+        nombre=datos.get('nombre'),
+        telefono=datos.get('telefono'),
+        marca=datos.get('marca'),
+        modelo=datos.get('modelo'),
+        placa=datos.get('placa'),
+        servicio_id=_entero(datos.get('servicio_id'), 'servicio_id'),
+        fecha_cita=_fecha(datos.get('fecha'), 'fecha'),
+        hora_cita=_hora(datos.get('hora'), 'hora'),
+        email=datos.get('email'),
+        direccion=datos.get('direccion'),
+        año=_entero(datos['año'], 'año') if datos.get('año') is not None else None,
+        color=datos.get('color'),
+        observaciones=datos.get('observaciones'),
+        sede_id=_entero(datos.get('sede_id', sedes.SEDE_PRINCIPAL), 'sede_id')
+    )
+    # Encabezado Idempotency-Key: un reintento con la misma clave y los mismos datos devuelve la
+    # cita original; la clave sola no basta, así que otro cliente o cuerpo no recibe esa cita
+    clave = request.headers.get('Idempotency-Key')
+    resultado = await _en_pool(
+        request,
+        citas.agendar_cita,
+        **reserva,
+        clave_idempotencia=citas.clave_reserva('api', clave=clave, **reserva) if clave else None
+    )
+    return _respuesta(resultado, 200 if resultado['repetida'] else 201)
+
+async def buscar_citas(request: web.Request) -> web.Response:
+    """Citas por teléfono: sin token solo las del número completo, con token también por fragmento"""
+    telefono = request.query.get('telefono', '').strip()
+    if not telefono:
+        raise DatosInvalidos("Indique el parámetro 'telefono'")
+    exacto = not _con_token(request)
+    return _respuesta(await _en_pool(request, citas.buscar_citas_por_telefono, telefono, exacto))
+
+async def obtener_cita(request: web.Request) -> web.Response:
+    cita_id = _entero(request.match_info['cita_id'], 'cita_id')
+    telefono = _titular(request, request.query.get('telefono'))
+    return _respuesta(await _en_pool(request, citas.obtener_cita, cita_id, telefono))
+
+async def actualizar_cita(request: web.Request) -> web.Response:
+    cita_id = _entero(request.match_info['cita_id'], 'cita_id')
+    datos = await _json(request)
+    estado = datos.get('estado')
+    if estado in ESTADOS_CLIENTE:
+        telefono = _titular(request, datos.get('telefono'))
+    else:
+        _requiere_token(request)
+        telefono = None
+    await _en_pool(request, citas.actualizar_estado, cita_id, estado, telefono=telefono)
+    return _respuesta({'id': cita_id, 'estado': estado})
+
+async def ficha_vehiculo(request: web.Request) -> web.Response:
+    _requiere_token(request)
+    return _respuesta(await _en_pool(request, vehiculos.ficha_vehiculo, request.match_info['placa']))
+
+async def historial_vehiculo(request: web.Request) -> web.Response:
+    _requiere_token(request)
+    limite = _entero(request.query.get('limite', 50), 'limite')
+    ficha = await _en_pool(request, vehiculos.ficha_vehiculo, request.match_info['placa'])
+    historial = await _en_pool(request, vehiculos.historial_vehiculo, ficha['id'], limite)
+    return _respuesta({'vehiculo_id': ficha['id'], 'placa': ficha['placa'], 'citas': historial})
+
+async def stock_bajo(request: web.Request) -> web.Response:
+    _requiere_token(request)
+    sede = request.query.get('sede')
+    sede_id = _entero(sede, 'sede') if sede else None
+    return _respuesta(await _en_pool(request, inventario.items_stock_bajo, sede_id))
+
+async def registrar_movimiento(request: web.Request) -> web.Response:
+    _requiere_token(request)
+    item_id = _entero(request.match_info['item_id'], 'item_id')
+    datos = await _json(request)
+    saldo = await _en_pool(
+        request,
+        inventario.registrar_movimiento,
+        item_id,
+        _entero(datos.get('delta'), 'delta'),
+        datos.get('tipo'),
+        datos.get('motivo'),
+        datos.get('usuario')
+    )
+    return _respuesta({'item_id': item_id, 'cantidad_actual': saldo}, 201)
+
+def crear_app(config: dict = DB_CONFIG, workers: int = 10, token: str = API_TOKEN) -> web.Application:
+    """Crea la aplicación con su pool de conexiones y de hilos"""
+    app = web.Application(middlewares=[medir_peticiones, manejar_errores])
+    app['db'] = DatabaseManager(config, maximo=workers, replicas=DB_REPLICAS, max_retraso=DB_MAX_RETRASO_REPLICA)
+    app['executor'] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='taller-api')
+    app['token'] = token
+    # El catálogo de /servicios se sirve desde caché; los cambios llegan por NOTIFY
+    app['escucha_catalogo'] = EscuchaCatalogo(config)
+
+    async def cerrar(app: web.Application):
+        app['executor'].shutdown(wait=True)
+        app['db'].cerrar()
+
+    app.on_cleanup.append(cerrar)
+    app.add_routes([
+        web.get('/salud', salud),
+        web.get('/metrics', exponer_metricas),
+        web.get('/servicios', listar_servicios),
+        web.get('/sedes', listar_sedes),
+        web.get('/sedes/cercana', sede_cercana),
+        web.get('/horarios', horarios),
+        web.post('/citas', crear_cita),
+        web.get('/citas', buscar_citas),
+        web.get('/citas/{cita_id}', obtener_cita),
+        web.patch('/citas/{cita_id}', actualizar_cita),
+        web.get('/vehiculos/{placa}', ficha_vehiculo),
+        web.get('/vehiculos/{placa}/citas', historial_vehiculo),
+        web.get('/inventario/stock-bajo', stock_bajo),
+        web.post('/inventario/{item_id}/movimientos', registrar_movimiento)
+    ])
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="API HTTP de Taller AutoMax")
+    parser.add_argument('--host', default='0.0.0.0', help="Dirección de escucha")
+    parser.add_argument('--port', type=int, default=8000, help="Puerto de escucha")
+    parser.add_argument('--workers', type=int, default=10, help="Hilos y conexiones a la base de datos")
+    args = parser.parse_args()
+
+    web.run_app(crear_app(DB_CONFIG, args.workers), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
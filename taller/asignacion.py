@@ -0,0 +1,282 @@
+"""Asignación diaria de citas a técnicos y puestos de trabajo
+
+Con las citas agendadas de un día en una sede, la duración de cada servicio y
+lo que sabe hacer cada técnico, arma un plan sin choques: ningún técnico ni
+puesto atiende dos trabajos a la vez, nadie hace un servicio que no sabe y
+ningún trabajo empieza antes de que llegue el vehículo. El costo del plan suma
+la espera de los clientes, el ocio de los técnicos entre un trabajo y el
+siguiente y las horas extra pasada su salida, cada uno con su peso.
+
+Hay dos modos:
+- rápido: voraz por orden de llegada; cada trabajo va al técnico que menos
+  encarece el plan. Responde en milisegundos aun con cientos de citas.
+- exacto: ramificación y poda sobre el técnico de cada trabajo, partiendo del
+  plan voraz como cota. Es óptimo entre los planes que atienden por orden de
+  llegada y solo se permite en días chicos (MAX_EXACTO trabajos). Si la
+  búsqueda no termina en LIMITE_EXACTO segundos devuelve el mejor plan
+  encontrado con optimo=False.
+
+Los tiempos se manejan en minutos desde la medianoche. Los puestos son los
+`puestos` de la sede.
+"""
+import time
+from bisect import bisect_right, insort
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from psycopg2.extras import execute_values
+
+from taller.db import DatabaseManager
+from taller.errores import DatosInvalidos
+from taller.sedes import SEDE_PRINCIPAL
+
+PESO_ESPERA = 1.0
+PESO_OCIO = 1.0
+PESO_EXTRA = 1.5
+MAX_EXACTO = 12
+LIMITE_EXACTO = 2.0
+# Los sábados se atiende hasta las 2:00 PM (fn_validar_horario_cita): el turno termina ahí
+SALIDA_SABADO = 14 * 60
+
+def _minutos(hora) -> int:
+    return hora.hour * 60 + hora.minute
+
+def _elegir_puesto(puestos: List[Tuple[int, int]], listo: int) -> int:
+    """Posición en `puestos` (pares libre, puesto ordenados) del que quedó libre más
+    tarde sin pasar de `listo`; si ninguno, el primero en liberarse"""
+    return max(0, bisect_right(puestos, (listo, float('inf'))) - 1)
+
+def _ocupar_puesto(puestos: List[Tuple[int, int]], posicion: int, fin: int) -> Tuple[int, int]:
+    """Marca el puesto ocupado hasta `fin` manteniendo el orden; devuelve el par anterior"""
+    anterior = puestos.pop(posicion)
+    insort(puestos, (fin, anterior[1]))
+    return anterior
+
+def _liberar_puesto(puestos: List[Tuple[int, int]], anterior: Tuple[int, int], fin: int):
+    """Deshace _ocupar_puesto"""
+    puestos.remove((fin, anterior[1]))
+    insort(puestos, anterior)
+
+def _evaluar(trabajo: Dict, tecnico: Dict, libre: Optional[int], puestos: List[Tuple[int, int]]):
+    """Posición del puesto, inicio, fin, espera, ocio, horas extra y costo de sumar el trabajo al técnico"""
+    listo = max(trabajo['llegada'], tecnico['entrada'], libre or 0)
+    posicion = _elegir_puesto(puestos, listo)
+    inicio = max(listo, puestos[posicion][0])
+    fin = inicio + trabajo['duracion']
+    espera = inicio - trabajo['llegada']
+    ocio = inicio - libre if libre is not None else 0
+    extra = max(0, fin - tecnico['salida']) - max(0, (libre or 0) - tecnico['salida'])
+    costo = PESO_ESPERA * espera + PESO_OCIO * ocio + PESO_EXTRA * extra
+    return posicion, inicio, fin, espera, ocio, extra, costo
+
+def asignar(trabajos: Sequence[Dict], tecnicos: Sequence[Dict], puestos: int, exacto: bool = False) -> Dict:
+    """Plan de un día: a qué técnico y puesto va cada trabajo y a qué hora empieza
+
+    trabajos: dicts con cita_id, llegada y duracion (minutos) y servicio_id.
+    tecnicos: dicts con id, entrada y salida (minutos) y servicios (ids que sabe hacer).
+    Los trabajos que ningún técnico sabe hacer quedan en sin_asignar.
+    """
+    if puestos < 1:
+        raise DatosInvalidos("La sede necesita al menos un puesto")
+    inicio_calculo = time.perf_counter()
+
+    # Por orden de llegada; a igual hora, primero los más largos
+    orden = sorted(trabajos, key=lambda t: (t['llegada'], -t['duracion'], t['cita_id']))
+    candidatos = []
+    sin_asignar = []
+    for trabajo in orden:
+        aptos = [i for i, tecnico in enumerate(tecnicos) if trabajo['servicio_id'] in tecnico['servicios']]
+        if aptos:
+            # Los técnicos con menos especialidades primero: los versátiles quedan para lo que solo ellos saben
+            aptos.sort(key=lambda i: (len(tecnicos[i]['servicios']), tecnicos[i]['id']))
+            candidatos.append((trabajo, aptos))
+        else:
+            sin_asignar.append(trabajo['cita_id'])
+
+    if exacto and len(candidatos) > MAX_EXACTO:
+        raise DatosInvalidos(f"El modo exacto admite hasta {MAX_EXACTO} trabajos; el día tiene {len(candidatos)}")
+
+    plan, costo = _voraz(candidatos, tecnicos, puestos)
+    optimo = False
+    if exacto:
+        plan, costo, optimo = _exacto(candidatos, tecnicos, puestos, plan, costo, inicio_calculo + LIMITE_EXACTO)
+
+    asignaciones = [
+        {
+            'cita_id': trabajo['cita_id'], 'tecnico_id': tecnicos[t]['id'], 'puesto': puesto + 1,
+            'inicio': inicio, 'fin': fin, 'espera': espera
+        }
+        for (trabajo, _), (t, puesto, inicio, fin, espera, _, _) in zip(candidatos, plan)
+    ]
+    return {
+        'asignaciones': sorted(asignaciones, key=lambda a: (a['inicio'], a['puesto'])),
+        'sin_asignar': sin_asignar,
+        'espera': sum(paso[4] for paso in plan),
+        'ocio': sum(paso[5] for paso in plan),
+        'extra': sum(paso[6] for paso in plan),
+        'costo': costo,
+        'exacto': exacto,
+        'optimo': optimo,
+        'milisegundos': (time.perf_counter() - inicio_calculo) * 1000
+    }
+
+def _voraz(candidatos, tecnicos, puestos: int):
+    """Cada trabajo, en orden, al técnico que menos aumenta el costo"""
+    libres = [None] * len(tecnicos)
+    libres_puesto = [(0, puesto) for puesto in range(puestos)]
+    plan = []
+    costo = 0.0
+    for trabajo, aptos in candidatos:
+        mejor = None
+        for t in aptos:
+            evaluacion = _evaluar(trabajo, tecnicos[t], libres[t], libres_puesto)
+            if mejor is None or evaluacion[6] < mejor[1][6]:
+                mejor = (t, evaluacion)
+        t, (posicion, inicio, fin, espera, ocio, extra, incremento) = mejor
+        libres[t] = fin
+        puesto = _ocupar_puesto(libres_puesto, posicion, fin)[1]
+        plan.append((t, puesto, inicio, fin, espera, ocio, extra))
+        costo += incremento
+    return plan, costo
+
+def _exacto(candidatos, tecnicos, puestos: int, plan_inicial, costo_inicial, limite: float):
+    """Ramificación y poda sobre el técnico de cada trabajo; devuelve plan, costo y si es óptimo
+
+    Cada paso solo suma costo, así que una rama se descarta en cuanto iguala
+    al mejor plan conocido. Técnicos con el mismo turno y especialidades son
+    intercambiables, igual que los puestos: un estado ya alcanzado con menor
+    costo no se vuelve a explorar.
+    """
+    firmas = [(tecnico['entrada'], tecnico['salida'], frozenset(tecnico['servicios'])) for tecnico in tecnicos]
+    grupos = {}
+    for t, firma in enumerate(firmas):
+        grupos.setdefault(firma, []).append(t)
+    grupos = list(grupos.values())
+
+    libres = [None] * len(tecnicos)
+    libres_puesto = [(0, puesto) for puesto in range(puestos)]
+    actual = []
+    mejor = [costo_inicial, plan_inicial]
+    visitados = {}
+    agotado = [False]
+
+    def ramificar(indice: int, costo: float):
+        if costo >= mejor[0] or agotado[0]:
+            return
+        if time.perf_counter() > limite:
+            agotado[0] = True
+            return
+        if indice == len(candidatos):
+            mejor[0], mejor[1] = costo, list(actual)
+            return
+
+        estado = (indice, tuple(tuple(sorted(libres[t] or -1 for t in grupo)) for grupo in grupos),
+                  tuple(libre for libre, _ in libres_puesto))
+        if visitados.get(estado, float('inf')) <= costo:
+            return
+        visitados[estado] = costo
+
+        trabajo, aptos = candidatos[indice]
+        opciones = []
+        vistos = set()
+        for t in aptos:
+            if libres[t] is None:
+                if firmas[t] in vistos:
+                    continue
+                vistos.add(firmas[t])
+            opciones.append((t, _evaluar(trabajo, tecnicos[t], libres[t], libres_puesto)))
+        # Las ramas más baratas primero: encuentran antes buenas cotas
+        opciones.sort(key=lambda opcion: opcion[1][6])
+
+        for t, (posicion, inicio, fin, espera, ocio, extra, incremento) in opciones:
+            libre_tecnico = libres[t]
+            libres[t] = fin
+            anterior = _ocupar_puesto(libres_puesto, posicion, fin)
+            actual.append((t, anterior[1], inicio, fin, espera, ocio, extra))
+            ramificar(indice + 1, costo + incremento)
+            actual.pop()
+            libres[t] = libre_tecnico
+            _liberar_puesto(libres_puesto, anterior, fin)
+
+    ramificar(0, 0.0)
+    return mejor[1], mejor[0], not agotado[0]
+
+def cargar_dia(db: DatabaseManager, fecha: date, sede_id: int = SEDE_PRINCIPAL):
+    """Trabajos agendados, técnicos activos y puestos de la sede para la fecha"""
+    filas = db.consultar("""
+        SELECT c.id AS cita_id, c.hora_cita, c.servicio_id, s.duracion_minutos
+        FROM citas c
+        JOIN servicios s ON s.id = c.servicio_id
+        WHERE c.sede_id = %s
+        AND c.fecha_cita = %s
+        AND c.estado IN ('pendiente', 'confirmada')
+    """, (sede_id, fecha))
+    trabajos = [
+        {'cita_id': fila['cita_id'], 'llegada': _minutos(fila['hora_cita']),
+         'duracion': fila['duracion_minutos'], 'servicio_id': fila['servicio_id']}
+        for fila in filas
+    ]
+
+    filas = db.consultar("""
+        SELECT t.id, t.nombre, t.hora_entrada, t.hora_salida,
+               COALESCE(array_agg(ts.servicio_id) FILTER (WHERE ts.servicio_id IS NOT NULL), '{}') AS servicios
+        FROM tecnicos t
+        LEFT JOIN tecnicos_servicios ts ON ts.tecnico_id = t.id
+        WHERE t.sede_id = %s
+        AND t.activo
+        GROUP BY t.id
+        ORDER BY t.id
+    """, (sede_id,))
+    salida_maxima = SALIDA_SABADO if fecha.weekday() == 5 else 24 * 60
+    tecnicos = [
+        {'id': fila['id'], 'nombre': fila['nombre'], 'entrada': _minutos(fila['hora_entrada']),
+         'salida': min(_minutos(fila['hora_salida']), salida_maxima), 'servicios': frozenset(fila['servicios'])}
+        for fila in filas
+    ]
+
+    puestos = db.consultar("SELECT puestos FROM sedes WHERE id = %s", (sede_id,))
+    return trabajos, tecnicos, puestos[0]['puestos'] if puestos else 1
+
+def planificar_dia(db: DatabaseManager, fecha: date, sede_id: int = SEDE_PRINCIPAL, exacto: bool = False) -> Dict:
+    """Plan del día con horas reales y el nombre de cada técnico (no se guarda)"""
+    trabajos, tecnicos, puestos = cargar_dia(db, fecha, sede_id)
+    if trabajos and not tecnicos:
+        raise DatosInvalidos("La sede no tiene técnicos activos")
+    plan = asignar(trabajos, tecnicos, puestos, exacto)
+
+    medianoche = datetime.combine(fecha, datetime.min.time())
+    nombres = {tecnico['id']: tecnico['nombre'] for tecnico in tecnicos}
+    for asignacion in plan['asignaciones']:
+        asignacion['inicio'] = medianoche + timedelta(minutes=asignacion['inicio'])
+        asignacion['fin'] = medianoche + timedelta(minutes=asignacion['fin'])
+        asignacion['tecnico_nombre'] = nombres[asignacion['tecnico_id']]
+    return plan
+
+def guardar_plan(db: DatabaseManager, fecha: date, sede_id: int, asignaciones: List[Dict]) -> int:
+    """Reemplaza en una transacción la asignación guardada de las citas del día en la sede"""
+    with db.transaccion() as cursor:
+        cursor.execute("""
+            DELETE FROM citas_asignaciones a
+            USING citas c
+            WHERE c.id = a.cita_id
+            AND c.sede_id = %s
+            AND c.fecha_cita = %s
+        """, (sede_id, fecha))
+        execute_values(cursor, """
+            INSERT INTO citas_asignaciones (cita_id, tecnico_id, puesto, inicio, fin)
+            VALUES %s
+        """, [(a['cita_id'], a['tecnico_id'], a['puesto'], a['inicio'], a['fin']) for a in asignaciones])
+    return len(asignaciones)
+
+def plan_guardado(db: DatabaseManager, fecha: date, sede_id: int = SEDE_PRINCIPAL) -> List[Dict]:
+    """Asignación guardada de las citas vigentes del día, por hora de inicio"""
+    return db.consultar("""
+        SELECT a.cita_id, a.tecnico_id, t.nombre AS tecnico_nombre, a.puesto, a.inicio, a.fin, a.asignado_en
+        FROM citas_asignaciones a
+        JOIN citas c ON c.id = a.cita_id
+        JOIN tecnicos t ON t.id = a.tecnico_id
+        WHERE c.sede_id = %s
+        AND c.fecha_cita = %s
+        AND c.estado IN ('pendiente', 'confirmada')
+        ORDER BY a.inicio, a.puesto
+    """, (sede_id, fecha), solo_lectura=True)
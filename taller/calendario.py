@@ -0,0 +1,156 @@
+"""Calendario de citas en vivo para las sesiones administrativas
+
+El proceso guarda en memoria los días que las sesiones están mirando y los
+mantiene al día con el canal 'citas' de PostgreSQL: el trigger tr_citas_cambios
+publica el id y las fechas de cada cita que cambia, y aquí solo se relee esa
+cita por su clave primaria. Mientras un día siga en memoria ninguna sesión
+vuelve a consultarlo completo, y todas comparten la misma copia.
+"""
+import json
+import select
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Iterable, List, Tuple
+
+import psycopg2
+
+from taller.db import DatabaseManager
+
+CANAL = 'citas'
+MAX_DIAS = 31
+
+COLUMNAS = """
+    id, fecha_cita, hora_cita, estado, observaciones, cliente_nombre,
+    cliente_telefono, vehiculo_info, servicio_nombre, sede_id, sede_nombre
+"""
+
+class CalendarioEnVivo:
+    """Días del calendario en memoria, actualizados por NOTIFY del canal 'citas'
+
+    Escucha y lee en el primario: las réplicas no reenvían notificaciones y
+    podrían no tener aún la cita notificada.
+    """
+
+    def __init__(self, db: DatabaseManager, config: Dict, max_dias: int = MAX_DIAS):
+        self.db = db
+        self.config = config
+        self.max_dias = max_dias
+        self.listo = threading.Event()
+        # fecha -> [versión, {cita_id: fila}], en orden de uso
+        self._dias: OrderedDict = OrderedDict()
+        # fecha -> ids notificados mientras alguna sesión carga ese día
+        self._cargando: Dict[date, set] = {}
+        self._lock = threading.Lock()
+        # Serializa releer y aplicar: una fila vieja nunca pisa una más nueva
+        self._serie = threading.Lock()
+        self._hilo = threading.Thread(target=self._run, name='taller-calendario', daemon=True)
+        self._hilo.start()
+
+    def dia(self, fecha: date) -> Tuple[int, List[Dict]]:
+        """Versión y citas del día ordenadas por hora; carga el día si no está en memoria
+
+        La versión aumenta con cada cambio aplicado al día.
+        """
+        with self._lock:
+            entrada = self._dias.get(fecha)
+            if entrada:
+                self._dias.move_to_end(fecha)
+                return entrada[0], _ordenadas(entrada[1])
+            self._cargando.setdefault(fecha, set())
+
+        filas = self.db.consultar(f"SELECT {COLUMNAS} FROM vista_citas_completas WHERE fecha_cita = %s", (fecha,))
+
+        with self._lock:
+            notificadas = self._cargando.pop(fecha, set())
+            if fecha not in self._dias:
+                self._dias[fecha] = [0, {fila['id']: dict(fila) for fila in filas}]
+                while len(self._dias) > self.max_dias:
+                    self._dias.popitem(last=False)
+        if notificadas:
+            # Pudieron confirmarse después de que la consulta tomó su instantánea
+            self._refrescar(notificadas)
+
+        with self._lock:
+            entrada = self._dias.get(fecha)
+            if entrada:
+                return entrada[0], _ordenadas(entrada[1])
+        return 0, sorted((dict(fila) for fila in filas), key=lambda cita: cita['hora_cita'])
+
+    def _run(self):
+        espera = 1
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.config)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CANAL}")
+                # Pudo haber cambios mientras no se escuchaba: los días se recargan al pedirlos
+                self._olvidar()
+                self.listo.set()
+                espera = 1
+
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    eventos = []
+                    while conn.notifies:
+                        eventos.append(json.loads(conn.notifies.pop(0).payload))
+                    self._aplicar(eventos)
+            except Exception:
+                self.listo.clear()
+                time.sleep(espera)
+                espera = min(espera * 2, 60)
+            finally:
+                if conn:
+                    conn.close()
+
+    def _aplicar(self, eventos: Iterable[Dict]):
+        """Relee en una sola consulta las citas notificadas que tocan días en memoria"""
+        ids = set()
+        with self._lock:
+            for evento in eventos:
+                for valor in (evento['fecha'], evento.get('fecha_anterior')):
+                    if not valor:
+                        continue
+                    fecha = date.fromisoformat(valor)
+                    if fecha in self._cargando:
+                        self._cargando[fecha].add(evento['id'])
+                    if fecha in self._dias:
+                        ids.add(evento['id'])
+        if ids:
+            self._refrescar(ids)
+
+    def _refrescar(self, ids: Iterable[int]):
+        """Coloca cada cita en el día de su fecha actual y la quita de los demás"""
+        ids = list(ids)
+        with self._serie:
+            filas = {
+                fila['id']: dict(fila)
+                for fila in self.db.consultar(
+                    f"SELECT {COLUMNAS} FROM vista_citas_completas WHERE id = ANY(%s)", (ids,)
+                )
+            }
+            with self._lock:
+                for fecha, entrada in self._dias.items():
+                    cambio = False
+                    for cita_id in ids:
+                        fila = filas.get(cita_id)
+                        if fila and fila['fecha_cita'] == fecha:
+                            entrada[1][cita_id] = fila
+                            cambio = True
+                        elif entrada[1].pop(cita_id, None):
+                            cambio = True
+                    if cambio:
+                        entrada[0] += 1
+
+    def _olvidar(self):
+        with self._lock:
+            self._dias.clear()
+
+def _ordenadas(citas: Dict[int, Dict]) -> List[Dict]:
+    """Copias de las citas del día ordenadas por hora"""
+    return [dict(cita) for cita in sorted(citas.values(), key=lambda cita: (cita['hora_cita'], cita['id']))]
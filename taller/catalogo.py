@@ -0,0 +1,115 @@
+"""Caché de datos de referencia compartida por todas las sesiones del proceso
+
+El catálogo de servicios y la lista de categorías de inventario se leen en
+cada render pero casi nunca cambian. Se guardan en un LRU acotado con TTL;
+cada entrada declara de qué etiquetas depende ('servicios', 'categorias') y
+se invalida explícitamente cuando la aplicación escribe en esas tablas o
+cuando llega un NOTIFY del canal 'catalogo' (cambios hechos desde otro
+proceso o directamente en la base de datos). El TTL solo acota el tiempo
+máximo de un dato desactualizado si se pierde una notificación.
+"""
+import select
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+
+import psycopg2
+
+from taller.config import CATALOGO_MAX_ENTRADAS, CATALOGO_TTL
+
+CANAL = 'catalogo'
+
+class CacheCatalogo:
+    """LRU con TTL e invalidación por etiqueta, seguro entre hilos"""
+
+    def __init__(self, maximo: int = 64, ttl: float = 300.0):
+        self.maximo = maximo
+        self.ttl = ttl
+        # clave -> (expira, etiquetas, filas)
+        self._entradas: OrderedDict = OrderedDict()
+        self._generacion = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave: str, etiquetas: Iterable[str], cargar: Callable[[], List[Dict]]) -> List[Dict]:
+        """Filas cacheadas de la clave, cargándolas si faltan o expiraron
+
+        Devuelve copias para que ninguna sesión altere las filas compartidas.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada and entrada[0] > ahora:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return [dict(fila) for fila in entrada[2]]
+            self.fallos += 1
+            generacion = self._generacion
+
+        filas = [dict(fila) for fila in cargar()]
+
+        with self._lock:
+            # Si se invalidó durante la carga, el resultado puede ser anterior al cambio
+            if generacion == self._generacion:
+                self._entradas[clave] = (time.monotonic() + self.ttl, frozenset(etiquetas), filas)
+                self._entradas.move_to_end(clave)
+                while len(self._entradas) > self.maximo:
+                    self._entradas.popitem(last=False)
+        return [dict(fila) for fila in filas]
+
+    def invalidar(self, etiqueta: Optional[str] = None):
+        """Descarta las entradas que dependen de la etiqueta, o todas si no se indica"""
+        with self._lock:
+            self._generacion += 1
+            if etiqueta is None:
+                self._entradas.clear()
+                return
+            for clave in [clave for clave, entrada in self._entradas.items() if etiqueta in entrada[1]]:
+                del self._entradas[clave]
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            return {'entradas': len(self._entradas), 'aciertos': self.aciertos, 'fallos': self.fallos}
+
+# Caché única del proceso: la comparten las sesiones de Streamlit y la API
+cache = CacheCatalogo(CATALOGO_MAX_ENTRADAS, CATALOGO_TTL)
+
+class EscuchaCatalogo:
+    """Invalida la caché al recibir NOTIFY del canal 'catalogo' de PostgreSQL
+
+    Debe conectarse al primario: las réplicas no reenvían notificaciones.
+    """
+
+    def __init__(self, config: Dict, cache_catalogo: CacheCatalogo = cache):
+        self.config = config
+        self.cache = cache_catalogo
+        self._hilo = threading.Thread(target=self._run, name='taller-catalogo', daemon=True)
+        self._hilo.start()
+
+    def _run(self):
+        espera = 1
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.config)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CANAL}")
+                # Pudo haber cambios mientras no se escuchaba
+                self.cache.invalidar()
+                espera = 1
+
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self.cache.invalidar(conn.notifies.pop(0).payload or None)
+            except Exception:
+                time.sleep(espera)
+                espera = min(espera * 2, 60)
+            finally:
+                if conn:
+                    conn.close()
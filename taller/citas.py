@@ -0,0 +1,269 @@
+"""Servicios de citas: catálogo, disponibilidad, reservas y cambios de estado"""
+import hashlib
+import itertools
+import json
+from datetime import date, time
+from typing import Dict, List, Optional
+
+from taller import metricas
+from taller.catalogo import cache
+from taller.db import DatabaseManager
+from taller.errores import Conflicto, DatosInvalidos, NoEncontrado, TallerError
+from taller.sedes import SEDE_PRINCIPAL
+
+ESTADOS_CITA = ('pendiente', 'confirmada', 'completada', 'cancelada')
+
+# Estados a los que puede pasar cada uno (copia de la tabla citas_transiciones)
+TRANSICIONES = {
+    'pendiente': ('confirmada', 'completada', 'cancelada'),
+    'confirmada': ('pendiente', 'completada', 'cancelada'),
+    'completada': (),
+    'cancelada': ()
+}
+
+# Vigencia de las claves de idempotencia; se purgan por lotes cada PURGA_CADA reservas nuevas
+IDEMPOTENCIA_HORAS = 24
+PURGA_CADA = 100
+_reservas_nuevas = itertools.count(1)
+
+# Búsqueda por teléfono: dígitos mínimos (con menos, casi todos los clientes coinciden) y citas devueltas
+MIN_DIGITOS_TELEFONO = 6
+MAX_CITAS_BUSQUEDA = 50
+
+def listar_servicios(db: DatabaseManager) -> List[Dict]:
+    """Servicios activos ordenados por nombre (desde la caché del catálogo)"""
+    # Se carga del primario: tras una invalidación una réplica podría no tener el cambio
+    return cache.obtener('servicios_activos', ('servicios',), lambda: db.consultar("""
+        SELECT id, nombre, descripcion, precio, duracion_minutos
+        FROM servicios
+        WHERE activo = TRUE
+        ORDER BY nombre
+    """))
+
+def horarios_disponibles(db: DatabaseManager, fecha: date, sede_id: int = SEDE_PRINCIPAL) -> List[str]:
+    """Horarios con algún puesto libre en la sede, en formato HH:MM (del primario: alimenta reservas)"""
+    filas = db.consultar("SELECT hora FROM fn_horarios_disponibles(%s, %s)", (fecha, sede_id))
+    return [fila['hora'].strftime('%H:%M') for fila in filas]
+
+def agendar_cita(
+    db: DatabaseManager,
+    nombre: str,
+    telefono: str,
+    marca: str,
+    modelo: str,
+    placa: str,
+    servicio_id: int,
+    fecha_cita: date,
+    hora_cita: time,
+    email: Optional[str] = None,
+    direccion: Optional[str] = None,
+    año: Optional[int] = None,
+    color: Optional[str] = None,
+    observaciones: Optional[str] = None,
+    clave_idempotencia: Optional[str] = None,
+    sede_id: int = SEDE_PRINCIPAL
+) -> Dict:
+    """Registra cliente, vehículo y cita en una sola transacción
+
+    El cliente se reutiliza por teléfono y su vehículo por placa, de modo que
+    un cliente recurrente puede volver a reservar. De un cliente ya registrado
+    se conservan nombre, email y dirección: la reserva no los modifica. Una
+    placa registrada a otro cliente es un Conflicto. Si falla cualquier paso no
+    queda ningún registro a medias. Con clave_idempotencia, repetir el envío
+    devuelve la cita original (repetida=True) sin escribir nada más.
+    """
+    if not all([nombre, telefono, marca, modelo, placa]) or not servicio_id:
+        metricas.reservas.inc(resultado='invalida')
+        raise DatosInvalidos("Nombre, teléfono, marca, modelo, placa y servicio son obligatorios")
+
+    try:
+        with db.transaccion() as cursor:
+            if clave_idempotencia:
+                original = _reclamar_clave(cursor, clave_idempotencia)
+                if original:
+                    metricas.reservas.inc(resultado='repetida')
+                    return dict(original, repetida=True)
+
+            cursor.execute(
+                "SELECT id FROM clientes WHERE telefono = %s ORDER BY id LIMIT 1",
+                (telefono,)
+            )
+            cliente = cursor.fetchone()
+            if cliente:
+                cliente_id = cliente['id']
+            else:
+                cursor.callproc('sp_crear_cliente', (nombre, telefono, email, direccion))
+                cliente_id = cursor.fetchone()['sp_crear_cliente']
+
+            cursor.execute("SELECT id, cliente_id FROM vehiculos WHERE placa = %s", (placa,))
+            vehiculo = cursor.fetchone()
+            if vehiculo and vehiculo['cliente_id'] != cliente_id:
+                # Reusarlo mezclaría el historial del vehículo con citas de otro cliente
+                raise Conflicto(f"La placa {placa} está registrada a otro cliente")
+            if vehiculo:
+                vehiculo_id = vehiculo['id']
+            else:
+                cursor.callproc('sp_crear_vehiculo', (cliente_id, marca, modelo, año, placa, color))
+                vehiculo_id = cursor.fetchone()['sp_crear_vehiculo']
+
+            cursor.callproc(
+                'sp_crear_cita',
+                (cliente_id, vehiculo_id, servicio_id, fecha_cita, hora_cita, observaciones, sede_id)
+            )
+            cita_id = cursor.fetchone()['sp_crear_cita']
+
+            if clave_idempotencia:
+                cursor.execute("""
+                    UPDATE reservas_idempotencia SET cita_id = %s, cliente_id = %s, vehiculo_id = %s
+                    WHERE clave = %s
+                """, (cita_id, cliente_id, vehiculo_id, clave_idempotencia))
+    except Conflicto:
+        # Horario ocupado, fuera de horario u otra regla de la base de datos
+        metricas.reservas.inc(resultado='conflicto')
+        raise
+    except TallerError:
+        metricas.reservas.inc(resultado='error')
+        raise
+    metricas.reservas.inc(resultado='creada')
+
+    if clave_idempotencia and next(_reservas_nuevas) % PURGA_CADA == 0:
+        try:
+            purgar_claves_vencidas(db)
+        except TallerError:
+            # La purga es de mantenimiento: la reserva ya quedó registrada
+            pass
+
+    return {'cita_id': cita_id, 'cliente_id': cliente_id, 'vehiculo_id': vehiculo_id, 'repetida': False}
+
+def clave_reserva(instancia: str, **datos) -> str:
+    """Clave de idempotencia de un formulario: misma instancia y mismos datos, misma clave"""
+    contenido = json.dumps(datos, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(f"{instancia}|{contenido}".encode('utf-8')).hexdigest()
+
+def _reclamar_clave(cursor, clave: str) -> Optional[Dict]:
+    """Registra la clave o, si ya existía, devuelve la reserva original
+
+    Si otra transacción está reservando con la misma clave, el INSERT espera a
+    que termine: si confirmó se devuelve su resultado; si falló, la clave queda
+    libre y esta reserva continúa.
+    """
+    cursor.execute("""
+        INSERT INTO reservas_idempotencia (clave) VALUES (%s)
+        ON CONFLICT (clave) DO NOTHING
+        RETURNING clave
+    """, (clave,))
+    if cursor.fetchone():
+        return None
+    cursor.execute(
+        "SELECT cita_id, cliente_id, vehiculo_id FROM reservas_idempotencia WHERE clave = %s",
+        (clave,)
+    )
+    return cursor.fetchone()
+
+def purgar_claves_vencidas(db: DatabaseManager, limite: int = 1000) -> int:
+    """Borra un lote de claves de idempotencia vencidas (por el índice de created_at)"""
+    filas = db.consultar("""
+        DELETE FROM reservas_idempotencia
+        WHERE clave IN (
+            SELECT clave FROM reservas_idempotencia
+            WHERE created_at < CURRENT_TIMESTAMP - make_interval(hours => %s)
+            ORDER BY created_at
+            LIMIT %s
+        )
+        RETURNING clave
+    """, (IDEMPOTENCIA_HORAS, limite))
+    return len(filas)
+
+def buscar_citas_por_telefono(db: DatabaseManager, telefono: str, exacto: bool = False) -> List[Dict]:
+    """Citas de los clientes cuyo teléfono contiene el texto dado (o es igual, con exacto=True),
+    de la más reciente a la más antigua"""
+    telefono = (telefono or '').strip()
+    if sum(caracter.isdigit() for caracter in telefono) < MIN_DIGITOS_TELEFONO:
+        raise DatosInvalidos(f"Ingrese al menos {MIN_DIGITOS_TELEFONO} dígitos del teléfono")
+    # strpos y no LIKE: un % o _ escrito por el usuario no actúa como comodín
+    condicion = "cliente_telefono = %s" if exacto else "strpos(cliente_telefono, %s) > 0"
+    return db.consultar(f"""
+        SELECT * FROM vista_citas_completas
+        WHERE {condicion}
+        ORDER BY fecha_cita DESC, hora_cita
+        LIMIT %s
+    """, (telefono, MAX_CITAS_BUSQUEDA), solo_lectura=True, clase='busqueda')
+
+def obtener_cita(db: DatabaseManager, cita_id: int, telefono: Optional[str] = None) -> Dict:
+    """Detalle de una cita; con `telefono`, solo si es el del cliente (si no, como si no existiera)"""
+    filas = db.consultar("""
+        SELECT * FROM vista_citas_completas
+        WHERE id = %s
+        AND (%s::VARCHAR IS NULL OR cliente_telefono = %s)
+    """, (cita_id, telefono, telefono), solo_lectura=True)
+    if not filas:
+        raise NoEncontrado(f"No se encontró la cita con ID: {cita_id}")
+    return filas[0]
+
+def actualizar_estado(
+    db: DatabaseManager,
+    cita_id: int,
+    estado: str,
+    usuario: Optional[str] = None,
+    telefono: Optional[str] = None
+) -> bool:
+    """Cambia el estado de una cita; completar descuenta sus repuestos
+
+    El trigger de citas valida la transición y la registra en citas_historial
+    con el usuario dado. Con `telefono` solo cambia la cita si es el del
+    cliente; si no coincide responde como si la cita no existiera. Devuelve
+    False, sin escribir nada, si la cita ya estaba en ese estado.
+    """
+    if estado not in ESTADOS_CITA:
+        raise DatosInvalidos(f"Estado inválido: {estado}")
+
+    with db.transaccion() as cursor:
+        cursor.execute("""
+            SELECT c.estado, cl.telefono
+            FROM citas c
+            JOIN clientes cl ON cl.id = c.cliente_id
+            WHERE c.id = %s
+            FOR UPDATE OF c
+        """, (cita_id,))
+        cita = cursor.fetchone()
+        if not cita or (telefono is not None and cita['telefono'] != telefono):
+            raise NoEncontrado(f"No se encontró la cita con ID: {cita_id}")
+        if cita['estado'] == estado:
+            # Sin UPDATE: no se registra en el historial ni se notifica un cambio que no hubo
+            return False
+        if estado not in TRANSICIONES[cita['estado']]:
+            raise Conflicto(f"La cita {cita_id} no puede pasar de {cita['estado']} a {estado}")
+
+        if usuario:
+            cursor.execute("SELECT set_config('taller.usuario', %s, true)", (usuario,))
+        cursor.callproc('sp_actualizar_cita', (cita_id, estado))
+    metricas.transiciones.inc(estado=estado)
+    return True
+
+def completar_citas(db: DatabaseManager, cita_ids: List[int], usuario: Optional[str] = None) -> int:
+    """Completa varias citas en una sola sentencia y devuelve cuántas cambiaron"""
+    if not cita_ids:
+        return 0
+    filas = db.consultar("SELECT sp_completar_citas(%s, %s) AS total", (list(cita_ids), usuario))
+    metricas.transiciones.inc(filas[0]['total'], estado='completada')
+    return filas[0]['total']
+
+def historial_cita(db: DatabaseManager, cita_id: int) -> List[Dict]:
+    """Cambios de estado de una cita en orden, con el tiempo que pasó en cada estado
+
+    La duración del último estado se mide hasta ahora (NULL si es final).
+    """
+    return db.consultar("""
+        SELECT
+            estado_anterior,
+            estado,
+            usuario,
+            cambiado_en,
+            COALESCE(
+                LEAD(cambiado_en) OVER (ORDER BY cambiado_en, id),
+                CASE WHEN estado IN ('pendiente', 'confirmada') THEN LOCALTIMESTAMP END
+            ) - cambiado_en AS duracion
+        FROM citas_historial
+        WHERE cita_id = %s
+        ORDER BY cambiado_en, id
+    """, (cita_id,), solo_lectura=True)
@@ -0,0 +1,68 @@
+"""Configuración compartida de Taller AutoMax"""
+import os
+
+# Configuración de la base de datos (variables de entorno de docker-compose)
+DB_CONFIG = {
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'database': os.environ.get('DB_NAME', 'taller_db'),
+    'user': os.environ.get('DB_USER', 'postgres'),
+    'password': os.environ.get('DB_PASSWORD', 'password'),
+    'port': int(os.environ.get('DB_PORT', 5432))
+}
+
+# Token para las operaciones administrativas de la API (deshabilitadas si no se define)
+API_TOKEN = os.environ.get('TALLER_API_TOKEN')
+
+def _configurar_replicas(valor: str):
+    """Réplicas de lectura desde DB_REPLICAS="host1:5432,host2:5433" (mismas credenciales)"""
+    replicas = []
+    for entrada in filter(None, (parte.strip() for parte in valor.split(','))):
+        host, _, puerto = entrada.partition(':')
+        replicas.append(dict(DB_CONFIG, host=host, port=int(puerto or DB_CONFIG['port'])))
+    return replicas
+
+# Réplicas de lectura (vacío: todo va al primario) y retraso máximo tolerado en segundos
+DB_REPLICAS = _configurar_replicas(os.environ.get('DB_REPLICAS', ''))
+DB_MAX_RETRASO_REPLICA = float(os.environ.get('DB_MAX_RETRASO_REPLICA', 5))
+
+# Tiempo límite por clase de consulta en milisegundos (0 sin límite): 'general' para lo no clasificado,
+# 'busqueda' para búsquedas por texto y 'reporte' para los reportes y el dashboard
+DB_TIEMPOS_LIMITE = {
+    'general': int(os.environ.get('TALLER_LIMITE_GENERAL_MS', 0)),
+    'busqueda': int(os.environ.get('TALLER_LIMITE_BUSQUEDA_MS', 2000)),
+    'reporte': int(os.environ.get('TALLER_LIMITE_REPORTE_MS', 15000))
+}
+
+# Reportes simultáneos por proceso y segundos que uno espera turno antes de rechazarse
+DB_MAX_REPORTES = int(os.environ.get('TALLER_MAX_REPORTES', 2))
+DB_ESPERA_REPORTES = float(os.environ.get('TALLER_ESPERA_REPORTES', 5))
+
+# Caché de datos de referencia (servicios, categorías): máximo de entradas y TTL en segundos
+CATALOGO_MAX_ENTRADAS = int(os.environ.get('CATALOGO_MAX_ENTRADAS', 64))
+CATALOGO_TTL = float(os.environ.get('CATALOGO_TTL', 300))
+
+# Perfilado por fases de cada página (también activable desde el panel) y carpeta opcional para sus trazas
+PERFILADO = os.environ.get('TALLER_PERFILADO', '').lower() in ('1', 'true', 'si', 'sí')
+PERFILADO_DIR = os.environ.get('TALLER_PERFILADO_DIR')
+
+# Puerto del endpoint /metrics (formato Prometheus) que acompaña a la interfaz Streamlit; 0 lo desactiva
+METRICAS_PUERTO = int(os.environ.get('TALLER_METRICAS_PUERTO', 9108))
+
+# Hilos de la cola de tareas dentro del proceso de Streamlit; 0 las deja al trabajador aparte (python -m taller.tareas)
+TAREAS_EN_PROCESO = int(os.environ.get('TALLER_TAREAS_EN_PROCESO', 0))
+
+# Recordatorios de citas: transporte por canal ('smtp', 'http' o 'archivo:<ruta>'), envíos en paralelo y por segundo (0 sin límite)
+RECORDATORIOS_EMAIL = os.environ.get('TALLER_RECORDATORIOS_EMAIL', 'archivo:recordatorios.jsonl')
+RECORDATORIOS_SMS = os.environ.get('TALLER_RECORDATORIOS_SMS', 'archivo:recordatorios.jsonl')
+RECORDATORIOS_CONCURRENCIA = int(os.environ.get('TALLER_RECORDATORIOS_CONCURRENCIA', 20))
+RECORDATORIOS_POR_SEGUNDO = float(os.environ.get('TALLER_RECORDATORIOS_POR_SEGUNDO', 200))
+
+# Servidor SMTP del transporte 'smtp' y pasarela HTTP del transporte 'http' de SMS
+SMTP_HOST = os.environ.get('TALLER_SMTP_HOST', 'localhost')
+SMTP_PUERTO = int(os.environ.get('TALLER_SMTP_PUERTO', 1025))
+SMTP_USUARIO = os.environ.get('TALLER_SMTP_USUARIO')
+SMTP_PASSWORD = os.environ.get('TALLER_SMTP_PASSWORD')
+SMTP_TLS = os.environ.get('TALLER_SMTP_TLS', '').lower() in ('1', 'true', 'si', 'sí')
+SMTP_REMITENTE = os.environ.get('TALLER_SMTP_REMITENTE', 'Taller AutoMax <citas@tallerautomax.com>')
+SMS_URL = os.environ.get('TALLER_SMS_URL')
+SMS_TOKEN = os.environ.get('TALLER_SMS_TOKEN')
@@ -0,0 +1,178 @@
+"""Acceso a PostgreSQL con pool de conexiones para la capa de servicios
+
+A diferencia del gestor de la interfaz Streamlit, este no muestra mensajes:
+los errores se propagan como excepciones de taller.errores para que cada
+cliente (Streamlit, API HTTP, tareas) decida cómo presentarlos.
+
+Las escrituras y las lecturas normales van al primario; las marcadas con
+solo_lectura=True pueden ir a una réplica (ver taller.replicas).
+
+Cada transacción pertenece a una clase de consulta ('general', 'busqueda',
+'reporte'). La clase fija su statement_timeout con SET LOCAL, de modo que el
+servidor cancela la consulta al vencer, y los reportes además esperan turno
+en taller.admision antes de tomar una conexión.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import psycopg2
+from psycopg2 import errors
+from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
+
+from taller import admision, metricas, perfilado
+from taller import replicas as enrutamiento
+from taller.config import DB_TIEMPOS_LIMITE
+from taller.errores import Conflicto, ErrorBaseDatos, Saturado, TiempoAgotado
+
+class _Pool:
+    """Pool de un servidor, creado en el primer uso"""
+
+    def __init__(self, config: Dict, maximo: int):
+        self.config = config
+        self.maximo = maximo
+        self.servidor = f"{config.get('host')}:{config.get('port')}"
+        self._pool = None
+        self._lock = threading.Lock()
+        # El pool de psycopg2 falla si se agota; el semáforo hace esperar en su lugar
+        self._disponibles = threading.BoundedSemaphore(maximo)
+        metricas.db_conexiones_maximo.inc(maximo, servidor=self.servidor)
+
+    def _pool_conexiones(self) -> ThreadedConnectionPool:
+        with self._lock:
+            if self._pool is None:
+                # minconn = maxconn: psycopg2 cierra al devolverlas las conexiones por encima del mínimo
+                self._pool = ThreadedConnectionPool(self.maximo, self.maximo, **self.config)
+            return self._pool
+
+    @contextmanager
+    def conexion(self):
+        """Conexión prestada del pool; se descarta si quedó cerrada"""
+        with metricas.db_espera_conexion.medir(servidor=self.servidor):
+            self._disponibles.acquire()
+        metricas.db_conexiones_en_uso.inc(servidor=self.servidor)
+        conn = None
+        try:
+            conn = self._pool_conexiones().getconn()
+            yield conn
+        finally:
+            if conn is not None:
+                self._pool.putconn(conn, close=bool(conn.closed))
+            self._disponibles.release()
+            metricas.db_conexiones_en_uso.dec(servidor=self.servidor)
+
+    def cerrar(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+
+class DatabaseManager:
+    """Pool de conexiones compartido entre hilos, con réplicas de lectura opcionales"""
+
+    def __init__(
+        self,
+        config: Dict,
+        maximo: int = 10,
+        replicas: Optional[List[Dict]] = None,
+        max_retraso: float = 5.0,
+        tiempos_limite: Optional[Dict[str, int]] = None
+    ):
+        self.config = config
+        self.maximo = maximo
+        self.max_retraso = max_retraso
+        # Milisegundos por clase de consulta; 0 deja el límite del servidor
+        self.tiempos_limite = dict(DB_TIEMPOS_LIMITE, **(tiempos_limite or {}))
+        self._primario = _Pool(config, maximo)
+        self._replicas = [_Pool(replica, maximo) for replica in replicas or []]
+        self.enrutador = enrutamiento.EnrutadorReplicas(replicas, max_retraso) if replicas else None
+
+    @contextmanager
+    def _conexion(self, solo_lectura: bool):
+        """Conexión a una réplica para lecturas seguras o al primario en los demás casos"""
+        if solo_lectura and self.enrutador and not enrutamiento.escritura_reciente(self.max_retraso):
+            indice = self.enrutador.elegir()
+            if indice is not None:
+                conectado = False
+                try:
+                    with self._replicas[indice].conexion() as conn:
+                        conectado = True
+                        yield conn
+                    return
+                except psycopg2.OperationalError as e:
+                    # Una consulta cancelada por su tiempo límite no indica que la réplica esté caída
+                    if isinstance(e, errors.QueryCanceled):
+                        raise
+                    # Réplica caída: se excluye y, si ni siquiera conectó, la lectura va al primario
+                    self.enrutador.marcar_caida(indice, e)
+                    if conectado:
+                        raise
+
+        with self._primario.conexion() as conn:
+            yield conn
+
+    @contextmanager
+    def transaccion(self, solo_lectura: bool = False, operacion: str = 'transaccion', clase: str = 'general'):
+        """Cursor dentro de una transacción: commit al salir, rollback ante error
+
+        El tiempo límite de la clase vale para cada sentencia de la transacción.
+        """
+        limite = self.tiempos_limite[clase]
+        escribio = False
+        resultado = 'error'
+        inicio = time.perf_counter()
+        try:
+            with admision.admitir(clase), self._conexion(solo_lectura) as conn:
+                try:
+                    with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                        if limite:
+                            cursor.execute("SET LOCAL statement_timeout = %s", (limite,))
+                        yield cursor
+                        if self.enrutador and not solo_lectura:
+                            # Solo las transacciones que escribieron reciben un ID
+                            cursor.execute("SELECT txid_current_if_assigned() IS NOT NULL AS escribio")
+                            escribio = cursor.fetchone()['escribio']
+                    conn.commit()
+                except Exception:
+                    if not conn.closed:
+                        conn.rollback()
+                    raise
+            resultado = 'ok'
+        except (errors.RaiseException, errors.UniqueViolation, errors.CheckViolation) as e:
+            # Reglas del negocio validadas en procedimientos, triggers y restricciones
+            resultado = 'conflicto'
+            raise Conflicto(e.diag.message_primary or str(e)) from e
+        except errors.QueryCanceled as e:
+            resultado = 'tiempo_agotado'
+            raise TiempoAgotado(f"La consulta superó su tiempo límite ({limite} ms) y se canceló") from e
+        except Saturado:
+            resultado = 'saturado'
+            raise
+        except psycopg2.Error as e:
+            raise ErrorBaseDatos(str(e).strip()) from e
+        finally:
+            metricas.db_operaciones.inc(operacion=operacion, resultado=resultado)
+            metricas.db_duracion.observar(time.perf_counter() - inicio, operacion=operacion)
+
+        if escribio:
+            enrutamiento.registrar_escritura()
+
+    def consultar(self, query: str, params: tuple = None, solo_lectura: bool = False, clase: str = 'general') -> List[Dict]:
+        """Ejecuta una consulta y devuelve las filas (vacío si no retorna filas)"""
+        with perfilado.fase('consultas', perfilado.etiqueta_sql(query)), self.transaccion(solo_lectura, 'consulta', clase) as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall() if cursor.description else []
+
+    def ejecutar_procedimiento(self, nombre: str, params: tuple = ()) -> List[Dict]:
+        """Ejecuta un procedimiento almacenado"""
+        with perfilado.fase('consultas', nombre), self.transaccion(operacion='procedimiento') as cursor:
+            cursor.callproc(nombre, params)
+            return cursor.fetchall() if cursor.description else []
+
+    def cerrar(self):
+        """Cierra todas las conexiones de los pools"""
+        self._primario.cerrar()
+        for replica in self._replicas:
+            replica.cerrar()
@@ -0,0 +1,187 @@
+"""Acceso asíncrono a PostgreSQL con asyncpg
+
+Misma superficie que taller.db (consultar, ejecutar_procedimiento,
+transaccion) pero con corutinas, para lanzar en paralelo consultas
+independientes como las métricas del Dashboard. Las consultas se escriben
+con marcadores %s como en psycopg2 y se convierten a $1, $2, ...
+
+Como en taller.db, las lecturas con solo_lectura=True pueden ir a una
+réplica; las escrituras deben usar transaccion() para que la sesión lea
+después del primario. Las consultas llevan el tiempo límite de su clase
+(DB_TIEMPOS_LIMITE): al vencer, asyncpg cancela la sentencia en el servidor.
+"""
+import asyncio
+import re
+import threading
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+import asyncpg
+
+from taller import admision, perfilado
+from taller import replicas as enrutamiento
+from taller.config import DB_TIEMPOS_LIMITE
+from taller.errores import Conflicto, ErrorBaseDatos, TiempoAgotado
+
+_MARCADOR = re.compile(r'%%|%s')
+
+def a_posicional(query: str) -> str:
+    """Convierte los marcadores %s de psycopg2 a $1, $2, ... de asyncpg"""
+    contador = 0
+
+    def reemplazar(coincidencia):
+        nonlocal contador
+        if coincidencia.group() == '%%':
+            return '%'
+        contador += 1
+        return f'${contador}'
+
+    return _MARCADOR.sub(reemplazar, query)
+
+def _traducir_error(e: Exception) -> Exception:
+    """Errores de asyncpg a errores de la capa de servicios"""
+    if isinstance(e, (asyncpg.RaiseError, asyncpg.UniqueViolationError, asyncpg.CheckViolationError)):
+        return Conflicto(e.args[0] if e.args else str(e))
+    return ErrorBaseDatos(str(e).strip())
+
+_ERRORES_CONEXION = (asyncpg.PostgresConnectionError, asyncpg.InterfaceError, OSError)
+
+class AsyncDatabaseManager:
+    """Pool de conexiones asíncrono, con réplicas de lectura opcionales"""
+
+    def __init__(
+        self,
+        config: Dict,
+        maximo: int = 10,
+        replicas: Optional[List[Dict]] = None,
+        max_retraso: float = 5.0,
+        tiempos_limite: Optional[Dict[str, int]] = None
+    ):
+        self.config = config
+        self.maximo = maximo
+        self.max_retraso = max_retraso
+        self.tiempos_limite = dict(DB_TIEMPOS_LIMITE, **(tiempos_limite or {}))
+        self.replicas = replicas or []
+        self.enrutador = enrutamiento.EnrutadorReplicas(replicas, max_retraso) if replicas else None
+        # Índice None para el primario, 0..n-1 para las réplicas
+        self._pools: Dict[Optional[int], asyncpg.Pool] = {}
+        self._lock = asyncio.Lock()
+
+    async def _pool_conexiones(self, indice: Optional[int] = None) -> asyncpg.Pool:
+        """Crea cada pool en el primer uso, dentro del bucle de eventos que lo usará"""
+        async with self._lock:
+            if indice not in self._pools:
+                config = self.config if indice is None else self.replicas[indice]
+                self._pools[indice] = await asyncpg.create_pool(
+                    host=config['host'],
+                    database=config['database'],
+                    user=config['user'],
+                    password=config['password'],
+                    port=config['port'],
+                    min_size=1,
+                    max_size=self.maximo
+                )
+            return self._pools[indice]
+
+    @asynccontextmanager
+    async def transaccion(self):
+        """Conexión dentro de una transacción en el primario: commit al salir, rollback ante error"""
+        try:
+            pool = await self._pool_conexiones()
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    yield conn
+        except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError) as e:
+            raise _traducir_error(e) from e
+        if self.enrutador:
+            enrutamiento.registrar_escritura()
+
+    async def consultar(self, query: str, params: tuple = None, solo_lectura: bool = False, clase: str = 'general') -> List[Dict]:
+        """Ejecuta una consulta y devuelve las filas como diccionarios"""
+        query = a_posicional(query)
+        params = params or ()
+        limite = self.tiempos_limite[clase]
+        timeout = limite / 1000 if limite else None
+
+        if solo_lectura and self.enrutador and not enrutamiento.escritura_reciente(self.max_retraso):
+            indice = self.enrutador.elegir(esperar=False)
+            if indice is not None:
+                try:
+                    pool = await self._pool_conexiones(indice)
+                    return [dict(fila) for fila in await pool.fetch(query, *params, timeout=timeout)]
+                except asyncio.TimeoutError as e:
+                    raise TiempoAgotado(f"La consulta superó su tiempo límite ({limite} ms) y se canceló") from e
+                except _ERRORES_CONEXION as e:
+                    # Réplica caída: se excluye y la lectura se repite en el primario
+                    self.enrutador.marcar_caida(indice, e)
+                except asyncpg.PostgresError as e:
+                    raise _traducir_error(e) from e
+
+        try:
+            pool = await self._pool_conexiones()
+            filas = await pool.fetch(query, *params, timeout=timeout)
+        except asyncio.TimeoutError as e:
+            raise TiempoAgotado(f"La consulta superó su tiempo límite ({limite} ms) y se canceló") from e
+        except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError) as e:
+            raise _traducir_error(e) from e
+        return [dict(fila) for fila in filas]
+
+    async def ejecutar_procedimiento(self, nombre: str, params: tuple = ()) -> List[Dict]:
+        """Ejecuta un procedimiento almacenado con el mismo resultado que callproc"""
+        marcadores = ', '.join(['%s'] * len(params))
+        return await self.consultar(f"SELECT * FROM {nombre}({marcadores})", params)
+
+    async def consultar_varios(
+        self,
+        consultas: Dict[str, Tuple[str, tuple]],
+        solo_lectura: bool = False,
+        clase: str = 'general'
+    ) -> Dict[str, List[Dict]]:
+        """Ejecuta consultas independientes en paralelo, cada una en su conexión"""
+        resultados = await asyncio.gather(*[
+            self.consultar(query, params, solo_lectura, clase) for query, params in consultas.values()
+        ])
+        return dict(zip(consultas.keys(), resultados))
+
+    async def cerrar(self):
+        """Cierra todas las conexiones del pool"""
+        async with self._lock:
+            for pool in self._pools.values():
+                await pool.close()
+            self._pools.clear()
+
+class EjecutorAsync:
+    """Bucle de eventos en un hilo propio para usar el gestor asíncrono desde código bloqueante
+
+    Streamlit ejecuta cada sesión en un hilo sin bucle de eventos; el pool de
+    asyncpg queda ligado a este bucle y se comparte entre todas las sesiones.
+    """
+
+    def __init__(self, db: AsyncDatabaseManager):
+        self.db = db
+        self._loop = asyncio.new_event_loop()
+        self._hilo = threading.Thread(target=self._loop.run_forever, name='taller-async', daemon=True)
+        self._hilo.start()
+
+    def ejecutar(self, corutina, timeout: float = None):
+        """Ejecuta una corutina en el bucle propio y espera su resultado"""
+        return asyncio.run_coroutine_threadsafe(corutina, self._loop).result(timeout)
+
+    def consultar_varios(
+        self,
+        consultas: Dict[str, Tuple[str, tuple]],
+        timeout: float = None,
+        solo_lectura: bool = False,
+        clase: str = 'general'
+    ) -> Dict[str, List[Dict]]:
+        """Versión bloqueante de AsyncDatabaseManager.consultar_varios
+
+        La lectura tras escritura se evalúa aquí, en el contexto del hilo que
+        llama, porque la corutina corre en el contexto del bucle propio. El
+        turno de taller.admision también se pide aquí: el lote entero ocupa un
+        solo lugar y el hilo que espera no bloquea el bucle compartido.
+        """
+        if solo_lectura and enrutamiento.escritura_reciente(self.db.max_retraso):
+            solo_lectura = False
+        with admision.admitir(clase), perfilado.fase('consultas', f"en paralelo: {', '.join(consultas)}"):
+            return self.ejecutar(self.db.consultar_varios(consultas, solo_lectura, clase), timeout)
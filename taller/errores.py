@@ -0,0 +1,22 @@
+"""Errores de la capa de servicios de Taller AutoMax"""
+
+class TallerError(Exception):
+    """Error base de la capa de servicios"""
+
+class DatosInvalidos(TallerError):
+    """Los datos recibidos están incompletos o no son válidos"""
+
+class NoEncontrado(TallerError):
+    """El registro solicitado no existe"""
+
+class Conflicto(TallerError):
+    """La operación viola una regla del negocio (horario ocupado, estado inválido, etc.)"""
+
+class ErrorBaseDatos(TallerError):
+    """La base de datos no está disponible o falló la consulta"""
+
+class TiempoAgotado(ErrorBaseDatos):
+    """La consulta superó el tiempo límite de su clase y se canceló"""
+
+class Saturado(TallerError):
+    """Hay demasiadas consultas pesadas en curso; conviene reintentar en unos segundos"""
@@ -0,0 +1,110 @@
+"""Servicios de inventario: consultas paginadas, stock bajo y movimientos"""
+from typing import Dict, List, Optional
+
+from taller.catalogo import cache
+from taller.db import DatabaseManager
+from taller.errores import DatosInvalidos
+from taller.sedes import SEDE_PRINCIPAL
+
+TIPOS_MOVIMIENTO = ('entrada', 'consumo', 'ajuste')
+SIN_CATEGORIA = 'Sin categoría'
+# Caracteres mínimos de la búsqueda de items por nombre
+MIN_CARACTERES_ITEM = 2
+
+def resumen_categorias(db: DatabaseManager, sede_id: int = SEDE_PRINCIPAL) -> List[Dict]:
+    """Totales por categoría de una sede desde el resumen mantenido por trigger"""
+    return db.consultar("""
+        SELECT categoria, total_items, stock_bajo, valor_total
+        FROM inventario_resumen
+        WHERE sede_id = %s
+        AND total_items > 0
+        ORDER BY categoria
+    """, (sede_id,), solo_lectura=True)
+
+def pagina_inventario(
+    db: DatabaseManager,
+    categoria: Optional[str] = None,
+    estado: Optional[str] = None,
+    limite: int = 50,
+    desplazamiento: int = 0,
+    sede_id: int = SEDE_PRINCIPAL
+) -> List[Dict]:
+    """Página de items de una sede filtrada por categoría y estado, calculada en la base de datos"""
+    condiciones = ["sede_id = %s"]
+    params = [sede_id]
+    if categoria == SIN_CATEGORIA:
+        condiciones.append("categoria IS NULL")
+    elif categoria:
+        condiciones.append("categoria = %s")
+        params.append(categoria)
+    if estado == 'Stock Bajo':
+        condiciones.append("cantidad_actual <= cantidad_minima")
+    elif estado == 'OK':
+        condiciones.append("cantidad_actual > cantidad_minima")
+
+    return db.consultar(f"""
+        SELECT id, nombre, descripcion, categoria, cantidad_actual, cantidad_minima, precio_unitario,
+               cantidad_actual * precio_unitario AS "Valor Total",
+               CASE WHEN cantidad_actual <= cantidad_minima THEN 'Stock Bajo' ELSE 'OK' END AS "Estado"
+        FROM inventario
+        WHERE {' AND '.join(condiciones)}
+        ORDER BY categoria, nombre, id
+        LIMIT %s OFFSET %s
+    """, tuple(params) + (limite, desplazamiento), solo_lectura=True)
+
+def listar_categorias(db: DatabaseManager) -> List[str]:
+    """Categorías de inventario existentes (desde la caché del catálogo)"""
+    filas = cache.obtener('categorias_inventario', ('categorias',), lambda: db.consultar("""
+        SELECT DISTINCT categoria FROM inventario WHERE categoria IS NOT NULL ORDER BY categoria
+    """))
+    return [fila['categoria'] for fila in filas]
+
+def items_stock_bajo(db: DatabaseManager, sede_id: Optional[int] = None) -> List[Dict]:
+    """Items con stock bajo ordenados por déficit, de una sede o de todas"""
+    return db.consultar("""
+        SELECT id, nombre, descripcion, categoria, cantidad_actual,
+               cantidad_minima, deficit, sede_id
+        FROM vista_stock_bajo
+        WHERE %s::INTEGER IS NULL OR sede_id = %s
+        ORDER BY deficit DESC
+    """, (sede_id, sede_id))
+
+def buscar_items(
+    db: DatabaseManager,
+    texto: str = "",
+    limite: int = 100,
+    sede_id: int = SEDE_PRINCIPAL
+) -> List[Dict]:
+    """Items de una sede cuyo nombre contiene el texto (sin distinguir mayúsculas), acotados al límite"""
+    texto = (texto or '').strip()
+    if len(texto) < MIN_CARACTERES_ITEM:
+        raise DatosInvalidos(f"Ingrese al menos {MIN_CARACTERES_ITEM} caracteres del nombre")
+    # strpos y no ILIKE: un % o _ escrito por el usuario no actúa como comodín
+    return db.consultar("""
+        SELECT id, nombre, cantidad_actual
+        FROM inventario
+        WHERE sede_id = %s
+        AND strpos(lower(nombre), lower(%s)) > 0
+        ORDER BY nombre
+        LIMIT %s
+    """, (sede_id, texto, limite), clase='busqueda')
+
+def registrar_movimiento(
+    db: DatabaseManager,
+    item_id: int,
+    delta: int,
+    tipo: str,
+    motivo: Optional[str] = None,
+    usuario: Optional[str] = None
+) -> int:
+    """Registra un movimiento con delta atómico y devuelve el stock resultante"""
+    if tipo not in TIPOS_MOVIMIENTO:
+        raise DatosInvalidos(f"Tipo de movimiento inválido: {tipo}")
+    if not delta:
+        raise DatosInvalidos("La cantidad del movimiento no puede ser cero")
+
+    filas = db.ejecutar_procedimiento(
+        'sp_registrar_movimiento',
+        (item_id, delta, tipo, motivo, usuario)
+    )
+    return filas[0]['sp_registrar_movimiento']
@@ -0,0 +1,158 @@
+"""Mantenimientos por vencer de toda la flota
+
+Calcula de una vez, para cada vehículo y servicio periódico, la fecha en que
+le toca volver: la última visita más el intervalo del servicio, ajustado por
+el ritmo con que ese vehículo lo ha repetido. Guarda en mantenimiento_pendiente
+los que vencen dentro del horizonte y aún no tienen una cita agendada, para
+que el panel solo pagine la tabla.
+
+Uso:
+    python -m taller.mantenimiento --dias-horizonte 30
+"""
+import argparse
+from datetime import date
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from psycopg2.extras import execute_values
+
+from taller.config import DB_CONFIG
+
+# Peso del intervalo del servicio, en visitas, frente a los intervalos observados del vehículo
+PESO_INTERVALO = 2
+# El intervalo ajustado queda entre la mitad y una vez y media el del servicio
+AJUSTE_MINIMO = 0.5
+AJUSTE_MAXIMO = 1.5
+
+def cargar_datos(conn, dias_historial: int):
+    """Carga intervalos, visitas completadas de servicios periódicos y citas ya agendadas"""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT servicio_id, intervalo_dias FROM servicios_intervalos")
+        intervalos = pd.DataFrame(cursor.fetchall(), columns=['servicio_id', 'intervalo_dias'])
+
+        cursor.execute("""
+            SELECT DISTINCT c.vehiculo_id, c.servicio_id, c.fecha_cita
+            FROM citas c
+            JOIN servicios_intervalos si ON si.servicio_id = c.servicio_id
+            WHERE c.estado = 'completada'
+            AND c.vehiculo_id IS NOT NULL
+            AND c.fecha_cita >= CURRENT_DATE - %s
+            AND c.fecha_cita <= CURRENT_DATE
+        """, (dias_historial,))
+        visitas = pd.DataFrame(cursor.fetchall(), columns=['vehiculo_id', 'servicio_id', 'fecha_cita'])
+
+        cursor.execute("""
+            SELECT DISTINCT vehiculo_id, servicio_id
+            FROM citas
+            WHERE estado IN ('pendiente', 'confirmada')
+            AND vehiculo_id IS NOT NULL
+            AND fecha_cita >= CURRENT_DATE
+        """)
+        agendadas = pd.DataFrame(cursor.fetchall(), columns=['vehiculo_id', 'servicio_id'])
+
+    return intervalos, visitas, agendadas
+
+def calcular_pendientes(
+    intervalos: pd.DataFrame,
+    visitas: pd.DataFrame,
+    agendadas: pd.DataFrame,
+    hoy: date,
+    dias_horizonte: int,
+    peso: float = PESO_INTERVALO
+) -> pd.DataFrame:
+    """Próxima fecha de cada servicio periódico por vehículo, filtrada al horizonte
+
+    Con las visitas ordenadas por vehículo, servicio y fecha, los intervalos
+    observados son las diferencias entre filas consecutivas del mismo par. El
+    intervalo de cada par promedia esos intervalos con el del servicio, que
+    pesa como `peso` visitas: con pocas visitas manda el del servicio.
+    """
+    columnas = ['vehiculo_id', 'servicio_id', 'ultima_fecha', 'veces', 'intervalo_dias', 'proxima_fecha']
+    if visitas.empty or intervalos.empty:
+        return pd.DataFrame(columns=columnas)
+
+    visitas = visitas.sort_values(['vehiculo_id', 'servicio_id', 'fecha_cita'])
+    vehiculo = visitas['vehiculo_id'].to_numpy()
+    servicio = visitas['servicio_id'].to_numpy()
+    dias = visitas['fecha_cita'].to_numpy(dtype='datetime64[D]').astype(np.int64)
+
+    # Inicio de cada par (vehículo, servicio) dentro del arreglo ordenado
+    nuevo_par = np.ones(len(visitas), dtype=bool)
+    nuevo_par[1:] = (vehiculo[1:] != vehiculo[:-1]) | (servicio[1:] != servicio[:-1])
+    inicios = np.flatnonzero(nuevo_par)
+    finales = np.append(inicios[1:], len(visitas)) - 1
+
+    veces = finales - inicios + 1
+    # Suma de intervalos de un par = última fecha - primera fecha
+    suma_intervalos = (dias[finales] - dias[inicios]).astype(float)
+
+    base = (
+        intervalos.set_index('servicio_id')['intervalo_dias']
+        .reindex(servicio[inicios])
+        .to_numpy(dtype=float)
+    )
+    intervalo = (suma_intervalos + peso * base) / (veces - 1 + peso)
+    intervalo = np.rint(np.clip(intervalo, AJUSTE_MINIMO * base, AJUSTE_MAXIMO * base)).astype(np.int64)
+    proxima = dias[finales] + intervalo
+
+    pendientes = pd.DataFrame({
+        'vehiculo_id': vehiculo[inicios],
+        'servicio_id': servicio[inicios],
+        'ultima_fecha': dias[finales].astype('datetime64[D]'),
+        'veces': veces,
+        'intervalo_dias': intervalo,
+        'proxima_fecha': proxima.astype('datetime64[D]')
+    })
+
+    limite = np.datetime64(hoy, 'D') + np.timedelta64(dias_horizonte, 'D')
+    pendientes = pendientes[pendientes['proxima_fecha'].to_numpy() <= limite]
+    if not agendadas.empty:
+        ya_agendadas = pd.MultiIndex.from_frame(agendadas[['vehiculo_id', 'servicio_id']])
+        pares = pd.MultiIndex.from_frame(pendientes[['vehiculo_id', 'servicio_id']])
+        pendientes = pendientes[~pares.isin(ya_agendadas)]
+    return pendientes[columnas].reset_index(drop=True)
+
+def guardar_pendientes(conn, pendientes: pd.DataFrame):
+    """Reemplaza la lista completa en una transacción: el panel nunca ve una lista a medias"""
+    filas = [
+        (int(fila.vehiculo_id), int(fila.servicio_id), fila.ultima_fecha.date(), int(fila.veces),
+         int(fila.intervalo_dias), fila.proxima_fecha.date())
+        for fila in pendientes.itertuples(index=False)
+    ]
+    with conn.cursor() as cursor:
+        cursor.execute("DELETE FROM mantenimiento_pendiente")
+        execute_values(cursor, """
+            INSERT INTO mantenimiento_pendiente
+                (vehiculo_id, servicio_id, ultima_fecha, veces, intervalo_dias, proxima_fecha)
+            VALUES %s
+        """, filas, page_size=1000)
+    conn.commit()
+
+def ejecutar(
+    config: Dict = DB_CONFIG,
+    dias_horizonte: int = 30,
+    dias_historial: int = 1095
+) -> int:
+    """Recalcula la lista de mantenimientos por vencer y devuelve cuántos quedaron"""
+    conn = psycopg2.connect(**config)
+    try:
+        intervalos, visitas, agendadas = cargar_datos(conn, dias_historial)
+        pendientes = calcular_pendientes(intervalos, visitas, agendadas, date.today(), dias_horizonte)
+        guardar_pendientes(conn, pendientes)
+        return len(pendientes)
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Mantenimientos por vencer de la flota")
+    parser.add_argument('--dias-horizonte', type=int, default=30, help="Incluye los que vencen en estos días")
+    parser.add_argument('--dias-historial', type=int, default=1095, help="Días de visitas a considerar")
+    args = parser.parse_args()
+
+    total = ejecutar(DB_CONFIG, args.dias_horizonte, args.dias_historial)
+    print(f"{total} mantenimientos por vencer")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""Métricas del proceso en formato de texto de Prometheus
+
+Registro en memoria de contadores, medidores e histogramas con etiquetas,
+seguro entre hilos y sin dependencias. Las métricas de la aplicación se
+definen aquí para tener sus nombres en un solo lugar; la capa de servicios
+las actualiza y la interfaz Streamlit (ServidorMetricas) y la API (/metrics)
+las exponen.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Cubetas por defecto de los histogramas de latencia, en segundos
+CUBETAS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escapar(valor) -> str:
+    return str(valor).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _formatear(valor: float) -> str:
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+def _etiquetas(nombres: Tuple[str, ...], valores: Tuple, extra: str = '') -> str:
+    pares = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+class _Metrica:
+    """Base común: nombre, ayuda, etiquetas y valores por combinación de etiquetas"""
+
+    tipo = ''
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Iterable[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _clave(self, etiquetas: Dict) -> Tuple:
+        if set(etiquetas) != set(self.etiquetas):
+            raise ValueError(f"{self.nombre} espera las etiquetas {self.etiquetas}, no {tuple(etiquetas)}")
+        return tuple(str(etiquetas[nombre]) for nombre in self.etiquetas)
+
+    def _muestras(self) -> List[str]:
+        raise NotImplementedError
+
+    def exponer(self) -> str:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        return '\n'.join(lineas + self._muestras())
+
+class Contador(_Metrica):
+    """Valor que solo crece (eventos ocurridos)"""
+
+    tipo = 'counter'
+
+    def inc(self, valor: float = 1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def valor(self, **etiquetas) -> float:
+        with self._lock:
+            return self._valores.get(self._clave(etiquetas), 0)
+
+    def _muestras(self) -> List[str]:
+        with self._lock:
+            valores = sorted(self._valores.items())
+        return [f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_formatear(valor)}" for clave, valor in valores]
+
+class Medidor(_Metrica):
+    """Valor que sube y baja; con `funcion` se calcula al exponerlo"""
+
+    tipo = 'gauge'
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Iterable[str] = (),
+                 funcion: Optional[Callable[[], float]] = None):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.funcion = funcion
+
+    def set(self, valor: float, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = valor
+
+    def inc(self, valor: float = 1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def dec(self, valor: float = 1, **etiquetas):
+        self.inc(-valor, **etiquetas)
+
+    def _muestras(self) -> List[str]:
+        if self.funcion is not None:
+            return [f"{self.nombre} {_formatear(self.funcion())}"]
+        with self._lock:
+            valores = sorted(self._valores.items())
+        return [f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_formatear(valor)}" for clave, valor in valores]
+
+class Histograma(_Metrica):
+    """Distribución de observaciones (latencias) en cubetas acumulativas"""
+
+    tipo = 'histogram'
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Iterable[str] = (), cubetas: Iterable[float] = CUBETAS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.cubetas = tuple(sorted(cubetas)) + (float('inf'),)
+
+    def observar(self, valor: float, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            # [conteos por cubeta..., suma, total]
+            datos = self._valores.setdefault(clave, [0] * len(self.cubetas) + [0.0, 0])
+            for indice, limite in enumerate(self.cubetas):
+                if valor <= limite:
+                    datos[indice] += 1
+                    break
+            datos[-2] += valor
+            datos[-1] += 1
+
+    @contextmanager
+    def medir(self, **etiquetas):
+        """Observa la duración del bloque en segundos"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **etiquetas)
+
+    def _muestras(self) -> List[str]:
+        with self._lock:
+            valores = sorted((clave, list(datos)) for clave, datos in self._valores.items())
+        lineas = []
+        for clave, datos in valores:
+            acumulado = 0
+            for limite, conteo in zip(self.cubetas, datos):
+                acumulado += conteo
+                le = f'le="{_formatear(limite)}"'
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, le)} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {_formatear(datos[-2])}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {datos[-1]}")
+        return lineas
+
+class Registro:
+    """Conjunto de métricas expuestas juntas"""
+
+    def __init__(self):
+        self._metricas: Dict[str, _Metrica] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, metrica: _Metrica) -> _Metrica:
+        with self._lock:
+            if metrica.nombre in self._metricas:
+                raise ValueError(f"Métrica duplicada: {metrica.nombre}")
+            self._metricas[metrica.nombre] = metrica
+        return metrica
+
+    def contador(self, nombre: str, ayuda: str, etiquetas: Iterable[str] = ()) -> Contador:
+        return self.registrar(Contador(nombre, ayuda, etiquetas))
+
+    def medidor(self, nombre: str, ayuda: str, etiquetas: Iterable[str] = (),
+                funcion: Optional[Callable[[], float]] = None) -> Medidor:
+        return self.registrar(Medidor(nombre, ayuda, etiquetas, funcion))
+
+    def histograma(self, nombre: str, ayuda: str, etiquetas: Iterable[str] = (),
+                   cubetas: Iterable[float] = CUBETAS) -> Histograma:
+        return self.registrar(Histograma(nombre, ayuda, etiquetas, cubetas))
+
+    def exponer(self) -> str:
+        """Todas las métricas en formato de texto de Prometheus"""
+        with self._lock:
+            metricas = list(self._metricas.values())
+        return '\n'.join(metrica.exponer() for metrica in metricas) + '\n'
+
+# Registro único del proceso
+registro = Registro()
+
+# Base de datos (taller.db)
+db_operaciones = registro.contador(
+    'taller_db_operaciones_total', "Consultas y procedimientos ejecutados", ('operacion', 'resultado'))
+db_duracion = registro.histograma(
+    'taller_db_operacion_segundos', "Duración de consultas y procedimientos", ('operacion',))
+db_conexiones_en_uso = registro.medidor(
+    'taller_db_conexiones_en_uso', "Conexiones prestadas del pool", ('servidor',))
+db_conexiones_maximo = registro.medidor(
+    'taller_db_conexiones_maximo', "Conexiones máximas de los pools del proceso", ('servidor',))
+db_espera_conexion = registro.histograma(
+    'taller_db_espera_conexion_segundos', "Espera hasta obtener una conexión del pool", ('servidor',))
+db_admision_en_curso = registro.medidor(
+    'taller_db_admision_en_curso', "Consultas pesadas en curso por clase", ('clase',))
+db_admision_rechazos = registro.contador(
+    'taller_db_admision_rechazos_total', "Consultas pesadas rechazadas por falta de turno", ('clase',))
+
+# Negocio (taller.citas)
+reservas = registro.contador(
+    'taller_reservas_total', "Intentos de reserva de citas por resultado (creada, repetida, conflicto, invalida, error)", ('resultado',))
+transiciones = registro.contador(
+    'taller_citas_transiciones_total', "Cambios de estado de citas por estado destino", ('estado',))
+
+# Interfaz Streamlit
+paginas = registro.contador(
+    'taller_paginas_total', "Ejecuciones de cada página de la interfaz", ('pagina',))
+pagina_duracion = registro.histograma(
+    'taller_pagina_segundos', "Duración de la ejecución de cada página", ('pagina',))
+errores_interfaz = registro.contador(
+    'taller_errores_interfaz_total', "Errores mostrados al usuario en la interfaz", ('origen',))
+
+class ActividadSesiones:
+    """Sesiones de la interfaz con actividad dentro de la ventana (segundos)"""
+
+    def __init__(self, ventana: float = 300.0):
+        self.ventana = ventana
+        self._vistas: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, sesion_id: str):
+        with self._lock:
+            self._vistas[sesion_id] = time.monotonic()
+
+    def activas(self) -> int:
+        limite = time.monotonic() - self.ventana
+        with self._lock:
+            for sesion_id in [sesion_id for sesion_id, visto in self._vistas.items() if visto < limite]:
+                del self._vistas[sesion_id]
+            return len(self._vistas)
+
+sesiones = ActividadSesiones()
+sesiones_activas = registro.medidor(
+    'taller_sesiones_activas', "Sesiones de la interfaz con actividad en los últimos 5 minutos",
+    funcion=sesiones.activas)
+
+# API HTTP
+api_peticiones = registro.contador(
+    'taller_api_peticiones_total', "Peticiones atendidas por la API", ('ruta', 'estado'))
+api_duracion = registro.histograma(
+    'taller_api_peticion_segundos', "Duración de las peticiones de la API", ('ruta',))
+
+recordatorios = registro.contador(
+    'taller_recordatorios_total', "Recordatorios de citas por canal y resultado (enviado, fallido)", ('canal', 'resultado'))
+
+# Cola de tareas (taller.tareas)
+tareas = registro.contador(
+    'taller_tareas_total', "Tareas en segundo plano ejecutadas por tipo y resultado (completada, reintento, fallida)",
+    ('tipo', 'resultado'))
+tarea_duracion = registro.histograma(
+    'taller_tarea_segundos', "Duración de las tareas en segundo plano", ('tipo',),
+    cubetas=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0))
+
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    """Responde /metrics con el registro del proceso"""
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        cuerpo = self.server.registro.exponer().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', TIPO_CONTENIDO)
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        pass
+
+class ServidorMetricas:
+    """Servidor HTTP en un hilo propio para exponer las métricas junto a Streamlit"""
+
+    def __init__(self, puerto: int, host: str = '0.0.0.0', registro_metricas: Registro = registro):
+        self.servidor = None
+        try:
+            self.servidor = ThreadingHTTPServer((host, puerto), _ManejadorMetricas)
+        except OSError as e:
+            # Otro proceso (p. ej. una segunda instancia) ya usa el puerto
+            logger.warning("No se pudo exponer métricas en el puerto %s: %s", puerto, e)
+            return
+        self.servidor.daemon_threads = True
+        self.servidor.registro = registro_metricas
+        self._hilo = threading.Thread(target=self.servidor.serve_forever, name='taller-metricas', daemon=True)
+        self._hilo.start()
+
+    @property
+    def puerto(self) -> Optional[int]:
+        return self.servidor.server_address[1] if self.servidor else None
+
+    def cerrar(self):
+        if self.servidor:
+            self.servidor.shutdown()
+            self.servidor.server_close()
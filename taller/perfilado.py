@@ -0,0 +1,146 @@
+"""Perfilado por fases de cada ejecución de una página
+
+Con el perfilado activo, cada ejecución registra cuánto tiempo pasó en
+consultas SQL, construcción de DataFrames, construcción de gráficos y el
+resto (emisión de widgets y lógica de la interfaz). Las fases se anidan:
+cada una guarda su tiempo propio, sin contar el de las fases internas.
+
+El perfil activo vive en una ContextVar, como la sesión de taller.replicas,
+así que las sesiones de Streamlit (un hilo cada una) no se mezclan y, sin
+perfil activo, fase() no hace nada.
+"""
+import cProfile
+import io
+import json
+import marshal
+import os
+import pstats
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+# Fases reconocidas; el tiempo no cubierto por ninguna se atribuye a 'interfaz'
+FASES = ('consultas', 'dataframes', 'graficos', 'interfaz')
+
+_perfil: ContextVar[Optional['Perfil']] = ContextVar('taller_perfil', default=None)
+
+class Perfil:
+    """Fases medidas durante una ejecución, con cProfile opcional"""
+
+    def __init__(self, nombre: str, con_cprofile: bool = False):
+        self.nombre = nombre
+        self.inicio_epoca = time.time()
+        self.inicio = time.perf_counter()
+        self.duracion = None
+        # (fase, etiqueta, inicio relativo, duración, tiempo propio)
+        self.eventos: List[tuple] = []
+        self._pila: List[list] = []
+        self.cprofile = None
+        if con_cprofile:
+            self.cprofile = cProfile.Profile()
+            try:
+                self.cprofile.enable()
+            except ValueError:
+                # Otro perfilador ya está activo en el proceso
+                self.cprofile = None
+
+    @contextmanager
+    def fase(self, nombre: str, etiqueta: str = ''):
+        # [inicio, tiempo de las fases hijas]
+        marco = [time.perf_counter(), 0.0]
+        self._pila.append(marco)
+        try:
+            yield
+        finally:
+            fin = time.perf_counter()
+            self._pila.pop()
+            duracion = fin - marco[0]
+            if self._pila:
+                self._pila[-1][1] += duracion
+            self.eventos.append((nombre, etiqueta, marco[0] - self.inicio, duracion, duracion - marco[1]))
+
+    def terminar(self):
+        self.duracion = time.perf_counter() - self.inicio
+        if self.cprofile:
+            self.cprofile.disable()
+            self.cprofile.create_stats()
+
+    def desglose(self) -> Dict[str, float]:
+        """Segundos propios por fase; 'interfaz' recibe el tiempo no cubierto"""
+        totales = dict.fromkeys(FASES, 0.0)
+        for nombre, _, _, _, propio in self.eventos:
+            totales[nombre] = totales.get(nombre, 0.0) + propio
+        totales['interfaz'] += max(self.duracion - sum(totales.values()), 0.0)
+        return totales
+
+    def mas_lentos(self, cantidad: int = 10) -> List[tuple]:
+        """Eventos individuales con más tiempo propio: (fase, etiqueta, segundos)"""
+        eventos = sorted(self.eventos, key=lambda evento: evento[4], reverse=True)
+        return [(nombre, etiqueta, propio) for nombre, etiqueta, _, _, propio in eventos[:cantidad]]
+
+    def resumen_cprofile(self, cantidad: int = 25) -> str:
+        """Funciones con más tiempo acumulado según cProfile"""
+        if not self.cprofile:
+            return ''
+        salida = io.StringIO()
+        pstats.Stats(self.cprofile, stream=salida).sort_stats('cumulative').print_stats(cantidad)
+        return salida.getvalue()
+
+    def volcado_cprofile(self) -> bytes:
+        """Estadísticas en el formato de pstats (archivo .prof, p. ej. para snakeviz)"""
+        return marshal.dumps(self.cprofile.stats) if self.cprofile else b''
+
+def iniciar(nombre: str, con_cprofile: bool = False) -> Perfil:
+    """Activa un perfil nuevo en el contexto actual"""
+    perfil = Perfil(nombre, con_cprofile)
+    _perfil.set(perfil)
+    return perfil
+
+def terminar() -> Optional[Perfil]:
+    """Cierra y devuelve el perfil activo del contexto actual"""
+    perfil = _perfil.get()
+    if perfil is not None:
+        perfil.terminar()
+        _perfil.set(None)
+    return perfil
+
+@contextmanager
+def fase(nombre: str, etiqueta: str = ''):
+    """Mide el bloque como parte de la fase indicada si hay un perfil activo"""
+    perfil = _perfil.get()
+    if perfil is None:
+        yield
+        return
+    with perfil.fase(nombre, etiqueta):
+        yield
+
+def etiqueta_sql(query: str, largo: int = 80) -> str:
+    """Consulta en una línea y recortada, para identificarla en el desglose"""
+    texto = re.sub(r'\s+', ' ', query).strip()
+    return texto if len(texto) <= largo else texto[:largo - 1] + '…'
+
+def traza_chrome(perfiles: List[Perfil]) -> str:
+    """Perfiles en formato Trace Event (chrome://tracing, Perfetto) como JSON"""
+    eventos = []
+    for numero, perfil in enumerate(perfiles, 1):
+        base = perfil.inicio_epoca * 1e6
+        eventos.append({'name': perfil.nombre, 'cat': 'ejecucion', 'ph': 'X', 'pid': 1, 'tid': numero,
+                        'ts': base, 'dur': (perfil.duracion or 0) * 1e6})
+        for nombre, etiqueta, inicio, duracion, _ in perfil.eventos:
+            eventos.append({'name': etiqueta or nombre, 'cat': nombre, 'ph': 'X', 'pid': 1, 'tid': numero,
+                            'ts': base + inicio * 1e6, 'dur': duracion * 1e6})
+    return json.dumps({'traceEvents': eventos, 'displayTimeUnit': 'ms'}, ensure_ascii=False)
+
+def exportar(perfil: Perfil, directorio: str) -> str:
+    """Guarda la traza (y el .prof si hubo cProfile) en el directorio; devuelve la ruta base"""
+    os.makedirs(directorio, exist_ok=True)
+    marca = time.strftime('%Y%m%d-%H%M%S', time.localtime(perfil.inicio_epoca))
+    base = os.path.join(directorio, f"{marca}-{int(perfil.inicio_epoca * 1000) % 1000:03d}-{perfil.nombre}")
+    with open(f"{base}.json", 'w', encoding='utf-8') as archivo:
+        archivo.write(traza_chrome([perfil]))
+    if perfil.cprofile:
+        with open(f"{base}.prof", 'wb') as archivo:
+            archivo.write(perfil.volcado_cprofile())
+    return base
@@ -0,0 +1,145 @@
+"""Pronóstico de reposición de inventario
+
+Calcula para todos los items a la vez el consumo diario (libro de movimientos)
+y la demanda de las citas ya agendadas (lista de materiales de cada servicio),
+y guarda el punto de reorden y la cantidad sugerida en inventario_pronostico.
+
+Uso:
+    python -m taller.pronostico --dias-historial 90 --dias-entrega 7
+"""
+import argparse
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from psycopg2.extras import execute_values
+
+from taller.config import DB_CONFIG
+
+# Factor z para un nivel de servicio del 95%
+Z_NIVEL_SERVICIO = 1.65
+
+def cargar_datos(conn, dias_historial: int, dias_entrega: int):
+    """Carga inventario, consumo diario por item y demanda agendada"""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT id AS item_id, cantidad_actual FROM inventario")
+        inventario = pd.DataFrame(cursor.fetchall(), columns=['item_id', 'cantidad_actual'])
+
+        cursor.execute("""
+            SELECT item_id, created_at::date AS dia, -SUM(delta) AS cantidad
+            FROM inventario_movimientos
+            WHERE tipo = 'consumo'
+            AND created_at >= CURRENT_DATE - %s
+            AND created_at < CURRENT_DATE
+            GROUP BY item_id, created_at::date
+        """, (dias_historial,))
+        consumo = pd.DataFrame(cursor.fetchall(), columns=['item_id', 'dia', 'cantidad'])
+
+        cursor.execute("""
+            SELECT item_id, requerido
+            FROM fn_proyeccion_repuestos(CURRENT_DATE, CURRENT_DATE + %s)
+        """, (dias_entrega,))
+        agendado = pd.DataFrame(cursor.fetchall(), columns=['item_id', 'requerido'])
+
+    return inventario, consumo, agendado
+
+def calcular_pronostico(
+    inventario: pd.DataFrame,
+    consumo: pd.DataFrame,
+    agendado: pd.DataFrame,
+    dias_historial: int,
+    dias_entrega: int,
+    dias_revision: int,
+    z: float = Z_NIVEL_SERVICIO
+) -> pd.DataFrame:
+    """Calcula punto de reorden y cantidad sugerida para todos los items
+
+    La media y la desviación del consumo diario salen de la suma y la suma de
+    cuadrados por item sobre todo el periodo, de modo que los días sin consumo
+    cuentan como cero sin construir la serie diaria. La demanda durante el
+    tiempo de entrega es el máximo entre el consumo histórico y lo agendado.
+    """
+    items = inventario['item_id']
+    n = dias_historial
+
+    sumas = (
+        consumo.assign(cuadrado=consumo['cantidad'].astype(float) ** 2)
+        .groupby('item_id')[['cantidad', 'cuadrado']].sum()
+        .reindex(items, fill_value=0)
+        .to_numpy(dtype=float)
+    )
+    consumo_diario = sumas[:, 0] / n
+    varianza = (sumas[:, 1] - n * consumo_diario ** 2) / max(n - 1, 1)
+    desviacion = np.sqrt(np.clip(varianza, 0, None))
+
+    demanda_agendada = (
+        agendado.set_index('item_id')['requerido']
+        .reindex(items, fill_value=0)
+        .to_numpy(dtype=float)
+    )
+
+    demanda_entrega = np.maximum(consumo_diario * dias_entrega, demanda_agendada)
+    stock_seguridad = z * desviacion * np.sqrt(dias_entrega)
+    punto_reorden = np.ceil(demanda_entrega + stock_seguridad)
+    nivel_objetivo = punto_reorden + np.ceil(consumo_diario * dias_revision)
+    cantidad_sugerida = np.clip(nivel_objetivo - inventario['cantidad_actual'].to_numpy(), 0, None)
+
+    return pd.DataFrame({
+        'item_id': items.to_numpy(),
+        'consumo_diario': consumo_diario.round(3),
+        'desviacion_diaria': desviacion.round(3),
+        'demanda_agendada': demanda_agendada.astype(int),
+        'punto_reorden': punto_reorden.astype(int),
+        'cantidad_sugerida': cantidad_sugerida.astype(int)
+    })
+
+def guardar_pronostico(conn, pronostico: pd.DataFrame):
+    """Reemplaza el pronóstico de cada item en una sola sentencia"""
+    filas = pronostico.astype(object).itertuples(index=False, name=None)
+    with conn.cursor() as cursor:
+        execute_values(cursor, """
+            INSERT INTO inventario_pronostico
+                (item_id, consumo_diario, desviacion_diaria, demanda_agendada, punto_reorden, cantidad_sugerida)
+            VALUES %s
+            ON CONFLICT (item_id) DO UPDATE SET
+                consumo_diario = EXCLUDED.consumo_diario,
+                desviacion_diaria = EXCLUDED.desviacion_diaria,
+                demanda_agendada = EXCLUDED.demanda_agendada,
+                punto_reorden = EXCLUDED.punto_reorden,
+                cantidad_sugerida = EXCLUDED.cantidad_sugerida,
+                calculado_en = CURRENT_TIMESTAMP
+        """, list(filas))
+    conn.commit()
+
+def ejecutar(
+    config: Dict = DB_CONFIG,
+    dias_historial: int = 90,
+    dias_entrega: int = 7,
+    dias_revision: int = 7
+) -> int:
+    """Ejecuta el pronóstico completo y devuelve la cantidad de items procesados"""
+    conn = psycopg2.connect(**config)
+    try:
+        inventario, consumo, agendado = cargar_datos(conn, dias_historial, dias_entrega)
+        if inventario.empty:
+            return 0
+
+        pronostico = calcular_pronostico(inventario, consumo, agendado, dias_historial, dias_entrega, dias_revision)
+        guardar_pronostico(conn, pronostico)
+        return len(pronostico)
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Pronóstico de reposición de inventario")
+    parser.add_argument('--dias-historial', type=int, default=90, help="Días de consumo a considerar")
+    parser.add_argument('--dias-entrega', type=int, default=7, help="Tiempo de entrega del proveedor en días")
+    parser.add_argument('--dias-revision', type=int, default=7, help="Días entre pedidos")
+    args = parser.parse_args()
+
+    total = ejecutar(DB_CONFIG, args.dias_historial, args.dias_entrega, args.dias_revision)
+    print(f"Pronóstico actualizado para {total} items")
+
+if __name__ == "__main__":
+    main()
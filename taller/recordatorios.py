@@ -0,0 +1,426 @@
+"""Recordatorios de citas por email o SMS
+
+Cada ejecución toma las citas confirmadas de una fecha (mañana por defecto)
+y las reclama en una sola sentencia: la selección usa el índice parcial
+idx_citas_agendadas_fecha y un INSERT ... ON CONFLICT en `recordatorios`
+garantiza un solo recordatorio por cita y fecha aunque dos ejecuciones
+coincidan. Los mensajes se generan todos juntos, se envían en paralelo por
+el transporte de su canal con un límite de envíos por segundo y el
+resultado de cada uno se guarda en un único UPDATE.
+
+Los transportes se eligen con RECORDATORIOS_EMAIL y RECORDATORIOS_SMS:
+'smtp', 'http' (pasarela de SMS) o 'archivo:<ruta>' (JSON por línea, para
+pruebas). La tarea 'recordatorios' de taller.tareas los envía cada tarde.
+
+Uso:
+    python -m taller.recordatorios --fecha 2025-01-15
+    python -m taller.recordatorios --smtp-local 1025
+"""
+import argparse
+import base64
+import json
+import logging
+import smtplib
+import socketserver
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from email.header import Header
+from email.utils import formatdate, make_msgid, parseaddr
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+from taller import config, metricas
+from taller.db import DatabaseManager
+from taller.errores import DatosInvalidos
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_RECORDATORIO = ('enviando', 'enviado', 'fallido')
+
+# Intentos por cita: un recordatorio fallido se reintenta en las siguientes ejecuciones
+MAX_INTENTOS = 3
+# Un recordatorio 'enviando' más antiguo quedó de una ejecución interrumpida
+MINUTOS_ABANDONO = 10
+
+ASUNTO_EMAIL = "Recordatorio de su cita en Taller AutoMax"
+PLANTILLA_EMAIL = (
+    "Hola {nombre}:\n\n"
+    "Le recordamos su cita de {servicio} para su {marca} {modelo} (placa {placa}) "
+    "el {fecha} a las {hora}.\n\n"
+    "Si no puede asistir, cancele la cita desde 'Mis Citas' para liberar el horario.\n\n"
+    "Taller AutoMax"
+)
+PLANTILLA_SMS = (
+    "Taller AutoMax: su cita de {servicio} para {placa} es el {fecha} a las {hora}. "
+    "Si no puede asistir, cancele desde Mis Citas."
+)
+
+class Mensaje:
+    """Recordatorio listo para enviar por un canal"""
+
+    __slots__ = ('cita_id', 'canal', 'destino', 'asunto', 'cuerpo')
+
+    def __init__(self, cita_id: int, canal: str, destino: str, asunto: str, cuerpo: str):
+        self.cita_id = cita_id
+        self.canal = canal
+        self.destino = destino
+        self.asunto = asunto
+        self.cuerpo = cuerpo
+
+def renderizar(filas: Iterable[Dict]) -> List[Mensaje]:
+    """Mensajes de todas las citas reclamadas, con la plantilla de su canal"""
+    mensajes = []
+    for fila in filas:
+        datos = dict(fila, fecha=fila['fecha_cita'].strftime('%d/%m/%Y'), hora=fila['hora_cita'].strftime('%H:%M'))
+        if fila['canal'] == 'email':
+            mensajes.append(Mensaje(fila['cita_id'], 'email', fila['destino'], ASUNTO_EMAIL,
+                                    PLANTILLA_EMAIL.format_map(datos)))
+        else:
+            mensajes.append(Mensaje(fila['cita_id'], 'sms', fila['destino'], '', PLANTILLA_SMS.format_map(datos)))
+    return mensajes
+
+class LimiteTasa:
+    """Cubeta de fichas compartida entre hilos: a lo sumo `por_segundo` envíos por segundo"""
+
+    def __init__(self, por_segundo: float, rafaga: Optional[int] = None):
+        self.por_segundo = por_segundo
+        self.capacidad = rafaga or max(int(por_segundo), 1)
+        self._fichas = float(self.capacidad)
+        self._ultima = time.monotonic()
+        self._lock = threading.Lock()
+
+    def esperar(self):
+        if self.por_segundo <= 0:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            self._fichas = min(self.capacidad, self._fichas + (ahora - self._ultima) * self.por_segundo)
+            self._ultima = ahora
+            self._fichas -= 1
+            # Con saldo negativo, el envío espera a que se repongan sus fichas
+            espera = -self._fichas / self.por_segundo if self._fichas < 0 else 0
+        if espera:
+            time.sleep(espera)
+
+class Transporte:
+    """Envía mensajes de un canal; enviar() lanza una excepción si el envío falla"""
+
+    def enviar(self, mensaje: Mensaje):
+        raise NotImplementedError
+
+    def cerrar(self):
+        pass
+
+class TransporteArchivo(Transporte):
+    """Escribe cada mensaje como una línea JSON (pruebas y entornos sin proveedor)"""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._archivo = open(ruta, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def enviar(self, mensaje: Mensaje):
+        linea = json.dumps({slot: getattr(mensaje, slot) for slot in Mensaje.__slots__}, ensure_ascii=False)
+        with self._lock:
+            self._archivo.write(linea + '\n')
+
+    def cerrar(self):
+        with self._lock:
+            self._archivo.close()
+
+class TransporteSMTP(Transporte):
+    """Email por SMTP; cada hilo reutiliza su conexión durante toda la ejecución"""
+
+    def __init__(self, host: str, puerto: int, remitente: str, usuario: Optional[str] = None,
+                 password: Optional[str] = None, tls: bool = False, timeout: float = 10.0):
+        self.host = host
+        self.puerto = puerto
+        self.remitente = remitente
+        self.usuario = usuario
+        self.password = password
+        self.tls = tls
+        self.timeout = timeout
+        self._direccion = parseaddr(remitente)[1]
+        self._dominio = self._direccion.rpartition('@')[2] or 'localhost'
+        self._asuntos: Dict[str, str] = {}
+        self._local = threading.local()
+        self._conexiones: List[smtplib.SMTP] = []
+        self._lock = threading.Lock()
+
+    def _conexion(self) -> smtplib.SMTP:
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None:
+            conexion = smtplib.SMTP(self.host, self.puerto, timeout=self.timeout)
+            if self.tls:
+                conexion.starttls()
+            if self.usuario:
+                conexion.login(self.usuario, self.password or '')
+            self._local.conexion = conexion
+            with self._lock:
+                self._conexiones.append(conexion)
+        return conexion
+
+    def _asunto(self, asunto: str) -> str:
+        if asunto not in self._asuntos:
+            self._asuntos[asunto] = Header(asunto, 'utf-8').encode()
+        return self._asuntos[asunto]
+
+    def _correo(self, mensaje: Mensaje) -> bytes:
+        """Mensaje MIME armado directamente: EmailMessage es el costo dominante en lotes grandes"""
+        cabeceras = (
+            f"From: {self.remitente}\r\n"
+            f"To: {mensaje.destino}\r\n"
+            f"Subject: {self._asunto(mensaje.asunto)}\r\n"
+            f"Date: {formatdate(localtime=True)}\r\n"
+            f"Message-ID: {make_msgid(str(mensaje.cita_id), self._dominio)}\r\n"
+            "MIME-Version: 1.0\r\n"
+            "Content-Type: text/plain; charset=utf-8\r\n"
+            "Content-Transfer-Encoding: base64\r\n\r\n"
+        )
+        return cabeceras.encode('utf-8') + base64.encodebytes(mensaje.cuerpo.encode('utf-8'))
+
+    def enviar(self, mensaje: Mensaje):
+        correo = self._correo(mensaje)
+        try:
+            self._conexion().sendmail(self._direccion, [mensaje.destino], correo)
+        except smtplib.SMTPServerDisconnected:
+            # El servidor cerró la conexión inactiva: se reintenta una vez con otra
+            self._local.conexion = None
+            self._conexion().sendmail(self._direccion, [mensaje.destino], correo)
+
+    def cerrar(self):
+        with self._lock:
+            conexiones, self._conexiones = self._conexiones, []
+        for conexion in conexiones:
+            try:
+                conexion.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+
+class TransporteSMSHttp(Transporte):
+    """SMS mediante una pasarela HTTP que recibe {"to", "message"} en JSON"""
+
+    def __init__(self, url: str, token: Optional[str] = None, timeout: float = 10.0):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+
+    def enviar(self, mensaje: Mensaje):
+        cuerpo = json.dumps({'to': mensaje.destino, 'message': mensaje.cuerpo}).encode('utf-8')
+        peticion = urllib.request.Request(self.url, data=cuerpo, method='POST',
+                                          headers={'Content-Type': 'application/json'})
+        if self.token:
+            peticion.add_header('Authorization', f"Bearer {self.token}")
+        with urllib.request.urlopen(peticion, timeout=self.timeout) as respuesta:
+            respuesta.read()
+
+def crear_transporte(especificacion: str) -> Transporte:
+    """Transporte desde 'smtp', 'http' o 'archivo:<ruta>' con la configuración del entorno"""
+    tipo, _, ruta = especificacion.partition(':')
+    if tipo == 'archivo':
+        return TransporteArchivo(ruta or 'recordatorios.jsonl')
+    if tipo == 'smtp':
+        return TransporteSMTP(config.SMTP_HOST, config.SMTP_PUERTO, config.SMTP_REMITENTE,
+                              config.SMTP_USUARIO, config.SMTP_PASSWORD, config.SMTP_TLS)
+    if tipo == 'http':
+        if not config.SMS_URL:
+            raise DatosInvalidos("El transporte 'http' de SMS requiere TALLER_SMS_URL")
+        return TransporteSMSHttp(config.SMS_URL, config.SMS_TOKEN)
+    raise DatosInvalidos(f"Transporte de recordatorios desconocido: {especificacion}")
+
+def transportes_configurados() -> Dict[str, Transporte]:
+    return {
+        'email': crear_transporte(config.RECORDATORIOS_EMAIL),
+        'sms': crear_transporte(config.RECORDATORIOS_SMS)
+    }
+
+def enviar_lote(mensajes: List[Mensaje], transportes: Dict[str, Transporte], concurrencia: int = 20,
+                por_segundo: float = 0) -> List[Tuple[int, str, Optional[str]]]:
+    """Envía los mensajes en paralelo; devuelve (cita_id, estado, error) de cada uno"""
+    limite = LimiteTasa(por_segundo)
+
+    def enviar(mensaje: Mensaje) -> Tuple[int, str, Optional[str]]:
+        limite.esperar()
+        try:
+            transportes[mensaje.canal].enviar(mensaje)
+        except Exception as e:
+            metricas.recordatorios.inc(canal=mensaje.canal, resultado='fallido')
+            return mensaje.cita_id, 'fallido', f"{type(e).__name__}: {e}"[:500]
+        metricas.recordatorios.inc(canal=mensaje.canal, resultado='enviado')
+        return mensaje.cita_id, 'enviado', None
+
+    with ThreadPoolExecutor(max_workers=max(concurrencia, 1), thread_name_prefix='taller-recordatorios') as ejecutor:
+        return list(ejecutor.map(enviar, mensajes))
+
+def reclamar(db: DatabaseManager, fecha: date) -> List[Dict]:
+    """Citas confirmadas de la fecha sin recordatorio enviado, ya marcadas 'enviando'
+
+    Prefiere el email si el cliente lo registró. Un recordatorio enviado, o en
+    curso en otra ejecución, no se vuelve a reclamar.
+    """
+    return db.consultar("""
+        WITH candidatas AS (
+            SELECT c.id AS cita_id, c.fecha_cita, c.hora_cita,
+                   cl.nombre, cl.telefono, cl.email,
+                   v.marca, v.modelo, v.placa, s.nombre AS servicio
+            FROM citas c
+            JOIN clientes cl ON cl.id = c.cliente_id
+            JOIN vehiculos v ON v.id = c.vehiculo_id
+            JOIN servicios s ON s.id = c.servicio_id
+            WHERE c.fecha_cita = %(fecha)s AND c.estado = 'confirmada'
+            AND (COALESCE(cl.email, '') <> '' OR COALESCE(cl.telefono, '') <> '')
+        ), reclamadas AS (
+            INSERT INTO recordatorios (cita_id, fecha_cita, canal, destino)
+            SELECT cita_id, fecha_cita,
+                   CASE WHEN COALESCE(email, '') <> '' THEN 'email' ELSE 'sms' END,
+                   CASE WHEN COALESCE(email, '') <> '' THEN email ELSE telefono END
+            FROM candidatas
+            ON CONFLICT (cita_id, fecha_cita) DO UPDATE SET
+                estado = 'enviando',
+                intentos = recordatorios.intentos + 1,
+                canal = EXCLUDED.canal,
+                destino = EXCLUDED.destino,
+                error = NULL,
+                actualizado_en = CURRENT_TIMESTAMP
+            WHERE (recordatorios.estado = 'fallido' AND recordatorios.intentos < %(max_intentos)s)
+            OR (recordatorios.estado = 'enviando'
+                AND recordatorios.actualizado_en < CURRENT_TIMESTAMP - make_interval(mins => %(abandono)s))
+            RETURNING cita_id, canal, destino
+        )
+        SELECT c.*, r.canal, r.destino
+        FROM candidatas c
+        JOIN reclamadas r USING (cita_id)
+        ORDER BY c.hora_cita, c.cita_id
+    """, {'fecha': fecha, 'max_intentos': MAX_INTENTOS, 'abandono': MINUTOS_ABANDONO})
+
+def registrar_resultados(db: DatabaseManager, fecha: date, resultados: List[Tuple[int, str, Optional[str]]]):
+    """Guarda el estado de entrega de todos los recordatorios en una sola sentencia"""
+    if not resultados:
+        return
+    with db.transaccion(operacion='procedimiento') as cursor:
+        execute_values(cursor, """
+            UPDATE recordatorios r
+            SET estado = v.estado,
+                error = v.error,
+                enviado_en = CASE WHEN v.estado = 'enviado' THEN CURRENT_TIMESTAMP END,
+                actualizado_en = CURRENT_TIMESTAMP
+            FROM (VALUES %s) AS v(cita_id, fecha_cita, estado, error)
+            WHERE r.cita_id = v.cita_id AND r.fecha_cita = v.fecha_cita
+        """, [(cita_id, fecha, estado, error) for cita_id, estado, error in resultados], page_size=1000)
+
+def enviar_recordatorios(db: DatabaseManager, fecha: Optional[date] = None,
+                         transportes: Optional[Dict[str, Transporte]] = None,
+                         concurrencia: int = None, por_segundo: float = None) -> Dict[str, int]:
+    """Envía los recordatorios pendientes de la fecha (mañana por defecto); devuelve totales por estado"""
+    fecha = fecha or date.today() + timedelta(days=1)
+    propios = transportes is None
+    transportes = transportes_configurados() if propios else transportes
+    try:
+        mensajes = renderizar(reclamar(db, fecha))
+        resultados = enviar_lote(
+            mensajes, transportes,
+            concurrencia or config.RECORDATORIOS_CONCURRENCIA,
+            config.RECORDATORIOS_POR_SEGUNDO if por_segundo is None else por_segundo
+        )
+        registrar_resultados(db, fecha, resultados)
+    finally:
+        if propios:
+            for transporte in transportes.values():
+                transporte.cerrar()
+    totales = {'enviado': 0, 'fallido': 0}
+    for _, estado, _ in resultados:
+        totales[estado] += 1
+    logger.info("Recordatorios del %s: %s enviados, %s fallidos", fecha, totales['enviado'], totales['fallido'])
+    return totales
+
+def resumen(db: DatabaseManager, fecha: date) -> Dict[str, int]:
+    """Recordatorios de la fecha por estado"""
+    filas = db.consultar("""
+        SELECT estado, COUNT(*) AS total FROM recordatorios WHERE fecha_cita = %s GROUP BY estado
+    """, (fecha,), solo_lectura=True)
+    totales = dict.fromkeys(ESTADOS_RECORDATORIO, 0)
+    totales.update({fila['estado']: fila['total'] for fila in filas})
+    return totales
+
+class _ManejadorSMTP(socketserver.StreamRequestHandler):
+    """Diálogo SMTP mínimo: acepta todo y guarda cada mensaje recibido"""
+
+    def _responder(self, linea: str):
+        self.wfile.write((linea + '\r\n').encode('ascii'))
+
+    def handle(self):
+        self._responder('220 taller-smtp-local')
+        while True:
+            linea = self.rfile.readline()
+            if not linea:
+                return
+            comando = linea.decode('utf-8', 'replace').strip().upper()
+            if comando.startswith('EHLO'):
+                self._responder('250-taller-smtp-local\r\n250 8BITMIME')
+            elif comando == 'DATA':
+                self._responder('354 Fin con <CRLF>.<CRLF>')
+                lineas = []
+                while True:
+                    dato = self.rfile.readline()
+                    if not dato or dato in (b'.\r\n', b'.\n'):
+                        break
+                    lineas.append(dato[1:] if dato.startswith(b'..') else dato)
+                self.server.recibir(b''.join(lineas))
+                self._responder('250 OK')
+            elif comando == 'QUIT':
+                self._responder('221 Hasta luego')
+                return
+            else:
+                # HELO, MAIL, RCPT, RSET, NOOP
+                self._responder('250 OK')
+
+class ServidorSMTPLocal(socketserver.ThreadingTCPServer):
+    """Servidor SMTP local que no entrega nada: guarda los mensajes (y opcionalmente los escribe)"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, puerto: int = 1025, host: str = '127.0.0.1', ruta: Optional[str] = None):
+        super().__init__((host, puerto), _ManejadorSMTP)
+        self.ruta = ruta
+        self.mensajes: List[bytes] = []
+        self._lock = threading.Lock()
+
+    def recibir(self, mensaje: bytes):
+        with self._lock:
+            self.mensajes.append(mensaje)
+            if self.ruta:
+                with open(self.ruta, 'ab') as archivo:
+                    archivo.write(mensaje + b'\n')
+
+    def iniciar(self) -> 'ServidorSMTPLocal':
+        threading.Thread(target=self.serve_forever, name='taller-smtp-local', daemon=True).start()
+        return self
+
+def main():
+    parser = argparse.ArgumentParser(description="Envío de recordatorios de citas")
+    parser.add_argument('--fecha', type=date.fromisoformat, default=None, help="Fecha de las citas (mañana por defecto)")
+    parser.add_argument('--concurrencia', type=int, default=None, help="Envíos en paralelo")
+    parser.add_argument('--smtp-local', type=int, metavar='PUERTO',
+                        help="Solo inicia un servidor SMTP local de prueba en el puerto indicado")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    if args.smtp_local:
+        servidor = ServidorSMTPLocal(args.smtp_local, ruta='smtp_local.eml')
+        print(f"SMTP local en 127.0.0.1:{args.smtp_local}; mensajes en smtp_local.eml")
+        servidor.serve_forever()
+        return
+
+    inicio = datetime.now()
+    db = DatabaseManager(config.DB_CONFIG, maximo=2)
+    totales = enviar_recordatorios(db, args.fecha, concurrencia=args.concurrencia)
+    print(f"{totales['enviado']} enviados, {totales['fallido']} fallidos "
+          f"en {(datetime.now() - inicio).total_seconds():.1f} s")
+
+if __name__ == "__main__":
+    main()
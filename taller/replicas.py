@@ -0,0 +1,119 @@
+"""Enrutamiento de lecturas a réplicas de PostgreSQL
+
+Las lecturas marcadas como seguras (solo_lectura=True) se reparten en turno
+rotativo entre las réplicas sanas cuyo retraso de replicación no supera el
+máximo configurado. Un hilo verifica periódicamente cada réplica; si ninguna
+está disponible, o la sesión escribió hace poco (lectura tras escritura), la
+lectura va al primario.
+"""
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+import psycopg2
+
+# Estado de la sesión actual: {'ultima_escritura': monotonic}
+_sesion: ContextVar[Optional[Dict]] = ContextVar('taller_db_sesion', default=None)
+
+def usar_sesion(estado: Dict):
+    """Asocia el contexto actual a un estado de sesión persistente (p. ej. st.session_state)"""
+    _sesion.set(estado)
+
+def _estado_sesion() -> Dict:
+    estado = _sesion.get()
+    if estado is None:
+        estado = {}
+        _sesion.set(estado)
+    return estado
+
+def registrar_escritura():
+    """Marca que la sesión acaba de escribir en el primario"""
+    _estado_sesion()['ultima_escritura'] = time.monotonic()
+
+def escritura_reciente(ventana: float) -> bool:
+    """Indica si la sesión escribió dentro de la ventana (segundos)"""
+    ultima = _estado_sesion().get('ultima_escritura')
+    return ultima is not None and time.monotonic() - ultima < ventana
+
+# Retraso en segundos: cero si la réplica ya aplicó todo lo recibido
+CONSULTA_RETRASO = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END AS retraso
+"""
+
+class EnrutadorReplicas:
+    """Elige réplica en turno rotativo según salud y retraso"""
+
+    def __init__(self, replicas: List[Dict], max_retraso: float = 5.0, intervalo: float = 2.0):
+        self.replicas = replicas
+        self.max_retraso = max_retraso
+        self.intervalo = intervalo
+        self._estado = [{'sana': False, 'retraso': None, 'error': None} for _ in replicas]
+        self._turno = 0
+        self._lock = threading.Lock()
+        self._iniciado = threading.Event()
+        self._hilo = None
+
+    def _iniciar(self, esperar: bool):
+        """Arranca el verificador en el primer uso y, si se pide, espera una primera ronda"""
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._run, name='taller-replicas', daemon=True)
+                self._hilo.start()
+        if esperar:
+            self._iniciado.wait(timeout=self.intervalo + 5)
+
+    def _run(self):
+        while True:
+            for indice, config in enumerate(self.replicas):
+                self._verificar(indice, config)
+            self._iniciado.set()
+            time.sleep(self.intervalo)
+
+    def _verificar(self, indice: int, config: Dict):
+        try:
+            conn = psycopg2.connect(connect_timeout=2, **config)
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(CONSULTA_RETRASO)
+                    retraso = float(cursor.fetchone()[0])
+            finally:
+                conn.close()
+            estado = {'sana': True, 'retraso': retraso, 'error': None}
+        except psycopg2.Error as e:
+            estado = {'sana': False, 'retraso': None, 'error': str(e).strip()}
+        with self._lock:
+            self._estado[indice] = estado
+
+    def elegir(self, esperar: bool = True) -> Optional[int]:
+        """Índice de la siguiente réplica utilizable, o None para usar el primario
+
+        Desde un bucle de eventos use esperar=False: mientras no termine la
+        primera verificación las lecturas van al primario.
+        """
+        self._iniciar(esperar)
+        with self._lock:
+            for _ in range(len(self.replicas)):
+                indice = self._turno % len(self.replicas)
+                self._turno += 1
+                estado = self._estado[indice]
+                if estado['sana'] and estado['retraso'] <= self.max_retraso:
+                    return indice
+        return None
+
+    def marcar_caida(self, indice: int, error: Exception):
+        """Excluye la réplica hasta la próxima verificación exitosa"""
+        with self._lock:
+            self._estado[indice] = {'sana': False, 'retraso': None, 'error': str(error).strip()}
+
+    def estado(self) -> List[Dict]:
+        """Estado de cada réplica para mostrar en administración"""
+        with self._lock:
+            return [
+                dict(estado, host=config['host'], port=config['port'])
+                for config, estado in zip(self.replicas, self._estado)
+            ]
@@ -0,0 +1,115 @@
+"""Consultas del Dashboard y de Reportes
+
+Cada función devuelve un diccionario nombre -> (consulta, parámetros) con
+consultas independientes entre sí, de modo que pueden ejecutarse en paralelo
+con AsyncDatabaseManager.consultar_varios o una tras otra con taller.db.
+Pertenecen a la clase CLASE: tiempo límite propio y turno en taller.admision.
+"""
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+
+from taller.db import DatabaseManager
+
+CLASE = 'reporte'
+
+def consultas_dashboard(hoy: date) -> Dict[str, Tuple[str, tuple]]:
+    """Métricas principales y distribución de citas por estado"""
+    return {
+        'citas_hoy': (
+            "SELECT COUNT(*) as total FROM citas WHERE fecha_cita = %s AND estado != 'cancelada'",
+            (hoy,)
+        ),
+        'citas_pendientes': (
+            "SELECT COUNT(*) as total FROM citas WHERE estado = 'pendiente' AND fecha_cita >= %s",
+            (hoy,)
+        ),
+        'ingresos_mes': ("""
+            SELECT COALESCE(SUM(s.precio), 0) as total
+            FROM citas c
+            JOIN servicios s ON c.servicio_id = s.id
+            WHERE date_trunc('month', c.fecha_cita) = date_trunc('month', %s::date)
+            AND c.estado = 'completada'
+        """, (hoy,)),
+        'citas_estado': ("""
+            SELECT estado, COUNT(*) as cantidad
+            FROM citas
+            WHERE fecha_cita >= %s
+            GROUP BY estado
+            ORDER BY cantidad DESC
+        """, (hoy - timedelta(days=30),))
+    }
+
+def consultas_reportes(hoy: date) -> Dict[str, Tuple[str, tuple]]:
+    """Ingresos mensuales del último año, servicios más solicitados y embudo de estados
+
+    Los percentiles del tiempo en cada estado se calculan en SQL sobre el
+    historial: cada tramo va de un cambio de estado al siguiente de la misma
+    cita, así que solo cuentan los estados ya abandonados.
+    """
+    return {
+        'ingresos_mensuales': ("""
+            SELECT
+                to_char(c.fecha_cita, 'YYYY-MM') as mes,
+                SUM(s.precio) as total_ingresos,
+                COUNT(*) as total_citas
+            FROM citas c
+            JOIN servicios s ON c.servicio_id = s.id
+            WHERE c.estado = 'completada'
+            AND c.fecha_cita >= %s
+            GROUP BY to_char(c.fecha_cita, 'YYYY-MM')
+            ORDER BY mes DESC
+        """, (hoy - timedelta(days=365),)),
+        'servicios_populares': ("""
+            SELECT
+                s.nombre,
+                COUNT(*) as cantidad_citas,
+                SUM(s.precio) as ingresos_totales
+            FROM citas c
+            JOIN servicios s ON c.servicio_id = s.id
+            WHERE c.fecha_cita >= %s
+            AND c.estado != 'cancelada'
+            GROUP BY s.id, s.nombre
+            ORDER BY cantidad_citas DESC
+            LIMIT 10
+        """, (hoy - timedelta(days=90),)),
+        'tiempo_en_estado': ("""
+            WITH tramos AS (
+                SELECT
+                    estado,
+                    EXTRACT(EPOCH FROM LEAD(cambiado_en) OVER (
+                        PARTITION BY cita_id ORDER BY cambiado_en, id
+                    ) - cambiado_en)::float / 3600 AS horas
+                FROM citas_historial
+                WHERE cambiado_en >= %s
+            )
+            SELECT
+                estado,
+                COUNT(*) AS tramos,
+                percentile_cont(0.5) WITHIN GROUP (ORDER BY horas) AS p50_horas,
+                percentile_cont(0.9) WITHIN GROUP (ORDER BY horas) AS p90_horas,
+                percentile_cont(0.99) WITHIN GROUP (ORDER BY horas) AS p99_horas
+            FROM tramos
+            WHERE horas IS NOT NULL
+            GROUP BY estado
+            ORDER BY estado
+        """, (hoy - timedelta(days=90),)),
+        'embudo_diario': ("""
+            SELECT
+                cambiado_en::date AS dia,
+                COUNT(*) FILTER (WHERE estado_anterior IS NULL) AS creadas,
+                COUNT(*) FILTER (WHERE estado = 'confirmada' AND estado_anterior IS NOT NULL) AS confirmadas,
+                COUNT(*) FILTER (WHERE estado = 'completada' AND estado_anterior IS NOT NULL) AS completadas,
+                COUNT(*) FILTER (WHERE estado = 'cancelada' AND estado_anterior IS NOT NULL) AS canceladas
+            FROM citas_historial
+            WHERE cambiado_en >= %s
+            GROUP BY cambiado_en::date
+            ORDER BY dia
+        """, (hoy - timedelta(days=30),))
+    }
+
+def consultar_secuencial(db: DatabaseManager, consultas: Dict[str, Tuple[str, tuple]]) -> Dict[str, List[Dict]]:
+    """Ejecuta las consultas una tras otra con el gestor bloqueante (admiten réplica)"""
+    return {
+        nombre: db.consultar(query, params, solo_lectura=True, clase=CLASE)
+        for nombre, (query, params) in consultas.items()
+    }
@@ -0,0 +1,87 @@
+"""Sedes del taller: catálogo, capacidad y sede más cercana
+
+Cada sede tiene su propia agenda (citas.sede_id) y su propio stock (una fila
+de inventario por item y sede). La lista de sedes cambia muy poco, así que se
+sirve desde la caché del catálogo y la sede más cercana se calcula en memoria
+contra las coordenadas guardadas de cada sede, sin consultar la base de datos.
+Para quien no comparte su ubicación, DISTRITOS trae el centro precalculado de
+los distritos atendidos.
+"""
+import math
+from typing import Dict, List, Optional
+
+from taller.catalogo import cache
+from taller.db import DatabaseManager
+from taller.errores import DatosInvalidos, NoEncontrado
+
+SEDE_PRINCIPAL = 1
+RADIO_TIERRA_KM = 6371.0
+
+# Centro aproximado (latitud, longitud) de los distritos de Lima atendidos
+DISTRITOS = {
+    'Ate': (-12.0257, -76.9180),
+    'Barranco': (-12.1494, -77.0216),
+    'Callao': (-12.0566, -77.1181),
+    'Cercado de Lima': (-12.0464, -77.0428),
+    'Chorrillos': (-12.1690, -77.0160),
+    'Jesús María': (-12.0770, -77.0480),
+    'La Molina': (-12.0866, -76.9360),
+    'Lince': (-12.0835, -77.0343),
+    'Los Olivos': (-11.9913, -77.0705),
+    'Magdalena del Mar': (-12.0907, -77.0710),
+    'Miraflores': (-12.1211, -77.0297),
+    'Pueblo Libre': (-12.0742, -77.0626),
+    'San Borja': (-12.1010, -77.0013),
+    'San Isidro': (-12.0977, -77.0365),
+    'San Juan de Lurigancho': (-11.9826, -77.0081),
+    'San Miguel': (-12.0779, -77.0918),
+    'Santiago de Surco': (-12.1455, -76.9918),
+    'Surquillo': (-12.1127, -77.0190)
+}
+
+def listar_sedes(db: DatabaseManager) -> List[Dict]:
+    """Sedes activas ordenadas por id (desde la caché del catálogo)"""
+    return cache.obtener('sedes_activas', ('sedes',), lambda: db.consultar("""
+        SELECT id, nombre, direccion, telefono, latitud, longitud, puestos
+        FROM sedes
+        WHERE activa = TRUE
+        ORDER BY id
+    """))
+
+def obtener_sede(db: DatabaseManager, sede_id: int) -> Dict:
+    """Sede activa por id"""
+    for sede in listar_sedes(db):
+        if sede['id'] == sede_id:
+            return sede
+    raise NoEncontrado(f"No existe la sede activa: {sede_id}")
+
+def distancia_km(latitud1: float, longitud1: float, latitud2: float, longitud2: float) -> float:
+    """Distancia sobre la superficie terrestre (fórmula del haversine)"""
+    fi1, fi2 = math.radians(latitud1), math.radians(latitud2)
+    delta_fi = fi2 - fi1
+    delta_lambda = math.radians(longitud2 - longitud1)
+    a = math.sin(delta_fi / 2) ** 2 + math.cos(fi1) * math.cos(fi2) * math.sin(delta_lambda / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * math.asin(math.sqrt(a))
+
+def sedes_por_distancia(db: DatabaseManager, latitud: float, longitud: float) -> List[Dict]:
+    """Sedes activas de la más cercana a la más lejana, con su distancia_km"""
+    if not (-90 <= latitud <= 90 and -180 <= longitud <= 180):
+        raise DatosInvalidos("Coordenadas fuera de rango")
+    sedes = [
+        dict(sede, distancia_km=round(distancia_km(latitud, longitud, sede['latitud'], sede['longitud']), 2))
+        for sede in listar_sedes(db)
+    ]
+    return sorted(sedes, key=lambda sede: sede['distancia_km'])
+
+def sede_mas_cercana(db: DatabaseManager, latitud: float, longitud: float) -> Dict:
+    """Sede activa más cercana a unas coordenadas"""
+    sedes = sedes_por_distancia(db, latitud, longitud)
+    if not sedes:
+        raise NoEncontrado("No hay sedes activas")
+    return sedes[0]
+
+def sede_por_distrito(db: DatabaseManager, distrito: Optional[str]) -> Dict:
+    """Sede activa más cercana al centro de un distrito atendido"""
+    if distrito not in DISTRITOS:
+        raise DatosInvalidos(f"Distrito no atendido: {distrito}")
+    return sede_mas_cercana(db, *DISTRITOS[distrito])
@@ -0,0 +1,626 @@
+"""Cola de tareas en segundo plano respaldada por la base de datos
+
+Las tareas lentas o recurrentes (recordatorios, instantáneas de inventario,
+pronóstico, mantenimientos por vencer, purgas) se encolan en la tabla `tareas`
+y las ejecuta un Trabajador, fuera de las ejecuciones de Streamlit: en un
+proceso aparte (`python -m taller.tareas`) o en hilos del propio proceso de la
+interfaz.
+
+En PostgreSQL cada hilo reclama una tarea con `FOR UPDATE SKIP LOCKED`, de
+modo que varios trabajadores (hilos o procesos) comparten la cola sin
+bloquearse ni ejecutar dos veces la misma tarea. En SQLite (ColaSQLite) la
+reclamación va dentro de `BEGIN IMMEDIATE`, que serializa a los escritores.
+
+Una tarea fallida se reintenta con espera exponencial hasta max_intentos;
+las tareas programadas (tareas_programadas, expresiones cron) las encola el
+planificador de cualquier trabajador activo, una vez por coincidencia.
+
+Uso:
+    python -m taller.tareas --concurrencia 4
+    python -m taller.tareas --encolar pronostico
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from datetime import time as dtime
+from typing import Callable, Dict, Iterable, List, Optional
+
+from taller import citas, metricas, recordatorios
+from taller.config import DB_CONFIG, METRICAS_PUERTO
+from taller.db import DatabaseManager
+from taller.errores import DatosInvalidos, NoEncontrado, TallerError
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_TAREA = ('pendiente', 'en_curso', 'completada', 'fallida')
+
+MAX_INTENTOS = 5
+# Espera antes de reintentar: BACKOFF_BASE * 2^(intento - 1) segundos, hasta BACKOFF_MAXIMO
+BACKOFF_BASE = 30
+BACKOFF_MAXIMO = 3600
+# Una tarea en curso por más tiempo se da por abandonada (trabajador caído) y vuelve a la cola
+TIEMPO_MAXIMO = timedelta(minutes=15)
+# Días que se conservan las tareas terminadas
+RETENCION_DIAS = 30
+
+class Cron:
+    """Expresión cron de cinco campos: minuto hora día-del-mes mes día-de-la-semana
+
+    Admite *, listas (1,15), rangos (1-5) y pasos (*/15, 8-18/2); el domingo
+    es 0 o 7. Como en cron, si se restringen el día del mes y el de la semana
+    basta con que coincida uno de los dos.
+    """
+
+    def __init__(self, expresion: str):
+        campos = expresion.split()
+        if len(campos) != 5:
+            raise DatosInvalidos(f"La expresión cron '{expresion}' debe tener 5 campos")
+        self.expresion = expresion
+        self.minutos = _campo_cron(campos[0], 0, 59)
+        self.horas = _campo_cron(campos[1], 0, 23)
+        self.dias = _campo_cron(campos[2], 1, 31)
+        self.meses = _campo_cron(campos[3], 1, 12)
+        self.dias_semana = sorted({valor % 7 for valor in _campo_cron(campos[4], 0, 7)})
+        self._cualquier_dia = campos[2] == '*'
+        self._cualquier_dia_semana = campos[4] == '*'
+
+    def _coincide_dia(self, dia: date) -> bool:
+        if dia.month not in self.meses:
+            return False
+        en_mes = dia.day in self.dias
+        en_semana = dia.isoweekday() % 7 in self.dias_semana
+        if self._cualquier_dia:
+            return en_semana
+        if self._cualquier_dia_semana:
+            return en_mes
+        return en_mes or en_semana
+
+    def siguiente(self, desde: datetime) -> datetime:
+        """Primer minuto posterior a `desde` que coincide con la expresión"""
+        inicio = desde.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        dia = inicio.date()
+        # Cinco años cubren cualquier expresión válida (incluido el 29 de febrero)
+        for _ in range(366 * 5):
+            if self._coincide_dia(dia):
+                for hora in self.horas:
+                    for minuto in self.minutos:
+                        candidato = datetime.combine(dia, dtime(hora, minuto))
+                        if candidato >= inicio:
+                            return candidato
+            dia += timedelta(days=1)
+        raise DatosInvalidos(f"La expresión cron '{self.expresion}' no coincide con ninguna fecha")
+
+def _campo_cron(texto: str, minimo: int, maximo: int) -> List[int]:
+    """Valores de un campo cron dentro de [minimo, maximo]"""
+    valores = set()
+    try:
+        for parte in texto.split(','):
+            rango, barra, paso = parte.partition('/')
+            paso = int(paso) if barra else 1
+            if rango == '*':
+                inicio, fin = minimo, maximo
+            elif '-' in rango:
+                inicio, fin = (int(valor) for valor in rango.split('-', 1))
+            else:
+                inicio = int(rango)
+                fin = maximo if barra else inicio
+            if paso < 1 or inicio < minimo or fin > maximo or inicio > fin:
+                raise ValueError(parte)
+            valores.update(range(inicio, fin + 1, paso))
+    except ValueError:
+        raise DatosInvalidos(f"Campo cron inválido: '{texto}'") from None
+    return sorted(valores)
+
+class Programa:
+    """Tarea recurrente: se encola una vez en cada coincidencia de su expresión cron"""
+
+    def __init__(self, nombre: str, tipo: str, cron: str, parametros: Optional[Dict] = None,
+                 max_intentos: int = MAX_INTENTOS):
+        self.nombre = nombre
+        self.tipo = tipo
+        self.cron = Cron(cron)
+        self.parametros = parametros or {}
+        self.max_intentos = max_intentos
+
+# tipo -> función(db, **parametros) que ejecuta la tarea y devuelve un resultado serializable a JSON
+_manejadores: Dict[str, Callable] = {}
+
+def tarea(tipo: str):
+    """Registra la función decorada como manejador de las tareas del tipo indicado"""
+    def registrar(funcion: Callable) -> Callable:
+        _manejadores[tipo] = funcion
+        return funcion
+    return registrar
+
+def tipos_registrados() -> List[str]:
+    return sorted(_manejadores)
+
+def espera_reintento(intentos: int) -> float:
+    """Segundos hasta el siguiente intento: exponencial, con variación para no sincronizar reintentos"""
+    return min(BACKOFF_BASE * 2 ** (intentos - 1), BACKOFF_MAXIMO) * random.uniform(0.5, 1.0)
+
+class _Cola:
+    """Operaciones de la cola comunes a PostgreSQL y SQLite
+
+    Las consultas se escriben con parámetros %s; cada subclase aporta la
+    transacción, la cláusula de bloqueo de la reclamación y la conversión
+    de parámetros y filas.
+    """
+
+    BLOQUEO = ''
+
+    def _transaccion(self):
+        """Context manager con un cursor dentro de una transacción"""
+        raise NotImplementedError
+
+    def _consultar(self, cursor, query: str, params: tuple = ()) -> List[Dict]:
+        cursor.execute(query, params)
+        return [self._fila(fila) for fila in cursor.fetchall()] if cursor.description else []
+
+    def _fila(self, fila) -> Dict:
+        return dict(fila)
+
+    def encolar(self, tipo: str, parametros: Optional[Dict] = None, ejecutar_en: Optional[datetime] = None,
+                max_intentos: int = MAX_INTENTOS, programa: Optional[str] = None) -> int:
+        """Agrega una tarea a la cola y devuelve su ID"""
+        if tipo not in _manejadores:
+            raise DatosInvalidos(f"Tipo de tarea desconocido: {tipo}")
+        with self._transaccion() as cursor:
+            return self._encolar(cursor, tipo, parametros or {}, ejecutar_en or datetime.now(), max_intentos, programa)
+
+    def _encolar(self, cursor, tipo, parametros, ejecutar_en, max_intentos, programa) -> int:
+        return self._consultar(cursor, """
+            INSERT INTO tareas (tipo, parametros, ejecutar_en, max_intentos, programa)
+            VALUES (%s, %s, %s, %s, %s)
+            RETURNING id
+        """, (tipo, json.dumps(parametros, default=str), ejecutar_en, max_intentos, programa))[0]['id']
+
+    def reclamar(self, trabajador: str) -> Optional[Dict]:
+        """Marca en curso la tarea pendiente más antigua ya vencida y la devuelve"""
+        ahora = datetime.now()
+        with self._transaccion() as cursor:
+            filas = self._consultar(cursor, f"""
+                UPDATE tareas
+                SET estado = 'en_curso', intentos = intentos + 1, iniciada_en = %s, trabajador = %s
+                WHERE id = (
+                    SELECT id FROM tareas
+                    WHERE estado = 'pendiente' AND ejecutar_en <= %s
+                    ORDER BY ejecutar_en, id
+                    LIMIT 1{self.BLOQUEO}
+                )
+                RETURNING id, tipo, parametros, intentos, max_intentos, programa
+            """, (ahora, trabajador, ahora))
+        return filas[0] if filas else None
+
+    def completar(self, tarea_id: int, resultado=None):
+        with self._transaccion() as cursor:
+            self._consultar(cursor, """
+                UPDATE tareas
+                SET estado = 'completada', terminada_en = %s, resultado = %s, ultimo_error = NULL
+                WHERE id = %s
+            """, (datetime.now(), json.dumps(resultado, default=str), tarea_id))
+
+    def fallar(self, tarea_id: int, error: str, reintentar_en: Optional[datetime] = None):
+        """Registra el error; con reintentar_en la tarea vuelve a la cola, si no queda fallida"""
+        with self._transaccion() as cursor:
+            if reintentar_en:
+                self._consultar(cursor, """
+                    UPDATE tareas SET estado = 'pendiente', ejecutar_en = %s, ultimo_error = %s
+                    WHERE id = %s
+                """, (reintentar_en, error, tarea_id))
+            else:
+                self._consultar(cursor, """
+                    UPDATE tareas SET estado = 'fallida', terminada_en = %s, ultimo_error = %s
+                    WHERE id = %s
+                """, (datetime.now(), error, tarea_id))
+
+    def reintentar(self, tarea_id: int):
+        """Devuelve a la cola una tarea fallida, con sus intentos en cero"""
+        with self._transaccion() as cursor:
+            filas = self._consultar(cursor, """
+                UPDATE tareas
+                SET estado = 'pendiente', intentos = 0, ejecutar_en = %s, terminada_en = NULL
+                WHERE id = %s AND estado = 'fallida'
+                RETURNING id
+            """, (datetime.now(), tarea_id))
+        if not filas:
+            raise NoEncontrado(f"No hay una tarea fallida con ID: {tarea_id}")
+
+    def liberar_abandonadas(self, tiempo_maximo: timedelta = TIEMPO_MAXIMO) -> int:
+        """Devuelve a la cola las tareas en curso de trabajadores que dejaron de responder"""
+        ahora = datetime.now()
+        with self._transaccion() as cursor:
+            filas = self._consultar(cursor, """
+                UPDATE tareas
+                SET estado = CASE WHEN intentos < max_intentos THEN 'pendiente' ELSE 'fallida' END,
+                    ejecutar_en = %s,
+                    terminada_en = CASE WHEN intentos < max_intentos THEN NULL ELSE %s END,
+                    ultimo_error = 'Trabajador sin respuesta: ' || COALESCE(trabajador, '')
+                WHERE estado = 'en_curso' AND iniciada_en < %s
+                RETURNING id
+            """, (ahora, ahora, ahora - tiempo_maximo))
+        return len(filas)
+
+    def purgar_terminadas(self, dias: int = RETENCION_DIAS, limite: int = 1000) -> int:
+        """Borra un lote de tareas terminadas hace más de `dias` días"""
+        with self._transaccion() as cursor:
+            filas = self._consultar(cursor, """
+                DELETE FROM tareas
+                WHERE id IN (
+                    SELECT id FROM tareas
+                    WHERE estado IN ('completada', 'fallida') AND terminada_en < %s
+                    ORDER BY terminada_en
+                    LIMIT %s
+                )
+                RETURNING id
+            """, (datetime.now() - timedelta(days=dias), limite))
+        return len(filas)
+
+    def sincronizar_programas(self, programas: Iterable[Programa]):
+        """Registra los programas del código; conserva la próxima ejecución si el cron no cambió"""
+        ahora = datetime.now()
+        with self._transaccion() as cursor:
+            for programa in programas:
+                self._consultar(cursor, """
+                    INSERT INTO tareas_programadas (nombre, tipo, cron, parametros, max_intentos, proxima_ejecucion)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (nombre) DO UPDATE SET
+                        tipo = EXCLUDED.tipo,
+                        parametros = EXCLUDED.parametros,
+                        max_intentos = EXCLUDED.max_intentos,
+                        proxima_ejecucion = CASE
+                            WHEN tareas_programadas.cron = EXCLUDED.cron THEN tareas_programadas.proxima_ejecucion
+                            ELSE EXCLUDED.proxima_ejecucion
+                        END,
+                        cron = EXCLUDED.cron
+                """, (programa.nombre, programa.tipo, programa.cron.expresion,
+                      json.dumps(programa.parametros, default=str), programa.max_intentos,
+                      programa.cron.siguiente(ahora)))
+
+    def programar_vencidas(self) -> int:
+        """Encola las tareas programadas cuya hora llegó y calcula su próxima ejecución
+
+        Si los trabajadores estuvieron detenidos, cada programa se encola una
+        sola vez aunque se haya saltado varias coincidencias.
+        """
+        ahora = datetime.now()
+        with self._transaccion() as cursor:
+            vencidas = self._consultar(cursor, f"""
+                SELECT nombre, tipo, cron, parametros, max_intentos
+                FROM tareas_programadas
+                WHERE activa = TRUE AND proxima_ejecucion <= %s
+                ORDER BY proxima_ejecucion{self.BLOQUEO}
+            """, (ahora,))
+            for programa in vencidas:
+                self._encolar(cursor, programa['tipo'], programa['parametros'], ahora,
+                              programa['max_intentos'], programa['nombre'])
+                self._consultar(cursor, """
+                    UPDATE tareas_programadas SET proxima_ejecucion = %s, ultima_ejecucion = %s
+                    WHERE nombre = %s
+                """, (Cron(programa['cron']).siguiente(ahora), ahora, programa['nombre']))
+        return len(vencidas)
+
+    def ejecutar_programa(self, nombre: str) -> int:
+        """Encola ya una tarea programada, sin mover su próxima ejecución"""
+        with self._transaccion() as cursor:
+            filas = self._consultar(cursor, """
+                SELECT tipo, parametros, max_intentos FROM tareas_programadas WHERE nombre = %s
+            """, (nombre,))
+            if not filas:
+                raise NoEncontrado(f"No existe la tarea programada: {nombre}")
+            return self._encolar(cursor, filas[0]['tipo'], filas[0]['parametros'], datetime.now(),
+                                 filas[0]['max_intentos'], nombre)
+
+    def activar_programa(self, nombre: str, activa: bool):
+        with self._transaccion() as cursor:
+            self._consultar(cursor, "UPDATE tareas_programadas SET activa = %s WHERE nombre = %s", (activa, nombre))
+
+    def resumen(self) -> Dict[str, Dict]:
+        """Por estado: cantidad de tareas y la fecha de ejecución más antigua"""
+        with self._transaccion() as cursor:
+            filas = self._consultar(cursor, """
+                SELECT estado, COUNT(*) AS total, MIN(ejecutar_en) AS mas_antigua
+                FROM tareas
+                GROUP BY estado
+            """)
+        resumen = {estado: {'total': 0, 'mas_antigua': None} for estado in ESTADOS_TAREA}
+        resumen.update({fila['estado']: fila for fila in filas})
+        return resumen
+
+    def listar(self, estado: Optional[str] = None, limite: int = 50) -> List[Dict]:
+        """Tareas más recientes, opcionalmente de un estado"""
+        filtro = "WHERE estado = %s" if estado else ""
+        with self._transaccion() as cursor:
+            return self._consultar(cursor, f"""
+                SELECT id, tipo, estado, intentos, max_intentos, programa, trabajador,
+                       ejecutar_en, iniciada_en, terminada_en, resultado, ultimo_error, created_at
+                FROM tareas
+                {filtro}
+                ORDER BY id DESC
+                LIMIT %s
+            """, ((estado,) if estado else ()) + (limite,))
+
+    def programas(self) -> List[Dict]:
+        with self._transaccion() as cursor:
+            return self._consultar(cursor, """
+                SELECT nombre, tipo, cron, activa, proxima_ejecucion, ultima_ejecucion
+                FROM tareas_programadas
+                ORDER BY nombre
+            """)
+
+class ColaPostgres(_Cola):
+    """Cola en las tablas tareas y tareas_programadas de PostgreSQL"""
+
+    BLOQUEO = '\n                FOR UPDATE SKIP LOCKED'
+
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+
+    @contextmanager
+    def _transaccion(self):
+        with self.db.transaccion(operacion='tareas') as cursor:
+            yield cursor
+
+class ColaSQLite(_Cola):
+    """Cola en un archivo SQLite, para instalaciones sin PostgreSQL o pruebas locales
+
+    Cada operación abre su conexión y toma el bloqueo de escritura con
+    BEGIN IMMEDIATE, así que varios hilos o procesos pueden compartir el archivo.
+    """
+
+    FECHAS = ('ejecutar_en', 'iniciada_en', 'terminada_en', 'created_at', 'proxima_ejecucion',
+              'ultima_ejecucion', 'mas_antigua')
+    JSON = ('parametros', 'resultado')
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        conn = sqlite3.connect(ruta, timeout=30)
+        try:
+            # WAL: las lecturas del panel no esperan a la reclamación en curso
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.executescript(ESQUEMA_SQLITE)
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaccion(self):
+        conn = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                yield cursor
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        except sqlite3.Error as e:
+            raise TallerError(f"Error en la cola de tareas: {e}") from e
+        finally:
+            conn.close()
+
+    def _consultar(self, cursor, query: str, params: tuple = ()) -> List[Dict]:
+        params = tuple(valor.isoformat(' ') if isinstance(valor, datetime) else valor for valor in params)
+        return super()._consultar(cursor, query.replace('%s', '?'), params)
+
+    def _fila(self, fila) -> Dict:
+        fila = dict(fila)
+        for columna in self.FECHAS:
+            if isinstance(fila.get(columna), str):
+                fila[columna] = datetime.fromisoformat(fila[columna])
+        for columna in self.JSON:
+            if isinstance(fila.get(columna), str):
+                fila[columna] = json.loads(fila[columna])
+        return fila
+
+ESQUEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS tareas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tipo TEXT NOT NULL,
+    parametros TEXT NOT NULL DEFAULT '{}',
+    estado TEXT NOT NULL DEFAULT 'pendiente'
+        CHECK (estado IN ('pendiente', 'en_curso', 'completada', 'fallida')),
+    intentos INTEGER NOT NULL DEFAULT 0,
+    max_intentos INTEGER NOT NULL DEFAULT 5,
+    ejecutar_en TEXT NOT NULL,
+    programa TEXT,
+    trabajador TEXT,
+    iniciada_en TEXT,
+    terminada_en TEXT,
+    resultado TEXT,
+    ultimo_error TEXT,
+    created_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+CREATE TABLE IF NOT EXISTS tareas_programadas (
+    nombre TEXT PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    cron TEXT NOT NULL,
+    parametros TEXT NOT NULL DEFAULT '{}',
+    max_intentos INTEGER NOT NULL DEFAULT 5,
+    activa BOOLEAN NOT NULL DEFAULT TRUE,
+    proxima_ejecucion TEXT NOT NULL,
+    ultima_ejecucion TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_tareas_pendientes ON tareas(ejecutar_en, id) WHERE estado = 'pendiente';
+CREATE INDEX IF NOT EXISTS idx_tareas_en_curso ON tareas(iniciada_en) WHERE estado = 'en_curso';
+CREATE INDEX IF NOT EXISTS idx_tareas_terminadas ON tareas(terminada_en) WHERE estado IN ('completada', 'fallida');
+"""
+
+class Trabajador:
+    """Hilos que ejecutan tareas de la cola y un planificador de las programadas
+
+    Cada hilo reclama una tarea a la vez y, si la cola está vacía, espera
+    `intervalo` segundos. El planificador encola las tareas programadas
+    vencidas, rescata las abandonadas y purga las antiguas.
+    """
+
+    def __init__(self, cola: _Cola, db: Optional[DatabaseManager] = None, concurrencia: int = 2,
+                 intervalo: float = 1.0, programas: Optional[Iterable[Programa]] = None,
+                 intervalo_planificador: float = 30.0):
+        self.cola = cola
+        self.db = db
+        self.concurrencia = concurrencia
+        self.intervalo = intervalo
+        self.programas = list(PROGRAMAS if programas is None else programas)
+        self.intervalo_planificador = intervalo_planificador
+        self.nombre = f"{socket.gethostname()}:{os.getpid()}"
+        self._detener = threading.Event()
+        self._hilos: List[threading.Thread] = []
+
+    def iniciar(self):
+        self._hilos = [threading.Thread(target=self._bucle, name=f'taller-tareas-{numero}', daemon=True)
+                       for numero in range(1, self.concurrencia + 1)]
+        self._hilos.append(threading.Thread(target=self._planificar, name='taller-tareas-planificador', daemon=True))
+        for hilo in self._hilos:
+            hilo.start()
+        return self
+
+    def detener(self, espera: Optional[float] = None):
+        """Pide a los hilos que terminen tras su tarea actual y los espera"""
+        self._detener.set()
+        for hilo in self._hilos:
+            hilo.join(espera)
+
+    def ejecutar_una(self) -> bool:
+        """Reclama y ejecuta una tarea; False si no había ninguna vencida"""
+        tarea = self.cola.reclamar(f"{self.nombre}/{threading.current_thread().name}")
+        if tarea is None:
+            return False
+
+        manejador = _manejadores.get(tarea['tipo'])
+        inicio = time.perf_counter()
+        try:
+            if manejador is None:
+                raise DatosInvalidos(f"Tipo de tarea desconocido: {tarea['tipo']}")
+            resultado = manejador(self.db, **tarea['parametros'])
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            reintentar = manejador is not None and tarea['intentos'] < tarea['max_intentos']
+            reintentar_en = datetime.now() + timedelta(seconds=espera_reintento(tarea['intentos'])) if reintentar else None
+            logger.warning("Tarea %s (%s) falló en el intento %s: %s",
+                           tarea['id'], tarea['tipo'], tarea['intentos'], error)
+            self.cola.fallar(tarea['id'], error, reintentar_en)
+            estado = 'reintento' if reintentar else 'fallida'
+        else:
+            self.cola.completar(tarea['id'], resultado)
+            estado = 'completada'
+        metricas.tareas.inc(tipo=tarea['tipo'], resultado=estado)
+        metricas.tarea_duracion.observar(time.perf_counter() - inicio, tipo=tarea['tipo'])
+        return True
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            try:
+                ejecuto = self.ejecutar_una()
+            except TallerError as e:
+                # Base de datos no disponible: se reintenta en el siguiente intervalo
+                logger.warning("No se pudo acceder a la cola de tareas: %s", e)
+                ejecuto = False
+            if not ejecuto:
+                self._detener.wait(self.intervalo)
+
+    def _planificar(self):
+        sincronizado = False
+        ultima_purga = None
+        while not self._detener.is_set():
+            try:
+                if not sincronizado:
+                    self.cola.sincronizar_programas(self.programas)
+                    sincronizado = True
+                self.cola.programar_vencidas()
+                self.cola.liberar_abandonadas()
+                if ultima_purga is None or time.monotonic() - ultima_purga > 3600:
+                    self.cola.purgar_terminadas()
+                    ultima_purga = time.monotonic()
+            except TallerError as e:
+                logger.warning("Error en el planificador de tareas: %s", e)
+            self._detener.wait(self.intervalo_planificador)
+
+# Tareas del taller
+
+@tarea('snapshot_inventario')
+def _snapshot_inventario(db: DatabaseManager) -> Dict:
+    """Instantánea diaria del stock (acota las consultas históricas del libro de movimientos)"""
+    return {'items': db.consultar("SELECT sp_snapshot_inventario() AS total")[0]['total']}
+
+@tarea('pronostico')
+def _pronostico(db: DatabaseManager, dias_historial: int = 90, dias_entrega: int = 7, dias_revision: int = 7) -> Dict:
+    """Recalcula el pronóstico de reposición de todo el inventario"""
+    # pandas y NumPy solo se cargan en el proceso que ejecuta el pronóstico
+    from taller import pronostico
+    return {'items': pronostico.ejecutar(db.config, dias_historial, dias_entrega, dias_revision)}
+
+@tarea('mantenimiento')
+def _mantenimiento(db: DatabaseManager, dias_horizonte: int = 30, dias_historial: int = 1095) -> Dict:
+    """Recalcula la lista de mantenimientos por vencer de toda la flota"""
+    from taller import mantenimiento
+    return {'pendientes': mantenimiento.ejecutar(db.config, dias_horizonte, dias_historial)}
+
+@tarea('purgar_idempotencia')
+def _purgar_idempotencia(db: DatabaseManager, limite: int = 1000) -> Dict:
+    """Borra por lotes las claves de idempotencia de reservas vencidas"""
+    total = 0
+    while True:
+        borradas = citas.purgar_claves_vencidas(db, limite)
+        total += borradas
+        if borradas < limite:
+            return {'claves': total}
+
+@tarea('recordatorios')
+def _recordatorios(db: DatabaseManager, fecha: Optional[str] = None) -> Dict:
+    """Envía los recordatorios de las citas confirmadas de la fecha (mañana por defecto)"""
+    totales = recordatorios.enviar_recordatorios(db, date.fromisoformat(fecha) if fecha else None)
+    if totales['fallido']:
+        # El reintento de la tarea solo vuelve a reclamar los recordatorios fallidos
+        raise TallerError(f"{totales['fallido']} recordatorios fallidos de {sum(totales.values())}")
+    return totales
+
+PROGRAMAS = [
+    Programa('recordatorios', 'recordatorios', '0 18 * * *'),
+    Programa('snapshot_inventario', 'snapshot_inventario', '55 23 * * *'),
+    Programa('pronostico', 'pronostico', '0 2 * * *'),
+    Programa('mantenimiento', 'mantenimiento', '30 2 * * *'),
+    Programa('purgar_idempotencia', 'purgar_idempotencia', '15 * * * *'),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description="Trabajador de la cola de tareas de Taller AutoMax")
+    parser.add_argument('--concurrencia', type=int, default=2, help="Tareas ejecutadas en paralelo")
+    parser.add_argument('--intervalo', type=float, default=1.0, help="Segundos de espera con la cola vacía")
+    parser.add_argument('--sqlite', help="Archivo SQLite para la cola en lugar de PostgreSQL")
+    parser.add_argument('--encolar', choices=tipos_registrados(), help="Encola una tarea del tipo indicado y termina")
+    parser.add_argument('--parametros', default='{}', help="Parámetros en JSON de la tarea a encolar")
+    parser.add_argument('--metricas-puerto', type=int, default=0,
+                        help=f"Expone /metrics en este puerto (p. ej. {METRICAS_PUERTO}); 0 no las expone")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    db = DatabaseManager(DB_CONFIG, maximo=args.concurrencia + 1)
+    cola = ColaSQLite(args.sqlite) if args.sqlite else ColaPostgres(db)
+
+    if args.encolar:
+        tarea_id = cola.encolar(args.encolar, json.loads(args.parametros))
+        print(f"Tarea {tarea_id} encolada")
+        return
+
+    if args.metricas_puerto:
+        metricas.ServidorMetricas(args.metricas_puerto)
+    trabajador = Trabajador(cola, db, args.concurrencia, args.intervalo).iniciar()
+    logger.info("Trabajador %s con %s hilos", trabajador.nombre, args.concurrencia)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        trabajador.detener()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Historial de servicio por vehículo
+
+El resumen de cada vehículo (visitas, gasto total y último servicio de cada
+tipo) lo mantienen los triggers de citas al completarlas, de modo que la ficha
+se arma con lecturas por clave primaria. El detalle de citas se recorre por el
+índice (vehiculo_id, fecha_cita), sin pasar por vista_citas_completas.
+
+La lista de mantenimientos por vencer la calcula cada noche
+taller.mantenimiento; aquí solo se pagina en el orden de su índice.
+"""
+from typing import Dict, List, Optional
+
+from taller.db import DatabaseManager
+from taller.errores import DatosInvalidos, NoEncontrado
+
+MAX_CITAS = 200
+ESTADOS_MANTENIMIENTO = ('Vencidos', 'Próximos')
+
+def ficha_vehiculo(db: DatabaseManager, placa: str) -> Dict:
+    """Vehículo, dueño y resumen de servicio buscando por placa (sin distinguir mayúsculas)"""
+    placa = (placa or '').strip()
+    if not placa:
+        raise DatosInvalidos("Indique la placa del vehículo")
+
+    filas = db.consultar("""
+        SELECT
+            v.id, v.placa, v.marca, v.modelo, v.año, v.color,
+            cl.nombre AS cliente_nombre, cl.telefono AS cliente_telefono,
+            COALESCE(r.visitas, 0) AS visitas,
+            COALESCE(r.gasto_total, 0) AS gasto_total,
+            r.primera_visita,
+            r.ultima_visita
+        FROM vehiculos v
+        LEFT JOIN clientes cl ON cl.id = v.cliente_id
+        LEFT JOIN vehiculos_resumen r ON r.vehiculo_id = v.id
+        WHERE UPPER(v.placa) = UPPER(%s)
+    """, (placa,), solo_lectura=True)
+    if not filas:
+        raise NoEncontrado(f"No se encontró el vehículo con placa: {placa}")
+
+    ficha = dict(filas[0])
+    ficha['ultimos_servicios'] = ultimos_servicios(db, ficha['id'])
+    return ficha
+
+def ultimos_servicios(db: DatabaseManager, vehiculo_id: int) -> List[Dict]:
+    """Última vez que se hizo cada tipo de servicio al vehículo, del más reciente al más antiguo"""
+    return db.consultar("""
+        SELECT vs.servicio_id, s.nombre AS servicio_nombre, vs.veces, vs.ultima_fecha, vs.ultima_cita_id
+        FROM vehiculos_servicios vs
+        JOIN servicios s ON s.id = vs.servicio_id
+        WHERE vs.vehiculo_id = %s
+        ORDER BY vs.ultima_fecha DESC, s.nombre
+    """, (vehiculo_id,), solo_lectura=True)
+
+def historial_vehiculo(db: DatabaseManager, vehiculo_id: int, limite: int = 50) -> List[Dict]:
+    """Citas del vehículo de la más reciente a la más antigua"""
+    limite = max(1, min(limite, MAX_CITAS))
+    return db.consultar("""
+        SELECT c.id, c.fecha_cita, c.hora_cita, c.estado, c.observaciones,
+               s.nombre AS servicio_nombre, s.precio AS servicio_precio
+        FROM citas c
+        JOIN servicios s ON s.id = c.servicio_id
+        WHERE c.vehiculo_id = %s
+        ORDER BY c.fecha_cita DESC, c.hora_cita DESC
+        LIMIT %s
+    """, (vehiculo_id, limite), solo_lectura=True)
+
+def resumen_mantenimiento(db: DatabaseManager) -> Dict:
+    """Totales de la lista de mantenimientos por vencer y cuándo se calculó"""
+    return db.consultar("""
+        SELECT
+            COUNT(*) AS total,
+            COUNT(*) FILTER (WHERE proxima_fecha < CURRENT_DATE) AS vencidos,
+            MAX(calculado_en) AS calculado_en
+        FROM mantenimiento_pendiente
+    """, solo_lectura=True)[0]
+
+def pagina_mantenimiento(
+    db: DatabaseManager,
+    estado: Optional[str] = None,
+    limite: int = 25,
+    desplazamiento: int = 0
+) -> List[Dict]:
+    """Página de la lista de mantenimientos por vencer, del más atrasado al más lejano"""
+    if estado == 'Vencidos':
+        where = "WHERE m.proxima_fecha < CURRENT_DATE"
+    elif estado == 'Próximos':
+        where = "WHERE m.proxima_fecha >= CURRENT_DATE"
+    elif estado:
+        raise DatosInvalidos(f"Estado inválido: {estado}")
+    else:
+        where = ""
+    return db.consultar(f"""
+        SELECT
+            m.vehiculo_id, v.placa, v.marca, v.modelo,
+            cl.nombre AS cliente_nombre, cl.telefono AS cliente_telefono,
+            s.nombre AS servicio_nombre, m.ultima_fecha, m.veces, m.intervalo_dias, m.proxima_fecha,
+            CURRENT_DATE - m.proxima_fecha AS dias_atraso
+        FROM mantenimiento_pendiente m
+        JOIN vehiculos v ON v.id = m.vehiculo_id
+        JOIN servicios s ON s.id = m.servicio_id
+        LEFT JOIN clientes cl ON cl.id = v.cliente_id
+        {where}
+        ORDER BY m.proxima_fecha, m.vehiculo_id, m.servicio_id
+        LIMIT %s OFFSET %s
+    """, (limite, desplazamiento), solo_lectura=True)
@@ -2,14 +2,36 @@
 import streamlit as st
 import psycopg2
 from psycopg2.extras import RealDictCursor
-import pandas as pd
 from datetime import datetime, date, timedelta
 import hashlib
-import folium
-from streamlit_folium import st_folium
-import plotly.express as px
+import json
+import select
+import threading
+import time
+import uuid
+from collections import deque
+import streamlit.components.v1 as components
 from typing import Dict, List, Optional, Tuple
 
+from taller import citas as servicio_citas
+from taller import asignacion as servicio_asignacion
+from taller import db as servicio_db
+from taller import inventario as servicio_inventario
+from taller import metricas, perfilado
+from taller import recordatorios as servicio_recordatorios
+from taller import reportes
+from taller import sedes as servicio_sedes
+from taller import tareas as servicio_tareas
+from taller import vehiculos as servicio_vehiculos
+from taller.calendario import CalendarioEnVivo
+from taller.catalogo import EscuchaCatalogo, cache as cache_catalogo
+from taller.db_async import AsyncDatabaseManager, EjecutorAsync
+from taller.config import (
+    DB_CONFIG, DB_MAX_RETRASO_REPLICA, DB_REPLICAS, METRICAS_PUERTO, PERFILADO, PERFILADO_DIR, TAREAS_EN_PROCESO
+)
+from taller.replicas import usar_sesion
+from taller.errores import DatosInvalidos, NoEncontrado, Saturado, TallerError
+
 # Configuración de la página
 st.set_page_config(
     page_title="Taller AutoMax",
@@ -18,319 +40,248 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Configuración de la base de datos
-DB_CONFIG = {
-    'host': 'localhost',  # Cambiar por tu host
-    'database': 'taller_db',
-    'user': 'postgres',
-    'password': 'password',  # Cambiar por tu password
-    'port': 5432
-}
+@st.cache_resource
+def get_servicio_db() -> servicio_db.DatabaseManager:
+    """Pool de conexiones compartido por todas las sesiones"""
+    return servicio_db.DatabaseManager(DB_CONFIG, replicas=DB_REPLICAS, max_retraso=DB_MAX_RETRASO_REPLICA)
+
+@st.cache_resource
+def get_ejecutor_async() -> EjecutorAsync:
+    """Pool asíncrono en un bucle de eventos propio, compartido por todas las sesiones"""
+    return EjecutorAsync(AsyncDatabaseManager(DB_CONFIG, replicas=DB_REPLICAS, max_retraso=DB_MAX_RETRASO_REPLICA))
+
+@st.cache_resource
+def get_escucha_catalogo() -> EscuchaCatalogo:
+    """Invalida la caché del catálogo ante cambios hechos fuera de este proceso"""
+    return EscuchaCatalogo(DB_CONFIG)
+
+@st.cache_resource
+def get_calendario() -> CalendarioEnVivo:
+    """Días del calendario en memoria, compartidos por las sesiones administrativas"""
+    return CalendarioEnVivo(get_servicio_db(), DB_CONFIG)
+
+@st.cache_resource
+def get_servidor_metricas() -> Optional[metricas.ServidorMetricas]:
+    """Endpoint /metrics de Prometheus junto al servidor de Streamlit"""
+    return metricas.ServidorMetricas(METRICAS_PUERTO) if METRICAS_PUERTO else None
+
+@st.cache_resource
+def get_cola_tareas() -> servicio_tareas.ColaPostgres:
+    """Cola de tareas en segundo plano sobre el pool compartido"""
+    return servicio_tareas.ColaPostgres(get_servicio_db())
+
+@st.cache_resource
+def get_trabajador_tareas() -> Optional[servicio_tareas.Trabajador]:
+    """Hilos que ejecutan la cola dentro de este proceso (TALLER_TAREAS_EN_PROCESO)"""
+    if not TAREAS_EN_PROCESO:
+        return None
+    return servicio_tareas.Trabajador(get_cola_tareas(), get_servicio_db(), TAREAS_EN_PROCESO).iniciar()
+
+def encolar_tarea(tipo: str, **parametros) -> Optional[int]:
+    """Encola una tarea en segundo plano mostrando el error en la interfaz"""
+    try:
+        return get_cola_tareas().encolar(tipo, parametros)
+    except TallerError as e:
+        metricas.errores_interfaz.inc(origen='tareas')
+        st.error(f"Error encolando la tarea: {e}")
+        return None
+
+def consultar_en_paralelo(consultas: Dict[str, Tuple[str, tuple]]) -> Dict[str, List[Dict]]:
+    """Ejecuta lecturas de reportes en paralelo (admiten réplica) mostrando el error en la interfaz"""
+    try:
+        return get_ejecutor_async().consultar_varios(consultas, timeout=30, solo_lectura=True, clase=reportes.CLASE)
+    except Saturado as e:
+        metricas.errores_interfaz.inc(origen='consultas_paralelas')
+        st.warning(str(e))
+        return {nombre: [] for nombre in consultas}
+    except TallerError as e:
+        metricas.errores_interfaz.inc(origen='consultas_paralelas')
+        st.error(f"Error ejecutando consultas: {e}")
+        return {nombre: [] for nombre in consultas}
 
 class DatabaseManager:
+    """Adaptador de la capa de servicios que muestra los errores en la interfaz"""
     def __init__(self, config: Dict):
         self.config = config
-    
-    def get_connection(self):
-        """Obtiene conexión a la base de datos"""
-        try:
-            return psycopg2.connect(**self.config)
-        except Exception as e:
-            st.error(f"Error conectando a la base de datos: {e}")
-            return None
+        self.pool = get_servicio_db()
     
     def execute_procedure(self, procedure_name: str, params: tuple = None):
         """Ejecuta un procedimiento almacenado"""
-        conn = self.get_connection()
-        if not conn:
-            return None
-        
         try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                if params:
-                    cursor.callproc(procedure_name, params)
-                else:
-                    cursor.callproc(procedure_name)
-                
-                try:
-                    result = cursor.fetchall()
-                except:
-                    result = None
-                
-                conn.commit()
-                return result
-        except Exception as e:
+            return self.pool.ejecutar_procedimiento(procedure_name, params or ())
+        except TallerError as e:
+            metricas.errores_interfaz.inc(origen='procedimiento')
             st.error(f"Error ejecutando procedimiento {procedure_name}: {e}")
-            conn.rollback()
             return None
-        finally:
-            conn.close()
     
-    def execute_query(self, query: str, params: tuple = None):
-        """Ejecuta una consulta SQL"""
-        conn = self.get_connection()
-        if not conn:
-            return None
-        
+    def execute_query(self, query: str, params: tuple = None, solo_lectura: bool = False):
+        """Ejecuta una consulta SQL; solo_lectura=True permite leer de una réplica"""
         try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute(query, params)
-                
-                try:
-                    result = cursor.fetchall()
-                except:
-                    result = None
-                
-                conn.commit()
-                return result
-        except Exception as e:
+            return self.pool.consultar(query, params, solo_lectura)
+        except TallerError as e:
+            metricas.errores_interfaz.inc(origen='consulta')
             st.error(f"Error ejecutando consulta: {e}")
-            conn.rollback()
             return None
-        finally:
-            conn.close()
 
-# Inicializar gestor de base de datos
+# Inicializar gestor de base de datos; el esquema lo crea setup_database_sql.sql, su única fuente
 db = DatabaseManager(DB_CONFIG)
 
-def init_database():
-    """Inicializa la base de datos con las tablas y procedimientos almacenados"""
-    
-    # Script SQL para crear tablas
-    create_tables_sql = """
-    -- Tabla de usuarios/administradores
-    CREATE TABLE IF NOT EXISTS usuarios (
-        id SERIAL PRIMARY KEY,
-        username VARCHAR(50) UNIQUE NOT NULL,
-        password_hash VARCHAR(255) NOT NULL,
-        rol VARCHAR(20) DEFAULT 'admin',
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-    
-    -- Tabla de clientes
-    CREATE TABLE IF NOT EXISTS clientes (
-        id SERIAL PRIMARY KEY,
-        nombre VARCHAR(100) NOT NULL,
-        telefono VARCHAR(20),
-        email VARCHAR(100),
-        direccion TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-    
-    -- Tabla de vehículos
-    CREATE TABLE IF NOT EXISTS vehiculos (
-        id SERIAL PRIMARY KEY,
-        cliente_id INTEGER REFERENCES clientes(id),
-        marca VARCHAR(50) NOT NULL,
-        modelo VARCHAR(50) NOT NULL,
-        año INTEGER,
-        placa VARCHAR(20) UNIQUE,
-        color VARCHAR(30),
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-    
-    -- Tabla de servicios
-    CREATE TABLE IF NOT EXISTS servicios (
-        id SERIAL PRIMARY KEY,
-        nombre VARCHAR(100) NOT NULL,
-        descripcion TEXT,
-        precio DECIMAL(10,2) NOT NULL,
-        duracion_minutos INTEGER DEFAULT 60,
-        activo BOOLEAN DEFAULT TRUE,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-    
-    -- Tabla de citas
-    CREATE TABLE IF NOT EXISTS citas (
-        id SERIAL PRIMARY KEY,
-        cliente_id INTEGER REFERENCES clientes(id),
-        vehiculo_id INTEGER REFERENCES vehiculos(id),
-        servicio_id INTEGER REFERENCES servicios(id),
-        fecha_cita DATE NOT NULL,
-        hora_cita TIME NOT NULL,
-        estado VARCHAR(20) DEFAULT 'pendiente',
-        observaciones TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-    
-    -- Tabla de inventario
-    CREATE TABLE IF NOT EXISTS inventario (
-        id SERIAL PRIMARY KEY,
-        nombre VARCHAR(100) NOT NULL,
-        descripcion TEXT,
-        cantidad_actual INTEGER DEFAULT 0,
-        cantidad_minima INTEGER DEFAULT 5,
-        precio_unitario DECIMAL(10,2),
-        categoria VARCHAR(50),
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-    """
-    
-    # Procedimientos almacenados
-    procedures_sql = """
-    -- Procedimiento para crear cliente
-    CREATE OR REPLACE FUNCTION sp_crear_cliente(
-        p_nombre VARCHAR(100),
-        p_telefono VARCHAR(20),
-        p_email VARCHAR(100),
-        p_direccion TEXT
-    )
-    RETURNS INTEGER AS $$
-    DECLARE
-        cliente_id INTEGER;
-    BEGIN
-        INSERT INTO clientes (nombre, telefono, email, direccion)
-        VALUES (p_nombre, p_telefono, p_email, p_direccion)
-        RETURNING id INTO cliente_id;
-        RETURN cliente_id;
-    END;
-    $$ LANGUAGE plpgsql;
-    
-    -- Procedimiento para crear vehículo
-    CREATE OR REPLACE FUNCTION sp_crear_vehiculo(
-        p_cliente_id INTEGER,
-        p_marca VARCHAR(50),
-        p_modelo VARCHAR(50),
-        p_año INTEGER,
-        p_placa VARCHAR(20),
-        p_color VARCHAR(30)
-    )
-    RETURNS INTEGER AS $$
-    DECLARE
-        vehiculo_id INTEGER;
-    BEGIN
-        INSERT INTO vehiculos (cliente_id, marca, modelo, año, placa, color)
-        VALUES (p_cliente_id, p_marca, p_modelo, p_año, p_placa, p_color)
-        RETURNING id INTO vehiculo_id;
-        RETURN vehiculo_id;
-    END;
-    $$ LANGUAGE plpgsql;
-    
-    -- Procedimiento para crear cita
-    CREATE OR REPLACE FUNCTION sp_crear_cita(
-        p_cliente_id INTEGER,
-        p_vehiculo_id INTEGER,
-        p_servicio_id INTEGER,
-        p_fecha_cita DATE,
-        p_hora_cita TIME,
-        p_observaciones TEXT
-    )
-    RETURNS INTEGER AS $$
-    DECLARE
-        cita_id INTEGER;
-    BEGIN
-        -- Verificar disponibilidad de horario
-        IF EXISTS (
-            SELECT 1 FROM citas 
-            WHERE fecha_cita = p_fecha_cita 
-            AND hora_cita = p_hora_cita 
-            AND estado != 'cancelada'
-        ) THEN
-            RAISE EXCEPTION 'El horario ya está ocupado';
-        END IF;
-        
-        INSERT INTO citas (cliente_id, vehiculo_id, servicio_id, fecha_cita, hora_cita, observaciones)
-        VALUES (p_cliente_id, p_vehiculo_id, p_servicio_id, p_fecha_cita, p_hora_cita, p_observaciones)
-        RETURNING id INTO cita_id;
-        RETURN cita_id;
-    END;
-    $$ LANGUAGE plpgsql;
-    
-    -- Procedimiento para actualizar estado de cita
-    CREATE OR REPLACE FUNCTION sp_actualizar_cita(
-        p_cita_id INTEGER,
-        p_estado VARCHAR(20)
-    )
-    RETURNS BOOLEAN AS $$
-    BEGIN
-        UPDATE citas SET estado = p_estado WHERE id = p_cita_id;
-        RETURN FOUND;
-    END;
-    $$ LANGUAGE plpgsql;
-    
-    -- Procedimiento para actualizar inventario
-    CREATE OR REPLACE FUNCTION sp_actualizar_inventario(
-        p_item_id INTEGER,
-        p_cantidad INTEGER
-    )
-    RETURNS BOOLEAN AS $$
-    BEGIN
-        UPDATE inventario 
-        SET cantidad_actual = p_cantidad 
-        WHERE id = p_item_id;
-        RETURN FOUND;
-    END;
-    $$ LANGUAGE plpgsql;
-    
-    -- Vista para citas completas
-    CREATE OR REPLACE VIEW vista_citas_completas AS
-    SELECT 
-        c.id,
-        c.fecha_cita,
-        c.hora_cita,
-        c.estado,
-        c.observaciones,
-        cl.nombre as cliente_nombre,
-        cl.telefono as cliente_telefono,
-        v.marca || ' ' || v.modelo || ' (' || v.placa || ')' as vehiculo_info,
-        s.nombre as servicio_nombre,
-        s.precio as servicio_precio,
-        s.duracion_minutos
-    FROM citas c
-    JOIN clientes cl ON c.cliente_id = cl.id
-    JOIN vehiculos v ON c.vehiculo_id = v.id
-    JOIN servicios s ON c.servicio_id = s.id;
-    """
-    
-    # Datos iniciales
-    initial_data_sql = """
-    -- Usuario administrador por defecto (password: admin123)
-    INSERT INTO usuarios (username, password_hash) 
-    VALUES ('admin', '240be518fabd2724ddb6f04eeb1da5967448d7e831c08c8fa822809f74c720a9')
-    ON CONFLICT (username) DO NOTHING;
-    
-    -- Servicios básicos
-    INSERT INTO servicios (nombre, descripcion, precio, duracion_minutos) VALUES
-    ('Cambio de Aceite', 'Cambio de aceite y filtro', 45.00, 30),
-    ('Revisión General', 'Diagnóstico completo del vehículo', 80.00, 60),
-    ('Cambio de Frenos', 'Cambio de pastillas y discos de freno', 120.00, 90),
-    ('Alineación y Balanceo', 'Alineación de ruedas y balanceo', 35.00, 45),
-    ('Cambio de Batería', 'Instalación de batería nueva', 25.00, 20),
-    ('Reparación de Motor', 'Reparación y mantenimiento de motor', 200.00, 240)
-    ON CONFLICT DO NOTHING;
-    
-    -- Items de inventario básicos
-    INSERT INTO inventario (nombre, descripcion, cantidad_actual, cantidad_minima, precio_unitario, categoria) VALUES
-    ('Aceite 5W-30', 'Aceite para motor sintético', 20, 5, 35.00, 'Lubricantes'),
-    ('Filtro de Aceite', 'Filtro de aceite universal', 15, 3, 8.50, 'Filtros'),
-    ('Pastillas de Freno', 'Pastillas de freno cerámicas', 8, 2, 45.00, 'Frenos'),
-    ('Batería 12V', 'Batería de automóvil 12V', 5, 2, 85.00, 'Eléctrico'),
-    ('Llantas 185/65R15', 'Llantas para automóvil', 12, 4, 120.00, 'Llantas')
-    ON CONFLICT DO NOTHING;
-    """
-    
+# Máximo de items con formulario de reposición en la pestaña Stock Bajo
+MAX_ITEMS_STOCK_BAJO = 50
+
+# Opción del formulario de inventario para escribir una categoría que aún no existe
+NUEVA_CATEGORIA = "➕ Nueva categoría"
+
+# Perfiles de página conservados por sesión para el desglose y la exportación
+MAX_PERFILES = 20
+
+# Cada cuánto se redibuja el calendario con los cambios ya recibidos (solo lee memoria)
+CALENDARIO_REFRESCO_SEGUNDOS = 5
+
+class StockBajoListener:
+    """Mantiene en memoria los items con stock bajo escuchando NOTIFY de PostgreSQL"""
+
+    CANAL = 'stock_bajo'
+    MAX_ALERTAS_POR_SESION = 50
+    SESION_INACTIVA_SEGUNDOS = 3600
+
+    def __init__(self, config: Dict):
+        self.config = config
+        self.listo = threading.Event()
+        self._items: Dict[int, Dict] = {}
+        self._suscriptores: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="stock-bajo-listener", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        """Bucle del hilo: LISTEN, carga inicial y aplicación de notificaciones"""
+        espera = 1
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.config)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+
+                with conn.cursor() as cursor:
+                    # LISTEN antes de la carga para no perder cambios intermedios
+                    cursor.execute(f"LISTEN {self.CANAL}")
+
+                self._cargar_inicial(conn)
+                espera = 1
+
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notificacion = conn.notifies.pop(0)
+                        self._aplicar(json.loads(notificacion.payload))
+            except Exception:
+                # Reintentar con espera exponencial; la recarga corrige eventos perdidos
+                time.sleep(espera)
+                espera = min(espera * 2, 60)
+            finally:
+                if conn:
+                    conn.close()
+
+    def _cargar_inicial(self, conn):
+        """Carga el conjunto completo desde vista_stock_bajo"""
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute("""
+                SELECT id, nombre, descripcion, categoria, cantidad_actual,
+                       cantidad_minima, deficit, sede_id
+                FROM vista_stock_bajo
+            """)
+            items = {row['id']: dict(row) for row in cursor.fetchall()}
+
+        with self._lock:
+            self._items = items
+        self.listo.set()
+
+    def _aplicar(self, evento: Dict):
+        """Actualiza el conjunto y reparte alertas cuando un item cruza su mínimo"""
+        item = {
+            k: evento[k]
+            for k in ('id', 'nombre', 'descripcion', 'categoria', 'cantidad_actual', 'cantidad_minima', 'sede_id')
+        }
+        item['deficit'] = item['cantidad_minima'] - item['cantidad_actual']
+
+        with self._lock:
+            if evento['bajo']:
+                self._items[item['id']] = item
+            else:
+                self._items.pop(item['id'], None)
+
+            if evento['cruce'] and evento['bajo']:
+                for suscriptor in self._suscriptores.values():
+                    suscriptor['alertas'].append(item)
+
+    def items(self, sede_id: Optional[int] = None) -> List[Dict]:
+        """Items con stock bajo ordenados por déficit, de una sede o de todas"""
+        with self._lock:
+            items = [item for item in self._items.values() if sede_id is None or item['sede_id'] == sede_id]
+        return sorted(items, key=lambda item: item['deficit'], reverse=True)
+
+    def suscribir(self, sesion_id: str):
+        """Registra una sesión administrativa para recibir alertas"""
+        ahora = time.monotonic()
+        with self._lock:
+            if sesion_id not in self._suscriptores:
+                self._suscriptores[sesion_id] = {
+                    'alertas': deque(maxlen=self.MAX_ALERTAS_POR_SESION),
+                    'visto': ahora
+                }
+            self._suscriptores[sesion_id]['visto'] = ahora
+
+            # Descartar sesiones cerradas sin cerrar sesión
+            inactivas = [
+                sid for sid, suscriptor in self._suscriptores.items()
+                if ahora - suscriptor['visto'] > self.SESION_INACTIVA_SEGUNDOS
+            ]
+            for sid in inactivas:
+                del self._suscriptores[sid]
+
+    def desuscribir(self, sesion_id: str):
+        """Elimina una sesión administrativa"""
+        with self._lock:
+            self._suscriptores.pop(sesion_id, None)
+
+    def obtener_alertas(self, sesion_id: str) -> List[Dict]:
+        """Devuelve y vacía las alertas pendientes de la sesión"""
+        with self._lock:
+            suscriptor = self._suscriptores.get(sesion_id)
+            if not suscriptor:
+                return []
+            alertas = list(suscriptor['alertas'])
+            suscriptor['alertas'].clear()
+        return alertas
+
+@st.cache_resource
+def get_stock_listener():
+    return StockBajoListener(DB_CONFIG)
+
+def obtener_items_stock_bajo(sede_id: Optional[int] = None) -> List[Dict]:
+    """Items con stock bajo desde memoria; consulta la vista solo si el listener no está listo"""
+    listener = get_stock_listener()
+    if listener.listo.is_set():
+        return listener.items(sede_id)
+
     try:
-        conn = db.get_connection()
-        if conn:
-            cursor = conn.cursor()
-            
-            # Crear tablas
-            cursor.execute(create_tables_sql)
-            
-            # Crear procedimientos y vistas
-            cursor.execute(procedures_sql)
-            
-            # Insertar datos iniciales
-            cursor.execute(initial_data_sql)
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
-            
-            return True
-    except Exception as e:
-        st.error(f"Error inicializando base de datos: {e}")
-        return False
+        return servicio_inventario.items_stock_bajo(db.pool, sede_id)
+    except TallerError as e:
+        st.error(f"Error consultando stock bajo: {e}")
+        return []
+
+def registrar_movimiento_inventario(item_id: int, delta: int, tipo: str, motivo: str) -> Optional[int]:
+    """Registra un movimiento del usuario actual y devuelve el stock resultante"""
+    try:
+        return servicio_inventario.registrar_movimiento(
+            db.pool, item_id, delta, tipo, motivo, st.session_state.get('username')
+        )
+    except TallerError as e:
+        st.error(f"Error registrando movimiento: {e}")
+        return None
 
 def hash_password(password: str) -> str:
     """Genera hash SHA-256 de la contraseña"""
@@ -345,6 +296,67 @@ def authenticate_user(username: str, password: str) -> bool:
     )
     return len(result) > 0 if result else False
 
+def obtener_sedes() -> List[Dict]:
+    """Sedes activas desde la caché del catálogo"""
+    try:
+        return servicio_sedes.listar_sedes(db.pool)
+    except TallerError as e:
+        st.error(f"Error cargando sedes: {e}")
+        return []
+
+def selector_sede(etiqueta: str, key: str, incluir_todas: bool = False) -> Optional[int]:
+    """Selector de sede; con una sola sede no se muestra y devuelve esa sede"""
+    sedes = obtener_sedes()
+    if len(sedes) <= 1:
+        return sedes[0]['id'] if sedes else servicio_sedes.SEDE_PRINCIPAL
+    opciones = ([None] if incluir_todas else []) + [sede['id'] for sede in sedes]
+    nombres = {sede['id']: sede['nombre'] for sede in sedes}
+    return st.selectbox(etiqueta, opciones, format_func=lambda sede_id: nombres.get(sede_id, 'Todas'), key=key)
+
+def url_mapa_estatico(lat: float, lon: float, margen: float = 0.006) -> str:
+    """Mapa embebido de OpenStreetMap: lo carga el navegador sin trabajo en el servidor"""
+    bbox = f"{lon - margen},{lat - margen / 2},{lon + margen},{lat + margen / 2}"
+    return f"https://www.openstreetmap.org/export/embed.html?bbox={bbox}&layer=mapnik&marker={lat},{lon}"
+
+@st.cache_resource
+def mapa_interactivo_html(ubicaciones: Tuple[Tuple[str, str, float, float], ...]) -> str:
+    """HTML del mapa de Folium con una marca por sede, construido una vez por lista de sedes"""
+    import folium
+    m = folium.Map(location=[ubicaciones[0][2], ubicaciones[0][3]], zoom_start=15)
+    for nombre, direccion, lat, lon in ubicaciones:
+        folium.Marker(
+            [lat, lon],
+            popup=f"Taller AutoMax {nombre}<br>{direccion}",
+            tooltip=f"Taller AutoMax {nombre}",
+            icon=folium.Icon(color='red', icon='wrench', prefix='fa')
+        ).add_to(m)
+    if len(ubicaciones) > 1:
+        m.fit_bounds([[lat, lon] for _, _, lat, lon in ubicaciones])
+    return m.get_root().render()
+
+@st.fragment
+def mapa_ubicacion():
+    """Vista estática ligera de una sede; el mapa interactivo con todas se carga solo si el usuario lo pide"""
+    sedes = obtener_sedes()
+    if not sedes:
+        st.info("Ubicación no disponible por el momento.")
+        return
+    
+    if st.toggle("🗺️ Mapa interactivo"):
+        ubicaciones = tuple((s['nombre'], s['direccion'], s['latitud'], s['longitud']) for s in sedes)
+        components.html(mapa_interactivo_html(ubicaciones), height=300)
+        for sede in sedes:
+            st.markdown(f"[Cómo llegar](https://www.google.com/maps?q={sede['latitud']},{sede['longitud']}) · "
+                        f"**{sede['nombre']}** · {sede['direccion']}")
+    else:
+        if len(sedes) > 1:
+            sede = st.selectbox("Sede:", sedes, format_func=lambda s: s['nombre'], key='mapa_sede')
+        else:
+            sede = sedes[0]
+        lat, lon = sede['latitud'], sede['longitud']
+        components.iframe(url_mapa_estatico(lat, lon), height=300)
+        st.markdown(f"[Cómo llegar](https://www.google.com/maps?q={lat},{lon}) · {sede['direccion']}")
+
 def show_home_page():
     """Página de inicio"""
     st.title("🔧 Taller AutoMax")
@@ -391,21 +403,9 @@ def show_home_page():
         info@tallerautomax.com
         """)
     
-    # Mapa de ubicación
-    st.markdown("### 📍 Nuestra Ubicación")
-    
-    # Coordenadas de San Isidro, Lima
-    lat, lon = -12.0931, -77.0465
-    
-    m = folium.Map(location=[lat, lon], zoom_start=15)
-    folium.Marker(
-        [lat, lon],
-        popup="Taller AutoMax<br>Av. Principal 123, San Isidro",
-        tooltip="Taller AutoMax",
-        icon=folium.Icon(color='red', icon='wrench', prefix='fa')
-    ).add_to(m)
-    
-    st_folium(m, width=700, height=300)
+    # Mapa de las sedes
+    st.markdown("### 📍 Nuestras Sedes")
+    mapa_ubicacion()
     
     # Botón para agendar cita
     st.markdown("---")
@@ -419,10 +419,12 @@ def show_services_page():
     """Página de servicios"""
     st.title("🛠️ Nuestros Servicios")
     
-    # Obtener servicios de la base de datos
-    servicios = db.execute_query(
-        "SELECT nombre, descripcion, precio, duracion_minutos FROM servicios WHERE activo = TRUE ORDER BY precio"
-    )
+    # Catálogo desde la caché compartida; la base de datos solo se consulta tras un cambio
+    try:
+        servicios = sorted(servicio_citas.listar_servicios(db.pool), key=lambda s: s['precio'])
+    except TallerError as e:
+        st.error(f"Error cargando servicios: {e}")
+        servicios = []
     
     if servicios:
         for servicio in servicios:
@@ -443,6 +445,110 @@ def show_services_page():
     else:
         st.warning("No se pudieron cargar los servicios.")
 
+def cita_vigente(cita: Dict) -> Dict:
+    """Versión más reciente de la cita si su tarjeta la cambió en una recarga parcial"""
+    return st.session_state.get(f"_cita_{cita['id']}", cita)
+
+def olvidar_citas_actualizadas():
+    """Descarta las versiones guardadas por las tarjetas al releer la lista completa"""
+    for clave in [clave for clave in st.session_state if str(clave).startswith('_cita_')]:
+        del st.session_state[clave]
+
+def cambiar_estado_en_tarjeta(cita_id: int, estado: str, mensaje: str, telefono: Optional[str] = None):
+    """Callback de los botones de estado: actualiza y guarda la cita releída para su tarjeta
+
+    Al correr antes que el fragmento, la tarjeta se dibuja una sola vez ya
+    con el nuevo estado, sin una segunda ejecución con st.rerun. Con
+    `telefono` (tarjetas del cliente) solo cambia la cita si es suya.
+    """
+    try:
+        servicio_citas.actualizar_estado(
+            db.pool, cita_id, estado, st.session_state.get('username'), telefono=telefono
+        )
+        st.session_state[f"_cita_{cita_id}"] = servicio_citas.obtener_cita(db.pool, cita_id, telefono)
+        st.session_state[f"_aviso_cita_{cita_id}"] = (True, mensaje)
+    except TallerError as e:
+        st.session_state[f"_aviso_cita_{cita_id}"] = (False, f"Error actualizando la cita: {e}")
+
+def formato_duracion(duracion: timedelta) -> str:
+    """Duración legible: días y horas, u horas y minutos"""
+    horas, segundos = divmod(int(duracion.total_seconds()), 3600)
+    if horas >= 24:
+        return f"{horas // 24} d {horas % 24} h"
+    return f"{horas} h {segundos // 60} min"
+
+def mostrar_aviso_cita(cita_id: int):
+    """Muestra el resultado del último cambio de estado hecho desde la tarjeta"""
+    aviso = st.session_state.pop(f"_aviso_cita_{cita_id}", None)
+    if aviso:
+        exito, mensaje = aviso
+        if exito:
+            st.toast(mensaje)
+        else:
+            st.error(mensaje)
+
+@st.fragment
+def tarjeta_cita_cliente(cita: Dict, telefono: str):
+    """Tarjeta de una cita del cliente con sus botones de confirmar o cancelar"""
+    cita = cita_vigente(cita)
+    with st.expander(f"Cita #{cita['id']} - {cita['fecha_cita']} {cita['hora_cita']}"):
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.write(f"**Cliente:** {cita['cliente_nombre']}")
+            st.write(f"**Vehículo:** {cita['vehiculo_info']}")
+            st.write(f"**Servicio:** {cita['servicio_nombre']}")
+        
+        with col2:
+            st.write(f"**Estado:** {cita['estado'].title()}")
+            st.write(f"**Sede:** {cita['sede_nombre']}")
+            st.write(f"**Precio:** S/ {cita['servicio_precio']:.2f}")
+            st.write(f"**Duración:** {cita['duracion_minutos']} min")
+        
+        if cita['observaciones']:
+            st.write(f"**Observaciones:** {cita['observaciones']}")
+        
+        # Botones de acción para citas pendientes
+        if cita['estado'] == 'pendiente':
+            col_btn1, col_btn2 = st.columns(2)
+            with col_btn1:
+                st.button(f"Confirmar #{cita['id']}", type="primary", on_click=cambiar_estado_en_tarjeta,
+                          args=(cita['id'], 'confirmada', "Cita confirmada", telefono))
+            
+            with col_btn2:
+                st.button(f"Cancelar #{cita['id']}", type="secondary", on_click=cambiar_estado_en_tarjeta,
+                          args=(cita['id'], 'cancelada', "Cita cancelada", telefono))
+        
+        mostrar_aviso_cita(cita['id'])
+
+@st.fragment
+def mis_citas():
+    """Búsqueda de citas por teléfono; se recarga sin reconstruir el resto de la página"""
+    st.subheader("Consultar Citas por Teléfono")
+    
+    telefono_buscar = st.text_input(
+        "Ingresa tu número de teléfono:",
+        help="El número completo con el que agendaste"
+    ).strip()
+    
+    if telefono_buscar:
+        try:
+            # Solo el número exacto: un fragmento mostraría (y dejaría cancelar) citas de otros clientes
+            citas = servicio_citas.buscar_citas_por_telefono(db.pool, telefono_buscar, exacto=True)
+        except DatosInvalidos as e:
+            st.info(str(e))
+            return
+        except TallerError as e:
+            st.error(f"Error consultando citas: {e}")
+            citas = []
+        olvidar_citas_actualizadas()
+        
+        if citas:
+            for cita in citas:
+                tarjeta_cita_cliente(cita, telefono_buscar)
+        else:
+            st.info("No se encontraron citas con ese número de teléfono.")
+
 def show_appointments_page():
     """Página de citas"""
     st.title("📅 Gestión de Citas")
@@ -452,6 +558,23 @@ def show_appointments_page():
     with tab1:
         st.subheader("Agendar Nueva Cita")
         
+        # Fuera del formulario para sugerir la sede apenas se elige el distrito
+        sedes = obtener_sedes()
+        sede_sugerida = None
+        if len(sedes) > 1:
+            distrito = st.selectbox(
+                "¿En qué distrito estás?",
+                [None] + list(servicio_sedes.DISTRITOS),
+                format_func=lambda d: d or "Elige tu distrito para sugerirte la sede más cercana"
+            )
+            if distrito:
+                try:
+                    sede_sugerida = servicio_sedes.sede_por_distrito(db.pool, distrito)
+                    st.caption(f"Sede más cercana: **{sede_sugerida['nombre']}** "
+                               f"({sede_sugerida['distancia_km']} km) · {sede_sugerida['direccion']}")
+                except TallerError:
+                    sede_sugerida = None
+        
         with st.form("nueva_cita"):
             col1, col2 = st.columns(2)
             
@@ -474,7 +597,11 @@ def show_appointments_page():
             st.markdown("**Detalles de la Cita**")
             
             # Obtener servicios disponibles
-            servicios = db.execute_query("SELECT id, nombre, precio FROM servicios WHERE activo = TRUE ORDER BY nombre")
+            try:
+                servicios = servicio_citas.listar_servicios(db.pool)
+            except TallerError as e:
+                st.error(f"Error cargando servicios: {e}")
+                servicios = []
             if servicios:
                 servicio_options = {f"{s['nombre']} - S/ {s['precio']:.2f}": s['id'] for s in servicios}
                 servicio_seleccionado = st.selectbox("Servicio*", options=list(servicio_options.keys()))
@@ -483,6 +610,18 @@ def show_appointments_page():
                 st.error("No hay servicios disponibles")
                 servicio_id = None
             
+            if sedes:
+                sede_options = {s['id']: f"{s['nombre']} - {s['direccion']}" for s in sedes}
+                ids_sede = list(sede_options)
+                sede_id = st.selectbox(
+                    "Sede*",
+                    ids_sede,
+                    index=ids_sede.index(sede_sugerida['id']) if sede_sugerida else 0,
+                    format_func=sede_options.get
+                )
+            else:
+                sede_id = servicio_sedes.SEDE_PRINCIPAL
+            
             col3, col4 = st.columns(2)
             with col3:
                 fecha_cita = st.date_input("Fecha de la Cita*", min_value=date.today())
@@ -499,95 +638,65 @@ def show_appointments_page():
                 if not all([nombre_cliente, telefono, marca, modelo, placa]) or not servicio_id:
                     st.error("Por favor completa todos los campos obligatorios (*)")
                 else:
+                    datos_reserva = dict(
+                        nombre=nombre_cliente,
+                        telefono=telefono,
+                        marca=marca,
+                        modelo=modelo,
+                        placa=placa,
+                        servicio_id=servicio_id,
+                        fecha_cita=fecha_cita,
+                        hora_cita=hora_cita,
+                        email=email,
+                        direccion=direccion,
+                        año=año,
+                        color=color,
+                        observaciones=observaciones,
+                        sede_id=sede_id
+                    )
+                    # Doble clic o reenvío: misma instancia del formulario y mismos datos, misma clave
+                    clave = servicio_citas.clave_reserva(
+                        st.session_state.setdefault('_form_reserva', uuid.uuid4().hex), **datos_reserva
+                    )
                     try:
-                        # Crear cliente
-                        cliente_id = db.execute_procedure(
-                            'sp_crear_cliente',
-                            (nombre_cliente, telefono, email, direccion)
-                        )[0][0]
-                        
-                        # Crear vehículo
-                        vehiculo_id = db.execute_procedure(
-                            'sp_crear_vehiculo',
-                            (cliente_id, marca, modelo, año, placa, color)
-                        )[0][0]
+                        # Cliente, vehículo y cita en una sola transacción
+                        reserva = servicio_citas.agendar_cita(db.pool, **datos_reserva, clave_idempotencia=clave)
                         
-                        # Crear cita
-                        cita_id = db.execute_procedure(
-                            'sp_crear_cita',
-                            (cliente_id, vehiculo_id, servicio_id, fecha_cita, hora_cita, observaciones)
-                        )[0][0]
-                        
-                        st.success(f"¡Cita agendada exitosamente! Número de cita: {cita_id}")
+                        if reserva['repetida']:
+                            st.info(f"Esta cita ya estaba registrada. Número de cita: {reserva['cita_id']}")
+                        else:
+                            st.success(f"¡Cita agendada exitosamente! Número de cita: {reserva['cita_id']}")
+                        st.session_state._reserva_registrada = True
                         
-                    except Exception as e:
+                    except TallerError as e:
                         if "ya está ocupado" in str(e):
                             st.error("El horario seleccionado ya está ocupado. Por favor elige otro horario.")
-                        elif "duplicate key" in str(e):
-                            st.error("La placa del vehículo ya está registrada.")
                         else:
                             st.error(f"Error al agendar la cita: {e}")
+            elif st.session_state.pop('_reserva_registrada', False):
+                # La siguiente ejecución sin envío abre una instancia nueva del formulario
+                st.session_state._form_reserva = uuid.uuid4().hex
     
     with tab2:
-        st.subheader("Consultar Citas por Teléfono")
-        
-        telefono_buscar = st.text_input("Ingresa tu número de teléfono:")
-        
-        if telefono_buscar:
-            citas = db.execute_query("""
-                SELECT * FROM vista_citas_completas 
-                WHERE cliente_telefono LIKE %s 
-                ORDER BY fecha_cita DESC, hora_cita
-            """, (f"%{telefono_buscar}%",))
-            
-            if citas:
-                for cita in citas:
-                    with st.expander(f"Cita #{cita['id']} - {cita['fecha_cita']} {cita['hora_cita']}"):
-                        col1, col2 = st.columns(2)
-                        
-                        with col1:
-                            st.write(f"**Cliente:** {cita['cliente_nombre']}")
-                            st.write(f"**Vehículo:** {cita['vehiculo_info']}")
-                            st.write(f"**Servicio:** {cita['servicio_nombre']}")
-                        
-                        with col2:
-                            st.write(f"**Estado:** {cita['estado'].title()}")
-                            st.write(f"**Precio:** S/ {cita['servicio_precio']:.2f}")
-                            st.write(f"**Duración:** {cita['duracion_minutos']} min")
-                        
-                        if cita['observaciones']:
-                            st.write(f"**Observaciones:** {cita['observaciones']}")
-                        
-                        # Botones de acción para citas pendientes
-                        if cita['estado'] == 'pendiente':
-                            col_btn1, col_btn2 = st.columns(2)
-                            with col_btn1:
-                                if st.button(f"Confirmar #{cita['id']}", type="primary"):
-                                    if db.execute_procedure('sp_actualizar_cita', (cita['id'], 'confirmada')):
-                                        st.success("Cita confirmada")
-                                        st.rerun()
-                            
-                            with col_btn2:
-                                if st.button(f"Cancelar #{cita['id']}", type="secondary"):
-                                    if db.execute_procedure('sp_actualizar_cita', (cita['id'], 'cancelada')):
-                                        st.success("Cita cancelada")
-                                        st.rerun()
-            else:
-                st.info("No se encontraron citas con ese número de teléfono.")
+        mis_citas()
     
     with tab3:
         st.subheader("Consultar Cita por ID")
         
         cita_id = st.number_input("Número de Cita:", min_value=1, step=1)
+        # El teléfono acredita al dueño: sin él se podrían recorrer los IDs y leer citas ajenas
+        telefono_cita = st.text_input("Teléfono con el que agendaste:", key="telefono_cita_id").strip()
         
         if st.button("Buscar Cita"):
-            cita = db.execute_query(
-                "SELECT * FROM vista_citas_completas WHERE id = %s", 
-                (cita_id,)
-            )
+            try:
+                cita = servicio_citas.obtener_cita(db.pool, cita_id, telefono_cita) if telefono_cita else None
+            except NoEncontrado:
+                cita = None
+            except TallerError as e:
+                st.error(f"Error consultando la cita: {e}")
+                cita = None
             
             if cita:
-                cita = cita[0]
                 
                 st.markdown(f"### Cita #{cita['id']}")
                 
@@ -597,7 +706,8 @@ def show_appointments_page():
                     st.info(f"""
                     **Fecha:** {cita['fecha_cita']}  
                     **Hora:** {cita['hora_cita']}  
-                    **Estado:** {cita['estado'].title()}
+                    **Estado:** {cita['estado'].title()}  
+                    **Sede:** {cita['sede_nombre']}
                     """)
                     
                     st.info(f"""
@@ -620,61 +730,90 @@ def show_appointments_page():
                     st.markdown(f"**Observaciones:** {cita['observaciones']}")
             
             else:
-                st.error("No se encontró una cita con ese ID.")
+                st.error("No se encontró una cita con ese ID y teléfono.")
 
 def show_inventory_page():
     """Página de inventario"""
+    import pandas as pd
     st.title("📦 Inventario")
     
-    tab1, tab2, tab3 = st.tabs(["Ver Inventario", "Agregar Item", "Stock Bajo"])
+    # Cada sede tiene su propio stock: todas las pestañas trabajan sobre la sede elegida
+    sede_id = selector_sede("Sede:", key='inventario_sede')
+    
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Ver Inventario", "Agregar Item", "Stock Bajo", "Movimientos", "Demanda Proyectada"])
     
     with tab1:
         st.subheader("Inventario Actual")
         
-        items = db.execute_query("""
-            SELECT id, nombre, descripcion, cantidad_actual, cantidad_minima, 
-                   precio_unitario, categoria
-            FROM inventario 
-            ORDER BY categoria, nombre
-        """)
+        # Totales por categoría desde el resumen mantenido por trigger (una fila por sede y categoría)
+        try:
+            resumen = servicio_inventario.resumen_categorias(db.pool, sede_id)
+        except TallerError as e:
+            st.error(f"Error consultando inventario: {e}")
+            resumen = []
         
-        if items:
-            df = pd.DataFrame(items)
-            df['Estado'] = df.apply(lambda row: 'Stock Bajo' if row['cantidad_actual'] <= row['cantidad_minima'] else 'OK', axis=1)
-            df['Valor Total'] = df['cantidad_actual'] * df['precio_unitario']
+        if resumen:
+            with perfilado.fase('dataframes', 'resumen de inventario'):
+                df_resumen = pd.DataFrame(resumen)
             
             # Filtros
-            col1, col2 = st.columns(2)
+            col1, col2, col3 = st.columns(3)
             with col1:
-                categorias = ['Todos'] + sorted(df['categoria'].unique().tolist())
+                categorias = ['Todos'] + df_resumen['categoria'].tolist()
                 categoria_filter = st.selectbox("Filtrar por Categoría:", categorias)
             
             with col2:
                 estado_filter = st.selectbox("Filtrar por Estado:", ['Todos', 'OK', 'Stock Bajo'])
             
-            # Aplicar filtros
-            df_filtered = df.copy()
-            if categoria_filter != 'Todos':
-                df_filtered = df_filtered[df_filtered['categoria'] == categoria_filter]
-            if estado_filter != 'Todos':
-                df_filtered = df_filtered[df_filtered['Estado'] == estado_filter]
+            with col3:
+                tamano_pagina = st.selectbox("Items por página:", [25, 50, 100], index=1)
+            
+            # Cantidad de filas del filtro sin contar en la tabla de inventario
+            df_seleccion = df_resumen if categoria_filter == 'Todos' else df_resumen[df_resumen['categoria'] == categoria_filter]
+            total_filtrado = {
+                'Todos': df_seleccion['total_items'].sum(),
+                'Stock Bajo': df_seleccion['stock_bajo'].sum(),
+                'OK': df_seleccion['total_items'].sum() - df_seleccion['stock_bajo'].sum()
+            }[estado_filter]
+            total_paginas = max((int(total_filtrado) + tamano_pagina - 1) // tamano_pagina, 1)
+            
+            pagina = st.number_input(f"Página (de {total_paginas}):", min_value=1, max_value=total_paginas, value=1)
+            
+            # Filtros y cálculos en la base de datos; solo viaja la página visible
+            try:
+                items = servicio_inventario.pagina_inventario(
+                    db.pool,
+                    categoria=None if categoria_filter == 'Todos' else categoria_filter,
+                    estado=None if estado_filter == 'Todos' else estado_filter,
+                    limite=tamano_pagina,
+                    desplazamiento=(pagina - 1) * tamano_pagina,
+                    sede_id=sede_id
+                )
+            except TallerError as e:
+                st.error(f"Error consultando inventario: {e}")
+                items = []
             
             # Mostrar tabla
-            st.dataframe(
-                df_filtered[['nombre', 'descripcion', 'categoria', 'cantidad_actual', 'cantidad_minima', 'precio_unitario', 'Valor Total', 'Estado']],
-                use_container_width=True
-            )
+            if items:
+                with perfilado.fase('dataframes', 'página de inventario'):
+                    df_items = pd.DataFrame(items).drop(columns='id')
+                st.dataframe(df_items, use_container_width=True)
+            else:
+                st.info("No hay items que coincidan con los filtros.")
             
             # Métricas
             col1, col2, col3, col4 = st.columns(4)
             with col1:
-                st.metric("Total Items", len(df))
+                st.metric("Total Items", int(df_resumen['total_items'].sum()))
             with col2:
-                st.metric("Stock Bajo", len(df[df['Estado'] == 'Stock Bajo']))
+                st.metric("Stock Bajo", int(df_resumen['stock_bajo'].sum()))
             with col3:
-                st.metric("Valor Total", f"S/ {df['Valor Total'].sum():.2f}")
+                st.metric("Valor Total", f"S/ {float(df_resumen['valor_total'].sum()):.2f}")
             with col4:
-                st.metric("Categorías", len(df['categoria'].unique()))
+                st.metric("Categorías", len(df_resumen))
+            
+            with st.expander("Resumen por Categoría"):
+                st.dataframe(df_resumen, use_container_width=True)
         
         else:
             st.info("No hay items en el inventario.")
@@ -688,7 +827,12 @@ def show_inventory_page():
             with col1:
                 nombre = st.text_input("Nombre del Item*")
                 descripcion = st.text_area("Descripción")
-                categoria = st.text_input("Categoría*")
+                try:
+                    categorias = servicio_inventario.listar_categorias(db.pool)
+                except TallerError:
+                    categorias = []
+                categoria = st.selectbox("Categoría*", categorias + [NUEVA_CATEGORIA])
+                nueva_categoria = st.text_input("Nueva categoría", help=f"Solo si eligió «{NUEVA_CATEGORIA}»")
             
             with col2:
                 cantidad_actual = st.number_input("Cantidad Actual", min_value=0, value=0)
@@ -698,16 +842,19 @@ def show_inventory_page():
             submitted = st.form_submit_button("Agregar Item", type="primary")
             
             if submitted:
+                if categoria == NUEVA_CATEGORIA:
+                    categoria = nueva_categoria.strip()
                 if not all([nombre, categoria]):
                     st.error("Por favor completa todos los campos obligatorios (*)")
                 else:
                     result = db.execute_query("""
-                        INSERT INTO inventario (nombre, descripcion, cantidad_actual, cantidad_minima, precio_unitario, categoria)
-                        VALUES (%s, %s, %s, %s, %s, %s)
+                        INSERT INTO inventario (nombre, descripcion, cantidad_actual, cantidad_minima, precio_unitario, categoria, sede_id)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s)
                         RETURNING id
-                    """, (nombre, descripcion, cantidad_actual, cantidad_minima, precio_unitario, categoria))
+                    """, (nombre, descripcion, cantidad_actual, cantidad_minima, precio_unitario, categoria, sede_id))
                     
                     if result:
+                        cache_catalogo.invalidar('categorias')
                         st.success(f"Item agregado exitosamente con ID: {result[0]['id']}")
                     else:
                         st.error("Error al agregar el item.")
@@ -715,22 +862,1142 @@ def show_inventory_page():
     with tab3:
         st.subheader("Items con Stock Bajo")
         
-        items_bajo_stock = db.execute_query("""
-            SELECT nombre, descripcion, categoria, cantidad_actual, cantidad_minima,
-                   (cantidad_minima - cantidad_actual) as deficit
-            FROM inventario 
-            WHERE cantidad_actual <= cantidad_minima
-            ORDER BY (cantidad_minima - cantidad_actual) DESC
-        """)
+        # El conjunto se mantiene en memoria por el listener de LISTEN/NOTIFY
+        items_bajo_stock = obtener_items_stock_bajo(sede_id)
+        
+        # Pronóstico de reposición precalculado por taller.pronostico (una sola consulta)
+        pronostico = db.execute_query("""
+            SELECT p.*, i.nombre, i.cantidad_actual, i.cantidad_minima
+            FROM inventario_pronostico p
+            JOIN inventario i ON i.id = p.item_id
+            WHERE i.sede_id = %s
+        """, (sede_id,)) or []
+        pronostico_por_item = {p['item_id']: p for p in pronostico}
         
         if items_bajo_stock:
             st.warning(f"⚠️ {len(items_bajo_stock)} items necesitan reposición")
             
-            for item in items_bajo_stock:
+            # Solo los mayores déficits como formularios; el resto queda en Ver Inventario
+            if len(items_bajo_stock) > MAX_ITEMS_STOCK_BAJO:
+                st.caption(f"Mostrando los {MAX_ITEMS_STOCK_BAJO} items con mayor déficit. Filtre por 'Stock Bajo' en Ver Inventario para ver todos.")
+            
+            for item in items_bajo_stock[:MAX_ITEMS_STOCK_BAJO]:
                 with st.expander(f"{item['nombre']} - Déficit: {item['deficit']} unidades"):
                     col1, col2 = st.columns(2)
                     
                     with col1:
                         st.write(f"**Categoría:** {item['categoria']}")
                         st.write(f"**Descripción:** {item['descripcion']}")
-                    
\ No newline at end of file
+                    
+                    with col2:
+                        st.metric("Stock Actual", item['cantidad_actual'])
+                        st.metric("Stock Mínimo", item['cantidad_minima'])
+                        
+                        sugerencia = pronostico_por_item.get(item['id'])
+                        if sugerencia:
+                            st.caption(
+                                f"Pedido sugerido: {sugerencia['cantidad_sugerida']} unidades "
+                                f"(consumo diario {sugerencia['consumo_diario']}, "
+                                f"agendado {sugerencia['demanda_agendada']})"
+                            )
+                        
+                        cantidad_recibida = st.number_input(
+                            f"Cantidad recibida de {item['nombre']}", 
+                            min_value=1, 
+                            value=max(sugerencia['cantidad_sugerida'] if sugerencia else item['deficit'], 1),
+                            key=f"stock_{item['id']}"
+                        )
+                        
+                        if st.button(f"Registrar Entrada", key=f"btn_{item['id']}"):
+                            # Delta atómico en la base de datos: no se pisan reposiciones simultáneas
+                            if registrar_movimiento_inventario(item['id'], cantidad_recibida, 'entrada', 'Reposición de stock bajo') is not None:
+                                st.success("Stock actualizado")
+                                st.rerun()
+        else:
+            st.success("✅ Todos los items tienen stock suficiente")
+        
+        st.subheader("Sugerencias de Reposición")
+        
+        if pronostico:
+            # Items que llegarán al punto de reorden aunque aún superen el mínimo fijo
+            with perfilado.fase('dataframes', 'sugerencias de reposición'):
+                df_pronostico = pd.DataFrame(pronostico)
+                df_reorden = df_pronostico[df_pronostico['cantidad_actual'] <= df_pronostico['punto_reorden']]
+            
+            if not df_reorden.empty:
+                st.dataframe(
+                    df_reorden[['nombre', 'cantidad_actual', 'cantidad_minima', 'punto_reorden', 'cantidad_sugerida', 'consumo_diario', 'demanda_agendada']],
+                    use_container_width=True
+                )
+            else:
+                st.info("Ningún item alcanza su punto de reorden")
+            
+            st.caption(f"Calculado: {df_pronostico['calculado_en'].max()}")
+            
+            if st.button("Usar punto de reorden como stock mínimo"):
+                actualizados = db.execute_query("""
+                    UPDATE inventario i
+                    SET cantidad_minima = GREATEST(p.punto_reorden, 1)
+                    FROM inventario_pronostico p
+                    WHERE p.item_id = i.id
+                    AND i.sede_id = %s
+                    AND (p.consumo_diario > 0 OR p.demanda_agendada > 0)
+                    AND i.cantidad_minima <> GREATEST(p.punto_reorden, 1)
+                    RETURNING i.id
+                """, (sede_id,))
+                if actualizados is not None:
+                    st.success(f"Stock mínimo actualizado en {len(actualizados)} items")
+                    st.rerun()
+        else:
+            st.info("Sin pronóstico calculado todavía")
+        
+        # El cálculo recorre todo el inventario: lo ejecuta un trabajador de la cola de tareas
+        if st.button("🔄 Recalcular pronóstico"):
+            tarea_id = encolar_tarea('pronostico')
+            if tarea_id:
+                st.success(f"Pronóstico encolado (tarea #{tarea_id}); se actualizará en segundo plano")
+    
+    with tab4:
+        st.subheader("Movimientos de Inventario")
+        
+        # Búsqueda acotada: no se envía el catálogo completo al selector
+        busqueda = st.text_input(
+            "Buscar item por nombre:",
+            help=f"Al menos {servicio_inventario.MIN_CARACTERES_ITEM} caracteres"
+        )
+        try:
+            items = servicio_inventario.buscar_items(db.pool, busqueda, sede_id=sede_id)
+        except DatosInvalidos as e:
+            st.info(str(e))
+            items = []
+        except TallerError as e:
+            st.error(f"Error buscando items: {e}")
+            items = []
+        
+        if items:
+            item_options = {f"{i['nombre']} (stock: {i['cantidad_actual']})": i['id'] for i in items}
+            item_seleccionado = st.selectbox("Item:", options=list(item_options.keys()))
+            item_id = item_options[item_seleccionado]
+            
+            with st.form("nuevo_movimiento"):
+                col1, col2, col3 = st.columns(3)
+                
+                with col1:
+                    tipo = st.selectbox("Tipo", ['entrada', 'consumo'], format_func=str.title)
+                with col2:
+                    cantidad = st.number_input("Cantidad", min_value=1, value=1)
+                with col3:
+                    motivo = st.text_input("Motivo")
+                
+                if st.form_submit_button("Registrar Movimiento", type="primary"):
+                    delta = cantidad if tipo == 'entrada' else -cantidad
+                    saldo = registrar_movimiento_inventario(item_id, delta, tipo, motivo)
+                    if saldo is not None:
+                        st.success(f"Movimiento registrado. Stock actual: {saldo}")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                fecha_consulta = st.date_input("Stock al cierre del día:", value=date.today())
+            with col2:
+                stock_fecha = db.execute_query(
+                    "SELECT fn_stock_a_fecha(%s, %s::date + INTERVAL '1 day' - INTERVAL '1 microsecond') as cantidad",
+                    (item_id, fecha_consulta)
+                )
+                st.metric("Stock a la fecha", stock_fecha[0]['cantidad'] if stock_fecha else 0)
+            
+            movimientos = db.execute_query("""
+                SELECT created_at, tipo, delta, saldo_resultante, motivo, usuario
+                FROM inventario_movimientos
+                WHERE item_id = %s
+                ORDER BY id DESC
+                LIMIT 50
+            """, (item_id,))
+            
+            if movimientos:
+                with perfilado.fase('dataframes', 'movimientos'):
+                    df_movimientos = pd.DataFrame(movimientos)
+                st.dataframe(
+                    df_movimientos,
+                    column_config={
+                        'created_at': 'Fecha',
+                        'tipo': 'Tipo',
+                        'delta': 'Cantidad',
+                        'saldo_resultante': 'Saldo',
+                        'motivo': 'Motivo',
+                        'usuario': 'Usuario'
+                    },
+                    hide_index=True,
+                    use_container_width=True
+                )
+        else:
+            st.info("No se encontraron items.")
+    
+    with tab5:
+        st.subheader("Repuestos Requeridos por Citas Agendadas")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            proyeccion_desde = st.date_input("Desde:", value=date.today(), key="proyeccion_desde")
+        with col2:
+            proyeccion_hasta = st.date_input("Hasta:", value=date.today() + timedelta(days=14), key="proyeccion_hasta")
+        
+        proyeccion = db.execute_query(
+            "SELECT * FROM fn_proyeccion_repuestos(%s, %s, %s)",
+            (proyeccion_desde, proyeccion_hasta, sede_id)
+        )
+        
+        if proyeccion:
+            faltantes = [p for p in proyeccion if p['faltante'] > 0]
+            if faltantes:
+                st.warning(f"⚠️ {len(faltantes)} items no alcanzan para las citas agendadas")
+            
+            with perfilado.fase('dataframes', 'proyección de repuestos'):
+                df_proyeccion = pd.DataFrame(proyeccion)[['nombre', 'categoria', 'requerido', 'cantidad_actual', 'faltante', 'primera_fecha']]
+            st.dataframe(
+                df_proyeccion,
+                column_config={
+                    'nombre': 'Item',
+                    'categoria': 'Categoría',
+                    'requerido': 'Requerido',
+                    'cantidad_actual': 'Stock Actual',
+                    'faltante': 'Faltante',
+                    'primera_fecha': 'Primera Cita'
+                },
+                hide_index=True,
+                use_container_width=True
+            )
+        else:
+            st.info("Las citas agendadas en el periodo no requieren repuestos.")
+
+@st.fragment
+def panel_dashboard():
+    """Métricas principales y distribución de citas"""
+    import pandas as pd
+    import plotly.express as px
+    st.subheader("Dashboard")
+    
+    today = date.today()
+    
+    # Métricas principales: consultas independientes en paralelo
+    tablero = consultar_en_paralelo(reportes.consultas_dashboard(today))
+    citas_hoy = tablero['citas_hoy']
+    citas_pendientes = tablero['citas_pendientes']
+    ingresos_mes = tablero['ingresos_mes']
+    
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("Citas Hoy", citas_hoy[0]['total'] if citas_hoy else 0)
+    with col2:
+        st.metric("Citas Pendientes", citas_pendientes[0]['total'] if citas_pendientes else 0)
+    with col3:
+        st.metric("Ingresos del Mes", f"S/ {ingresos_mes[0]['total']:.2f}" if ingresos_mes else "S/ 0.00")
+    with col4:
+        st.metric("Stock Bajo", len(obtener_items_stock_bajo()), delta_color="inverse")
+    
+    # Gráfico de citas por estado
+    st.subheader("Citas por Estado (Últimos 30 días)")
+    
+    citas_estado = tablero['citas_estado']
+    
+    if citas_estado:
+        with perfilado.fase('dataframes', 'citas por estado'):
+            df_estado = pd.DataFrame(citas_estado)
+        with perfilado.fase('graficos', 'citas por estado'):
+            fig = px.pie(df_estado, values='cantidad', names='estado', title="Distribución de Citas por Estado")
+        st.plotly_chart(fig, use_container_width=True)
+    
+    enrutador = get_servicio_db().enrutador
+    if enrutador:
+        with st.expander("Réplicas de lectura"):
+            st.dataframe(pd.DataFrame(enrutador.estado()), use_container_width=True)
+
+def citas_del_dia(fecha: date) -> List[Dict]:
+    """Citas de la fecha desde el calendario en vivo; consulta la vista solo si no está listo"""
+    calendario = get_calendario()
+    if calendario.listo.is_set():
+        try:
+            return calendario.dia(fecha)[1]
+        except TallerError as e:
+            st.error(f"Error consultando el calendario: {e}")
+            return []
+    
+    return db.execute_query("""
+        SELECT id, hora_cita, estado, observaciones, cliente_nombre,
+               cliente_telefono, vehiculo_info, servicio_nombre, sede_id, sede_nombre
+        FROM vista_citas_completas
+        WHERE fecha_cita = %s
+        ORDER BY hora_cita
+    """, (fecha,), solo_lectura=True)
+
+def avisar_cambios_calendario(fecha: date, citas_dia: List[Dict]):
+    """Avisa a la sesión de las citas nuevas o que cambiaron de estado desde el último dibujo del día"""
+    anterior = st.session_state.get('_calendario_visto')
+    vistas = {cita['id']: cita['estado'] for cita in citas_dia}
+    st.session_state['_calendario_visto'] = (fecha, vistas)
+    if not anterior or anterior[0] != fecha:
+        return
+    
+    for cita in citas_dia:
+        estado_anterior = anterior[1].get(cita['id'])
+        if estado_anterior is None:
+            st.toast(f"Nueva cita {cita['hora_cita']:%H:%M}: {cita['cliente_nombre']}", icon="📅")
+        elif estado_anterior != cita['estado']:
+            st.toast(f"Cita {cita['hora_cita']:%H:%M} de {cita['cliente_nombre']}: {cita['estado']}")
+
+@st.fragment(run_every=CALENDARIO_REFRESCO_SEGUNDOS)
+def panel_calendario():
+    """Citas de la fecha elegida; se redibuja sola con los cambios del calendario en vivo"""
+    st.subheader("Calendario de Citas")
+    
+    col_fecha, col_sede = st.columns(2)
+    with col_fecha:
+        fecha_seleccionada = st.date_input("Seleccionar fecha:", value=date.today(), key='calendario_fecha')
+    with col_sede:
+        sede_id = selector_sede("Sede:", key='calendario_sede', incluir_todas=True)
+    
+    # El calendario en vivo guarda el día completo; la sede se filtra en memoria
+    citas_dia = [cita for cita in citas_del_dia(fecha_seleccionada) or [] if sede_id is None or cita['sede_id'] == sede_id]
+    avisar_cambios_calendario(fecha_seleccionada, citas_dia)
+    
+    if citas_dia:
+        st.write(f"**{len(citas_dia)} citas programadas para {fecha_seleccionada}**")
+        
+        for cita in citas_dia:
+            with st.container():
+                col1, col2, col3, col4 = st.columns([1, 2, 2, 1])
+                
+                with col1:
+                    st.write(f"**{cita['hora_cita']}**")
+                    st.caption(cita['sede_nombre'])
+                
+                with col2:
+                    st.write(f"**{cita['cliente_nombre']}**")
+                    st.caption(f"Tel: {cita['cliente_telefono']}")
+                
+                with col3:
+                    st.write(f"{cita['servicio_nombre']}")
+                    st.caption(f"{cita['vehiculo_info']}")
+                
+                with col4:
+                    color = {
+                        'pendiente': '🟡',
+                        'confirmada': '🟢', 
+                        'completada': '✅',
+                        'cancelada': '❌'
+                    }.get(cita['estado'], '⚪')
+                    st.write(f"{color} {cita['estado'].title()}")
+                
+                st.markdown("---")
+    else:
+        st.info(f"No hay citas programadas para {fecha_seleccionada}")
+
+def tabla_asignacion(asignaciones: List[Dict], fecha: date):
+    """Asignaciones con cliente, servicio y vehículo tomados del calendario del día"""
+    import pandas as pd
+    citas = {cita['id']: cita for cita in citas_del_dia(fecha) or []}
+    filas = []
+    for asignacion in asignaciones:
+        cita = citas.get(asignacion['cita_id'], {})
+        filas.append({
+            'Inicio': f"{asignacion['inicio']:%H:%M}",
+            'Fin': f"{asignacion['fin']:%H:%M}",
+            'Técnico': asignacion['tecnico_nombre'],
+            'Puesto': asignacion['puesto'],
+            'Cita': asignacion['cita_id'],
+            'Cliente': cita.get('cliente_nombre'),
+            'Servicio': cita.get('servicio_nombre'),
+            'Vehículo': cita.get('vehiculo_info'),
+            **({'Espera (min)': asignacion['espera']} if 'espera' in asignacion else {})
+        })
+    return pd.DataFrame(filas)
+
+@st.fragment
+def panel_asignacion():
+    """Técnico y puesto de cada cita del día: plan propuesto por taller.asignacion o el ya guardado"""
+    st.subheader("Asignación de Técnicos")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        fecha = st.date_input("Fecha:", value=date.today(), key='asignacion_fecha')
+    with col2:
+        sede_id = selector_sede("Sede:", key='asignacion_sede')
+    with col3:
+        modo = st.radio("Modo:", ['Rápido', 'Exacto'], horizontal=True, key='asignacion_modo',
+                        help=f"El exacto busca el mejor plan en días de hasta {servicio_asignacion.MAX_EXACTO} citas")
+    
+    if st.button("Calcular asignación", type="primary"):
+        try:
+            plan = servicio_asignacion.planificar_dia(db.pool, fecha, sede_id, exacto=modo == 'Exacto')
+            st.session_state._plan_asignacion = (fecha, sede_id, plan)
+        except TallerError as e:
+            st.error(f"No se pudo calcular la asignación: {e}")
+    
+    propuesta = st.session_state.get('_plan_asignacion')
+    if propuesta and propuesta[:2] == (fecha, sede_id):
+        plan = propuesta[2]
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Citas asignadas", len(plan['asignaciones']))
+        with col2:
+            st.metric("Espera de clientes", f"{plan['espera']} min")
+        with col3:
+            st.metric("Ocio entre trabajos", f"{plan['ocio']} min")
+        with col4:
+            st.metric("Horas extra", f"{plan['extra']} min")
+        
+        detalle = "óptimo" if plan['optimo'] else "mejor plan encontrado en el tiempo límite" if plan['exacto'] else "voraz"
+        st.caption(f"Plan {detalle}, calculado en {plan['milisegundos']:.1f} ms")
+        if plan['sin_asignar']:
+            st.warning(f"Ningún técnico de la sede sabe hacer el servicio de las citas: "
+                       f"{', '.join(f'#{cita_id}' for cita_id in plan['sin_asignar'])}")
+        
+        if plan['asignaciones']:
+            st.dataframe(tabla_asignacion(plan['asignaciones'], fecha), hide_index=True, use_container_width=True)
+            if st.button("Guardar asignación"):
+                try:
+                    total = servicio_asignacion.guardar_plan(db.pool, fecha, sede_id, plan['asignaciones'])
+                    del st.session_state._plan_asignacion
+                    st.success(f"Asignación guardada para {total} citas")
+                except TallerError as e:
+                    st.error(f"Error guardando la asignación: {e}")
+        else:
+            st.info("No hay citas pendientes o confirmadas para asignar ese día")
+        return
+    
+    try:
+        guardado = servicio_asignacion.plan_guardado(db.pool, fecha, sede_id)
+    except TallerError as e:
+        st.error(f"Error consultando la asignación: {e}")
+        guardado = []
+    if guardado:
+        st.caption(f"Asignación guardada el {max(a['asignado_en'] for a in guardado):%d/%m %H:%M}")
+        st.dataframe(tabla_asignacion(guardado, fecha), hide_index=True, use_container_width=True)
+    else:
+        st.info("Sin asignación guardada para este día")
+
+@st.fragment
+def tarjeta_cita_admin(cita: Dict):
+    """Tarjeta de una cita del panel; cambiar su estado solo redibuja esta tarjeta"""
+    cita = cita_vigente(cita)
+    with st.expander(f"#{cita['id']} - {cita['cliente_nombre']} - {cita['fecha_cita']} {cita['hora_cita']}"):
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.write(f"**Cliente:** {cita['cliente_nombre']}")
+            st.write(f"**Teléfono:** {cita['cliente_telefono']}")
+            st.write(f"**Vehículo:** {cita['vehiculo_info']}")
+        
+        with col2:
+            st.write(f"**Servicio:** {cita['servicio_nombre']}")
+            st.write(f"**Precio:** S/ {cita['servicio_precio']:.2f}")
+            st.write(f"**Estado:** {cita['estado'].title()}")
+            st.write(f"**Sede:** {cita['sede_nombre']}")
+        
+        if cita['observaciones']:
+            st.write(f"**Observaciones:** {cita['observaciones']}")
+        
+        # Botones de cambio de estado
+        botones = [
+            ('pendiente', "Marcar Pendiente", 'pend'),
+            ('confirmada', "Confirmar", 'conf'),
+            ('completada', "Completar", 'comp'),
+            ('cancelada', "Cancelar", 'canc'),
+        ]
+        
+        for col_btn, (estado, etiqueta, prefijo) in zip(st.columns(4), botones):
+            if estado in servicio_citas.TRANSICIONES[cita['estado']]:
+                with col_btn:
+                    st.button(etiqueta, key=f"{prefijo}_{cita['id']}", on_click=cambiar_estado_en_tarjeta,
+                              args=(cita['id'], estado, "Estado actualizado"))
+        
+        # El historial solo se consulta al abrirlo
+        if st.toggle("Ver historial", key=f"hist_{cita['id']}"):
+            try:
+                historial = servicio_citas.historial_cita(db.pool, cita['id'])
+            except TallerError as e:
+                st.error(f"Error consultando el historial: {e}")
+                historial = []
+            for cambio in historial:
+                desde = cambio['estado_anterior'].title() if cambio['estado_anterior'] else "Creada"
+                duracion = f" · {formato_duracion(cambio['duracion'])} en este estado" if cambio['duracion'] else ""
+                usuario = f" · {cambio['usuario']}" if cambio['usuario'] else ""
+                st.caption(f"{cambio['cambiado_en']:%d/%m/%Y %H:%M} — {desde} → {cambio['estado'].title()}{usuario}{duracion}")
+        
+        mostrar_aviso_cita(cita['id'])
+
+@st.fragment
+def panel_citas():
+    """Gestión de citas con filtros, cambios de estado y completado en lote"""
+    st.subheader("Gestión de Citas")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        estado_filtro = st.selectbox("Estado:", ['Todos', 'pendiente', 'confirmada', 'completada', 'cancelada'])
+    
+    with col2:
+        fecha_desde = st.date_input("Desde:", value=date.today() - timedelta(days=7))
+    
+    with col3:
+        fecha_hasta = st.date_input("Hasta:", value=date.today() + timedelta(days=7))
+    
+    with col4:
+        sede_filtro = selector_sede("Sede:", key='citas_sede', incluir_todas=True)
+    
+    # Consulta con filtros
+    query = """
+        SELECT id, fecha_cita, hora_cita, estado, observaciones, cliente_nombre,
+               cliente_telefono, vehiculo_info, servicio_nombre, servicio_precio, sede_id, sede_nombre
+        FROM vista_citas_completas
+        WHERE fecha_cita BETWEEN %s AND %s
+    """
+    params = [fecha_desde, fecha_hasta]
+    
+    if estado_filtro != 'Todos':
+        query += " AND estado = %s"
+        params.append(estado_filtro)
+    
+    if sede_filtro is not None:
+        query += " AND sede_id = %s"
+        params.append(sede_filtro)
+    
+    query += " ORDER BY fecha_cita DESC, hora_cita"
+    
+    citas_filtradas = db.execute_query(query, tuple(params))
+    olvidar_citas_actualizadas()
+    
+    # Completar varias citas en una sola transacción (descuenta sus repuestos)
+    completables = {
+        f"#{c['id']} - {c['cliente_nombre']} - {c['servicio_nombre']}": c['id']
+        for c in (citas_filtradas or []) if c['estado'] in ('pendiente', 'confirmada')
+    }
+    if completables:
+        col_sel, col_btn = st.columns([3, 1])
+        with col_sel:
+            seleccionadas = st.multiselect("Completar en lote:", options=list(completables.keys()))
+        with col_btn:
+            if st.button("Completar seleccionadas", disabled=not seleccionadas, use_container_width=True):
+                try:
+                    total = servicio_citas.completar_citas(
+                        db.pool, [completables[k] for k in seleccionadas], st.session_state.get('username')
+                    )
+                    st.toast(f"{total} citas completadas")
+                    st.rerun(scope="fragment")
+                except TallerError as e:
+                    st.error(f"Error completando citas: {e}")
+    
+    if citas_filtradas:
+        for cita in citas_filtradas:
+            tarjeta_cita_admin(cita)
+    else:
+        st.info("No se encontraron citas con los filtros seleccionados.")
+
+@st.fragment
+def panel_vehiculos():
+    """Ficha e historial de servicio de un vehículo buscado por placa"""
+    import pandas as pd
+    st.subheader("Historial por Vehículo")
+    
+    placa = st.text_input("Placa:", key='vehiculo_placa', placeholder="ABC-123")
+    if not placa.strip():
+        st.info("Ingrese una placa para ver el historial del vehículo.")
+        return
+    
+    try:
+        ficha = servicio_vehiculos.ficha_vehiculo(db.pool, placa)
+        historial = servicio_vehiculos.historial_vehiculo(db.pool, ficha['id'])
+    except NoEncontrado:
+        st.warning(f"No hay ningún vehículo con placa {placa.strip()}.")
+        return
+    except TallerError as e:
+        st.error(f"Error consultando el vehículo: {e}")
+        return
+    
+    st.markdown(f"### 🚗 {ficha['marca']} {ficha['modelo']} ({ficha['placa']})")
+    st.caption(f"{ficha['cliente_nombre']} · Tel: {ficha['cliente_telefono']}")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Visitas", ficha['visitas'])
+    with col2:
+        st.metric("Gasto total", f"S/ {ficha['gasto_total']:.2f}")
+    with col3:
+        st.metric("Última visita", f"{ficha['ultima_visita']:%d/%m/%Y}" if ficha['ultima_visita'] else "-")
+    
+    st.markdown("#### Último servicio por tipo")
+    if ficha['ultimos_servicios']:
+        st.dataframe(
+            pd.DataFrame(ficha['ultimos_servicios'])[['servicio_nombre', 'ultima_fecha', 'veces']],
+            column_config={
+                'servicio_nombre': 'Servicio',
+                'ultima_fecha': st.column_config.DateColumn('Última vez', format="DD/MM/YYYY"),
+                'veces': 'Veces'
+            },
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.caption("El vehículo aún no tiene servicios completados.")
+    
+    st.markdown("#### Citas")
+    if historial:
+        st.dataframe(
+            pd.DataFrame(historial)[['fecha_cita', 'hora_cita', 'servicio_nombre', 'estado', 'servicio_precio']],
+            column_config={
+                'fecha_cita': st.column_config.DateColumn('Fecha', format="DD/MM/YYYY"),
+                'hora_cita': 'Hora',
+                'servicio_nombre': 'Servicio',
+                'estado': 'Estado',
+                'servicio_precio': st.column_config.NumberColumn('Precio (S/)', format="S/ %.2f")
+            },
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.caption("El vehículo no tiene citas registradas.")
+
+@st.fragment
+def panel_mantenimiento():
+    """Lista de mantenimientos por vencer precalculada por taller.mantenimiento, paginada"""
+    import pandas as pd
+    st.subheader("Mantenimientos por Vencer")
+    
+    try:
+        resumen = servicio_vehiculos.resumen_mantenimiento(db.pool)
+    except TallerError as e:
+        st.error(f"Error consultando los mantenimientos: {e}")
+        return
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("En la lista", resumen['total'])
+    with col2:
+        st.metric("Vencidos", resumen['vencidos'])
+    with col3:
+        st.metric("Calculado", f"{resumen['calculado_en']:%d/%m %H:%M}" if resumen['calculado_en'] else "-")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        estado = st.selectbox("Mostrar:", ['Todos', *servicio_vehiculos.ESTADOS_MANTENIMIENTO], key='mantenimiento_estado')
+    with col2:
+        tamano_pagina = st.selectbox("Filas por página:", [25, 50, 100], key='mantenimiento_tamano')
+    
+    # Cantidad de filas del filtro desde el resumen, sin contar de nuevo
+    total_filtrado = {
+        'Todos': resumen['total'],
+        'Vencidos': resumen['vencidos'],
+        'Próximos': resumen['total'] - resumen['vencidos']
+    }[estado]
+    total_paginas = max((total_filtrado + tamano_pagina - 1) // tamano_pagina, 1)
+    pagina = st.number_input(f"Página (de {total_paginas}):", min_value=1, max_value=total_paginas, value=1,
+                             key='mantenimiento_pagina')
+    
+    try:
+        pendientes = servicio_vehiculos.pagina_mantenimiento(
+            db.pool,
+            estado=None if estado == 'Todos' else estado,
+            limite=tamano_pagina,
+            desplazamiento=(pagina - 1) * tamano_pagina
+        )
+    except TallerError as e:
+        st.error(f"Error consultando los mantenimientos: {e}")
+        pendientes = []
+    
+    if pendientes:
+        st.dataframe(
+            pd.DataFrame(pendientes)[['placa', 'marca', 'modelo', 'cliente_nombre', 'cliente_telefono',
+                                      'servicio_nombre', 'ultima_fecha', 'proxima_fecha', 'dias_atraso']],
+            column_config={
+                'placa': 'Placa',
+                'marca': 'Marca',
+                'modelo': 'Modelo',
+                'cliente_nombre': 'Cliente',
+                'cliente_telefono': 'Teléfono',
+                'servicio_nombre': 'Servicio',
+                'ultima_fecha': st.column_config.DateColumn('Última vez', format="DD/MM/YYYY"),
+                'proxima_fecha': st.column_config.DateColumn('Le toca', format="DD/MM/YYYY"),
+                'dias_atraso': 'Días de atraso'
+            },
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.info("No hay mantenimientos por vencer con ese filtro")
+    
+    # El cálculo recorre toda la flota: lo ejecuta un trabajador de la cola de tareas (cada noche a las 2:30)
+    if st.button("🔄 Recalcular mantenimientos"):
+        tarea_id = encolar_tarea('mantenimiento')
+        if tarea_id:
+            st.success(f"Cálculo encolado (tarea #{tarea_id}); la lista se actualizará en segundo plano")
+
+@st.fragment
+def panel_reportes():
+    """Ingresos mensuales, servicios más solicitados y tiempos del ciclo de las citas"""
+    import pandas as pd
+    import plotly.express as px
+    st.subheader("Reportes")
+    
+    # Todos los reportes se consultan en paralelo
+    datos_reportes = consultar_en_paralelo(reportes.consultas_reportes(date.today()))
+    
+    # Reporte de ingresos
+    st.markdown("### 💰 Ingresos por Mes")
+    
+    ingresos_mensuales = datos_reportes['ingresos_mensuales']
+    
+    if ingresos_mensuales:
+        with perfilado.fase('dataframes', 'ingresos mensuales'):
+            df_ingresos = pd.DataFrame(ingresos_mensuales)
+        
+        with perfilado.fase('graficos', 'ingresos mensuales'):
+            fig_ingresos = px.bar(
+                df_ingresos, 
+                x='mes', 
+                y='total_ingresos', 
+                title="Ingresos Mensuales",
+                labels={'total_ingresos': 'Ingresos (S/)', 'mes': 'Mes'}
+            )
+        st.plotly_chart(fig_ingresos, use_container_width=True)
+    
+    # Reporte de servicios más solicitados
+    st.markdown("### 🔧 Servicios Más Solicitados")
+    
+    servicios_populares = datos_reportes['servicios_populares']
+    
+    if servicios_populares:
+        with perfilado.fase('dataframes', 'servicios más solicitados'):
+            df_servicios = pd.DataFrame(servicios_populares)
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            with perfilado.fase('graficos', 'servicios más solicitados'):
+                fig_servicios = px.bar(
+                    df_servicios, 
+                    x='cantidad_citas', 
+                    y='nombre', 
+                    orientation='h',
+                    title="Cantidad de Citas por Servicio"
+                )
+            st.plotly_chart(fig_servicios, use_container_width=True)
+        
+        with col2:
+            st.dataframe(
+                df_servicios[['nombre', 'cantidad_citas', 'ingresos_totales']],
+                column_config={
+                    'nombre': 'Servicio',
+                    'cantidad_citas': 'Citas',
+                    'ingresos_totales': st.column_config.NumberColumn(
+                        'Ingresos (S/)',
+                        format="S/ %.2f"
+                    )
+                },
+                hide_index=True,
+                use_container_width=True
+            )
+    
+    # Embudo y tiempos del ciclo de las citas (desde citas_historial)
+    st.markdown("### ⏱️ Ciclo de las Citas")
+    
+    embudo = datos_reportes['embudo_diario']
+    
+    if embudo:
+        with perfilado.fase('dataframes', 'embudo de citas'):
+            df_embudo = pd.DataFrame(embudo)
+        
+        creadas = int(df_embudo['creadas'].sum())
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Citas creadas (30 días)", creadas)
+        with col2:
+            st.metric("Tasa de confirmación", f"{df_embudo['confirmadas'].sum() / creadas:.0%}" if creadas else "-")
+        with col3:
+            st.metric("Tasa de cancelación", f"{df_embudo['canceladas'].sum() / creadas:.0%}" if creadas else "-")
+        
+        with perfilado.fase('graficos', 'embudo de citas'):
+            fig_embudo = px.bar(
+                df_embudo.melt(id_vars='dia', var_name='cambio', value_name='citas'),
+                x='dia',
+                y='citas',
+                color='cambio',
+                barmode='group',
+                title="Cambios de Estado por Día",
+                labels={'dia': 'Día', 'citas': 'Citas', 'cambio': 'Cambio'}
+            )
+        st.plotly_chart(fig_embudo, use_container_width=True)
+    
+    tiempo_en_estado = datos_reportes['tiempo_en_estado']
+    
+    if tiempo_en_estado:
+        st.dataframe(
+            pd.DataFrame(tiempo_en_estado),
+            column_config={
+                'estado': 'Estado',
+                'tramos': 'Citas',
+                'p50_horas': st.column_config.NumberColumn('Mediana (h)', format="%.1f"),
+                'p90_horas': st.column_config.NumberColumn('P90 (h)', format="%.1f"),
+                'p99_horas': st.column_config.NumberColumn('P99 (h)', format="%.1f")
+            },
+            hide_index=True,
+            use_container_width=True
+        )
+        st.caption("Tiempo que las citas pasan en cada estado antes de cambiar (últimos 90 días).")
+
+@st.fragment
+def panel_tareas():
+    """Estado de la cola de tareas en segundo plano y de las tareas programadas"""
+    import pandas as pd
+    st.subheader("Tareas en Segundo Plano")
+    
+    cola = get_cola_tareas()
+    try:
+        resumen = cola.resumen()
+        programas = cola.programas()
+    except TallerError as e:
+        metricas.errores_interfaz.inc(origen='tareas')
+        st.error(f"Error consultando la cola de tareas: {e}")
+        return
+    
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Pendientes", resumen['pendiente']['total'])
+    col2.metric("En curso", resumen['en_curso']['total'])
+    col3.metric("Completadas", resumen['completada']['total'])
+    col4.metric("Fallidas", resumen['fallida']['total'])
+    
+    mas_antigua = resumen['pendiente']['mas_antigua']
+    if mas_antigua and datetime.now() - mas_antigua > timedelta(minutes=5):
+        st.warning(
+            f"Hay tareas pendientes desde {mas_antigua:%d/%m %H:%M}: verifique que haya un "
+            "trabajador activo (python -m taller.tareas o TALLER_TAREAS_EN_PROCESO)"
+        )
+    if TAREAS_EN_PROCESO:
+        st.caption(f"Este proceso ejecuta tareas con {TAREAS_EN_PROCESO} hilos")
+    
+    st.markdown("### ⏰ Programadas")
+    
+    if programas:
+        st.dataframe(
+            pd.DataFrame(programas),
+            column_config={
+                'nombre': 'Tarea',
+                'tipo': 'Tipo',
+                'cron': 'Cron',
+                'activa': 'Activa',
+                'proxima_ejecucion': st.column_config.DatetimeColumn('Próxima', format="DD/MM HH:mm"),
+                'ultima_ejecucion': st.column_config.DatetimeColumn('Última', format="DD/MM HH:mm")
+            },
+            hide_index=True,
+            use_container_width=True
+        )
+        
+        col_sel, col_ejecutar, col_activar = st.columns([2, 1, 1])
+        with col_sel:
+            programa = st.selectbox("Tarea programada:", programas, format_func=lambda p: p['nombre'])
+        with col_ejecutar:
+            if st.button("Ejecutar ahora", use_container_width=True):
+                try:
+                    tarea_id = cola.ejecutar_programa(programa['nombre'])
+                    st.toast(f"Tarea #{tarea_id} encolada")
+                    st.rerun(scope="fragment")
+                except TallerError as e:
+                    st.error(f"Error encolando la tarea: {e}")
+        with col_activar:
+            if st.button("Pausar" if programa['activa'] else "Reanudar", use_container_width=True):
+                try:
+                    cola.activar_programa(programa['nombre'], not programa['activa'])
+                    st.rerun(scope="fragment")
+                except TallerError as e:
+                    st.error(f"Error actualizando la tarea programada: {e}")
+    else:
+        st.info("Sin tareas programadas: se registran al iniciar el primer trabajador")
+    
+    st.markdown("### 📨 Recordatorios de Mañana")
+    
+    manana = date.today() + timedelta(days=1)
+    try:
+        envios = servicio_recordatorios.resumen(db.pool, manana)
+    except TallerError as e:
+        st.error(f"Error consultando los recordatorios: {e}")
+    else:
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Enviados", envios['enviado'])
+        col2.metric("Fallidos", envios['fallido'])
+        col3.metric("En envío", envios['enviando'])
+        st.caption(f"Citas confirmadas del {manana:%d/%m/%Y}; la tarea 'recordatorios' los envía a las 18:00")
+    
+    st.markdown("### 📋 Recientes")
+    
+    estado = st.selectbox("Estado:", ['Todos', *servicio_tareas.ESTADOS_TAREA], key='tareas_estado')
+    try:
+        recientes = cola.listar(None if estado == 'Todos' else estado, limite=100)
+    except TallerError as e:
+        st.error(f"Error consultando la cola de tareas: {e}")
+        return
+    
+    if not recientes:
+        st.info("No hay tareas con ese estado")
+        return
+    
+    with perfilado.fase('dataframes', 'tareas recientes'):
+        df_tareas = pd.DataFrame([
+            dict(t, resultado=json.dumps(t['resultado'], ensure_ascii=False, default=str) if t['resultado'] is not None else '')
+            for t in recientes
+        ])
+    st.dataframe(
+        df_tareas[['id', 'tipo', 'estado', 'intentos', 'max_intentos', 'programa', 'ejecutar_en',
+                   'terminada_en', 'resultado', 'ultimo_error']],
+        hide_index=True,
+        use_container_width=True
+    )
+    
+    fallidas = [t['id'] for t in recientes if t['estado'] == 'fallida']
+    if fallidas:
+        col_sel, col_btn = st.columns([3, 1])
+        with col_sel:
+            tarea_id = st.selectbox("Tarea fallida:", fallidas, format_func=lambda i: f"#{i}")
+        with col_btn:
+            if st.button("Reintentar", use_container_width=True):
+                try:
+                    cola.reintentar(tarea_id)
+                    st.toast(f"Tarea #{tarea_id} reintentada")
+                    st.rerun(scope="fragment")
+                except TallerError as e:
+                    st.error(f"Error reintentando la tarea: {e}")
+
+def show_admin_panel():
+    """Panel administrativo
+
+    Cada pestaña es un fragmento que carga sus propios datos: interactuar con
+    una pestaña solo vuelve a ejecutar esa pestaña, no las consultas y
+    gráficos de las demás.
+    """
+    st.title("👨‍💼 Panel Administrativo")
+    
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["Dashboard", "Calendario", "Citas", "Vehículos", "Reportes", "Tareas"])
+    
+    with tab1:
+        panel_dashboard()
+    
+    with tab2:
+        panel_calendario()
+        st.divider()
+        panel_asignacion()
+    
+    with tab3:
+        panel_citas()
+    
+    with tab4:
+        panel_mantenimiento()
+        st.divider()
+        panel_vehiculos()
+    
+    with tab5:
+        panel_reportes()
+    
+    with tab6:
+        panel_tareas()
+
+def show_login_page():
+    """Página de login"""
+    st.title("🔐 Acceso Administrativo")
+    
+    with st.form("login_form"):
+        st.markdown("### Iniciar Sesión")
+        
+        username = st.text_input("Usuario:")
+        password = st.text_input("Contraseña:", type="password")
+        
+        submitted = st.form_submit_button("Iniciar Sesión", type="primary")
+        
+        if submitted:
+            if authenticate_user(username, password):
+                st.session_state.authenticated = True
+                st.session_state.username = username
+                st.success("¡Bienvenido al panel administrativo!")
+                st.rerun()
+            else:
+                st.error("Usuario o contraseña incorrectos")
+
+def mostrar_alertas_stock():
+    """Muestra a la sesión administrativa las alertas de stock bajo recibidas"""
+    listener = get_stock_listener()
+    listener.suscribir(st.session_state.sesion_id)
+    
+    alertas = listener.obtener_alertas(st.session_state.sesion_id)
+    if not alertas:
+        return
+    
+    nombres_sede = {sede['id']: sede['nombre'] for sede in obtener_sedes()}
+    for alerta in alertas:
+        st.toast(
+            f"Stock bajo en {nombres_sede.get(alerta['sede_id'], 'otra sede')}: "
+            f"{alerta['nombre']} ({alerta['cantidad_actual']}/{alerta['cantidad_minima']})",
+            icon="⚠️"
+        )
+
+def guardar_perfil(perfil: perfilado.Perfil):
+    """Conserva los últimos perfiles de la sesión y los exporta si hay carpeta configurada"""
+    st.session_state.setdefault('_perfiles', deque(maxlen=MAX_PERFILES)).append(perfil)
+    if PERFILADO_DIR:
+        perfilado.exportar(perfil, PERFILADO_DIR)
+
+def mostrar_perfil():
+    """Desglose por fases de la última ejecución de la página, en la barra lateral"""
+    perfiles = list(st.session_state.get('_perfiles', []))
+    if not perfiles:
+        return
+    perfil = perfiles[-1]
+    total_ms = perfil.duracion * 1000
+    
+    with st.sidebar.expander(f"⏱️ Perfil: {perfil.nombre} ({total_ms:.0f} ms)", expanded=True):
+        filas = ["| Fase | ms | % |", "|---|---:|---:|"]
+        for fase, segundos in perfil.desglose().items():
+            filas.append(f"| {fase} | {segundos * 1000:.1f} | {segundos * 100 / perfil.duracion:.0f} |")
+        st.markdown("\n".join(filas))
+        
+        lentos = [evento for evento in perfil.mas_lentos(5) if evento[2] * 1000 >= 1]
+        if lentos:
+            st.markdown("**Más lentos:**\n" + "\n".join(
+                f"- {fase} · {segundos * 1000:.1f} ms · `{etiqueta}`" for fase, etiqueta, segundos in lentos
+            ))
+        
+        misma_pagina = sorted(p.duracion for p in perfiles if p.nombre == perfil.nombre)
+        if len(misma_pagina) > 1:
+            st.caption(f"{len(misma_pagina)} ejecuciones de esta página: p50 {misma_pagina[len(misma_pagina) // 2] * 1000:.0f} ms")
+        st.caption("Los fragmentos que se vuelven a ejecutar por sí solos no se registran.")
+        
+        st.download_button(
+            "Descargar trazas (JSON)",
+            perfilado.traza_chrome(perfiles),
+            file_name="perfil_taller.json",
+            mime="application/json",
+            help="Formato Trace Event: abrir en chrome://tracing o ui.perfetto.dev"
+        )
+        if perfil.cprofile:
+            st.download_button(
+                "Descargar cProfile (.prof)",
+                perfil.volcado_cprofile(),
+                file_name=f"perfil_{perfil.nombre}.prof",
+                help="Estadísticas de pstats: abrir con snakeviz o python -m pstats"
+            )
+            st.code(perfil.resumen_cprofile(15), language=None)
+
+def main():
+    """Función principal de la aplicación"""
+    
+    # Inicializar estado de sesión
+    if 'authenticated' not in st.session_state:
+        st.session_state.authenticated = False
+    if 'current_page' not in st.session_state:
+        st.session_state.current_page = 'home'
+    if 'sesion_id' not in st.session_state:
+        st.session_state.sesion_id = uuid.uuid4().hex
+    # Lectura tras escritura: tras guardar, la sesión lee del primario un rato
+    usar_sesion(st.session_state.setdefault('_db_sesion', {}))
+    get_escucha_catalogo()
+    get_servidor_metricas()
+    get_trabajador_tareas()
+    metricas.sesiones.registrar(st.session_state.sesion_id)
+    
+    # Sidebar de navegación
+    with st.sidebar:
+        st.title("🔧 Taller AutoMax")
+        st.markdown("---")
+        
+        # Navegación principal
+        paginas = ['home', 'services', 'citas', 'inventory']
+        page = st.radio(
+            "Navegación:",
+            options=paginas,
+            format_func=lambda x: {
+                'home': '🏠 Inicio',
+                'services': '🛠️ Servicios', 
+                'citas': '📅 Citas',
+                'inventory': '📦 Inventario'
+            }[x],
+            index=paginas.index(st.session_state.current_page) if st.session_state.current_page in paginas else 0
+        )
+        
+        if st.session_state.current_page in paginas:
+            st.session_state.current_page = page
+        
+        st.markdown("---")
+        
+        # Panel administrativo
+        if st.session_state.authenticated:
+            if st.button("👨‍💼 Panel Administrativo", use_container_width=True):
+                st.session_state.current_page = 'admin'
+                st.rerun()
+            
+            if st.button("🚪 Cerrar Sesión", use_container_width=True):
+                get_stock_listener().desuscribir(st.session_state.sesion_id)
+                st.session_state.authenticated = False
+                st.session_state.current_page = 'home'
+                st.rerun()
+            
+            st.success(f"Sesión activa: {st.session_state.username}")
+            
+            st.checkbox("⏱️ Perfilar páginas", value=PERFILADO, key='perfilado')
+            if st.session_state.perfilado:
+                st.checkbox("Incluir cProfile", key='perfilado_cprofile')
+        else:
+            if st.button("🔐 Acceso Administrativo", use_container_width=True):
+                st.session_state.current_page = 'login'
+                st.rerun()
+        
+        st.markdown("---")
+        st.markdown("### 📞 Contacto")
+        st.info("""
+        **Teléfono:**  
+        (01) 234-5678
+        
+        **Email:**  
+        info@tallerautomax.com
+        
+        **Horario:**  
+        Lun-Vie: 8AM-6PM  
+        Sáb: 8AM-2PM
+        """)
+    
+    if st.session_state.authenticated:
+        mostrar_alertas_stock()
+    
+    # Perfilado opcional de la página (TALLER_PERFILADO o casilla del panel)
+    pagina_actual = st.session_state.current_page
+    perfilando = st.session_state.get('perfilado', PERFILADO)
+    if perfilando:
+        perfilado.iniciar(pagina_actual, st.session_state.get('perfilado_cprofile', False))
+    inicio = time.perf_counter()
+    try:
+        mostrar_pagina_actual()
+    finally:
+        metricas.paginas.inc(pagina=pagina_actual)
+        metricas.pagina_duracion.observar(time.perf_counter() - inicio, pagina=pagina_actual)
+        if perfilando:
+            guardar_perfil(perfilado.terminar())
+    
+    if perfilando:
+        mostrar_perfil()
+
+def mostrar_pagina_actual():
+    """Contenido principal según la página seleccionada"""
+    if st.session_state.current_page == 'home':
+        show_home_page()
+    elif st.session_state.current_page == 'services':
+        show_services_page()
+    elif st.session_state.current_page == 'citas':
+        show_appointments_page()
+    elif st.session_state.current_page == 'inventory':
+        show_inventory_page()
+    elif st.session_state.current_page == 'login':
+        show_login_page()
+    elif st.session_state.current_page == 'admin':
+        if st.session_state.authenticated:
+            show_admin_panel()
+        else:
+            st.warning("Debes iniciar sesión para acceder al panel administrativo.")
+            show_login_page()
+
+if __name__ == "__main__":
+    main()
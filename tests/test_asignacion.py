@@ -0,0 +1,93 @@
+"""Invariantes del plan de asignación sobre días sintéticos; no necesitan base de datos"""
+import random
+
+import pytest
+
+from taller import asignacion
+from taller.errores import DatosInvalidos
+
+DURACIONES = [30, 60, 90, 45, 20, 240, 60, 90, 75, 120]
+
+def dia(trabajos: int, tecnicos: int, semilla: int):
+    """Citas entre las 8:00 y las 17:30 y técnicos con tres o cuatro servicios cada uno"""
+    azar = random.Random(semilla)
+    servicios = list(range(1, len(DURACIONES) + 1))
+    plantel = [{
+        'id': numero, 'entrada': 8 * 60, 'salida': azar.choice([14, 18]) * 60,
+        'servicios': frozenset(azar.sample(servicios, azar.choice([3, 4])))
+    } for numero in range(1, tecnicos + 1)]
+    citas = []
+    for numero in range(1, trabajos + 1):
+        servicio = azar.choice(servicios)
+        citas.append({
+            'cita_id': numero, 'llegada': 8 * 60 + 30 * azar.randrange(20),
+            'duracion': DURACIONES[servicio - 1], 'servicio_id': servicio
+        })
+    return citas, plantel
+
+def sin_choques(intervalos):
+    intervalos = sorted(intervalos)
+    return all(fin <= inicio for (_, fin), (inicio, _) in zip(intervalos, intervalos[1:]))
+
+def verificar(plan, citas, plantel, puestos):
+    por_cita = {cita['cita_id']: cita for cita in citas}
+    por_tecnico = {tecnico['id']: tecnico for tecnico in plantel}
+    asignadas = [a['cita_id'] for a in plan['asignaciones']]
+    assert sorted(asignadas + plan['sin_asignar']) == sorted(por_cita)
+
+    for a in plan['asignaciones']:
+        cita = por_cita[a['cita_id']]
+        tecnico = por_tecnico[a['tecnico_id']]
+        assert cita['servicio_id'] in tecnico['servicios']
+        assert a['inicio'] >= max(cita['llegada'], tecnico['entrada'])
+        assert a['fin'] - a['inicio'] == cita['duracion']
+        assert a['espera'] == a['inicio'] - cita['llegada']
+        assert 1 <= a['puesto'] <= puestos
+    for cita_id in plan['sin_asignar']:
+        assert not any(por_cita[cita_id]['servicio_id'] in t['servicios'] for t in plantel)
+
+    for clave in ('tecnico_id', 'puesto'):
+        ocupacion = {}
+        for a in plan['asignaciones']:
+            ocupacion.setdefault(a[clave], []).append((a['inicio'], a['fin']))
+        assert all(sin_choques(intervalos) for intervalos in ocupacion.values())
+
+    costo = (asignacion.PESO_ESPERA * plan['espera'] + asignacion.PESO_OCIO * plan['ocio']
+             + asignacion.PESO_EXTRA * plan['extra'])
+    assert plan['costo'] == pytest.approx(costo)
+
+@pytest.mark.parametrize('semilla', range(20))
+@pytest.mark.parametrize('trabajos, tecnicos, puestos', [(8, 3, 2), (40, 5, 3), (150, 6, 2)])
+def test_plan_rapido_sin_choques(semilla, trabajos, tecnicos, puestos):
+    citas, plantel = dia(trabajos, tecnicos, semilla)
+    verificar(asignacion.asignar(citas, plantel, puestos), citas, plantel, puestos)
+
+@pytest.mark.parametrize('semilla', range(15))
+def test_plan_exacto_no_empeora_al_rapido(semilla):
+    citas, plantel = dia(8, 3, semilla)
+    rapido = asignacion.asignar(citas, plantel, 2)
+    exacto = asignacion.asignar(citas, plantel, 2, exacto=True)
+    verificar(exacto, citas, plantel, 2)
+    assert exacto['costo'] <= rapido['costo'] + 1e-9
+
+def test_un_puesto_obliga_a_turnarse():
+    citas = [{'cita_id': n, 'llegada': 8 * 60, 'duracion': 60, 'servicio_id': 1} for n in (1, 2)]
+    plantel = [{'id': n, 'entrada': 8 * 60, 'salida': 18 * 60, 'servicios': {1}} for n in (1, 2)]
+    for exacto in (False, True):
+        plan = asignacion.asignar(citas, plantel, 1, exacto=exacto)
+        assert [(a['inicio'], a['fin']) for a in plan['asignaciones']] == [(480, 540), (540, 600)]
+        assert plan['espera'] == 60
+
+def test_servicio_que_nadie_sabe_queda_sin_asignar():
+    citas = [{'cita_id': 7, 'llegada': 9 * 60, 'duracion': 30, 'servicio_id': 99}]
+    plantel = [{'id': 1, 'entrada': 8 * 60, 'salida': 18 * 60, 'servicios': {1}}]
+    plan = asignacion.asignar(citas, plantel, 1)
+    assert plan['asignaciones'] == [] and plan['sin_asignar'] == [7]
+
+def test_limites():
+    citas, plantel = dia(asignacion.MAX_EXACTO + 1, 3, 0)
+    plantel[0]['servicios'] = frozenset(range(1, len(DURACIONES) + 1))
+    with pytest.raises(DatosInvalidos):
+        asignacion.asignar(citas, plantel, 2, exacto=True)
+    with pytest.raises(DatosInvalidos):
+        asignacion.asignar(citas, plantel, 0)
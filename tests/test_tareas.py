@@ -0,0 +1,51 @@
+"""Expresiones cron de las tareas programadas; no necesitan base de datos"""
+from datetime import datetime
+
+import pytest
+
+from taller.errores import DatosInvalidos
+from taller.tareas import Cron, _campo_cron
+
+def test_campo_cron_listas_rangos_y_pasos():
+    assert _campo_cron('*/15', 0, 59) == [0, 15, 30, 45]
+    assert _campo_cron('8-18', 0, 23) == list(range(8, 19))
+    assert _campo_cron('8-18/4', 0, 23) == [8, 12, 16]
+    assert _campo_cron('1,15,1', 1, 31) == [1, 15]
+    assert _campo_cron('5/20', 0, 59) == [5, 25, 45]
+
+@pytest.mark.parametrize('texto', ['60', '*/0', '5-1', '0-7', 'x', '', '1,'])
+def test_campo_cron_invalido(texto):
+    with pytest.raises(DatosInvalidos):
+        _campo_cron(texto, 1, 6)
+
+def test_horario_de_oficina():
+    cron = Cron('*/15 8-18 * * 1-5')
+    assert cron.minutos == [0, 15, 30, 45]
+    assert cron.horas == list(range(8, 19))
+    assert cron.dias_semana == [1, 2, 3, 4, 5]
+    # Viernes 18:45 pasa al lunes 8:00
+    assert cron.siguiente(datetime(2026, 10, 16, 18, 45)) == datetime(2026, 10, 19, 8, 0)
+    assert cron.siguiente(datetime(2026, 10, 19, 8, 0, 30)) == datetime(2026, 10, 19, 8, 15)
+    assert cron.siguiente(datetime(2026, 10, 19, 7, 59)) == datetime(2026, 10, 19, 8, 0)
+
+def test_domingo_es_0_o_7():
+    assert Cron('0 3 * * 7').dias_semana == Cron('0 3 * * 0').dias_semana == [0]
+    assert Cron('0 3 * * 7').siguiente(datetime(2026, 10, 19)) == datetime(2026, 10, 25, 3, 0)
+
+def test_dia_del_mes_o_de_la_semana():
+    # Con ambos restringidos basta uno: el 1 del mes o cualquier lunes
+    cron = Cron('0 9 1 * 1')
+    assert cron.siguiente(datetime(2026, 10, 20)) == datetime(2026, 10, 26, 9, 0)
+    assert cron.siguiente(datetime(2026, 10, 27)) == datetime(2026, 11, 1, 9, 0)
+
+def test_29_de_febrero():
+    assert Cron('0 0 29 2 *').siguiente(datetime(2026, 3, 1)) == datetime(2028, 2, 29, 0, 0)
+
+def test_fecha_imposible():
+    with pytest.raises(DatosInvalidos):
+        Cron('0 0 31 2 *').siguiente(datetime(2026, 1, 1))
+
+@pytest.mark.parametrize('expresion', ['* * * *', '* * * * * *', '0 24 * * *', '0 0 0 * *', '0 0 * 13 *'])
+def test_expresion_invalida(expresion):
+    with pytest.raises(DatosInvalidos):
+        Cron(expresion)